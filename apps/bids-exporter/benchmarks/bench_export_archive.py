@@ -0,0 +1,145 @@
+"""
+Benchmark for the export archive step: write-then-archive vs streamed ZIP.
+
+--sessions sessions of --minutes of 256 Hz data are exported once into an
+output cache with the stand-ins of bench_export_scheduler. The archive of the
+merged dataset is then produced in each mode:
+
+  make_archive   the exporter before streaming: merge the session roots into a
+                 copy of the dataset on disk, then shutil.make_archive (deflate)
+  file/stored    archive.write_zip to a file, binary entries STORED
+  file/fast      archive.write_zip to a file, binary entries deflated at level 1
+  http           archive.iter_zip consumed as an HTTP response body would be
+  minio          archive.upload_zip into a stand-in that reads the pipe part by part
+
+For each mode the wall time, archive size and the extra local disk space at
+peak (merged copy + archive) are reported, and every archive is read back and
+checked against the dataset.
+
+Usage (from apps/bids-exporter):
+    python -m benchmarks.bench_export_archive --sessions 8 --minutes 30
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+os.environ.setdefault("BIDS_OUTPUT_DIR", tempfile.mkdtemp(prefix="bench_archive_"))
+
+from benchmarks import bench_export_scheduler as scheduler_bench
+from src import archive, config, export_plan, worker
+
+
+class CountingMinio:
+    """Reads a put_object stream part by part, as the MinIO client does, and keeps only the size."""
+
+    def __init__(self):
+        self.size = 0
+
+    def put_object(self, bucket, object_name, data, length, part_size, content_type):
+        while part := data.read(part_size):
+            self.size += len(part)
+
+    def remove_object(self, bucket, object_name):
+        pass
+
+
+def tree_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(dirpath, f))
+        for dirpath, _, files in os.walk(path)
+        for f in files
+    )
+
+
+def check_archive(path: str, dataset: archive.Dataset):
+    with zipfile.ZipFile(path) as zf:
+        # make_archive also stores directory entries
+        names = {name for name in zf.namelist() if not name.endswith("/")} - {"participants.tsv"}
+        assert names == set(dataset.files), "archive entries differ from the dataset"
+        assert zf.testzip() is None, "archive is corrupt"
+
+
+def legacy_archive(dataset: archive.Dataset, out_dir: str) -> tuple[str, int]:
+    merged = os.path.join(out_dir, "merged")
+    for name, src in dataset.files.items():
+        dest = os.path.join(merged, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(src, dest)
+    with open(os.path.join(merged, "participants.tsv"), "wb") as f:
+        f.write(dataset.participants_tsv)
+    merged_size = tree_size(merged)
+    path = shutil.make_archive(os.path.join(out_dir, "legacy"), "zip", root_dir=merged)
+    shutil.rmtree(merged)
+    return path, merged_size + os.path.getsize(path)
+
+
+def file_archive(dataset: archive.Dataset, out_dir: str, compression: str) -> tuple[str, int]:
+    config.EXPORT_ZIP_BINARY_COMPRESSION = compression
+    path = os.path.join(out_dir, f"{compression}.zip")
+    with open(path, "wb") as f:
+        archive.write_zip(f, dataset)
+    return path, os.path.getsize(path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=8)
+    ap.add_argument("--minutes", type=float, default=30.0, help="recording length per session")
+    args = ap.parse_args()
+    os.environ["BENCH_SESSION_MINUTES"] = str(args.minutes)
+    scheduler_bench.install_stand_ins()
+    worker.init_worker_process()
+
+    plans = export_plan.plan_experiment(None, f"exp-{args.sessions}")
+    started = time.perf_counter()
+    keys = [worker.export_session_job(plan) for plan in plans]
+    dataset = worker.dataset_for(keys)
+    data_size = sum(os.path.getsize(src) for src in dataset.files.values())
+    print(
+        f"sessions={args.sessions} x {args.minutes} min: exported in "
+        f"{time.perf_counter() - started:.1f} s, "
+        f"{len(dataset.files)} files, {data_size / 1e6:.1f} MB"
+    )
+
+    out_dir = tempfile.mkdtemp(dir=config.BIDS_OUTPUT_DIR)
+    runs = [
+        ("make_archive", lambda: legacy_archive(dataset, out_dir)),
+        ("file/stored", lambda: file_archive(dataset, out_dir, "stored")),
+        ("file/fast", lambda: file_archive(dataset, out_dir, "fast")),
+    ]
+    for mode, run in runs:
+        started = time.perf_counter()
+        path, peak_disk = run()
+        elapsed = time.perf_counter() - started
+        check_archive(path, dataset)
+        print(
+            f"  {mode:13s} {elapsed:6.2f} s  archive {os.path.getsize(path) / 1e6:7.1f} MB  "
+            f"extra disk at peak {peak_disk / 1e6:7.1f} MB"
+        )
+        os.remove(path)
+
+    config.EXPORT_ZIP_BINARY_COMPRESSION = "stored"
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in archive.iter_zip(dataset))
+    print(
+        f"  {'http':13s} {time.perf_counter() - started:6.2f} s  archive {size / 1e6:7.1f} MB  "
+        f"extra disk at peak {0:7.1f} MB"
+    )
+
+    minio = CountingMinio()
+    started = time.perf_counter()
+    archive.upload_zip(minio, "bench.zip", dataset)
+    print(
+        f"  {'minio':13s} {time.perf_counter() - started:6.2f} s  archive {minio.size / 1e6:7.1f} "
+        "MB  "
+        f"extra disk at peak {0:7.1f} MB"
+    )
+    shutil.rmtree(config.BIDS_OUTPUT_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
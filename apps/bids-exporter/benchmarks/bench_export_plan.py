@@ -0,0 +1,217 @@
+"""
+Benchmark for export planning: per-session queries vs. the bulk plan.
+
+PostgreSQL is replaced by an in-process stand-in that charges --latency-ms
+per round trip. An experiment has --sessions sessions with --objects linked
+objects and --events events each.
+
+  per-session  the exporter before bulk planning: the sessions, then for
+               every session its objects (SELECT o.*) and its events, each a
+               query fetched whole into dict rows (2N+1 round trips)
+  bulk         export_plan.plan_experiment: the sessions, then all links and
+               all events streamed as tuple rows, EXPORT_PLAN_FETCH_SIZE rows
+               per round trip, folded into SessionPlans
+
+Reported: wall time, round trips, and the memory held by the result (what
+the scheduler keeps for the whole task) as measured by tracemalloc in a
+second run. Both
+must yield the same objects and events per session.
+
+Usage (from apps/bids-exporter):
+    python -m benchmarks.bench_export_plan --sessions 1000 --objects 2000
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+from datetime import UTC, datetime, timedelta
+
+# config validates these at import time; the benchmark never connects anywhere
+for _name, _value in {
+    "DATABASE_URL": "postgresql://bench@localhost/bench",
+    "MINIO_ENDPOINT": "localhost:9000",
+    "MINIO_ACCESS_KEY": "bench",
+    "MINIO_SECRET_KEY": "bench",
+    "MINIO_BUCKET": "bench",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from src import config, export_plan, storage  # noqa: E402
+from src.session_reader import EPOCH  # noqa: E402
+
+START = datetime(2024, 1, 1, tzinfo=UTC)
+PACKET = timedelta(milliseconds=125)
+
+
+class FakeDatabase:
+    def __init__(self, latency: float, num_sessions: int, num_objects: int, num_events: int):
+        self.latency = latency
+        self.round_trips = 0
+        self.sessions = [
+            {
+                "session_id": f"session-{i:05d}",
+                "user_id": f"user{i % 20}",
+                "experiment_id": "exp",
+                "device_id": "AA:BB:CC:DD:EE:FF",
+                "start_time": START + timedelta(days=i),
+                "end_time": None,
+                "session_type": "rest",
+                "link_status": "completed",
+                "created_at": START,
+            }
+            for i in range(num_sessions)
+        ]
+        self.num_objects = num_objects
+        self.num_events = num_events
+
+    def round_trip(self):
+        time.sleep(self.latency)
+        self.round_trips += 1
+
+    def object_rows(self, session: dict):
+        """(object_id, start_time, end_time) of a session's objects in time order."""
+        for j in range(self.num_objects):
+            start = session["start_time"] + j * PACKET
+            yield f"eeg/{session['user_id']}/{session['session_id']}-{j}.zst", start, start + PACKET
+
+    def object_rows_us(self, session: dict):
+        """object_rows() with times as epoch microseconds, as the bulk query returns them."""
+        first_us = (session["start_time"] - EPOCH) // timedelta(microseconds=1)
+        packet_us = PACKET // timedelta(microseconds=1)
+        for j in range(self.num_objects):
+            start_us = first_us + j * packet_us
+            yield (
+                f"eeg/{session['user_id']}/{session['session_id']}-{j}.zst",
+                start_us,
+                start_us + packet_us,
+            )
+
+    def event_rows(self, session: dict):
+        for j in range(self.num_events):
+            yield float(j), 0.5, f"stim-{j % 4}"
+
+    # --- The queries before bulk planning: one per session, fetchall() into dict rows ---
+
+    def get_object_metadata_for_session(self, session: dict) -> list[dict]:
+        self.round_trip()
+        return [
+            {
+                "object_id": object_id,
+                "user_id": session["user_id"],
+                "device_id": session["device_id"],
+                "start_time": start,
+                "end_time": end,
+                "data_type": "eeg",
+                "created_at": start,
+            }
+            for object_id, start, end in self.object_rows(session)
+        ]
+
+    def get_events_for_session(self, session: dict) -> list[dict]:
+        self.round_trip()
+        return [
+            {
+                "id": j,
+                "session_id": session["session_id"],
+                "onset_s": onset,
+                "duration_s": duration,
+                "description": description,
+                "value": None,
+            }
+            for j, (onset, duration, description) in enumerate(self.event_rows(session))
+        ]
+
+    # --- Stand-ins for storage's bulk queries: server-side cursors, itersize rows per round trip
+    # ---
+
+    def _stream(self, rows):
+        for i, row in enumerate(rows):
+            if i % config.EXPORT_PLAN_FETCH_SIZE == 0:
+                self.round_trip()
+            yield row
+
+    def iter_experiment_object_links(self, conn, experiment_id: str):
+        return self._stream(
+            (session["session_id"], *row)
+            for session in self.sessions
+            for row in self.object_rows_us(session)
+        )
+
+    def iter_experiment_events(self, conn, experiment_id: str):
+        return self._stream(
+            (session["session_id"], *row)
+            for session in self.sessions
+            for row in self.event_rows(session)
+        )
+
+    def get_session_info_for_experiment(self, conn, experiment_id: str) -> list[dict]:
+        self.round_trip()
+        return list(self.sessions)
+
+
+def plan_per_session(db: FakeDatabase) -> list[tuple[dict, list[dict], list[dict]]]:
+    sessions = db.get_session_info_for_experiment(None, "exp")
+    return [
+        (s, db.get_object_metadata_for_session(s), db.get_events_for_session(s)) for s in sessions
+    ]
+
+
+def measure(db: FakeDatabase, plan):
+    """Timed without tracing (tracemalloc slows allocations down), then run again for memory."""
+    db.round_trips = 0
+    started = time.perf_counter()
+    plan()
+    elapsed, round_trips = time.perf_counter() - started, db.round_trips
+    tracemalloc.start()
+    result = plan()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, round_trips, held, peak
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=500)
+    ap.add_argument("--objects", type=int, default=2000, help="linked objects per session")
+    ap.add_argument("--events", type=int, default=50, help="events per session")
+    ap.add_argument(
+        "--latency-ms", type=float, default=1.0, help="simulated round trip per query or fetch"
+    )
+    args = ap.parse_args()
+
+    db = FakeDatabase(args.latency_ms / 1000.0, args.sessions, args.objects, args.events)
+    storage.get_session_info_for_experiment = db.get_session_info_for_experiment
+    storage.iter_experiment_object_links = db.iter_experiment_object_links
+    storage.iter_experiment_events = db.iter_experiment_events
+
+    print(
+        f"{args.sessions} sessions x {args.objects} objects, {args.events} events each, "
+        f"latency={args.latency_ms} ms, fetch size={config.EXPORT_PLAN_FETCH_SIZE}"
+    )
+    legacy, elapsed, trips, held, peak = measure(db, lambda: plan_per_session(db))
+    print(
+        f"  per-session  {elapsed:7.2f} s  {trips:7d} round trips  held {held / 1e6:8.1f} MB  peak "
+        f"{peak / 1e6:8.1f} MB"
+    )
+    del legacy[1:]
+    plans, elapsed, trips, held, peak = measure(
+        db, lambda: export_plan.plan_experiment(None, "exp")
+    )
+    print(
+        f"  bulk         {elapsed:7.2f} s  {trips:7d} round trips  held {held / 1e6:8.1f} MB  peak "
+        f"{peak / 1e6:8.1f} MB"
+    )
+
+    session, objects_meta, events = legacy[0]
+    assert plans[0].session_id == session["session_id"]
+    assert plans[0].objects_meta() == [
+        {key: o[key] for key in ("object_id", "start_time", "end_time")} for o in objects_meta
+    ], "objects differ"
+    assert plans[0].events() == [
+        {key: e[key] for key in ("onset_s", "duration_s", "description")} for e in events
+    ], "events differ"
+
+
+if __name__ == "__main__":
+    main()
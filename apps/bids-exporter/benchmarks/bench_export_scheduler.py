@@ -0,0 +1,175 @@
+"""
+Benchmark for ExportScheduler: session-level parallelism and fairness.
+
+PostgreSQL and MinIO are replaced by in-process stand-ins: every session of
+a synthetic experiment has --minutes of 256 Hz data served by the same
+on-demand object store as bench_export_stream, and the whole export runs
+(decode, BIDS writing, merge, zip). Task state is kept in an in-memory
+task_store stand-in. Three scenarios are measured, each on an empty output cache
+unless noted:
+
+  scaling   one experiment of --sessions sessions, for each --workers count
+  fairness  a large experiment submitted just before a small one; with
+            round-robin scheduling the small one finishes long before the large one
+  re-export the scaling experiment plus one new session, exported again on the
+            cache the first export filled; only the new session is rebuilt
+
+Usage (from apps/bids-exporter):
+    python -m benchmarks.bench_export_scheduler --sessions 8 --minutes 10 --workers 1 2 4
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+# Must be set before src.config is imported, here and in the spawned workers
+os.environ.setdefault("BIDS_OUTPUT_DIR", tempfile.mkdtemp(prefix="bench_export_"))
+
+from benchmarks import bench_export_stream as stream_bench
+from src import config, storage, task_store, worker
+from src.scheduler import ExportScheduler
+from src.session_reader import to_us
+
+USERS = 4
+
+
+def experiment_sessions(experiment_id: str, num_sessions: int) -> list[dict]:
+    return [
+        {
+            "session_id": f"{experiment_id}:{i}",
+            "user_id": f"user{i % USERS}",
+            "session_type": "rest",
+            "start_time": (stream_bench.SESSION_START + timedelta(days=i)).replace(tzinfo=None),
+        }
+        for i in range(num_sessions)
+    ]
+
+
+def install_stand_ins():
+    """Replaces the storage layer with in-process stand-ins (main process and workers)."""
+    minutes = float(os.environ["BENCH_SESSION_MINUTES"])
+    sessions = {}
+
+    def get_session_info_for_experiment(conn, experiment_id):
+        name, count = experiment_id.rsplit("-", 1)
+        found = experiment_sessions(experiment_id, int(count))
+        sessions.update((s["session_id"], s) for s in found)
+        return found
+
+    storage.get_db_connection = lambda: _NullContext()
+    storage.get_minio_client = stream_bench.FakeMinio
+    storage.get_session_info_for_experiment = get_session_info_for_experiment
+    storage.iter_experiment_object_links = lambda conn, experiment_id: (
+        (session["session_id"], o["object_id"], to_us(o["start_time"]), to_us(o["end_time"]))
+        for session in get_session_info_for_experiment(conn, experiment_id)
+        for o in stream_bench.session_objects(minutes / 60)
+    )
+    storage.iter_experiment_events = lambda conn, experiment_id: iter(())
+
+
+def install_task_store():
+    """Keeps task state in a dict instead of PostgreSQL (main process only)."""
+    tasks: dict[str, dict] = {}
+
+    def update_task(task_id, status=None, progress=None, message=None, result_file=None):
+        fields = {
+            "status": status,
+            "progress": progress,
+            "message": message,
+            "result_file": result_file,
+        }
+        tasks[task_id].update((k, v) for k, v in fields.items() if v is not None)
+
+    task_store.create_task = lambda task_id, experiment_id: tasks.update(
+        {task_id: {"status": "pending", "message": "Task is queued."}}
+    )
+    task_store.update_task = update_task
+    task_store.get_task = lambda task_id: dict(tasks[task_id]) if task_id in tasks else None
+    task_store.get_unfinished_tasks = lambda: []
+    task_store.add_task_sessions = lambda task_id, sessions: None
+    task_store.get_finished_sessions = lambda task_id: {}
+    task_store.mark_session_finished = lambda task_id, session_id, key, progress, message: (
+        update_task(task_id, progress=progress, message=message)
+    )
+
+
+def init_bench_worker():
+    install_stand_ins()
+    worker.init_worker_process()
+
+
+class _NullContext:
+    def __enter__(self):
+        # The storage stand-ins ignore the connection
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+def wait_for(task_ids: list[str], started: float) -> dict[str, float]:
+    finished = {}
+    while len(finished) < len(task_ids):
+        for task_id in task_ids:
+            task = task_store.get_task(task_id) or {}
+            status = task.get("status")
+            if task_id not in finished and status in ("completed", "failed"):
+                if status == "failed":
+                    raise RuntimeError(task["message"])
+                finished[task_id] = time.perf_counter() - started
+        time.sleep(0.05)
+    return finished
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=8)
+    ap.add_argument("--minutes", type=float, default=10.0, help="recording length per session")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = ap.parse_args()
+    os.environ["BENCH_SESSION_MINUTES"] = str(args.minutes)
+    install_stand_ins()
+    install_task_store()
+
+    print(
+        f"sessions={args.sessions} x {args.minutes} min, cpus={os.cpu_count()}, "
+        f"output={config.BIDS_OUTPUT_DIR}"
+    )
+    for num_workers in args.workers:
+        shutil.rmtree(config.EXPORT_CACHE_DIR, ignore_errors=True)
+        scheduler = ExportScheduler(num_workers, 0, initializer=init_bench_worker)
+        started = time.perf_counter()
+        scheduler.submit("scaling", f"exp-{args.sessions}")
+        elapsed = wait_for(["scaling"], started)["scaling"]
+        scheduler.shutdown()
+        print(f"  scaling  workers={num_workers:3d}: {elapsed:7.1f} s")
+
+    # The last scaling run left the experiment's sessions in the cache
+    scheduler = ExportScheduler(max(args.workers), 0, initializer=init_bench_worker)
+    started = time.perf_counter()
+    scheduler.submit("re-export", f"exp-{args.sessions + 1}")
+    elapsed = wait_for(["re-export"], started)["re-export"]
+    scheduler.shutdown()
+    print(
+        f"  re-export workers={max(args.workers):2d}: {elapsed:7.1f} s ({args.sessions} of "
+        f"{args.sessions + 1} sessions from the cache)"
+    )
+
+    shutil.rmtree(config.EXPORT_CACHE_DIR, ignore_errors=True)
+    scheduler = ExportScheduler(max(args.workers), 0, initializer=init_bench_worker)
+    started = time.perf_counter()
+    scheduler.submit("large", f"exp-{args.sessions * 2}")
+    scheduler.submit("small", "exp-1")
+    finished = wait_for(["large", "small"], started)
+    scheduler.shutdown()
+    print(
+        f"  fairness workers={max(args.workers):3d}: small done at {finished['small']:.1f} s, "
+        f"large done at {finished['large']:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Memory and wall-time benchmark for loading a long session in the BIDS exporter.
+
+A synthetic session of --hours of 256 Hz data, stored as one zstd-compressed
+packet per object (as the processor writes them), is served by an in-process
+MinIO stand-in that builds each object on request, so the store itself adds
+nothing to the measured memory. Each pipeline runs in its own subprocess and
+reports its peak RSS:
+
+  legacy       download every object, decode each into records, concatenate,
+               convert to float64 volts (the exporter before streaming)
+  streaming    session_reader.load_session_eeg + eeg_to_volts
+  out-of-core  stream into a BrainVision file and let mne-bids copy it
+               (always includes writing the BIDS dataset)
+
+--write-bids additionally writes the in-memory modes' sessions with mne-bids
+to a temporary directory, as the exporter does.
+
+Usage (from apps/bids-exporter):
+    python -m benchmarks.bench_export_stream --hours 2 --write-bids
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+
+# config validates these at import time; the benchmark never connects anywhere
+for _name, _value in {
+    "DATABASE_URL": "postgresql://bench@localhost/bench",
+    "MINIO_ENDPOINT": "localhost:9000",
+    "MINIO_ACCESS_KEY": "bench",
+    "MINIO_SECRET_KEY": "bench",
+    "MINIO_BUCKET": "bench",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import numpy as np  # noqa: E402
+from neuro_common import codec, loadgen, packet  # noqa: E402
+
+from src import session_reader, storage, worker  # noqa: E402
+
+SFREQ = 256.0
+PACKET_SAMPLES = 32
+SESSION_START = datetime(2024, 1, 1, tzinfo=UTC)
+DEVICE = loadgen.SyntheticDevice("bench-device-0001", int(SFREQ), PACKET_SAMPLES)
+
+
+def make_packet(index: int) -> bytes:
+    return DEVICE.packet(index)
+
+
+class FakeResponse(io.BytesIO):
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    """Builds object `packet-<index>` on request instead of holding the session in memory."""
+
+    def get_object(self, bucket, key):
+        return FakeResponse(make_packet(int(key.rsplit("-", 1)[1])))
+
+
+def session_objects(hours: float) -> list[dict]:
+    num_packets = int(hours * 3600 * SFREQ) // PACKET_SAMPLES
+    span = timedelta(seconds=(PACKET_SAMPLES - 1) / SFREQ)
+    objects = []
+    for i in range(num_packets):
+        start = SESSION_START + timedelta(seconds=i * PACKET_SAMPLES / SFREQ)
+        objects.append({"object_id": f"packet-{i}", "start_time": start, "end_time": start + span})
+    return objects
+
+
+def legacy_load(minio_client, objects_meta) -> np.ndarray:
+    """The exporter's pipeline before streaming, up to the volts array passed to RawArray."""
+    with ThreadPoolExecutor() as executor:
+        compressed_chunks = list(
+            executor.map(
+                lambda meta: storage.download_object_from_minio(minio_client, meta["object_id"]),
+                objects_meta,
+            )
+        )
+    parsed_chunks = []
+    for chunk in compressed_chunks:
+        data = codec.decompress(chunk)
+        sensor_bytes = data[packet.HEADER_SIZE :]
+        parsed_chunks.append(
+            np.frombuffer(
+                sensor_bytes,
+                dtype=packet.RECORD_DTYPE,
+                count=len(sensor_bytes) // packet.RECORD_SIZE,
+            )
+        )
+    parsed_data = np.concatenate(parsed_chunks)
+    eeg_data_volts = (parsed_data["eeg"].astype(np.float64) - 2048.0) * (4.5 / 4096.0) * 1e-6
+    return np.ascontiguousarray(eeg_data_volts.T)
+
+
+def streaming_load(minio_client, objects_meta) -> np.ndarray:
+    return session_reader.eeg_to_volts(
+        session_reader.load_session_eeg(minio_client, objects_meta, SFREQ)
+    )
+
+
+MODES = ["legacy", "streaming", "out-of-core"]
+CH_NAMES = ["Fp1", "Fp2", "F7", "F8", "T7", "T8", "P7", "P8"]
+
+
+def write_bids(raw, root: str, **options):
+    from mne_bids import BIDSPath, write_raw_bids
+
+    raw.set_meas_date(SESSION_START)
+    bids_path = BIDSPath(subject="bench", session="01", task="rest", root=root)
+    write_raw_bids(raw, bids_path, overwrite=True, verbose=False, **options)
+
+
+def bids_checksum(root: str) -> float:
+    """Same checksum as for the in-memory modes, read from the written BrainVision file."""
+    import mne
+    from mne_bids import find_matching_paths
+
+    (vhdr,) = find_matching_paths(root, extensions=".vhdr")
+    raw = mne.io.read_raw_brainvision(vhdr.fpath, preload=False, verbose=False)
+    total = 0.0
+    step = 997 * 4096
+    for start in range(0, raw.n_times, step):
+        total += float(
+            raw.get_data(start=start, stop=min(start + step, raw.n_times))[:, ::997].sum()
+        )
+    return total
+
+
+def run_child(mode: str, hours: float, do_write_bids: bool):
+    import mne
+
+    objects_meta = session_objects(hours)
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as scratch:
+        if mode == "out-of-core":
+            raw = worker._read_session_out_of_core(
+                FakeMinio(), objects_meta, SFREQ, CH_NAMES, scratch
+            )
+            load_seconds = time.perf_counter() - start
+            write_bids(raw, root)
+        else:
+            volts = (legacy_load if mode == "legacy" else streaming_load)(FakeMinio(), objects_meta)
+            load_seconds = time.perf_counter() - start
+            checksum = float(volts[:, ::997].sum())
+            if do_write_bids:
+                info = mne.create_info(CH_NAMES, SFREQ, "eeg")
+                write_bids(
+                    mne.io.RawArray(volts, info, verbose=False),
+                    root,
+                    allow_preload=True,
+                    format="BrainVision",
+                )
+        total_seconds = time.perf_counter() - start
+        # Peak RSS is taken before the checksum, which reads the output back
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        if mode == "out-of-core":
+            checksum = bids_checksum(root)
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "checksum": checksum,
+                "load_seconds": load_seconds,
+                "total_seconds": total_seconds,
+                "peak_rss_mb": peak_rss_mb,
+            }
+        )
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--hours", type=float, default=2.0)
+    ap.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    ap.add_argument("--write-bids", action="store_true")
+    ap.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        run_child(args.child, args.hours, args.write_bids)
+        return
+
+    num_samples = int(args.hours * 3600 * SFREQ) // PACKET_SAMPLES * PACKET_SAMPLES
+    print(
+        f"session={args.hours} h, {num_samples:,} samples "
+        f"(float64 volts: {num_samples * 8 * 8 / 2**20:,.0f} MB, uint16 EEG: "
+        f"{num_samples * 8 * 2 / 2**20:,.0f} MB)"
+    )
+    checksums = set()
+    for mode in args.modes:
+        cmd = [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_export_stream",
+            "--child",
+            mode,
+            "--hours",
+            str(args.hours),
+        ]
+        if args.write_bids:
+            cmd.append("--write-bids")
+        r = json.loads(
+            subprocess.run(cmd, check=True, capture_output=True, text=True)
+            .stdout.strip()
+            .splitlines()[-1]
+        )
+        checksums.add(round(r["checksum"], 9))
+        print(
+            f"  {mode:>11}: load {r['load_seconds']:7.1f} s, total {r['total_seconds']:7.1f} s, "
+            f"peak RSS {r['peak_rss_mb']:8,.0f} MB"
+        )
+    if len(checksums) > 1:
+        print("❌ Pipelines produced different data")
+
+
+if __name__ == "__main__":
+    main()
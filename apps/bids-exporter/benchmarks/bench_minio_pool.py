@@ -0,0 +1,122 @@
+"""
+Benchmark for MinIO client reuse and HTTP connection pool sizing.
+
+A local keep-alive HTTP server answers every GetObject with --object-kb of
+data after --latency-ms, standing in for the network round trip. The load
+comes in --rounds bursts of --threads concurrent downloads, like a batch
+flush or a session's fetch window, and idles in between. Three clients:
+
+  client per call  a new Minio() for every request (the exporter's old
+                   get_minio_client), so every request opens a connection
+  sdk default      one shared Minio(); urllib3 keeps at most 10 idle
+                   connections, so each burst above 10 reopens the rest
+  object_store     one shared client sized to the burst (neuro_common)
+
+Usage (from apps/bids-exporter):
+    python -m benchmarks.bench_minio_pool --threads 16 --rounds 50
+"""
+
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from minio import Minio
+from neuro_common import object_store
+
+
+class ObjectHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = b""
+    latency = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with ObjectHandler.lock:
+            ObjectHandler.connections += 1
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.send_header("Content-Type", "application/octet-stream")
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(get_client, threads: int, rounds: int) -> float:
+    def download(i):
+        response = get_client().get_object("bench", f"object-{i}")
+        try:
+            response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in range(rounds):
+            list(executor.map(download, range(threads)))
+    return time.perf_counter() - started
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument(
+        "--rounds", type=int, default=50, help="bursts of --threads concurrent downloads"
+    )
+    ap.add_argument("--object-kb", type=int, default=4)
+    ap.add_argument("--latency-ms", type=float, default=2.0)
+    args = ap.parse_args()
+    ObjectHandler.latency = args.latency_ms / 1000.0
+    ObjectHandler.body = b"\x00" * (args.object_kb * 1024)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ObjectHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"127.0.0.1:{server.server_port}"
+
+    # A region skips the bucket-location request, which would be counted too
+    def new_client():
+        return Minio(endpoint, "bench", "benchbench", secure=False, region="us-east-1")
+
+    shared_default = new_client()
+    shared_pooled = object_store.create_client(
+        endpoint,
+        "bench",
+        "benchbench",
+        False,
+        name="bench",
+        max_connections=args.threads + 4,
+        region="us-east-1",
+    )
+    clients = {
+        "client per call": new_client,
+        "sdk default": lambda: shared_default,
+        "object_store": lambda: shared_pooled,
+    }
+    downloads = args.threads * args.rounds
+    print(
+        f"threads={args.threads}, downloads={downloads}, object={args.object_kb} KB, "
+        f"latency={args.latency_ms} ms"
+    )
+    # urllib3 warns about every connection a full pool discards
+    logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
+    for name, get_client in clients.items():
+        ObjectHandler.connections = 0
+        elapsed = run(get_client, args.threads, args.rounds)
+        print(
+            f"  {name:16s} {downloads / elapsed:8.0f} req/s  connections opened "
+            f"{ObjectHandler.connections}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Benchmark for time-range sample queries (GET /api/v1/samples).
+
+--hours of 256 Hz data are stored twice in an in-process MinIO stand-in: as
+one packet object per --packet-samples samples (as the processor writes them)
+and as compacted --bucket-sec objects (as src.compactor in the processor
+writes them). Every GET costs --latency-ms plus the transfer time at --mbps.
+--queries windows of --window-sec at random offsets are answered by:
+
+  packets           sample_query over the packet objects (one GET per packet)
+  compacted/whole   download each overlapping compacted object entirely and
+                    decode every chunk, i.e. without range reads
+  compacted/range   sample_query over the compacted objects: chunk index from
+                    a ranged GET (cached after the first query) and one ranged
+                    GET for the overlapping chunks
+
+All modes must return the same samples.
+
+Then an overview of the whole recording for a plot --width pixels wide:
+
+  overview/samples  every sample through sample_query, binned by the client
+  overview/summary  sample_query.query_summary: the precomputed min/max/mean
+                    level each compacted object carries, one ranged GET each
+
+Both must produce the same bins.
+
+Usage (from apps/bids-exporter):
+    python -m benchmarks.bench_sample_query --hours 2 --window-sec 60
+"""
+
+import argparse
+import os
+import time
+from datetime import UTC, datetime, timedelta
+
+# config validates these at import time; the benchmark never connects anywhere
+for _name, _value in {
+    "DATABASE_URL": "postgresql://bench@localhost/bench",
+    "MINIO_ENDPOINT": "localhost:9000",
+    "MINIO_ACCESS_KEY": "bench",
+    "MINIO_SECRET_KEY": "bench",
+    "MINIO_BUCKET": "bench",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import numpy as np  # noqa: E402
+from neuro_common import chunk, codec, packet, summary  # noqa: E402
+
+from src import sample_query  # noqa: E402
+from src.session_reader import to_us  # noqa: E402
+
+SFREQ = 256
+SAMPLE_US = 1_000_000 // SFREQ
+START = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+class FakeResponse:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    def __init__(self, latency: float, mbps: float):
+        self.latency = latency
+        self.bytes_per_sec = mbps * 1e6 / 8
+        self.objects: dict[str, bytes] = {}
+        self.gets = 0
+        self.bytes_read = 0
+
+    def get_object(self, bucket, name, offset=0, length=0):
+        data = self.objects[name]
+        data = data[offset : offset + length] if length else data[offset:]
+        time.sleep(self.latency + len(data) / self.bytes_per_sec)
+        self.gets += 1
+        self.bytes_read += len(data)
+        return FakeResponse(data)
+
+
+def make_recording(minio: FakeMinio, hours: float, packet_samples: int, bucket_sec: int):
+    """Stores the recording both ways; returns (packet metas, compacted metas)."""
+    rng = np.random.default_rng(0)
+    n = int(hours * 3600 * SFREQ)
+    records = np.zeros(n, dtype=packet.RECORD_DTYPE)
+    t = np.arange(n) / SFREQ
+    eeg = 2048 + 300 * np.sin(2 * np.pi * 10 * t)[:, None] + rng.normal(0, 20, (n, 8))
+    records["eeg"] = np.clip(eeg, 0, 4095)
+    records["esp_micros"] = (np.arange(n) * SAMPLE_US + 777) % (1 << 32)
+    time_us = to_us(START) + np.arange(n, dtype=np.int64) * SAMPLE_US
+    header = b"AA:BB:CC:DD:EE:FF".ljust(packet.HEADER_SIZE, b"\x00")
+
+    packets = []
+    for first in range(0, n, packet_samples):
+        last = min(first + packet_samples, n)
+        object_id = f"eeg/bench/{first}.zst"
+        minio.objects[object_id] = codec.compress(header + records[first:last].tobytes())
+        packets.append(_meta(object_id, time_us[first], time_us[last - 1]))
+
+    compacted = []
+    bucket_samples = bucket_sec * SFREQ
+    for first in range(0, n, bucket_samples):
+        last = min(first + bucket_samples, n)
+        object_id = f"eeg/bench/{first}{chunk.OBJECT_SUFFIX}"
+        columns = {name: records[name][first:last] for name in packet.RECORD_DTYPE.names}
+        # The summary sections the compactor stores with each object
+        sections = {
+            summary.section_name(level): summary.encode(
+                summary.summarize(time_us[first:last], columns["eeg"], level * 1_000_000), 9
+            )
+            for level in summary.LEVELS_SEC
+        }
+        minio.objects[object_id] = chunk.encode(time_us[first:last], columns, {}, 2560, 9, sections)
+        compacted.append(_meta(object_id, time_us[first], time_us[last - 1]))
+    return packets, compacted
+
+
+def _meta(object_id: str, start_us: int, end_us: int) -> dict:
+    return {
+        "object_id": object_id,
+        "start_time": START + timedelta(microseconds=int(start_us) - to_us(START)),
+        "end_time": START + timedelta(microseconds=int(end_us) - to_us(START)),
+    }
+
+
+def overlapping(metas: list[dict], start: datetime, end: datetime) -> list[dict]:
+    """What sample_query.find_objects returns from the database."""
+    return [m for m in metas if m["start_time"] <= end and m["end_time"] >= start]
+
+
+def query_range_reads(minio, metas, start, end) -> np.ndarray:
+    blocks = list(sample_query.iter_samples(minio, overlapping(metas, start, end), start, end))
+    return np.concatenate([b.eeg for b in blocks])
+
+
+def query_whole_objects(minio, metas, start, end) -> np.ndarray:
+    start_us, end_us = to_us(start), to_us(end)
+    parts = []
+    for meta in overlapping(metas, start, end):
+        _, columns = chunk.decode(minio.get_object("bench", meta["object_id"]).read(), ["eeg"])
+        times = columns[chunk.TIME_COLUMN]
+        parts.append(columns["eeg"][(times >= start_us) & (times <= end_us)])
+    return np.concatenate(parts)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--hours", type=float, default=2.0)
+    ap.add_argument("--packet-samples", type=int, default=32)
+    ap.add_argument("--bucket-sec", type=int, default=600)
+    ap.add_argument("--window-sec", type=float, default=60.0)
+    ap.add_argument("--queries", type=int, default=10)
+    ap.add_argument("--latency-ms", type=float, default=2.0, help="simulated round trip per GET")
+    ap.add_argument("--mbps", type=float, default=1000.0, help="simulated bandwidth")
+    ap.add_argument("--width", type=int, default=1000, help="overview plot width in pixels")
+    args = ap.parse_args()
+
+    minio = FakeMinio(args.latency_ms / 1000.0, args.mbps)
+    packets, compacted = make_recording(minio, args.hours, args.packet_samples, args.bucket_sec)
+    rng = np.random.default_rng(1)
+    windows = []
+    for _ in range(args.queries):
+        offset = rng.uniform(0, args.hours * 3600 - args.window_sec)
+        start = START + timedelta(seconds=offset)
+        windows.append((start, start + timedelta(seconds=args.window_sec)))
+
+    modes = {
+        "packets": lambda s, e: query_range_reads(minio, packets, s, e),
+        "compacted/whole": lambda s, e: query_whole_objects(minio, compacted, s, e),
+        "compacted/range": lambda s, e: query_range_reads(minio, compacted, s, e),
+    }
+    print(
+        f"{args.hours:g} h recording, {args.queries} queries of {args.window_sec:g} s, "
+        f"latency={args.latency_ms} ms, {args.mbps:g} Mbit/s"
+    )
+    reference = None
+    for mode, query in modes.items():
+        minio.gets = minio.bytes_read = 0
+        started = time.perf_counter()
+        results = [query(start, end) for start, end in windows]
+        elapsed = time.perf_counter() - started
+        if reference is None:
+            reference = results
+        assert all(np.array_equal(a, b) for a, b in zip(reference, results, strict=True)), (
+            f"{mode} returned other samples"
+        )
+        print(
+            f"  {mode:16s} {elapsed / args.queries * 1000:8.1f} ms/query  "
+            f"{minio.gets / args.queries:8.1f} GETs/query  "
+            f"{minio.bytes_read / args.queries / 1e6:7.2f} MB/query"
+        )
+
+    start, end = compacted[0]["start_time"], compacted[-1]["end_time"]
+    sample_query._headers.clear()
+    minio.gets = minio.bytes_read = 0
+    started = time.perf_counter()
+    level, bins = sample_query.query_summary(
+        minio, overlapping(compacted, start, end), start, end, args.width
+    )
+    summary_time, summary_gets, summary_bytes = (
+        time.perf_counter() - started,
+        minio.gets,
+        minio.bytes_read,
+    )
+
+    sample_query._headers.clear()
+    minio.gets = minio.bytes_read = 0
+    started = time.perf_counter()
+    blocks = list(sample_query.iter_samples(minio, overlapping(compacted, start, end), start, end))
+    expected = summary.summarize(
+        np.concatenate([b.time_us for b in blocks]),
+        np.concatenate([b.eeg for b in blocks]),
+        bins.bin_us,
+    )
+    samples_time = time.perf_counter() - started
+    assert (
+        np.array_equal(bins.bins, expected.bins)
+        and np.array_equal(bins.count, expected.count)
+        and np.array_equal(bins.min, expected.min)
+        and np.array_equal(bins.max, expected.max)
+        and np.allclose(bins.mean, expected.mean, atol=1e-3)
+    ), "summary bins differ from the samples"
+
+    print(f"overview of {args.hours:g} h at {args.width} px (level {level} s, {len(bins)} bins):")
+    print(
+        f"  {'overview/samples':16s} {samples_time * 1000:8.1f} ms        "
+        f"{minio.gets:8d} GETs        {minio.bytes_read / 1e6:7.2f} MB"
+    )
+    print(
+        f"  {'overview/summary':16s} {summary_time * 1000:8.1f} ms        "
+        f"{summary_gets:8d} GETs        {summary_bytes / 1e6:7.2f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+End-to-end load test of the BIDS exporter: one experiment of --sessions
+sessions, each --minutes of a synthetic device's packets (neuro_common.loadgen)
+served by the in-process MinIO and PostgreSQL stand-ins of
+bench_export_scheduler, exported by an ExportScheduler with --workers worker
+processes on an empty cache: planning, streaming and decoding, BIDS writing
+and the ZIP archive. Reports export throughput in EEG samples and recording
+minutes per second and the peak RSS of the service and of its workers.
+
+The last line of output is the results as JSON, for benchmarks/e2e.py in
+the repository root.
+
+Usage (from apps/bids-exporter):
+    python -m benchmarks.e2e_exporter --sessions 4 --minutes 5 --workers 2
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+
+from neuro_common import loadgen
+
+from benchmarks import bench_export_scheduler as scheduler_bench
+from benchmarks import bench_export_stream as stream_bench
+from src import config, task_store
+from src.scheduler import ExportScheduler
+
+
+def run(args) -> dict:
+    # Read by the stand-ins, here and in the spawned workers
+    os.environ["BENCH_SESSION_MINUTES"] = str(args.minutes)
+    scheduler_bench.install_stand_ins()
+    scheduler_bench.install_task_store()
+    shutil.rmtree(config.EXPORT_CACHE_DIR, ignore_errors=True)
+
+    scheduler = ExportScheduler(args.workers, 0, initializer=scheduler_bench.init_bench_worker)
+    started = time.perf_counter()
+    scheduler.submit("e2e", f"exp-{args.sessions}")
+    elapsed = scheduler_bench.wait_for(["e2e"], started)["e2e"]
+    scheduler.shutdown()
+
+    samples_per_session = (
+        len(stream_bench.session_objects(args.minutes / 60)) * stream_bench.PACKET_SAMPLES
+    )
+    result_file = task_store.get_task("e2e")["result_file"]
+    archive = os.path.join(config.BIDS_OUTPUT_DIR, result_file) if result_file else None
+    return {
+        "export_seconds": elapsed,
+        "samples_per_sec": args.sessions * samples_per_session / elapsed,
+        "recording_min_per_sec": args.sessions * args.minutes / elapsed,
+        "archive_mb": os.path.getsize(archive) / 2**20
+        if archive and os.path.exists(archive)
+        else None,
+        "peak_rss_mb": loadgen.peak_rss_mb(),
+        # The pool's workers, reaped by scheduler.shutdown()
+        "workers_peak_rss_mb": loadgen.peak_rss_mb(children=True),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=4)
+    ap.add_argument("--minutes", type=float, default=5.0, help="recording length per session")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    result = run(args)
+    print(
+        f"sessions={args.sessions} x {args.minutes} min, workers={args.workers}, "
+        f"output={config.BIDS_OUTPUT_DIR}"
+    )
+    print(
+        f"  export     : {result['export_seconds']:.1f} s, {result['samples_per_sec']:,.0f} "
+        "samples/s, "
+        f"{result['recording_min_per_sec']:.1f} recording min/s"
+    )
+    print(
+        f"  peak RSS   : {result['peak_rss_mb']:.0f} MB (workers "
+        f"{result['workers_peak_rss_mb']:.0f} MB)"
+    )
+    print(json.dumps(result))
+    shutil.rmtree(config.BIDS_OUTPUT_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
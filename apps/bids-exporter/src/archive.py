@@ -0,0 +1,210 @@
+"""
+Streaming ZIP assembly of an export from its per-session BIDS roots.
+
+The dataset is never merged on disk: plan_dataset() only decides which cached
+file ends up under which name, and the ZIP is written from the session roots
+in a single pass, one entry at a time. Text sidecars (.tsv, .json, .vhdr, ...)
+are deflated; binary data (.eeg and other already dense formats) is STORED by
+default or deflated at the fastest level (EXPORT_ZIP_BINARY_COMPRESSION).
+
+The writer only needs a write() method, so the same archive can go to a local
+file, to a MinIO multipart upload through a pipe, or straight into an HTTP
+response (iter_zip).
+"""
+
+import os
+import threading
+import zipfile
+from collections.abc import Iterator
+
+from . import config
+
+READ_CHUNK = 1024 * 1024
+# Extensions whose content is binary sample data or already compressed
+BINARY_EXTENSIONS = {
+    ".eeg",
+    ".dat",
+    ".edf",
+    ".bdf",
+    ".fif",
+    ".fdt",
+    ".set",
+    ".gz",
+    ".zip",
+    ".png",
+    ".jpg",
+}
+
+
+# Tables whose rows are merged across parts, by the part-relative name: participants.tsv
+# at the top level and the per-session *_scans.tsv, which same-day sessions share
+# (the BIDS session label is the date)
+def _is_merged_table(name: str) -> bool:
+    return name == "participants.tsv" or name.endswith("_scans.tsv")
+
+
+class _Table:
+    """A TSV merged across parts: the union of the columns, rows keyed by their first column."""
+
+    def __init__(self):
+        self.columns: list[str] = []
+        self.rows: dict[str, dict] = {}
+
+    def add(self, path: str, replace: bool):
+        with open(path, encoding="utf-8") as f:
+            header, *rows = [line.rstrip("\n").split("\t") for line in f if line.strip()]
+        self.columns += [c for c in header if c not in self.columns]
+        for row in rows:
+            if replace or row[0] not in self.rows:
+                self.rows[row[0]] = dict(zip(header, row, strict=True))
+
+    def render(self) -> bytes:
+        lines = ["\t".join(self.columns)]
+        lines += [
+            "\t".join(self.rows[k].get(c, "n/a") for c in self.columns) for k in sorted(self.rows)
+        ]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class Dataset:
+    """
+    The files of a merged BIDS dataset: archive name -> source path, plus the
+    merged tables' contents.
+    """
+
+    def __init__(self, files: dict[str, str], tables: dict[str, bytes]):
+        self.files = files
+        self.tables = tables
+
+    def __bool__(self):
+        return bool(self.files)
+
+
+def plan_dataset(part_roots: list[str]) -> Dataset:
+    """
+    Merges per-session BIDS roots by name only. Other top-level files are
+    identical across parts and taken from the first. Parts are merged in
+    session order, so a later session overwrites an earlier one with the
+    same BIDS path (same subject, day and task). participants.tsv is the
+    union of the parts' rows, and so is a *_scans.tsv, which several sessions
+    of the same day share; a scans row of a later session replaces the one
+    for the same filename, matching the file it describes.
+    """
+    files: dict[str, str] = {}
+    tables: dict[str, _Table] = {}
+    for part_root in part_roots:
+        if not os.path.isdir(part_root):
+            # Evicted from the cache after its session finished; never silently drop a session
+            raise FileNotFoundError(f"Session output {part_root} is missing; re-run the export.")
+        for dirpath, _, filenames in os.walk(part_root):
+            rel_dir = os.path.relpath(dirpath, part_root)
+            for filename in filenames:
+                src = os.path.join(dirpath, filename)
+                name = filename if rel_dir == "." else f"{rel_dir.replace(os.sep, '/')}/{filename}"
+                if _is_merged_table(name):
+                    tables.setdefault(name, _Table()).add(src, replace=name != "participants.tsv")
+                    continue
+                if rel_dir == "." and name in files:
+                    continue
+                files[name] = src
+    return Dataset(files, {name: table.render() for name, table in tables.items()})
+
+
+def _zip_info(name: str, path: str) -> zipfile.ZipInfo:
+    zinfo = zipfile.ZipInfo.from_file(path, name)
+    if os.path.splitext(name)[1].lower() in BINARY_EXTENSIONS:
+        if config.EXPORT_ZIP_BINARY_COMPRESSION == "stored":
+            zinfo.compress_type = zipfile.ZIP_STORED
+        else:
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            # Public as ZipInfo.compress_level from Python 3.13
+            zinfo._compresslevel = 1
+    else:
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    return zinfo
+
+
+def _write_entries(zf: zipfile.ZipFile, dataset: Dataset) -> Iterator[None]:
+    """Writes the dataset into zf, yielding after every chunk so a caller can drain the output."""
+    for name in sorted(dataset.tables):
+        zf.writestr(name, dataset.tables[name], compress_type=zipfile.ZIP_DEFLATED)
+        yield
+    for name in sorted(dataset.files):
+        path = dataset.files[name]
+        with open(path, "rb") as src, zf.open(_zip_info(name, path), "w") as dest:
+            while chunk := src.read(READ_CHUNK):
+                dest.write(chunk)
+                yield
+
+
+def write_zip(fileobj, dataset: Dataset):
+    """Writes the dataset as a ZIP to fileobj, which may be unseekable (a pipe, a socket)."""
+    with zipfile.ZipFile(fileobj, "w") as zf:
+        for _ in _write_entries(zf, dataset):
+            pass
+
+
+class _ChunkSink:
+    """Write-only file object collecting what ZipFile writes until a generator drains it."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(dataset: Dataset) -> Iterator[bytes]:
+    """Yields the ZIP of the dataset piece by piece, e.g. as an HTTP response body."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for _ in _write_entries(zf, dataset):
+            if data := sink.drain():
+                yield data
+    if data := sink.drain():
+        yield data
+
+
+def upload_zip(minio_client, object_name: str, dataset: Dataset):
+    """
+    Streams the ZIP into a MinIO multipart upload through a pipe; only the
+    part being uploaded (EXPORT_ARCHIVE_PART_SIZE) is held in memory.
+    """
+    read_fd, write_fd = os.pipe()
+    errors: list[BaseException] = []
+
+    def produce():
+        try:
+            with open(write_fd, "wb") as writer:
+                write_zip(writer, dataset)
+        except BaseException as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, name="export-zip", daemon=True)
+    producer.start()
+    try:
+        # Closing the read end on failure unblocks the producer with a broken pipe
+        with open(read_fd, "rb") as reader:
+            minio_client.put_object(
+                config.MINIO_BUCKET,
+                object_name,
+                reader,
+                length=-1,
+                part_size=config.EXPORT_ARCHIVE_PART_SIZE,
+                content_type="application/zip",
+            )
+    finally:
+        producer.join()
+    if errors:
+        # The upload saw a clean EOF and completed with a truncated archive
+        minio_client.remove_object(config.MINIO_BUCKET, object_name)
+        raise errors[0]
@@ -0,0 +1,84 @@
+"""
+Incremental BrainVision writer for out-of-core session export.
+
+Samples are appended block by block to the binary .eeg file as INT_16 ADC
+counts (centred at 0), and the conversion to physical units is left to the
+per-channel resolution in the .vhdr header. Nothing larger than one block is
+ever held in memory, and the resulting file can be opened lazily with
+mne.io.read_raw_brainvision, which mne-bids then copies into the dataset
+without loading it.
+"""
+
+import os
+
+import numpy as np
+
+ADC_OFFSET = 2048
+# Resolution of one ADC count in microvolts: (4.5 / 4096) µV, as in the volts conversion
+RESOLUTION_UV = 4.5 / 4096.0
+
+
+class BrainVisionWriter:
+    def __init__(self, directory: str, basename: str, ch_names: list[str], sfreq: float):
+        self.ch_names = ch_names
+        self.sfreq = sfreq
+        self.vhdr_path = os.path.join(directory, f"{basename}.vhdr")
+        self._eeg_name = f"{basename}.eeg"
+        self._vmrk_name = f"{basename}.vmrk"
+        self._directory = directory
+        self._eeg_file = open(os.path.join(directory, self._eeg_name), "wb")
+        self.num_samples = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def append(self, adc: np.ndarray):
+        """Appends (n, channels) uint16 ADC samples; the layout is already MULTIPLEXED."""
+        if len(adc) == 0:
+            return
+        block = adc.astype(np.int16)
+        block -= ADC_OFFSET
+        self._eeg_file.write(block.astype("<i2", copy=False).tobytes())
+        self.num_samples += len(adc)
+
+    def close(self) -> str:
+        """Finishes the data file and writes the header and marker files."""
+        if self._eeg_file.closed:
+            return self.vhdr_path
+        self._eeg_file.close()
+        channel_lines = "\n".join(
+            f"Ch{i}={name},,{RESOLUTION_UV!r},µV" for i, name in enumerate(self.ch_names, start=1)
+        )
+        with open(self.vhdr_path, "w", encoding="utf-8") as f:
+            f.write(
+                "Brain Vision Data Exchange Header File Version 1.0\n"
+                "; Written incrementally by the BIDS exporter\n\n"
+                "[Common Infos]\n"
+                "Codepage=UTF-8\n"
+                f"DataFile={self._eeg_name}\n"
+                f"MarkerFile={self._vmrk_name}\n"
+                "DataFormat=BINARY\n"
+                "DataOrientation=MULTIPLEXED\n"
+                f"NumberOfChannels={len(self.ch_names)}\n"
+                "; Sampling interval in microseconds\n"
+                f"SamplingInterval={1e6 / self.sfreq!r}\n\n"
+                "[Binary Infos]\n"
+                "BinaryFormat=INT_16\n\n"
+                "[Channel Infos]\n"
+                "; Each entry: Ch<Channel number>=<Name>,<Reference channel name>,"
+                '<Resolution in "Unit">,<Unit>\n'
+                f"{channel_lines}\n"
+            )
+        with open(os.path.join(self._directory, self._vmrk_name), "w", encoding="utf-8") as f:
+            f.write(
+                "Brain Vision Data Exchange Marker File, Version 1.0\n\n"
+                "[Common Infos]\n"
+                "Codepage=UTF-8\n"
+                f"DataFile={self._eeg_name}\n\n"
+                "[Marker Infos]\n"
+            )
+        return self.vhdr_path
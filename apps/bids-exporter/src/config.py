@@ -1,4 +1,5 @@
 import os
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,6 +9,9 @@ PORT = int(os.getenv("PORT", "5004"))
 
 # Database Configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Connection pool per process (the API process and each export worker process)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "8"))
 
 # MinIO Configuration
 MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT")
@@ -16,9 +20,76 @@ MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
 MINIO_BUCKET = os.getenv("MINIO_BUCKET")
 MINIO_SECURE = os.getenv("MINIO_SECURE", "false").lower() == "true"
 
+# Prefix of the trained zstd dictionaries stored in MinIO
+ZSTD_DICT_PREFIX = os.getenv("ZSTD_DICT_PREFIX", "_dictionaries/")
+
 # BIDS Exporter Configuration
 BIDS_OUTPUT_DIR = os.getenv("BIDS_OUTPUT_DIR", "/bids_output")
 
+# --- Export Scheduling ---
+# Worker processes that export sessions (decode + BIDS writing); defaults to the CPU count
+EXPORT_PROCESS_WORKERS = int(os.getenv("EXPORT_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+# Upper bound on sessions of one export task running at once (0 = no limit beyond the pool)
+EXPORT_MAX_SESSIONS_PER_TASK = int(os.getenv("EXPORT_MAX_SESSIONS_PER_TASK", "0"))
+# Threads per worker process for MinIO downloads, shared by every session in that process
+EXPORT_IO_WORKERS = int(os.getenv("EXPORT_IO_WORKERS", "16"))
+# HTTP connections each process keeps open to MinIO; below EXPORT_IO_WORKERS downloads reconnect
+# constantly
+MINIO_MAX_CONNECTIONS = int(os.getenv("MINIO_MAX_CONNECTIONS", str(EXPORT_IO_WORKERS + 4)))
+# Number of raw data objects downloaded and decoded ahead of the one being appended
+EXPORT_FETCH_CONCURRENCY = int(os.getenv("EXPORT_FETCH_CONCURRENCY", "8"))
+# Rows per round trip when an experiment's object links and events are streamed for planning
+EXPORT_PLAN_FETCH_SIZE = int(os.getenv("EXPORT_PLAN_FETCH_SIZE", "10000"))
+# Out-of-core mode: assemble each session in a BrainVision file on disk instead of in memory
+EXPORT_OUT_OF_CORE = os.getenv("EXPORT_OUT_OF_CORE", "true").lower() == "true"
+# Scratch directory for sessions being assembled out of core (defaults to BIDS_OUTPUT_DIR)
+EXPORT_SCRATCH_DIR = os.getenv("EXPORT_SCRATCH_DIR", BIDS_OUTPUT_DIR)
+# Content-addressed cache of per-session BIDS outputs reused by later exports
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(BIDS_OUTPUT_DIR, "_cache"))
+# Least recently used entries are evicted beyond this size (0 = unlimited)
+EXPORT_CACHE_MAX_BYTES = int(float(os.getenv("EXPORT_CACHE_MAX_GB", "50")) * 1024**3)
+
+# --- Export Archive ---
+# Where the finished ZIP goes: "file" (BIDS_OUTPUT_DIR), "minio" (multipart upload, no local copy)
+# or "stream" (nothing is stored; the ZIP is built from the cache while it is downloaded)
+EXPORT_ARCHIVE_TARGET = os.getenv("EXPORT_ARCHIVE_TARGET", "file").lower()
+# Object name prefix of archives uploaded to MINIO_BUCKET
+EXPORT_ARCHIVE_PREFIX = os.getenv("EXPORT_ARCHIVE_PREFIX", "exports/")
+# Multipart upload part size; one part is buffered in memory (MinIO minimum: 5 MB)
+EXPORT_ARCHIVE_PART_SIZE = int(os.getenv("EXPORT_ARCHIVE_PART_SIZE_MB", "16")) * 1024 * 1024
+# Compression of binary entries (.eeg): "stored" (none) or "fast" (deflate level 1). Text is always
+# deflated
+EXPORT_ZIP_BINARY_COMPRESSION = os.getenv("EXPORT_ZIP_BINARY_COMPRESSION", "stored").lower()
+
+# --- Sample Queries (GET /api/v1/samples) ---
+# Longest time range one query may ask for
+SAMPLE_QUERY_MAX_RANGE_SEC = int(os.getenv("SAMPLE_QUERY_MAX_RANGE_SEC", "3600"))
+# Longest span of a single object; must cover the processor's COMPACTION_BUCKET_SEC plus one packet
+SAMPLE_QUERY_MAX_OBJECT_SEC = int(os.getenv("SAMPLE_QUERY_MAX_OBJECT_SEC", "1200"))
+# JSON responses are limited to this many samples; larger ranges use the binary format
+SAMPLE_QUERY_MAX_JSON_SAMPLES = int(os.getenv("SAMPLE_QUERY_MAX_JSON_SAMPLES", "100000"))
+# Chunk indexes of compacted objects kept in memory, so repeated queries skip one GET per object
+SAMPLE_QUERY_HEADER_CACHE_SIZE = int(os.getenv("SAMPLE_QUERY_HEADER_CACHE_SIZE", "1024"))
+# Precomputed summary levels stored by the processor's compactor (COMPACTION_SUMMARY_LEVELS_SEC)
+SAMPLE_SUMMARY_LEVELS_SEC = [
+    int(v) for v in os.getenv("SAMPLE_SUMMARY_LEVELS_SEC", "1,10,60").split(",") if v.strip()
+]
+# Widest plot a summary query may ask for, in pixels (bins computed from samples are one per pixel)
+SAMPLE_SUMMARY_MAX_WIDTH = int(os.getenv("SAMPLE_SUMMARY_MAX_WIDTH", "10000"))
+# Most objects one summary query may summarize from their samples (packets not yet compacted, or
+# every object when the span is too short for the finest level); the default is about the last
+# hour of 256 Hz packets, which the compactor leaves alone (COMPACTION_MIN_AGE_SEC)
+SAMPLE_SUMMARY_MAX_RAW_OBJECTS = int(os.getenv("SAMPLE_SUMMARY_MAX_RAW_OBJECTS", "30000"))
+
+# --- Observability (Prometheus metrics are served at /metrics) ---
+# Allow GET /debug/profile?seconds=N, a sampling profile of the API process taken on request
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# The same log event is written at most once per this many seconds (0 = no limit)
+LOG_RATE_LIMIT_SEC = float(os.getenv("LOG_RATE_LIMIT_SEC", "10"))
+
 # Validate that essential variables are set
 if not all([DATABASE_URL, MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY, MINIO_BUCKET]):
-    raise ValueError("One or more essential environment variables are not set.")
\ No newline at end of file
+    raise ValueError("One or more essential environment variables are not set.")
+if EXPORT_ARCHIVE_TARGET not in ("file", "minio", "stream"):
+    raise ValueError(f"Unknown EXPORT_ARCHIVE_TARGET: {EXPORT_ARCHIVE_TARGET}")
@@ -0,0 +1,142 @@
+"""
+Content-addressed cache of per-session BIDS outputs.
+
+Each exported session is a small BIDS root of its own (see worker.py). It is
+stored under EXPORT_CACHE_DIR by a key derived from everything the output
+depends on: the session row fields that end up in the dataset, the IDs of its
+linked raw data objects (which are written once and never modified), its
+events and the export options. A re-export of an experiment therefore only
+rebuilds sessions that are new or whose data or events changed; the others are
+read straight from the cache when the archive is written (see archive.py).
+
+Entries are created atomically (built in a temporary directory, then renamed),
+so a crash never leaves a half-written entry behind under a valid key.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Callable
+
+from . import config
+
+# Bump whenever the per-session output changes for the same inputs
+CACHE_FORMAT_VERSION = 1
+_TEMP_PREFIX = ".tmp-"
+
+
+def session_cache_key(
+    session: dict, objects_meta: list[dict], events: list[dict], options: dict
+) -> str:
+    """sha256 over the inputs of one session's export."""
+    inputs = {
+        "version": CACHE_FORMAT_VERSION,
+        "options": options,
+        "session": {
+            "user_id": session["user_id"],
+            "session_type": session["session_type"],
+            "start_time": session["start_time"].isoformat(),
+            # Compacted objects are cut to the session's time range
+            "end_time": session["end_time"].isoformat() if session.get("end_time") else None,
+        },
+        # In export order, which is also the order the samples are concatenated in
+        "objects": [o["object_id"] for o in objects_meta],
+        "events": [[e["onset_s"], e["duration_s"], e["description"]] for e in events],
+    }
+    encoded = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def entry_path(key: str) -> str:
+    return os.path.join(config.EXPORT_CACHE_DIR, key[:2], key)
+
+
+def lookup(key: str) -> str | None:
+    """Returns the entry's BIDS root if it is cached, marking it as recently used."""
+    path = entry_path(key)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def store(key: str, build: Callable[[str], object]) -> str:
+    """
+    Runs build(root) on an empty temporary directory and publishes it as the
+    entry for key. A session without data is cached as an empty root.
+    """
+    path = entry_path(key)
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    temp_root = tempfile.mkdtemp(prefix=_TEMP_PREFIX, dir=parent)
+    try:
+        build(temp_root)
+        try:
+            os.rename(temp_root, path)
+        except OSError:
+            # Another job published the same key first; its entry is equivalent
+            if not os.path.isdir(path):
+                raise
+            shutil.rmtree(temp_root, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(temp_root, ignore_errors=True)
+        raise
+    return path
+
+
+def _entries():
+    if not os.path.isdir(config.EXPORT_CACHE_DIR):
+        return
+    for prefix in os.scandir(config.EXPORT_CACHE_DIR):
+        if prefix.is_dir():
+            yield from (entry for entry in os.scandir(prefix.path) if entry.is_dir())
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def remove_incomplete():
+    """
+    Removes temporary directories left by builds that were interrupted. Only
+    safe while no job runs.
+    """
+    for entry in list(_entries()):
+        if entry.name.startswith(_TEMP_PREFIX):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def prune(max_bytes: int, keep: set[str]) -> int:
+    """
+    Evicts least recently used entries until the cache fits in max_bytes
+    (0 = unlimited). Entries in keep are still needed by running tasks and are
+    never evicted. Returns the number of entries removed.
+    """
+    if max_bytes <= 0:
+        return 0
+    entries = [
+        (entry.stat().st_mtime, entry.path, _tree_size(entry.path))
+        for entry in _entries()
+        if not entry.name.startswith(_TEMP_PREFIX)
+    ]
+    total = sum(size for _, _, size in entries)
+    removed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.basename(path) in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,96 @@
+"""
+Bulk planning of an experiment's export.
+
+Instead of two queries per session (its objects and its events), the
+sessions, all their object links and all their events are read in three
+queries. Links and events are streamed through server-side cursors as tuple
+rows and folded, session by session, into SessionPlans: object IDs plus their
+times as int64 microseconds, and events as tuples. A plan is all an export
+job needs, so worker processes no longer query the database per session, and
+an experiment with millions of linked objects is held as compact arrays
+rather than a dict per object.
+"""
+
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+from neuro_common import metrics
+
+from . import storage
+from .session_reader import EPOCH
+
+_PLAN = metrics.STAGE_SECONDS.labels("export_plan")
+
+
+class SessionPlan:
+    """
+    The inputs of one session's export: the session row, its objects in time
+    order and its events.
+    """
+
+    __slots__ = ("session", "object_ids", "start_us", "end_us", "event_rows")
+
+    def __init__(self, session: dict):
+        self.session = session
+        self.object_ids: list[str] = []
+        self.start_us = np.empty(0, dtype=np.int64)
+        self.end_us = np.empty(0, dtype=np.int64)
+        # (onset_s, duration_s, description), by onset
+        self.event_rows: list[tuple] = []
+
+    @property
+    def session_id(self) -> str:
+        return self.session["session_id"]
+
+    def objects_meta(self) -> list[dict]:
+        """The session's objects as session_reader expects them."""
+        return [
+            {
+                "object_id": object_id,
+                "start_time": EPOCH + timedelta(microseconds=start),
+                "end_time": EPOCH + timedelta(microseconds=end),
+            }
+            for object_id, start, end in zip(
+                self.object_ids,
+                self.start_us.tolist(),
+                self.end_us.tolist(),
+                strict=True,
+            )
+        ]
+
+    def events(self) -> list[dict]:
+        return [
+            {"onset_s": onset, "duration_s": duration, "description": description}
+            for onset, duration, description in self.event_rows
+        ]
+
+
+def plan_experiment(conn, experiment_id: str) -> list[SessionPlan]:
+    """Plans of the experiment's sessions, in session start order."""
+    with _PLAN.time():
+        return _plan_experiment(conn, experiment_id)
+
+
+def _plan_experiment(conn, experiment_id: str) -> list[SessionPlan]:
+    sessions = storage.get_session_info_for_experiment(conn, experiment_id)
+    plans = {session["session_id"]: SessionPlan(session) for session in sessions}
+    for session_id, rows in groupby(
+        storage.iter_experiment_object_links(conn, experiment_id), key=itemgetter(0)
+    ):
+        plan = plans.get(session_id)
+        if plan is None:
+            # Session added to the experiment after the sessions were read
+            continue
+        rows = list(rows)
+        plan.object_ids = [row[1] for row in rows]
+        plan.start_us = np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows))
+        plan.end_us = np.fromiter((row[3] for row in rows), dtype=np.int64, count=len(rows))
+    for session_id, rows in groupby(
+        storage.iter_experiment_events(conn, experiment_id), key=itemgetter(0)
+    ):
+        plan = plans.get(session_id)
+        if plan is not None:
+            plan.event_rows = [row[1:] for row in rows]
+    return list(plans.values())
@@ -1,54 +1,283 @@
 import os
 import uuid
-from concurrent.futures import ThreadPoolExecutor
-from flask import Flask, jsonify, request, send_from_directory
-from . import config
-from .worker import run_bids_export_task
+from datetime import UTC, datetime
+
+import numpy as np
+from flask import Flask, Response, jsonify, request, send_from_directory
+from minio.error import S3Error
+from neuro_common import db, log, metrics, object_store, profiler
+
+from . import archive, config, sample_query, storage, task_store
+from .scheduler import ExportScheduler
+from .worker import CH_NAMES, SFREQ, dataset_for
 
 # --- App Initialization ---
 app = Flask(__name__)
-executor = ThreadPoolExecutor(max_workers=2)
-# In a real-world scenario, you would use Redis or a DB for this
-export_tasks = {}
+# Created at startup (not at import) so spawned export workers don't build their own pool
+export_scheduler: ExportScheduler | None = None
+
 
 # --- API Endpoints ---
 @app.route("/api/v1/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "ok"})
 
+
+@app.route("/api/v1/metrics/pools", methods=["GET"])
+def pool_metrics():
+    """Connection pool usage of the API process (export workers keep their own pools)."""
+    return jsonify(storage.pool_metrics())
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Prometheus metrics: per-stage latency histograms (export planning, MinIO
+    reads, BIDS writing, archiving, ...) including those of the export
+    workers, session queue lag, exported samples and sessions, worker and
+    pool usage.
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/debug/profile", methods=["GET"])
+def profile():
+    """Samples the API process's threads for ?seconds= (default 10) and returns collapsed stacks."""
+    if not config.PROFILER_ENABLED:
+        return jsonify({"error": "The profiler is disabled (PROFILER_ENABLED=false)."}), 404
+    try:
+        seconds = float(request.args.get("seconds", "10"))
+        interval = float(request.args.get("interval_ms", "5")) / 1000
+        return Response(profiler.profile(seconds, interval), mimetype="text/plain")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
+
 @app.route("/api/v1/experiments/<experiment_id>/export", methods=["POST"])
 def start_export(experiment_id: str):
     """Starts a new BIDS export task in the background."""
     task_id = str(uuid.uuid4())
-    export_tasks[task_id] = {"status": "pending", "message": "Task is queued."}
-    executor.submit(run_bids_export_task, task_id, experiment_id, export_tasks)
-    
-    return jsonify({
-        "status": "accepted",
-        "task_id": task_id,
-        "message": "BIDS export task has been started."
-    }), 202
+    export_scheduler.submit(task_id, experiment_id)
+
+    return jsonify(
+        {"status": "accepted", "task_id": task_id, "message": "BIDS export task has been started."}
+    ), 202
+
 
 @app.route("/api/v1/export-tasks/<task_id>", methods=["GET"])
 def get_export_status(task_id: str):
     """Retrieves the status of an export task."""
-    task = export_tasks.get(task_id)
+    task = task_store.get_task(task_id)
     if not task:
         return jsonify({"error": "Task ID not found."}), 404
     return jsonify(task)
 
+
+def _stream_object(minio_client, object_name: str):
+    with storage.open_object_stream(minio_client, object_name) as response:
+        yield from response.stream(archive.READ_CHUNK)
+
+
+@app.route("/api/v1/export-tasks/<task_id>/download", methods=["GET"])
+def download_export(task_id: str):
+    """Downloads the ZIP of a completed task from wherever EXPORT_ARCHIVE_TARGET put it."""
+    task = task_store.get_task(task_id)
+    if not task:
+        return jsonify({"error": "Task ID not found."}), 404
+    if task["status"] != "completed":
+        return jsonify({"error": "Export is not completed yet.", "status": task["status"]}), 409
+    filename = task["result_file"]
+    if config.EXPORT_ARCHIVE_TARGET == "file":
+        return send_from_directory(config.BIDS_OUTPUT_DIR, filename, as_attachment=True)
+
+    if config.EXPORT_ARCHIVE_TARGET == "minio":
+        minio_client = storage.get_minio_client()
+        object_name = config.EXPORT_ARCHIVE_PREFIX + filename
+        try:
+            minio_client.stat_object(config.MINIO_BUCKET, object_name)
+        except S3Error:
+            return jsonify({"error": "Archive not found."}), 404
+        body = _stream_object(minio_client, object_name)
+    else:
+        # Built from the session cache while it is sent; nothing is written locally
+        try:
+            dataset = dataset_for(task_store.get_session_keys(task_id))
+        except FileNotFoundError:
+            return jsonify(
+                {"error": "Session outputs were evicted from the cache; export again."}
+            ), 410
+        body = archive.iter_zip(dataset)
+    return Response(
+        body,
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _parse_time(value: str | None) -> datetime:
+    """ISO 8601; a time without an offset is taken as UTC."""
+    if not value:
+        raise ValueError("start and end are required.")
+    t = datetime.fromisoformat(value)
+    return t if t.tzinfo else t.replace(tzinfo=UTC)
+
+
+def _parse_channels(value: str | None) -> list[int]:
+    """Comma-separated channel names or indices; all channels by default."""
+    if not value:
+        return list(range(len(CH_NAMES)))
+    channels = []
+    for name in value.split(","):
+        name = name.strip()
+        if name.isdigit() and int(name) < len(CH_NAMES):
+            channels.append(int(name))
+        elif name in CH_NAMES:
+            channels.append(CH_NAMES.index(name))
+        else:
+            raise ValueError(f"Unknown channel: {name}")
+    return channels
+
+
+@app.route("/api/v1/samples", methods=["GET"])
+def query_samples():
+    """
+    Raw EEG samples of a user between start and end, optionally of one device
+    and a subset of channels. By default the response is a stream of packed
+    little-endian records (int64 time_us, uint16 ADC value per channel; see
+    X-Record-Format); format=json returns the same samples as arrays.
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id is required."}), 400
+    try:
+        start = _parse_time(request.args.get("start"))
+        end = _parse_time(request.args.get("end"))
+        channels = _parse_channels(request.args.get("channels"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if end <= start:
+        return jsonify({"error": "end must be after start."}), 400
+    if (end - start).total_seconds() > config.SAMPLE_QUERY_MAX_RANGE_SEC:
+        return jsonify(
+            {"error": f"The range is limited to {config.SAMPLE_QUERY_MAX_RANGE_SEC} seconds."}
+        ), 400
+
+    with storage.get_db_connection() as conn:
+        objects_meta = sample_query.find_objects(
+            conn, user_id, request.args.get("device_id"), start, end
+        )
+    blocks = sample_query.iter_samples(storage.get_minio_client(), objects_meta, start, end)
+    channel_names = [CH_NAMES[c] for c in channels]
+
+    if request.args.get("format") == "json":
+        time_us, eeg = [], []
+        num_samples = 0
+        for block in blocks:
+            num_samples += len(block)
+            if num_samples > config.SAMPLE_QUERY_MAX_JSON_SAMPLES:
+                blocks.close()
+                return jsonify(
+                    {
+                        "error": f"More than {config.SAMPLE_QUERY_MAX_JSON_SAMPLES} samples; use "
+                        "the binary format."
+                    }
+                ), 413
+            time_us.append(block.time_us)
+            eeg.append(block.eeg[:, channels])
+        return jsonify(
+            {
+                "channels": channel_names,
+                "sfreq": SFREQ,
+                "time_us": np.concatenate(time_us).tolist() if time_us else [],
+                "eeg": np.concatenate(eeg).tolist() if eeg else [],
+            }
+        )
+
+    dtype = sample_query.records_dtype(len(channels))
+    return Response(
+        (block.to_records(channels).tobytes() for block in blocks),
+        mimetype="application/octet-stream",
+        headers={
+            "X-Record-Format": f"time_us:<i8,eeg:<u2[{len(channels)}]",
+            "X-Record-Size": str(dtype.itemsize),
+            "X-Channels": ",".join(channel_names),
+            "X-Sampling-Frequency": str(SFREQ),
+        },
+    )
+
+
+@app.route("/api/v1/samples/summary", methods=["GET"])
+def query_sample_summary():
+    """
+    Per-channel min/max/mean bins of a user's EEG between start and end for
+    an overview plot width pixels wide (default 1000), optionally of one
+    device and a subset of channels.
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id is required."}), 400
+    try:
+        start = _parse_time(request.args.get("start"))
+        end = _parse_time(request.args.get("end"))
+        channels = _parse_channels(request.args.get("channels"))
+        width = int(request.args.get("width", "1000"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if end <= start:
+        return jsonify({"error": "end must be after start."}), 400
+    if not 1 <= width <= config.SAMPLE_SUMMARY_MAX_WIDTH:
+        return jsonify(
+            {"error": f"width must be between 1 and {config.SAMPLE_SUMMARY_MAX_WIDTH}."}
+        ), 400
+
+    with storage.get_db_connection() as conn:
+        objects_meta = sample_query.find_objects(
+            conn, user_id, request.args.get("device_id"), start, end
+        )
+    try:
+        level, bins = sample_query.query_summary(
+            storage.get_minio_client(), objects_meta, start, end, width
+        )
+    except sample_query.TooManyObjects as e:
+        return jsonify({"error": str(e)}), 413
+    return jsonify(
+        {
+            "channels": [CH_NAMES[c] for c in channels],
+            # None: computed from the samples because the span is too short for the finest
+            # precomputed level
+            "level_sec": level,
+            "bin_us": bins.bin_us,
+            "bin_start_us": bins.start_us.tolist(),
+            "count": bins.count.tolist(),
+            "min": bins.min[:, channels].tolist(),
+            "max": bins.max[:, channels].tolist(),
+            "mean": np.round(bins.mean[:, channels].astype(np.float64), 2).tolist(),
+        }
+    )
+
+
 @app.route("/api/v1/downloads/<path:filename>", methods=["GET"])
 def download_file(filename: str):
     """Downloads a completed BIDS zip file."""
-    return send_from_directory(
-        config.BIDS_OUTPUT_DIR, 
-        filename, 
-        as_attachment=True
-    )
+    return send_from_directory(config.BIDS_OUTPUT_DIR, filename, as_attachment=True)
+
 
 # --- Main Execution ---
 if __name__ == "__main__":
     if not os.path.exists(config.BIDS_OUTPUT_DIR):
         os.makedirs(config.BIDS_OUTPUT_DIR)
-    
-    app.run(host="0.0.0.0", port=config.PORT)
\ No newline at end of file
+
+    log.configure(config.LOG_LEVEL, config.LOG_RATE_LIMIT_SEC)
+    export_scheduler = ExportScheduler(
+        config.EXPORT_PROCESS_WORKERS, config.EXPORT_MAX_SESSIONS_PER_TASK
+    )
+    metrics.register_collector(metrics.dict_collector("neuro_export", export_scheduler.get_metrics))
+    metrics.register_collector(metrics.dict_collector("neuro_db_pool", db.metrics, "pool"))
+    metrics.register_collector(
+        metrics.dict_collector("neuro_minio_pool", object_store.metrics, "client")
+    )
+    # Pick up exports interrupted by the previous shutdown
+    export_scheduler.resume()
+    app.run(host="0.0.0.0", port=config.PORT)
@@ -0,0 +1,275 @@
+"""
+Time-range queries for raw EEG samples of one user (optionally one device).
+
+The objects overlapping the range are found through idx_raw_data_user_time;
+the lower bound on start_time (SAMPLE_QUERY_MAX_OBJECT_SEC before the range)
+keeps the lookup an index range scan. Packet objects are small and fetched
+whole. Compacted objects (neuro_common.chunk) are read like a seekable zstd
+file: their header and chunk index come from one ranged GET and are cached,
+since compacted objects are never modified, and only the chunks that overlap
+the range are fetched, with one more ranged GET, and decoded.
+
+Objects are fetched on the exporter's shared I/O pool, a few ahead of the one
+being returned, and every object's samples are cut to the range, so a client
+can consume the result as a stream of blocks.
+
+For overview plots, query_summary() returns per-channel min/max/mean bins
+instead of samples. The level is the coarsest one of SAMPLE_SUMMARY_LEVELS_SEC
+that still gives at least one bin per pixel; compacted objects carry every
+level as a section (see the processor's compactor), so a whole session costs
+one small ranged GET per object. Objects without it (packets not yet
+compacted) and spans too short for the finest level are summarized from the
+samples; a query that would read more than SAMPLE_SUMMARY_MAX_RAW_OBJECTS of
+them is refused with TooManyObjects before anything is fetched.
+"""
+
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from itertools import islice
+
+import numpy as np
+import zstandard
+from neuro_common import chunk, codec, log, packet, summary
+
+from . import config, storage
+from .session_reader import NUM_EEG_CHANNELS, get_io_pool, to_us
+
+logger = log.get_logger("bids-exporter.sample_query")
+
+
+class SampleBlock:
+    """
+    Samples of one object within the queried range: time_us (n,) int64 and eeg
+    (n, channels) uint16.
+    """
+
+    def __init__(self, time_us: np.ndarray, eeg: np.ndarray):
+        self.time_us = time_us
+        self.eeg = eeg
+
+    def __len__(self) -> int:
+        return len(self.time_us)
+
+    def to_records(self, channels: list[int]) -> np.ndarray:
+        """The block as records_dtype(len(channels)), ready to be written out."""
+        records = np.empty(len(self), dtype=records_dtype(len(channels)))
+        records["time_us"] = self.time_us
+        records["eeg"] = self.eeg[:, channels]
+        return records
+
+
+def records_dtype(num_channels: int) -> np.dtype:
+    """Layout of the binary response: per sample, the timestamp and the selected channels."""
+    return np.dtype([("time_us", "<i8"), ("eeg", "<u2", (num_channels,))])
+
+
+def find_objects(
+    conn, user_id: str, device_id: str | None, start: datetime, end: datetime
+) -> list[dict]:
+    """EEG objects of the user (and device) overlapping [start, end], in time order."""
+    # No object starts earlier than this and still reaches start; bounds the index scan from below
+    earliest = start - timedelta(seconds=config.SAMPLE_QUERY_MAX_OBJECT_SEC)
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT object_id, device_id, start_time, end_time
+            FROM raw_data_objects
+            WHERE user_id = %(user_id)s
+              AND start_time <= %(end)s
+              AND start_time >= %(earliest)s
+              AND end_time >= %(start)s
+              AND data_type = 'eeg'
+              AND (%(device_id)s::text IS NULL OR device_id = %(device_id)s)
+            ORDER BY start_time ASC
+            """,
+            {
+                "user_id": user_id,
+                "device_id": device_id,
+                "start": start,
+                "end": end,
+                "earliest": earliest,
+            },
+        )
+        return cur.fetchall()
+
+
+# --- Chunk headers of compacted objects (immutable, so cached by object key) ---
+
+_headers: OrderedDict[str, chunk.ChunkHeader] = OrderedDict()
+_headers_lock = threading.Lock()
+
+
+def _read_at(minio_client, object_key: str):
+    return lambda offset, length: storage.download_object_range(
+        minio_client, object_key, offset, length
+    )
+
+
+def get_chunk_header(minio_client, object_key: str) -> chunk.ChunkHeader:
+    with _headers_lock:
+        header = _headers.get(object_key)
+        if header is not None:
+            _headers.move_to_end(object_key)
+            return header
+    header = chunk.read_header(_read_at(minio_client, object_key))
+    with _headers_lock:
+        _headers[object_key] = header
+        while len(_headers) > config.SAMPLE_QUERY_HEADER_CACHE_SIZE:
+            _headers.popitem(last=False)
+    return header
+
+
+def _cut(time_us: np.ndarray, eeg: np.ndarray, start_us: int, end_us: int) -> SampleBlock:
+    lo = int(np.searchsorted(time_us, start_us, side="left"))
+    hi = int(np.searchsorted(time_us, end_us, side="right"))
+    return SampleBlock(time_us[lo:hi], np.ascontiguousarray(eeg[lo:hi]))
+
+
+def _empty_block() -> SampleBlock:
+    return SampleBlock(
+        np.empty(0, dtype=np.int64), np.empty((0, NUM_EEG_CHANNELS), dtype=np.uint16)
+    )
+
+
+def read_chunked_object(minio_client, meta: dict, start_us: int, end_us: int) -> SampleBlock:
+    header = get_chunk_header(minio_client, meta["object_id"])
+    first, last = header.chunk_range(start_us, end_us)
+    offset, length = header.byte_range(first, last)
+    if length == 0:
+        return _empty_block()
+    data = storage.download_object_range(minio_client, meta["object_id"], offset, length)
+    columns = header.decode_chunks(data, first, last, ["eeg"])
+    return _cut(columns[chunk.TIME_COLUMN], columns["eeg"], start_us, end_us)
+
+
+def read_packet_object(minio_client, meta: dict, start_us: int, end_us: int) -> SampleBlock:
+    """
+    A packet object stores only its first sample's time (start_time); the
+    others follow from the device clock (esp_micros), as in the processor.
+    A corrupt or truncated object is skipped rather than breaking a response
+    that is already streaming.
+    """
+    data = storage.download_object_from_minio(minio_client, meta["object_id"])
+    try:
+        decoded = packet.decode(codec.decompress(data))
+    except (packet.PacketError, zstandard.ZstdError) as e:
+        logger.warning(
+            "skipping malformed packet object", object_id=meta["object_id"], error=str(e)
+        )
+        return _empty_block()
+    esp_micros = decoded.esp_micros.astype(np.int64)
+    time_us = to_us(meta["start_time"]) + (esp_micros - esp_micros[:1]) % (1 << 32)
+    return _cut(time_us, decoded.eeg, start_us, end_us)
+
+
+def read_object(minio_client, meta: dict, start_us: int, end_us: int) -> SampleBlock:
+    if chunk.is_chunk_object(meta["object_id"]):
+        return read_chunked_object(minio_client, meta, start_us, end_us)
+    return read_packet_object(minio_client, meta, start_us, end_us)
+
+
+def _iter_objects(read, minio_client, objects_meta: list[dict], *args) -> Iterator:
+    """
+    Yields read(minio_client, meta, *args) for each object in order, fetching
+    ahead on the I/O pool.
+    """
+    executor = get_io_pool()
+    metas = iter(objects_meta)
+    pending = deque(
+        executor.submit(read, minio_client, meta, *args)
+        for meta in islice(metas, config.EXPORT_FETCH_CONCURRENCY)
+    )
+    try:
+        while pending:
+            result = pending.popleft().result()
+            next_meta = next(metas, None)
+            if next_meta is not None:
+                pending.append(executor.submit(read, minio_client, next_meta, *args))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_samples(
+    minio_client, objects_meta: list[dict], start: datetime, end: datetime
+) -> Iterator[SampleBlock]:
+    """
+    Yields each object's samples within [start, end] in the order of
+    objects_meta, fetching ahead.
+    """
+    for block in _iter_objects(read_object, minio_client, objects_meta, to_us(start), to_us(end)):
+        if len(block):
+            yield block
+
+
+# --- Summaries ---
+
+
+class TooManyObjects(Exception):
+    """A summary query would read more objects sample by sample than allowed."""
+
+    def __init__(self, count: int, limit: int):
+        super().__init__(
+            f"{count} objects would be summarized from their samples (at most {limit}); "
+            "narrow the range."
+        )
+        self.count = count
+        self.limit = limit
+
+
+def choose_level(span_sec: float, width: int, levels: list[int]) -> int | None:
+    """
+    The coarsest level with at least one bin per pixel, or None if the finest is
+    already too coarse.
+    """
+    seconds_per_pixel = span_sec / max(width, 1)
+    fitting = [level for level in levels if level <= seconds_per_pixel]
+    return max(fitting) if fitting else None
+
+
+def read_object_summary(
+    minio_client, meta: dict, level: int | None, bin_us: int, start_us: int, end_us: int
+):
+    if level is not None and chunk.is_chunk_object(meta["object_id"]):
+        header = get_chunk_header(minio_client, meta["object_id"])
+        section = header.section_range(summary.section_name(level))
+        if section is not None:
+            data = storage.download_object_range(minio_client, meta["object_id"], *section)
+            return summary.decode(data).cut(start_us, end_us)
+    # Whole bins, so edge bins match the precomputed ones of neighbouring objects
+    block = read_object(
+        minio_client, meta, start_us // bin_us * bin_us, (end_us // bin_us + 1) * bin_us - 1
+    )
+    return summary.summarize(block.time_us, block.eeg, bin_us)
+
+
+def query_summary(
+    minio_client, objects_meta: list[dict], start: datetime, end: datetime, width: int
+) -> tuple[int | None, summary.Summary]:
+    """
+    Min/max/mean bins of [start, end] for a plot width pixels wide. Returns the
+    precomputed level used (None if the bins were computed from samples, one
+    per pixel) and the bins of all objects combined. Raises TooManyObjects if
+    more than SAMPLE_SUMMARY_MAX_RAW_OBJECTS objects lack a precomputed level.
+    """
+    start_us, end_us = to_us(start), to_us(end)
+    level = choose_level((end_us - start_us) / 1e6, width, config.SAMPLE_SUMMARY_LEVELS_SEC)
+    raw_objects = sum(
+        level is None or not chunk.is_chunk_object(meta["object_id"]) for meta in objects_meta
+    )
+    if raw_objects > config.SAMPLE_SUMMARY_MAX_RAW_OBJECTS:
+        raise TooManyObjects(raw_objects, config.SAMPLE_SUMMARY_MAX_RAW_OBJECTS)
+    bin_us = (
+        level * 1_000_000 if level is not None else max((end_us - start_us) // max(width, 1), 1)
+    )
+    parts = list(
+        _iter_objects(
+            read_object_summary, minio_client, objects_meta, level, bin_us, start_us, end_us
+        )
+    )
+    if not any(len(part) for part in parts):
+        return level, summary.empty(bin_us, NUM_EEG_CHANNELS)
+    return level, summary.combine(parts)
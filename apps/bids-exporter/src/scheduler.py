@@ -0,0 +1,258 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from neuro_common import log, metrics
+
+from . import config, export_cache, export_plan, storage, task_store
+from .worker import (
+    SESSIONS_TOTAL,
+    discard_export,
+    export_session_job,
+    finalize_export_job,
+    init_worker_process,
+)
+
+logger = log.get_logger("bids-exporter.scheduler")
+_QUEUE_LAG = metrics.QUEUE_LAG_SECONDS.labels("export_sessions")
+
+
+class ExportTask:
+    def __init__(self, task_id: str, experiment_id: str):
+        self.task_id = task_id
+        self.experiment_id = experiment_id
+        self.pending: deque[tuple[int, export_plan.SessionPlan]] = deque()
+        # Cache key of each finished session, in session order
+        self.session_keys: list[str | None] = []
+        self.total = 0
+        self.finished = 0
+        self.running = 0
+        self.error: str | None = None
+        # When the sessions were planned, for the time they wait for a worker
+        self.planned_at = 0.0
+
+
+class ExportScheduler:
+    """
+    Runs export tasks on a shared pool of worker processes, one session per job.
+
+    Sessions of every active task are interleaved round-robin, so a large
+    experiment cannot starve one submitted after it, and each task runs at most
+    EXPORT_MAX_SESSIONS_PER_TASK sessions at once. Every session is written to
+    its own BIDS root in the output cache (export_cache) so sessions can run in
+    parallel and later exports can reuse them; when the last one is done, a
+    finalize job merges the roots and zips the dataset.
+
+    Status, progress and every finished session are persisted with task_store,
+    so resume() can pick up tasks interrupted by a restart where they stopped.
+    The timings the workers record reach this process's /metrics through
+    prometheus_client's multiprocess mode (see neuro_common.metrics).
+    """
+
+    def __init__(
+        self, max_workers: int, max_sessions_per_task: int, initializer=init_worker_process
+    ):
+        self._max_workers = max_workers
+        self._max_sessions_per_task = max_sessions_per_task or max_workers
+        # "spawn" keeps the Flask process's threads and sockets out of the workers
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+        )
+        # Planning streams each task's sessions, object links and events from the database
+        self._planner = ThreadPoolExecutor(max_workers=2, thread_name_prefix="export-plan")
+        self._tasks: deque[ExportTask] = deque()
+        # Every task from planning until its zip is written; their cache entries must not be evicted
+        self._active: dict[str, ExportTask] = {}
+        self._busy = 0
+        # Re-entrant: a future that fails immediately runs its callback inside _fill
+        self._lock = threading.RLock()
+
+    def submit(self, task_id: str, experiment_id: str):
+        task_store.create_task(task_id, experiment_id)
+        self._planner.submit(self._plan, ExportTask(task_id, experiment_id))
+
+    def resume(self):
+        """
+        Re-plans the tasks that were pending or running when the service stopped.
+        Call once at startup.
+        """
+        # No job is running yet, so leftovers of interrupted session builds can go
+        export_cache.remove_incomplete()
+        for row in task_store.get_unfinished_tasks():
+            print(f"Resuming BIDS export task {row['task_id']}")
+            self._planner.submit(self._plan, ExportTask(row["task_id"], row["experiment_id"]))
+
+    def _plan(self, task: ExportTask):
+        with self._lock:
+            self._active[task.task_id] = task
+        try:
+            with storage.get_db_connection() as conn:
+                plans = export_plan.plan_experiment(conn, task.experiment_id)
+            if not plans:
+                raise ValueError(f"No sessions found for experiment ID: {task.experiment_id}")
+            task_store.add_task_sessions(task.task_id, [plan.session for plan in plans])
+            finished = task_store.get_finished_sessions(task.task_id)
+            task.total = len(plans)
+            task.session_keys = [None] * task.total
+            task.planned_at = time.monotonic()
+            for index, plan in enumerate(plans):
+                key = finished.get(plan.session_id)
+                if key is not None and export_cache.lookup(key) is not None:
+                    # Finished before a restart
+                    task.session_keys[index] = key
+                    task.finished += 1
+                else:
+                    task.pending.append((index, plan))
+            task_store.update_task(
+                task.task_id,
+                status="running",
+                progress=self._progress(task),
+                message=f"Processing {task.finished}/{task.total} sessions",
+            )
+        except Exception as e:
+            self._fail(task, e)
+            return
+        if not task.pending:
+            self._finish(task)
+            return
+        with self._lock:
+            self._tasks.append(task)
+            self._fill()
+
+    @staticmethod
+    def _progress(task: ExportTask) -> int:
+        return int(task.finished / task.total * 95)
+
+    def _fill(self):
+        """
+        Hands free worker slots to sessions, round-robin over tasks. The caller must
+        hold _lock.
+        """
+        while self._busy < self._max_workers:
+            task = self._next_task()
+            if task is None:
+                return
+            index, plan = task.pending.popleft()
+            task.running += 1
+            self._busy += 1
+            _QUEUE_LAG.observe(time.monotonic() - task.planned_at)
+            future = self._pool.submit(export_session_job, plan)
+            future.add_done_callback(
+                lambda f, t=task, i=index, p=plan: self._on_session_done(t, i, p, f)
+            )
+
+    def _next_task(self) -> ExportTask | None:
+        for _ in range(len(self._tasks)):
+            task = self._tasks[0]
+            self._tasks.rotate(-1)
+            if task.pending and task.running < self._max_sessions_per_task:
+                return task
+        return None
+
+    def _on_session_done(
+        self, task: ExportTask, index: int, plan: export_plan.SessionPlan, future: Future
+    ):
+        key = None
+        with self._lock:
+            self._busy -= 1
+            task.running -= 1
+            task.finished += 1
+            try:
+                key = future.result()
+                task.session_keys[index] = key
+            except Exception as e:
+                SESSIONS_TOTAL.labels("failed").inc()
+                if task.error is None:
+                    task.error = str(e)
+                # Stop scheduling the rest of a failed task
+                task.pending.clear()
+            done = not task.pending and task.running == 0
+            if done:
+                self._tasks.remove(task)
+            self._fill()
+        if key is not None:
+            # Recorded even if the task has failed meanwhile: the session's output is in the cache
+            try:
+                task_store.mark_session_finished(
+                    task.task_id,
+                    plan.session_id,
+                    key,
+                    self._progress(task),
+                    f"Processing {task.finished}/{task.total} sessions",
+                )
+            except Exception as e:
+                logger.warning(
+                    "could not record export progress", task_id=task.task_id, error=str(e)
+                )
+        if done:
+            self._finish(task)
+
+    def _finish(self, task: ExportTask):
+        if task.error is not None:
+            self._fail(task, task.error)
+            return
+        try:
+            task_store.update_task(task.task_id, progress=95, message="Compressing dataset...")
+        except Exception as e:
+            self._fail(task, e)
+            return
+        with self._lock:
+            # Zipping occupies a worker like a session does
+            self._busy += 1
+        future = self._pool.submit(
+            finalize_export_job, task.experiment_id, task.task_id, task.session_keys
+        )
+        future.add_done_callback(lambda f, t=task: self._on_finalized(t, f))
+
+    def _on_finalized(self, task: ExportTask, future: Future):
+        with self._lock:
+            self._busy -= 1
+            self._fill()
+        try:
+            zip_filename = future.result()
+            task_store.update_task(
+                task.task_id,
+                status="completed",
+                progress=100,
+                message="Export completed successfully.",
+                result_file=zip_filename,
+            )
+        except Exception as e:
+            self._fail(task, e)
+            return
+        self._release(task)
+
+    def _fail(self, task: ExportTask, error):
+        print(f"Error in BIDS export task {task.task_id}: {error}")
+        try:
+            task_store.update_task(task.task_id, status="failed", message=str(error))
+        except Exception as e:
+            print(f"Error recording the failure of BIDS export task {task.task_id}: {e}")
+        self._planner.submit(discard_export, task.task_id)
+        self._release(task)
+
+    def _release(self, task: ExportTask):
+        """Forgets a task that is done and trims the output cache back to its size limit."""
+        with self._lock:
+            self._active.pop(task.task_id, None)
+            keep = {key for t in self._active.values() for key in t.session_keys if key is not None}
+        self._planner.submit(export_cache.prune, config.EXPORT_CACHE_MAX_BYTES, keep)
+
+    def get_metrics(self) -> dict:
+        """Worker slots in use and the sessions of all active tasks by state."""
+        with self._lock:
+            return {
+                "busy_workers": self._busy,
+                "max_workers": self._max_workers,
+                "active_tasks": len(self._active),
+                "pending_sessions": sum(len(t.pending) for t in self._tasks),
+                "running_sessions": sum(t.running for t in self._tasks),
+            }
+
+    def shutdown(self):
+        self._planner.shutdown(wait=False, cancel_futures=True)
+        self._pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,246 @@
+"""
+Streaming reader that turns a session's raw data objects into one EEG array.
+
+Objects are fetched in time order by the process's shared I/O thread pool,
+with at most EXPORT_FETCH_CONCURRENCY objects of a session in flight. Each
+object is decompressed frame by frame straight from the MinIO response and
+only its EEG samples are kept, appended to a preallocated output array sized
+from the object metadata. Peak
+memory is therefore about one session of uint16 EEG samples plus a few objects,
+instead of every compressed object, their decompressed bytes and the parsed
+records at the same time. In out-of-core mode the samples go to a BrainVision
+file on disk instead, so memory no longer depends on the session length.
+
+Objects written by the processor's compactor hold up to a whole time bucket
+in the chunked layout of neuro_common.chunk. Only the chunks overlapping the
+session are fetched, with one ranged GET for the chunk index and one for the
+chunks, and the samples are cut to the session's start and end times.
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from itertools import islice
+
+import numpy as np
+from neuro_common import chunk, codec, log, metrics, packet
+
+from . import config, storage
+from .brainvision import BrainVisionWriter
+
+logger = log.get_logger("bids-exporter.session_reader")
+# Download and frame-by-frame decompression of a packet object, which overlap
+_STREAM_OBJECT = metrics.STAGE_SECONDS.labels("minio_stream_decode")
+_SAMPLES = metrics.SAMPLES_TOTAL.labels("export")
+
+NUM_EEG_CHANNELS = packet.NUM_EEG_CHANNELS
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+# (start, end) of a session; compacted objects are cut to it. Either bound may be None.
+Window = tuple[datetime | None, datetime | None]
+
+
+class SampleArray:
+    """Append-only (n, channels) uint16 array with amortized growth."""
+
+    def __init__(self, capacity: int, num_channels: int = NUM_EEG_CHANNELS):
+        self._data = np.empty((max(capacity, 1), num_channels), dtype=np.uint16)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, samples: np.ndarray):
+        end = self._size + len(samples)
+        if end > len(self._data):
+            grown = np.empty(
+                (max(end, int(len(self._data) * 1.5)), self._data.shape[1]), dtype=np.uint16
+            )
+            grown[: self._size] = self._data[: self._size]
+            self._data = grown
+        self._data[self._size : end] = samples
+        self._size = end
+
+    def view(self) -> np.ndarray:
+        return self._data[: self._size]
+
+
+def _utc(t: datetime | None) -> datetime | None:
+    # Naive timestamps from the database are UTC, as the exporter assumes for meas_date
+    return t.replace(tzinfo=UTC) if t is not None and t.tzinfo is None else t
+
+
+def session_window(session: dict) -> Window:
+    return _utc(session["start_time"]), _utc(session.get("end_time"))
+
+
+def to_us(t: datetime | None) -> int | None:
+    return None if t is None else (_utc(t) - EPOCH) // timedelta(microseconds=1)
+
+
+def decode_chunked_object_eeg(
+    minio_client, object_key: str, window: Window | None = None
+) -> np.ndarray:
+    """
+    Reads the chunks of a compacted object that overlap window; returns their
+    EEG samples within it.
+    """
+    header = chunk.read_header(
+        lambda offset, length: storage.download_object_range(
+            minio_client, object_key, offset, length
+        )
+    )
+    start_us, end_us = (to_us(t) for t in window) if window else (None, None)
+    first, last = header.chunk_range(start_us, end_us)
+    offset, length = header.byte_range(first, last)
+    if length == 0:
+        return np.empty((0, NUM_EEG_CHANNELS), dtype=np.uint16)
+    data = storage.download_object_range(minio_client, object_key, offset, length)
+    columns = header.decode_chunks(data, first, last, ["eeg"])
+    times = columns[chunk.TIME_COLUMN]
+    lo = 0 if start_us is None else int(np.searchsorted(times, start_us, side="left"))
+    hi = len(times) if end_us is None else int(np.searchsorted(times, end_us, side="right"))
+    return np.ascontiguousarray(columns["eeg"][lo:hi])
+
+
+def decode_object_eeg(minio_client, object_key: str, window: Window | None = None) -> np.ndarray:
+    """
+    Streams one object from MinIO and returns its EEG samples as (n, channels) uint16.
+    Packet objects are returned whole; compacted objects are cut to window.
+    """
+    if chunk.is_chunk_object(object_key):
+        return decode_chunked_object_eeg(minio_client, object_key, window)
+    parts = []
+    decoder = packet.StreamDecoder()
+    try:
+        with (
+            _STREAM_OBJECT.time(),
+            storage.open_object_stream(minio_client, object_key) as response,
+        ):
+            for piece in codec.stream_decompress(response):
+                # Views into the decompressed piece; a record split across pieces is completed by
+                # the next one
+                for records in decoder.feed(piece):
+                    parts.append(records["eeg"])
+        decoder.close()
+    except packet.PacketError as e:
+        logger.warning("skipping malformed packet object", object_id=object_key, error=str(e))
+        return np.empty((0, NUM_EEG_CHANNELS), dtype=np.uint16)
+    if not parts:
+        return np.empty((0, NUM_EEG_CHANNELS), dtype=np.uint16)
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def estimate_num_samples(
+    objects_meta: list[dict], sfreq: float, window: Window | None = None
+) -> int:
+    """Expected sample count from each object's first/last sample timestamps."""
+    total = 0
+    for meta in objects_meta:
+        start, end = _utc(meta["start_time"]), _utc(meta["end_time"])
+        if window and chunk.is_chunk_object(meta["object_id"]):
+            # A compacted object covers a whole bucket; only the part within the session is read
+            if window[0] is not None:
+                start = max(start, window[0])
+            if window[1] is not None:
+                end = min(end, window[1])
+            if end < start:
+                continue
+        total += int(round((end - start).total_seconds() * sfreq)) + 1
+    return total
+
+
+_io_pool: ThreadPoolExecutor | None = None
+_io_pool_lock = threading.Lock()
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    """
+    The process-wide thread pool for MinIO downloads, shared by every session
+    this process exports.
+    """
+    global _io_pool
+    if _io_pool is None:
+        with _io_pool_lock:
+            if _io_pool is None:
+                _io_pool = ThreadPoolExecutor(
+                    max_workers=config.EXPORT_IO_WORKERS, thread_name_prefix="export-io"
+                )
+    return _io_pool
+
+
+def iter_session_eeg(
+    minio_client,
+    objects_meta: list[dict],
+    max_in_flight: int | None = None,
+    window: Window | None = None,
+):
+    """
+    Yields each object's EEG samples as (n, channels) uint16, in the order of
+    objects_meta, while the next objects are already being fetched.
+    """
+    max_in_flight = max_in_flight or config.EXPORT_FETCH_CONCURRENCY
+    executor = get_io_pool()
+    object_keys = (meta["object_id"] for meta in objects_meta)
+    pending = deque(
+        executor.submit(decode_object_eeg, minio_client, key, window)
+        for key in islice(object_keys, max_in_flight)
+    )
+    try:
+        while pending:
+            eeg = pending.popleft().result()
+            # Keep the window full: one object leaves, the next one starts downloading
+            next_key = next(object_keys, None)
+            if next_key is not None:
+                pending.append(executor.submit(decode_object_eeg, minio_client, next_key, window))
+            _SAMPLES.inc(len(eeg))
+            yield eeg
+    finally:
+        # The pool outlives this session, so drop anything still queued for it
+        for future in pending:
+            future.cancel()
+
+
+def load_session_eeg(
+    minio_client,
+    objects_meta: list[dict],
+    sfreq: float,
+    max_in_flight: int | None = None,
+    window: Window | None = None,
+) -> np.ndarray:
+    """
+    Fetches and decodes a session's objects (already in time order) and
+    returns the concatenated EEG samples as (n, channels) uint16.
+    """
+    samples = SampleArray(estimate_num_samples(objects_meta, sfreq, window))
+    for eeg in iter_session_eeg(minio_client, objects_meta, max_in_flight, window):
+        samples.append(eeg)
+    return samples.view()
+
+
+def write_session_brainvision(
+    minio_client,
+    objects_meta: list[dict],
+    writer: BrainVisionWriter,
+    max_in_flight: int | None = None,
+    window: Window | None = None,
+) -> int:
+    """
+    Streams a session's EEG samples into a BrainVision file; returns the number
+    of samples written.
+    """
+    for eeg in iter_session_eeg(minio_client, objects_meta, max_in_flight, window):
+        writer.append(eeg)
+    return writer.num_samples
+
+
+def eeg_to_volts(eeg: np.ndarray) -> np.ndarray:
+    """
+    (n, channels) ADC values -> C-contiguous (channels, n) float64 volts,
+    without full-size temporaries.
+    """
+    volts = np.empty((eeg.shape[1], eeg.shape[0]), dtype=np.float64)
+    volts[...] = eeg.T
+    volts -= 2048.0
+    volts *= (4.5 / 4096.0) * 1e-6
+    return volts
@@ -1,67 +1,167 @@
+import threading
 from contextlib import contextmanager
+
 import psycopg
 from minio import Minio
+from neuro_common import db, metrics, object_store
+
 from . import config
 
+# Created on first use in each process: the API process and every export
+# worker process (spawned, so nothing is inherited) get their own pool and client
+_db_pool = None
+_minio_client = None
+_init_lock = threading.Lock()
+
+_MINIO_DOWNLOAD = metrics.STAGE_SECONDS.labels("minio_download")
+_DB_QUERY = metrics.STAGE_SECONDS.labels("db_query")
+_BYTES_DOWNLOADED = metrics.BYTES_TOTAL.labels("minio_download")
+
+
 # --- Database Connection ---
-@contextmanager
+def get_db_pool():
+    global _db_pool
+    with _init_lock:
+        if _db_pool is None:
+            _db_pool = db.create_pool(
+                config.DATABASE_URL,
+                name="bids-exporter-db",
+                min_size=config.DB_POOL_MIN_SIZE,
+                max_size=config.DB_POOL_MAX_SIZE,
+                row_factory=psycopg.rows.dict_row,
+            )
+    return _db_pool
+
+
 def get_db_connection():
-    """Provides a transactional database connection."""
-    conn = psycopg.connect(config.DATABASE_URL, row_factory=psycopg.rows.dict_row)
-    try:
-        yield conn
-    finally:
-        conn.close()
+    """
+    Borrows a pooled connection returning rows as dicts. The transaction is
+    committed when the block succeeds and rolled back if it raises.
+    """
+    return get_db_pool().connection()
+
 
 # --- MinIO Connection ---
-def get_minio_client():
-    """Initializes and returns a MinIO client instance."""
-    return Minio(
-        config.MINIO_ENDPOINT,
-        access_key=config.MINIO_ACCESS_KEY,
-        secret_key=config.MINIO_SECRET_KEY,
-        secure=config.MINIO_SECURE
-    )
+def get_minio_client() -> Minio:
+    """Returns this process's MinIO client; its HTTP connections are shared by all threads."""
+    global _minio_client
+    with _init_lock:
+        if _minio_client is None:
+            _minio_client = object_store.create_client(
+                config.MINIO_ENDPOINT,
+                config.MINIO_ACCESS_KEY,
+                config.MINIO_SECRET_KEY,
+                config.MINIO_SECURE,
+                name="bids-exporter-minio",
+                max_connections=config.MINIO_MAX_CONNECTIONS,
+            )
+    return _minio_client
+
+
+def pool_metrics() -> dict:
+    """Connection pool usage of this process."""
+    return {"db": db.metrics(), "minio": object_store.metrics()}
+
 
 # --- Data Fetching Functions ---
 def get_session_info_for_experiment(conn: psycopg.Connection, experiment_id: str):
     """Fetches all session details for a given experiment."""
-    with conn.cursor() as cur:
+    with _DB_QUERY.time(), conn.cursor() as cur:
         cur.execute(
             "SELECT * FROM sessions WHERE experiment_id = %s ORDER BY start_time ASC",
-            (experiment_id,)
+            (experiment_id,),
         )
         return cur.fetchall()
 
-def get_object_metadata_for_session(conn: psycopg.Connection, session_id: str):
-    """Fetches all raw data object metadata for a session, ordered by time."""
-    with conn.cursor() as cur:
+
+def iter_experiment_object_links(conn: psycopg.Connection, experiment_id: str):
+    """
+    Streams (session_id, object_id, start_us, end_us) of every raw data
+    object linked to a session of the experiment, grouped by session and in
+    time order within each, through a server-side cursor. Times are
+    microseconds since the Unix epoch, so no datetime is built per row.
+    """
+    with conn.cursor(name="experiment_object_links", row_factory=psycopg.rows.tuple_row) as cur:
+        cur.itersize = config.EXPORT_PLAN_FETCH_SIZE
+        # idx_session_links_session_time yields each session's links already in time order
         cur.execute(
             """
-            SELECT o.*
-            FROM raw_data_objects o
-            JOIN session_object_links l ON o.object_id = l.object_id
-            WHERE l.session_id = %s
-            ORDER BY o.start_time ASC
+            SELECT
+                l.session_id, l.object_id,
+                (EXTRACT(EPOCH FROM o.start_time) * 1000000)::bigint,
+                (EXTRACT(EPOCH FROM o.end_time) * 1000000)::bigint
+            FROM sessions s
+            JOIN session_object_links l ON l.session_id = s.session_id
+            JOIN raw_data_objects o ON o.object_id = l.object_id
+            WHERE s.experiment_id = %s
+            ORDER BY l.session_id, l.start_time, l.object_id
             """,
-            (session_id,)
+            (experiment_id,),
         )
-        return cur.fetchall()
+        yield from cur
+
 
 def download_object_from_minio(minio_client: Minio, object_key: str):
     """Downloads a single object from MinIO and returns its content as bytes."""
+    with _MINIO_DOWNLOAD.time():
+        response = minio_client.get_object(config.MINIO_BUCKET, object_key)
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+    _BYTES_DOWNLOADED.inc(len(data))
+    return data
+
+
+def download_object_range(minio_client: Minio, object_key: str, offset: int, length: int) -> bytes:
+    """Downloads length bytes of an object from offset (fewer at the end of the object)."""
+    with _MINIO_DOWNLOAD.time():
+        response = minio_client.get_object(
+            config.MINIO_BUCKET, object_key, offset=offset, length=length
+        )
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+    _BYTES_DOWNLOADED.inc(len(data))
+    return data
+
+
+@contextmanager
+def open_object_stream(minio_client: Minio, object_key: str):
+    """Opens an object for streaming reads; the connection is released on exit."""
     response = minio_client.get_object(config.MINIO_BUCKET, object_key)
     try:
-        return response.read()
+        yield response
     finally:
         response.close()
         response.release_conn()
 
-def get_events_for_session(conn: psycopg.Connection, session_id: str):
-    """Fetches event data for a given session, ordered by onset time."""
-    with conn.cursor() as cur:
+
+def download_dictionary(dict_id: int) -> bytes:
+    """Downloads a trained zstd dictionary referenced by an object's frame header."""
+    return download_object_from_minio(
+        get_minio_client(), f"{config.ZSTD_DICT_PREFIX}{dict_id}.zdict"
+    )
+
+
+def iter_experiment_events(conn: psycopg.Connection, experiment_id: str):
+    """
+    Streams (session_id, onset_s, duration_s, description) of the experiment's
+    events, grouped by session.
+    """
+    with conn.cursor(name="experiment_events", row_factory=psycopg.rows.tuple_row) as cur:
+        cur.itersize = config.EXPORT_PLAN_FETCH_SIZE
         cur.execute(
-            "SELECT * FROM events WHERE session_id = %s ORDER BY onset_s ASC",
-            (session_id,)
+            """
+            SELECT e.session_id, e.onset_s, e.duration_s, e.description
+            FROM events e
+            JOIN sessions s ON s.session_id = e.session_id
+            WHERE s.experiment_id = %s
+            ORDER BY e.session_id, e.onset_s
+            """,
+            (experiment_id,),
         )
-        return cur.fetchall()
+        yield from cur
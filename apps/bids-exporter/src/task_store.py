@@ -0,0 +1,135 @@
+"""
+Persistent state of export tasks (tables export_tasks and export_task_sessions).
+
+The scheduler records every status change and every finished session here, so
+the status endpoint survives restarts and a task that was interrupted can be
+resumed: on startup, unfinished tasks are re-planned and the sessions already
+recorded as finished are taken from the output cache instead of re-exported.
+"""
+
+import uuid
+
+from . import storage
+
+UNFINISHED_STATUSES = ("pending", "running")
+
+
+def create_task(task_id: str, experiment_id: str):
+    with storage.get_db_connection() as conn:
+        conn.execute(
+            "INSERT INTO export_tasks (task_id, experiment_id, status, message) VALUES (%s, %s, "
+            "'pending', %s)",
+            (task_id, experiment_id, "Task is queued."),
+        )
+        conn.commit()
+
+
+def update_task(
+    task_id: str,
+    status: str | None = None,
+    progress: int | None = None,
+    message: str | None = None,
+    result_file: str | None = None,
+):
+    """Updates the given fields of a task; fields left as None keep their value."""
+    with storage.get_db_connection() as conn:
+        conn.execute(
+            """
+            UPDATE export_tasks
+            SET status = COALESCE(%s, status),
+                progress = COALESCE(%s, progress),
+                message = COALESCE(%s, message),
+                result_file = COALESCE(%s, result_file),
+                updated_at = NOW()
+            WHERE task_id = %s
+            """,
+            (status, progress, message, result_file, task_id),
+        )
+        conn.commit()
+
+
+def get_task(task_id: str) -> dict | None:
+    """Returns the task as reported by the status endpoint, or None if it does not exist."""
+    try:
+        uuid.UUID(task_id)
+    except ValueError:
+        # Not a UUID, so not a task ID either
+        return None
+    with storage.get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT status, progress, message, result_file FROM export_tasks WHERE task_id = %s",
+            (task_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    return {key: value for key, value in row.items() if value is not None}
+
+
+def get_unfinished_tasks() -> list[dict]:
+    """Tasks that were pending or running when the service stopped, oldest first."""
+    with storage.get_db_connection() as conn:
+        return conn.execute(
+            "SELECT task_id::text, experiment_id FROM export_tasks WHERE status = ANY(%s) ORDER BY "
+            "created_at",
+            (list(UNFINISHED_STATUSES),),
+        ).fetchall()
+
+
+def add_task_sessions(task_id: str, sessions: list[dict]):
+    """
+    Records the sessions of a task in export order. Sessions already recorded
+    keep their state.
+    """
+    with storage.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO export_task_sessions (task_id, session_id, session_index)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (task_id, session_id)
+                DO UPDATE SET session_index = EXCLUDED.session_index
+                """,
+                [(task_id, session["session_id"], index) for index, session in enumerate(sessions)],
+            )
+        conn.commit()
+
+
+def get_finished_sessions(task_id: str) -> dict[str, str]:
+    """Returns {session_id: cache_key} for the sessions of a task that already finished."""
+    with storage.get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT session_id, cache_key FROM export_task_sessions WHERE task_id = %s AND "
+            "cache_key IS NOT NULL",
+            (task_id,),
+        ).fetchall()
+    return {row["session_id"]: row["cache_key"] for row in rows}
+
+
+def get_session_keys(task_id: str) -> list[str]:
+    """Cache keys of a finished task's sessions, in session order."""
+    with storage.get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT cache_key FROM export_task_sessions WHERE task_id = %s ORDER BY session_index",
+            (task_id,),
+        ).fetchall()
+    return [row["cache_key"] for row in rows]
+
+
+def mark_session_finished(
+    task_id: str, session_id: str, cache_key: str, progress: int, message: str
+):
+    """Records a finished session together with the task's new progress, in one transaction."""
+    with storage.get_db_connection() as conn:
+        conn.execute(
+            """
+            UPDATE export_task_sessions SET cache_key = %s, finished_at = NOW()
+            WHERE task_id = %s AND session_id = %s
+            """,
+            (cache_key, task_id, session_id),
+        )
+        conn.execute(
+            "UPDATE export_tasks SET progress = %s, message = %s, updated_at = NOW() WHERE task_id "
+            "= %s",
+            (progress, message, task_id),
+        )
+        conn.commit()
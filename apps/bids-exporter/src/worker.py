@@ -1,149 +1,214 @@
 import os
 import shutil
-import uuid
-from concurrent.futures import ThreadPoolExecutor
-from datetime import timezone
-import numpy as np
-import zstandard
+import tempfile
+from datetime import UTC
+
 import mne
 from mne_bids import BIDSPath, write_raw_bids
-from . import config, storage
-
-# Sensor data format, matching the firmware and processor
-SENSOR_DATA_DTYPE = np.dtype(
-    [
-        ("eeg", "<u2", (8,)),
-        ("accel", "<f4", (3,)),
-        ("gyro", "<f4", (3,)),
-        ("trig", "u1"),
-        ("imp", "i1", (8,)),
-        ("esp_time", "<u4"),
-    ]
+from neuro_common import codec, log, metrics
+
+from . import archive, config, export_cache, storage
+from .brainvision import BrainVisionWriter
+from .export_plan import SessionPlan
+from .session_reader import (
+    eeg_to_volts,
+    load_session_eeg,
+    session_window,
+    write_session_brainvision,
+)
+
+# Assuming a fixed sample rate. In a real scenario, this might come from metadata.
+SFREQ = 256.0
+CH_NAMES = ["Fp1", "Fp2", "F7", "F8", "T7", "T8", "P7", "P8"]
+
+# Recorded in the worker processes; prometheus multiprocess mode exports them from the API process
+_SESSION_READ = metrics.STAGE_SECONDS.labels("session_read")
+_BIDS_WRITE = metrics.STAGE_SECONDS.labels("bids_write")
+_ARCHIVE = metrics.STAGE_SECONDS.labels("archive")
+SESSIONS_TOTAL = metrics.counter(
+    "neuro_export_sessions_total", "Sessions handled by export jobs by result", ("result",)
 )
-HEADER_SIZE = 18
-
-def parse_raw_data(decompressed_data: bytes):
-    """Parses decompressed binary data into a structured numpy array."""
-    if len(decompressed_data) <= HEADER_SIZE:
-        return None, np.array([])
-
-    device_id_bytes = decompressed_data[:17]
-    device_id = device_id_bytes.decode("utf-8").strip("\x00")
-    
-    sensor_bytes = decompressed_data[HEADER_SIZE:]
-    num_samples = len(sensor_bytes) // SENSOR_DATA_DTYPE.itemsize
-    
+
+
+def _read_session_in_memory(
+    minio_client, objects_meta, sfreq: float, ch_names: list[str], window=None
+):
+    """Builds a RawArray holding the whole session as float64 volts."""
+    eeg_adc = load_session_eeg(minio_client, objects_meta, sfreq, window=window)
+    if len(eeg_adc) == 0:
+        return None
+    # Convert ADC values to Volts
+    eeg_data_volts = eeg_to_volts(eeg_adc)
+    del eeg_adc
+    info = mne.create_info(ch_names=ch_names, sfreq=sfreq, ch_types=["eeg"] * len(ch_names))
+    # RawArray keeps the C-contiguous float64 array without copying
+    return mne.io.RawArray(eeg_data_volts, info)
+
+
+def _read_session_out_of_core(
+    minio_client, objects_meta, sfreq: float, ch_names: list[str], scratch_dir: str, window=None
+):
+    """
+    Streams the session into a BrainVision file in scratch_dir and opens it
+    without preloading, so write_raw_bids copies the file instead of
+    converting an in-memory array.
+    """
+    with BrainVisionWriter(scratch_dir, "session", ch_names, sfreq) as writer:
+        num_samples = write_session_brainvision(minio_client, objects_meta, writer, window=window)
     if num_samples == 0:
-        return device_id, np.array([])
-        
-    structured_array = np.frombuffer(sensor_bytes, dtype=SENSOR_DATA_DTYPE, count=num_samples)
-    return device_id, structured_array
+        return None
+    return mne.io.read_raw_brainvision(writer.vhdr_path, preload=False, verbose=False)
 
-def run_bids_export_task(task_id: str, experiment_id: str, task_registry: dict):
+
+def export_options() -> dict:
+    """Settings that change a session's output; part of its cache key."""
+    return {"sfreq": SFREQ, "ch_names": CH_NAMES, "out_of_core": config.EXPORT_OUT_OF_CORE}
+
+
+def export_session(
+    minio_client, session: dict, objects_meta: list[dict], events: list[dict], bids_root_path: str
+) -> bool:
     """
-    Main function for the background BIDS export task.
+    Writes one session into the BIDS dataset at bids_root_path, given its
+    object metadata (in time order) and events. Returns False if it had no data.
     """
-    bids_root_path = os.path.join(config.BIDS_OUTPUT_DIR, task_id)
-    zip_filename = f"experiment_{experiment_id}_{task_id}.zip"
-    zip_filepath = os.path.join(config.BIDS_OUTPUT_DIR, zip_filename)
+    session_id = session["session_id"]
 
+    # 1. Check the session's object metadata
+    if not objects_meta:
+        print(f"Warning: No data objects found for session {session_id}. Skipping.")
+        return False
+
+    # 2. Stream the objects in time order: bounded-concurrency downloads,
+    # frame-by-frame decompression, EEG samples appended as they arrive.
+    # Objects compacted into time buckets are cut to the session's time range
+    window = session_window(session)
+    scratch_dir = tempfile.mkdtemp(dir=config.EXPORT_SCRATCH_DIR)
     try:
-        task_registry[task_id] = {"status": "running", "progress": 0, "message": "Initializing..."}
-
-        minio_client = storage.get_minio_client()
-        with storage.get_db_connection() as conn:
-            # 1. Get all sessions for the experiment
-            sessions = storage.get_session_info_for_experiment(conn, experiment_id)
-            if not sessions:
-                raise ValueError(f"No sessions found for experiment ID: {experiment_id}")
-
-            total_sessions = len(sessions)
-            for i, session in enumerate(sessions):
-                progress = int((i / total_sessions) * 100)
-                session_id = session["session_id"]
-                task_registry[task_id].update({
-                    "progress": progress,
-                    "message": f"Processing session {i+1}/{total_sessions}: {session_id}",
-                })
-
-                # 2. Get all object metadata for the current session
-                objects_meta = storage.get_object_metadata_for_session(conn, session_id)
-                if not objects_meta:
-                    print(f"Warning: No data objects found for session {session_id}. Skipping.")
-                    continue
-
-                # 3. Download all objects in parallel
-                object_keys = [meta["object_id"] for meta in objects_meta]
-                with ThreadPoolExecutor() as executor:
-                    compressed_chunks = list(executor.map(
-                        lambda key: storage.download_object_from_minio(minio_client, key),
-                        object_keys
-                    ))
-                
-                # 4. Stitch, decompress, and parse
-                full_compressed_data = b"".join(compressed_chunks)
-                dctx = zstandard.ZstdDecompressor()
-                decompressed_data = dctx.decompress(full_compressed_data)
-                device_id, parsed_data = parse_raw_data(decompressed_data)
-
-                if parsed_data.size == 0:
-                    print(f"Warning: Parsed data is empty for session {session_id}. Skipping.")
-                    continue
-                
-                # 5. Create MNE Raw object
-                # Assuming a fixed sample rate. In a real scenario, this might come from metadata.
-                sfreq = 256.0
-                ch_names = ["Fp1", "Fp2", "F7", "F8", "T7", "T8", "P7", "P8"]
-                ch_types = ["eeg"] * 8
-                
-                # Convert ADC values to Volts
-                eeg_data_volts = (parsed_data["eeg"].astype(np.float64) - 2048.0) * (4.5 / 4096.0) * 1e-6
-                
-                info = mne.create_info(ch_names=ch_names, sfreq=sfreq, ch_types=ch_types)
-                info.set_montage("standard_1020", on_missing="warn")
-                raw = mne.io.RawArray(eeg_data_volts.T, info)
-
-                # Use the session start time as the measurement date
-                meas_date = session["start_time"].replace(tzinfo=timezone.utc)
-                raw.set_meas_date(meas_date)
-
-                # 6. Get and add events as annotations
-                events = storage.get_events_for_session(conn, session_id)
-                if events:
-                    annotations = mne.Annotations(
-                        onset=[e["onset_s"] for e in events],
-                        duration=[e["duration_s"] for e in events],
-                        description=[e["description"] for e in events]
-                    )
-                    raw.set_annotations(annotations)
-                
-                # 7. Write to BIDS format
-                bids_path = BIDSPath(
-                    subject=session["user_id"],
-                    session=meas_date.strftime("%Y%m%d"),
-                    task=session["session_type"],
-                    root=bids_root_path
+        # 3. Create MNE Raw object
+        with _SESSION_READ.time():
+            if config.EXPORT_OUT_OF_CORE:
+                raw = _read_session_out_of_core(
+                    minio_client, objects_meta, SFREQ, CH_NAMES, scratch_dir, window
                 )
-                write_raw_bids(raw, bids_path, overwrite=True, verbose=False)
-
-        # 8. Zip the output directory
-        task_registry[task_id].update({"progress": 95, "message": "Compressing dataset..."})
-        shutil.make_archive(
-            base_name=os.path.join(config.BIDS_OUTPUT_DIR, f"experiment_{experiment_id}_{task_id}"),
-            format='zip',
-            root_dir=bids_root_path
+                write_options = {}
+            else:
+                raw = _read_session_in_memory(minio_client, objects_meta, SFREQ, CH_NAMES, window)
+                write_options = {"allow_preload": True, "format": "BrainVision"}
+        if raw is None:
+            print(f"Warning: Parsed data is empty for session {session_id}. Skipping.")
+            return False
+        raw.set_montage("standard_1020", on_missing="warn")
+
+        # Use the session start time as the measurement date
+        meas_date = session["start_time"].replace(tzinfo=UTC)
+        raw.set_meas_date(meas_date)
+
+        # 4. Add events as annotations
+        if events:
+            annotations = mne.Annotations(
+                onset=[e["onset_s"] for e in events],
+                duration=[e["duration_s"] for e in events],
+                description=[e["description"] for e in events],
+            )
+            raw.set_annotations(annotations)
+
+        # 5. Write to BIDS format
+        bids_path = BIDSPath(
+            subject=session["user_id"],
+            session=meas_date.strftime("%Y%m%d"),
+            task=session["session_type"],
+            root=bids_root_path,
+        )
+        with _BIDS_WRITE.time():
+            write_raw_bids(raw, bids_path, overwrite=True, verbose=False, **write_options)
+        return True
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+# --- Process-pool entry points ---
+# Jobs get everything they need from the SessionPlan; each worker process shares one MinIO client
+# (see storage)
+
+
+def init_worker_process():
+    """Initializer for export worker processes."""
+    log.configure(config.LOG_LEVEL, config.LOG_RATE_LIMIT_SEC)
+    codec.set_dictionary_loader(storage.download_dictionary)
+
+
+def export_session_job(plan: SessionPlan) -> str:
+    """
+    Exports one session into its own BIDS root in the output cache, unless an
+    entry for the same inputs is already there; runs in a worker process.
+    Returns the session's cache key.
+    """
+    session = plan.session
+    objects_meta = plan.objects_meta()
+    events = plan.events()
+    minio_client = storage.get_minio_client()
+    key = export_cache.session_cache_key(session, objects_meta, events, export_options())
+    if export_cache.lookup(key) is None:
+        export_cache.store(
+            key, lambda root: export_session(minio_client, session, objects_meta, events, root)
         )
-        shutil.rmtree(bids_root_path) # Clean up the uncompressed directory
-
-        task_registry[task_id] = {
-            "status": "completed",
-            "progress": 100,
-            "message": "Export completed successfully.",
-            "result_file": zip_filename,
-        }
-
-    except Exception as e:
-        print(f"Error in BIDS export task {task_id}: {e}")
-        task_registry[task_id] = {"status": "failed", "message": str(e)}
-        if os.path.exists(bids_root_path):
-            shutil.rmtree(bids_root_path)
\ No newline at end of file
+        SESSIONS_TOTAL.labels("exported").inc()
+    else:
+        SESSIONS_TOTAL.labels("cached").inc()
+    return key
+
+
+def archive_filename(experiment_id: str, task_id: str) -> str:
+    return f"experiment_{experiment_id}_{task_id}.zip"
+
+
+def _partial_archive_path(task_id: str) -> str:
+    return os.path.join(config.BIDS_OUTPUT_DIR, f".{task_id}.zip.part")
+
+
+def dataset_for(session_keys: list[str]) -> archive.Dataset:
+    """Plans the merged dataset of a task from its sessions' cache entries, in session order."""
+    return archive.plan_dataset([export_cache.entry_path(key) for key in session_keys])
+
+
+def discard_export(task_id: str):
+    """
+    Removes a partially written archive of a task. Session outputs stay in the
+    cache for later exports.
+    """
+    try:
+        os.remove(_partial_archive_path(task_id))
+    except FileNotFoundError:
+        pass
+
+
+def finalize_export_job(experiment_id: str, task_id: str, session_keys: list[str]) -> str:
+    """
+    Streams the cached session roots into the task's ZIP; runs in a worker
+    process. Depending on EXPORT_ARCHIVE_TARGET the archive is written to
+    BIDS_OUTPUT_DIR, uploaded to MinIO, or ("stream") only checked here and
+    built on the fly when it is downloaded. Returns the zip filename.
+    """
+    dataset = dataset_for(session_keys)
+    if not dataset:
+        raise ValueError(f"No session of experiment {experiment_id} contained data.")
+    filename = archive_filename(experiment_id, task_id)
+    if config.EXPORT_ARCHIVE_TARGET == "stream":
+        return filename
+    with _ARCHIVE.time():
+        if config.EXPORT_ARCHIVE_TARGET == "minio":
+            archive.upload_zip(
+                storage.get_minio_client(), config.EXPORT_ARCHIVE_PREFIX + filename, dataset
+            )
+            return filename
+        # Written under a temporary name so the download never sees a partial archive
+        partial_path = _partial_archive_path(task_id)
+        try:
+            with open(partial_path, "wb") as f:
+                archive.write_zip(f, dataset)
+            os.replace(partial_path, os.path.join(config.BIDS_OUTPUT_DIR, filename))
+        except BaseException:
+            discard_export(task_id)
+            raise
+    return filename
@@ -0,0 +1,11 @@
+import os
+
+# src.config refuses to import without these; the tests never connect to either service
+for name, value in {
+    "DATABASE_URL": "postgresql://test@localhost/test",
+    "MINIO_ENDPOINT": "localhost:9000",
+    "MINIO_ACCESS_KEY": "test",
+    "MINIO_SECRET_KEY": "test",
+    "MINIO_BUCKET": "test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,70 @@
+import io
+import zipfile
+
+from src import archive
+
+SCANS_HEADER = "filename\tacq_time\n"
+
+
+def write_part(root, files: dict[str, str]) -> str:
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    return str(root)
+
+
+def session_part(root, task: str, acq_time: str) -> str:
+    """One session's BIDS root as mne-bids writes it, for subject 01 on 2024-01-01."""
+    ses = "sub-01/ses-20240101"
+    stem = f"sub-01_ses-20240101_task-{task}"
+    scans = f"{SCANS_HEADER}eeg/{stem}_eeg.vhdr\t{acq_time}\n"
+    return write_part(
+        root,
+        {
+            "dataset_description.json": "{}",
+            "participants.tsv": "participant_id\tage\nsub-01\tn/a\n",
+            f"{ses}/sub-01_ses-20240101_scans.tsv": scans,
+            f"{ses}/eeg/{stem}_eeg.vhdr": task,
+            f"{ses}/eeg/{stem}_eeg.eeg": task,
+        },
+    )
+
+
+def read_zip(dataset: archive.Dataset) -> dict[str, str]:
+    buf = io.BytesIO()
+    archive.write_zip(buf, dataset)
+    with zipfile.ZipFile(buf) as zf:
+        return {name: zf.read(name).decode() for name in zf.namelist()}
+
+
+def test_same_day_sessions_share_one_scans_table(tmp_path):
+    parts = [
+        session_part(tmp_path / "a", "rest", "2024-01-01T09:00:00"),
+        session_part(tmp_path / "b", "oddball", "2024-01-01T15:00:00"),
+    ]
+    entries = read_zip(archive.plan_dataset(parts))
+
+    scans = entries["sub-01/ses-20240101/sub-01_ses-20240101_scans.tsv"]
+    assert scans == (
+        SCANS_HEADER
+        + "eeg/sub-01_ses-20240101_task-oddball_eeg.vhdr\t2024-01-01T15:00:00\n"
+        + "eeg/sub-01_ses-20240101_task-rest_eeg.vhdr\t2024-01-01T09:00:00\n"
+    )
+    assert entries["participants.tsv"] == "participant_id\tage\nsub-01\tn/a\n"
+    assert "sub-01/ses-20240101/eeg/sub-01_ses-20240101_task-rest_eeg.eeg" in entries
+    assert "sub-01/ses-20240101/eeg/sub-01_ses-20240101_task-oddball_eeg.eeg" in entries
+
+
+def test_later_session_replaces_the_scans_row_of_its_file(tmp_path):
+    parts = [
+        session_part(tmp_path / "a", "rest", "2024-01-01T09:00:00"),
+        session_part(tmp_path / "b", "rest", "2024-01-01T15:00:00"),
+    ]
+    entries = read_zip(archive.plan_dataset(parts))
+
+    scans = entries["sub-01/ses-20240101/sub-01_ses-20240101_scans.tsv"]
+    assert (
+        scans == SCANS_HEADER + "eeg/sub-01_ses-20240101_task-rest_eeg.vhdr\t2024-01-01T15:00:00\n"
+    )
+    assert entries["sub-01/ses-20240101/eeg/sub-01_ses-20240101_task-rest_eeg.vhdr"] == "rest"
@@ -0,0 +1,67 @@
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+import pytest
+from neuro_common import chunk, codec, packet
+
+from src import config, sample_query, storage
+
+START = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+def make_packet(num_samples: int) -> bytes:
+    header = b"AA:BB:CC:DD:EE:FF".ljust(packet.HEADER_SIZE, b"\x00")
+    records = np.zeros(num_samples, dtype=packet.RECORD_DTYPE)
+    records["esp_micros"] = np.arange(num_samples) * 3906
+    records["eeg"] = 2048
+    return header + records.tobytes()
+
+
+def read(monkeypatch, data: bytes) -> sample_query.SampleBlock:
+    monkeypatch.setattr(storage, "download_object_from_minio", lambda client, key: data)
+    meta = {"object_id": "eeg/u/1.zst", "start_time": START}
+    return sample_query.read_packet_object(None, meta, 0, 2**62)
+
+
+def test_reads_packet_object(monkeypatch):
+    block = read(monkeypatch, codec.compress(make_packet(8)))
+    assert len(block) == 8
+    assert block.time_us[0] == sample_query.to_us(START)
+    assert block.eeg.shape == (8, sample_query.NUM_EEG_CHANNELS)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"not zstd at all",
+        codec.compress(make_packet(8))[:-5],
+        codec.compress(b"\x00" * 10),
+    ],
+    ids=["not-zstd", "truncated-frame", "truncated-header"],
+)
+def test_malformed_packet_object_is_skipped(monkeypatch, data):
+    block = read(monkeypatch, data)
+    assert len(block) == 0
+    assert block.eeg.shape == (0, sample_query.NUM_EEG_CHANNELS)
+
+
+def test_summary_refuses_too_many_uncompacted_objects(monkeypatch):
+    monkeypatch.setattr(config, "SAMPLE_SUMMARY_MAX_RAW_OBJECTS", 2)
+    monkeypatch.setattr(config, "SAMPLE_SUMMARY_LEVELS_SEC", [1])
+
+    def download(*args):
+        raise AssertionError("nothing is fetched")
+
+    monkeypatch.setattr(storage, "download_object_from_minio", download)
+    monkeypatch.setattr(storage, "download_object_range", download)
+    end = START + timedelta(days=1)
+    compacted = [{"object_id": f"eeg/u/{i}{chunk.OBJECT_SUFFIX}"} for i in range(5)]
+    packets = [{"object_id": f"eeg/u/{i}.zst"} for i in range(3)]
+    # Compacted objects are read from their precomputed level and do not count
+    with pytest.raises(sample_query.TooManyObjects) as e:
+        sample_query.query_summary(None, compacted + packets, START, end, 1000)
+    assert e.value.count == 3
+    # Too short a span for the finest level: every object is summarized from samples
+    with pytest.raises(sample_query.TooManyObjects) as e:
+        sample_query.query_summary(None, compacted, START, START + timedelta(seconds=10), 1000)
+    assert e.value.count == 5
@@ -1,6 +1,6 @@
 import { Router } from 'express';
 import multer from 'multer';
-import { getRabbitMQChannel } from './rabbitmq';
+import { analyzerPartition, getRabbitMQChannel } from './rabbitmq';
 
 const upload = multer({ storage: multer.memoryStorage() });
 const router = Router();
@@ -19,10 +19,12 @@ router.post('/data', (req, res) => {
 
   try {
     const payloadBuffer = Buffer.from(payload_base64, 'base64');
-    const headers = { user_id };
+    // published_at_ms: 発行時刻。Pythonサービスがキュー遅延（neuro_queue_lag_seconds）の計測に使う
+    const headers = { user_id, published_at_ms: Date.now() };
 
-    // Fanout Exchangeに発行 (ルーティングキーは不要)
-    channel.publish('raw_data_exchange', '', payloadBuffer, { persistent: true, headers });
+    // Fanout Exchangeに発行。fanoutはルーティングキーを無視するが、
+    // シャーディングしたrealtime-analyzerはキー（ユーザーのパーティション番号）で担当分だけを受信する
+    channel.publish('raw_data_exchange', analyzerPartition(user_id), payloadBuffer, { persistent: true, headers });
     
     res.status(202).json({ status: 'accepted' });
   } catch (error) {
@@ -16,23 +16,24 @@ export async function processLinkJob(sessionData: any) {
 
     // 2. Find overlapping raw_data_objects
     const findObjectsQuery = `
-      SELECT object_id FROM raw_data_objects
+      SELECT object_id, start_time FROM raw_data_objects
       WHERE user_id = $1
       AND start_time < $2 -- Object starts before session ends
       AND end_time > $3   -- Object ends after session starts
     `;
     const res = await client.query(findObjectsQuery, [user_id, end_time, start_time]);
-    const objectIds = res.rows.map(row => row.object_id);
+    const objects = res.rows;
 
     // 3. Insert links into the junction table
+    // (start_time is copied so the exporter can read a session's objects in time order from the index alone)
     const insertLinkQuery = `
-      INSERT INTO session_object_links (session_id, object_id) VALUES ($1, $2)
+      INSERT INTO session_object_links (session_id, object_id, start_time) VALUES ($1, $2, $3)
       ON CONFLICT (session_id, object_id) DO NOTHING
     `;
-    for (const objectId of objectIds) {
-      await client.query(insertLinkQuery, [session_id, objectId]);
+    for (const obj of objects) {
+      await client.query(insertLinkQuery, [session_id, obj.object_id, obj.start_time]);
     }
-    console.log(`  - Linked ${objectIds.length} sensor data objects to session ${session_id}.`);
+    console.log(`  - Linked ${objects.length} sensor data objects to session ${session_id}.`);
 
     // 4. Update experiment_id for media files within the session
     const updateImagesQuery = `UPDATE images SET experiment_id = $1 WHERE session_id = $2`;
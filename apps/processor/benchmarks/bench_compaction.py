@@ -0,0 +1,217 @@
+"""
+Benchmark for compaction: reading a session from packet objects vs. from
+compacted time-bucket objects.
+
+--minutes of 256 Hz data arrive as packets of --samples-per-packet samples,
+stored one object per packet as the processor does. MinIO is an in-process
+stand-in that sleeps --latency-ms per GET and counts requests and bytes.
+
+  packets    the exporter's read path before compaction: one GET per object,
+             --concurrency in flight, every sample decoded
+  compacted  the same session after src.compactor merged the packets into
+             --bucket-sec buckets: per bucket one ranged GET for the chunk
+             index and one for the chunks overlapping the session window
+
+The session window starts --offset-sec into the first bucket, so the
+compacted read also has to cut its first and last bucket. Both paths must
+return the same EEG samples.
+
+Usage (from apps/processor):
+    python -m benchmarks.bench_compaction --minutes 60
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+import zstandard
+from neuro_common import chunk, packet
+
+from src import compactor, storage
+
+SFREQ = 256
+SAMPLE_US = 1_000_000 // SFREQ
+
+
+class FakeResponse:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.objects: dict[str, bytes] = {}
+        self.gets = 0
+        self.bytes_read = 0
+
+    def put_object(self, bucket, name, data, length, content_type=None, metadata=None):
+        self.objects[name] = data.read()
+
+    def get_object(self, bucket, name, offset=0, length=0):
+        time.sleep(self.latency)
+        data = self.objects[name]
+        data = data[offset : offset + length] if length else data[offset:]
+        self.gets += 1
+        self.bytes_read += len(data)
+        return FakeResponse(data)
+
+    def reset_counters(self):
+        self.gets = self.bytes_read = 0
+
+
+def make_packets(
+    minutes: float, samples_per_packet: int, start: datetime
+) -> list[tuple[str, datetime, bytes]]:
+    """Packet objects (object_id, start_time, body) with a plausible, compressible EEG signal."""
+    header = b"AA:BB:CC:DD:EE:FF".ljust(packet.HEADER_SIZE, b"\x00")
+    cctx = zstandard.ZstdCompressor()
+    rng = np.random.default_rng(0)
+    num_samples = int(minutes * 60 * SFREQ)
+    t = np.arange(num_samples) / SFREQ
+    eeg = 2048 + 300 * np.sin(2 * np.pi * 10 * t)[:, None] + rng.normal(0, 20, (num_samples, 8))
+    samples = np.zeros(num_samples, dtype=packet.RECORD_DTYPE)
+    samples["eeg"] = np.clip(eeg, 0, 4095)
+    samples["accel"] = rng.normal(0, 0.01, (num_samples, 3)) + [0, 0, 1]
+    samples["esp_micros"] = (np.arange(num_samples) * SAMPLE_US + 123_456) % (1 << 32)
+    packets = []
+    for first in range(0, num_samples, samples_per_packet):
+        start_time = start + timedelta(microseconds=first * SAMPLE_US)
+        object_id = f"eeg/bench_user/{first}.zst"
+        body = cctx.compress(header + samples[first : first + samples_per_packet].tobytes())
+        packets.append((object_id, start_time, body))
+    return packets
+
+
+def read_packets(
+    objects: list[tuple[str, datetime]], window: tuple[int, int], concurrency: int
+) -> np.ndarray:
+    start_us, end_us = window
+
+    def fetch(obj):
+        object_id, start_time = obj
+        times, records = compactor.decode_packet_object(
+            storage.download_object(object_id), start_time
+        )
+        # Packets are read whole; cut them to the window too so both paths return the same samples
+        return records["eeg"][(times >= start_us) & (times <= end_us)]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return np.concatenate(list(executor.map(fetch, objects)))
+
+
+def read_compacted(
+    minio: FakeMinio, object_ids: list[str], window: tuple[int, int], concurrency: int
+) -> np.ndarray:
+    start_us, end_us = window
+
+    def fetch(object_id):
+        def read_at(offset, length):
+            return minio.get_object("bench", object_id, offset, length).read()
+
+        header = chunk.read_header(read_at)
+        first, last = header.chunk_range(start_us, end_us)
+        offset, length = header.byte_range(first, last)
+        columns = header.decode_chunks(read_at(offset, length), first, last, ["eeg"])
+        times = columns[chunk.TIME_COLUMN]
+        return columns["eeg"][(times >= start_us) & (times <= end_us)]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return np.concatenate(list(executor.map(fetch, object_ids)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--minutes", type=float, default=60.0)
+    ap.add_argument("--samples-per-packet", type=int, default=64)
+    ap.add_argument("--bucket-sec", type=int, default=600)
+    ap.add_argument("--chunk-samples", type=int, default=2560)
+    ap.add_argument("--zstd-level", type=int, default=9)
+    ap.add_argument(
+        "--offset-sec", type=float, default=90.0, help="session start after the first packet"
+    )
+    ap.add_argument("--latency-ms", type=float, default=2.0, help="simulated round trip per GET")
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    minio = FakeMinio(args.latency_ms / 1000.0)
+    storage.minio_client = minio
+    bucket_start = datetime(2024, 1, 1, tzinfo=UTC)
+    packets = make_packets(args.minutes, args.samples_per_packet, bucket_start)
+    for object_id, _, body in packets:
+        minio.objects[object_id] = body
+    packet_bytes = sum(len(body) for _, _, body in packets)
+
+    # The session skips the first --offset-sec and the last --offset-sec of the recording
+    first_us = compactor.to_us(packets[0][1])
+    last_us = first_us + int(args.minutes * 60 * SFREQ - 1) * SAMPLE_US
+    offset_us = int(args.offset_sec * 1e6)
+    window = (first_us + offset_us, last_us - offset_us)
+    # The objects the datalinker would link: those overlapping the session
+    in_session = [
+        (object_id, start_time)
+        for object_id, start_time, _ in packets
+        if window[0] <= compactor.to_us(start_time) + (args.samples_per_packet - 1) * SAMPLE_US
+        and compactor.to_us(start_time) <= window[1]
+    ]
+
+    minio.reset_counters()
+    started = time.perf_counter()
+    before = read_packets(in_session, window, args.concurrency)
+    before_time = time.perf_counter() - started
+    before_gets, before_bytes = minio.gets, minio.bytes_read
+
+    started = time.perf_counter()
+    compacted_ids = []
+    bucket = timedelta(seconds=args.bucket_sec)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        while bucket_start <= packets[-1][1]:
+            objects = [(o, s) for o, s, _ in packets if bucket_start <= s < bucket_start + bucket]
+            time_us, columns = compactor.load_bucket(objects, executor)
+            object_id = f"eeg/bench_user/{bucket_start.timestamp():.0f}{chunk.OBJECT_SUFFIX}"
+            minio.objects[object_id] = chunk.encode(
+                time_us, columns, {"user_id": "bench_user"}, args.chunk_samples, args.zstd_level
+            )
+            compacted_ids.append(object_id)
+            bucket_start += bucket
+    compact_time = time.perf_counter() - started
+    compacted_bytes = sum(len(minio.objects[o]) for o in compacted_ids)
+
+    minio.reset_counters()
+    started = time.perf_counter()
+    after = read_compacted(minio, compacted_ids, window, args.concurrency)
+    after_time = time.perf_counter() - started
+    assert np.array_equal(before, after), "compacted read differs from the packet read"
+
+    print(
+        f"{args.minutes:g} min at {SFREQ} Hz, {args.samples_per_packet} samples/packet, "
+        f"latency={args.latency_ms} ms, concurrency={args.concurrency}"
+    )
+    print(
+        f"  stored     {len(packets):6d} packet objects {packet_bytes / 1e6:7.2f} MB -> "
+        f"{len(compacted_ids)} compacted objects {compacted_bytes / 1e6:7.2f} MB "
+        f"(compacted in {compact_time:.2f} s)"
+    )
+    print(f"  packets    {before_gets:6d} GETs {before_bytes / 1e6:7.2f} MB  {before_time:6.2f} s")
+    print(
+        f"  compacted  {minio.gets:6d} GETs {minio.bytes_read / 1e6:7.2f} MB  {after_time:6.2f} s"
+    )
+    print(
+        f"  {len(after)} samples identical; {before_gets / max(minio.gets, 1):.0f}x fewer GETs, "
+        f"{before_time / after_time:.1f}x faster"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Throughput benchmark: one-at-a-time ingest vs. batched ingest.
+
+MinIO and PostgreSQL are replaced by in-process stand-ins that sleep for a
+configurable round-trip time, so the benchmark measures how many round trips
+each path pays per message rather than the speed of a particular server.
+
+Usage (from apps/processor):
+    python -m benchmarks.bench_ingest --messages 2000 --rtt-ms 2
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import numpy as np
+import zstandard
+from neuro_common import packet
+
+from src import main as processor_main
+from src import storage
+from src.batch import IngestBatch
+
+
+class FakeMinio:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+
+    def put_object(self, bucket, name, data, length, content_type=None, metadata=None):
+        time.sleep(self.rtt)
+        return SimpleNamespace(etag="bench")
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        time.sleep(self.conn.rtt)
+
+    @contextmanager
+    def copy(self, query):
+        class _Copy:
+            def write_row(self, row):
+                pass
+
+        yield _Copy()
+        time.sleep(self.conn.rtt)
+
+
+class FakeConnection:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        time.sleep(self.rtt)
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    """Stands in for the psycopg_pool pool: every borrow hands out the same connection."""
+
+    def __init__(self, rtt: float):
+        self.conn = FakeConnection(rtt)
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+
+def make_packet(num_samples: int) -> bytes:
+    header = b"AA:BB:CC:DD:EE:FF".ljust(packet.HEADER_SIZE, b"\x00")
+    samples = np.zeros(num_samples, dtype=packet.RECORD_DTYPE)
+    samples["eeg"] = np.random.randint(0, 4096, size=(num_samples, 8))
+    samples["esp_micros"] = np.arange(num_samples) * 3906
+    return zstandard.ZstdCompressor().compress(header + samples.tobytes())
+
+
+def run_single(bodies: list[bytes]) -> float:
+    start = time.perf_counter()
+    for body in bodies:
+        metadata, payload = processor_main.prepare_object(body, "bench_user", datetime.now(UTC))
+        storage.upload_to_minio(metadata["object_id"], payload, metadata["zstd_dict_id"])
+        with storage.get_db_connection() as db_conn:
+            storage.insert_raw_data_metadata_to_db(db_conn, metadata)
+    return time.perf_counter() - start
+
+
+def run_batch(bodies: list[bytes], batch_size: int, workers: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch = IngestBatch(executor)
+        for tag, body in enumerate(bodies, start=1):
+            batch.add(tag, *processor_main.prepare_object(body, "bench_user", datetime.now(UTC)))
+            if len(batch) >= batch_size:
+                batch.flush()
+        batch.flush()
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--messages", type=int, default=2000)
+    ap.add_argument("--samples-per-packet", type=int, default=32)
+    ap.add_argument("--rtt-ms", type=float, default=2.0, help="simulated round trip per store call")
+    ap.add_argument("--batch-size", type=int, default=100)
+    ap.add_argument("--workers", type=int, default=8)
+    args = ap.parse_args()
+
+    rtt = args.rtt_ms / 1000.0
+    storage.minio_client = FakeMinio(rtt)
+    storage.db_pool = FakePool(rtt)
+    bodies = [make_packet(args.samples_per_packet) for _ in range(args.messages)]
+
+    single = run_single(bodies)
+    batched = run_batch(bodies, args.batch_size, args.workers)
+
+    print(
+        f"messages={args.messages} rtt={args.rtt_ms}ms batch_size={args.batch_size} "
+        f"workers={args.workers}"
+    )
+    print(f"  single: {args.messages / single:10.1f} msg/s ({single:.2f}s)")
+    print(f"  batch : {args.messages / batched:10.1f} msg/s ({batched:.2f}s)")
+    print(f"  speedup: {single / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Micro-benchmark for per-message timestamp reconstruction in parser.parse_raw_data.
+
+Compares the previous per-sample ``list[datetime]`` construction with the lazy
+SampleTimestamps view (bounds only, as main.prepare_object uses it) and with a
+full datetime64[us] materialization, over packet sizes typical for 256 Hz devices.
+
+Usage (from apps/processor):
+    python -m benchmarks.bench_parser --iterations 5000
+"""
+
+import argparse
+import timeit
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+from neuro_common import packet
+
+from src import parser
+
+PACKET_SIZES = [8, 16, 32, 64, 128, 256]
+
+
+def legacy_timestamps(raw_bytes: bytes, server_received_time: datetime) -> list[datetime]:
+    """The per-sample implementation parse_raw_data used before SampleTimestamps."""
+    payload = raw_bytes[packet.HEADER_SIZE :]
+    num_samples = len(payload) // packet.RECORD_SIZE
+    arr = np.frombuffer(payload, dtype=packet.RECORD_DTYPE, count=num_samples)
+    esp_micros_arr = arr["esp_micros"]
+    boot = server_received_time - timedelta(microseconds=int(esp_micros_arr[-1]))
+    timestamps = [boot + timedelta(microseconds=int(us)) for us in esp_micros_arr.tolist()]
+    return [timestamps[0], timestamps[-1]]
+
+
+def make_raw_packet(num_samples: int) -> bytes:
+    header = b"AA:BB:CC:DD:EE:FF".ljust(packet.HEADER_SIZE, b"\x00")
+    samples = np.zeros(num_samples, dtype=packet.RECORD_DTYPE)
+    samples["esp_micros"] = 1_000_000 + np.arange(num_samples) * 3906
+    return header + samples.tobytes()
+
+
+def bounds_only(raw_bytes: bytes, now: datetime):
+    _, _, ts = parser.parse_raw_data(raw_bytes, now)
+    return ts.start, ts.end
+
+
+def full_array(raw_bytes: bytes, now: datetime):
+    _, _, ts = parser.parse_raw_data(raw_bytes, now)
+    return ts.to_datetime64()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=5000)
+    args = ap.parse_args()
+
+    now = datetime.now(UTC)
+    print(f"{'samples':>8} {'legacy us':>10} {'bounds us':>10} {'array us':>10} {'speedup':>8}")
+    for n in PACKET_SIZES:
+        raw = make_raw_packet(n)
+        assert legacy_timestamps(raw, now) == list(bounds_only(raw, now))
+        results = []
+        for fn in (legacy_timestamps, bounds_only, full_array):
+            seconds = min(
+                timeit.repeat(lambda fn=fn, raw=raw: fn(raw, now), number=args.iterations, repeat=3)
+            )
+            results.append(seconds / args.iterations * 1e6)
+        legacy, bounds, array = results
+        print(f"{n:>8} {legacy:>10.2f} {bounds:>10.2f} {array:>10.2f} {legacy / bounds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+End-to-end load test of the processor: synthetic devices publish through an
+in-process RabbitMQ stand-in into the processor's own main(), which stores
+to in-process MinIO and PostgreSQL stand-ins (neuro_common.loadgen) that
+sleep --rtt-ms per call. Two phases:
+
+  backlog  --backlog-sec of every device's packets published at once; the
+           drain rate is the processor's maximum messages per second
+  paced    --seconds of real-time traffic from every device; latency is
+           measured from publish to ack, i.e. until both stores have the packet
+
+The last line of output is the results as JSON, for benchmarks/e2e.py in
+the repository root.
+
+Usage (from apps/processor):
+    python -m benchmarks.e2e_processor --devices 20 --seconds 10 --ingest-mode batch
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+# Read by src.config at import; the load test serves no metrics and prints no pool stats
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("POOL_STATS_INTERVAL_SEC", "0")
+
+import pika
+from neuro_common import loadgen
+
+from src import config, storage
+from src import main as processor_main
+
+
+def streams(
+    devices: list[loadgen.SyntheticDevice], first: int, count: int
+) -> list[list[tuple[bytes, dict]]]:
+    """
+    Packets first..first+count of every device with the collector's headers (one
+    user per device).
+    """
+    return [
+        [(device.packet(i), {"user_id": f"user{n}"}) for i in range(first, first + count)]
+        for n, device in enumerate(devices)
+    ]
+
+
+def run(args) -> dict:
+    devices = loadgen.make_devices(args.devices, args.sample_rate, args.samples_per_packet)
+    interval = devices[0].packet_interval
+    backlog_packets = max(1, round(args.backlog_sec / interval))
+    paced_packets = max(1, round(args.seconds / interval))
+    # Generated up front so compressing them does not count against the processor
+    backlog = [m for stream in streams(devices, 0, backlog_packets) for m in stream]
+    paced = streams(devices, backlog_packets, paced_packets)
+
+    rtt = args.rtt_ms / 1000
+    broker = loadgen.LocalBroker()
+    store = storage.minio_client = loadgen.MemoryObjectStore(rtt)
+    db_pool = storage.db_pool = loadgen.MemoryDbPool(rtt, config.DB_POOL_MAX_SIZE)
+    pika.BlockingConnection = broker.connect
+    config.INGEST_MODE = args.ingest_mode
+    processor = threading.Thread(target=processor_main.main, daemon=True)
+    processor.start()
+    broker.wait_bound()
+
+    started = time.perf_counter()
+    loadgen.publish_backlog(broker, backlog)
+    if not broker.wait_acked(len(backlog), args.timeout):
+        raise TimeoutError(f"backlog: {broker.acked} of {len(backlog)} messages acked")
+    drain_seconds = time.perf_counter() - started
+    broker.take_latencies()
+
+    started = time.perf_counter()
+    behind = loadgen.publish_paced(broker, paced, interval)
+    total = len(backlog) + args.devices * paced_packets
+    if not broker.wait_acked(total, args.timeout):
+        raise TimeoutError(f"paced: {broker.acked} of {total} messages acked")
+    paced_seconds = time.perf_counter() - started
+    latency = loadgen.latency_summary(broker.take_latencies())
+    broker.close()
+    processor.join(timeout=30)
+
+    return {
+        "ingest_mode": args.ingest_mode,
+        "messages_per_sec": len(backlog) / drain_seconds,
+        "offered_messages_per_sec": args.devices / interval,
+        "paced_messages_per_sec": args.devices * paced_packets / paced_seconds,
+        "publisher_behind_sec": behind,
+        "latency_p50_ms": latency["p50_ms"],
+        "latency_p95_ms": latency["p95_ms"],
+        "latency_p99_ms": latency["p99_ms"],
+        "latency_max_ms": latency["max_ms"],
+        "objects_stored": len(store),
+        "rows_inserted": db_pool.rows,
+        "nacked": broker.nacked,
+        "peak_rss_mb": loadgen.peak_rss_mb(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--devices", type=int, default=20)
+    ap.add_argument("--seconds", type=float, default=10.0, help="length of the paced phase")
+    ap.add_argument(
+        "--backlog-sec", type=float, default=10.0, help="recording time per device in the backlog"
+    )
+    ap.add_argument("--sample-rate", type=int, default=256)
+    ap.add_argument("--samples-per-packet", type=int, default=32)
+    ap.add_argument("--rtt-ms", type=float, default=1.0, help="simulated round trip per store call")
+    ap.add_argument("--ingest-mode", choices=["single", "batch"], default=config.INGEST_MODE)
+    ap.add_argument("--timeout", type=float, default=300.0)
+    args = ap.parse_args()
+
+    result = run(args)
+    print(
+        f"devices={args.devices} ({result['offered_messages_per_sec']:.0f} msg/s offered), "
+        f"rtt={args.rtt_ms}ms, ingest_mode={args.ingest_mode}"
+    )
+    print(f"  backlog drain: {result['messages_per_sec']:10.1f} msg/s")
+    print(
+        f"  paced latency: p50 {result['latency_p50_ms']:.1f} ms, p95 "
+        f"{result['latency_p95_ms']:.1f} ms, "
+        f"p99 {result['latency_p99_ms']:.1f} ms"
+    )
+    print(f"  peak RSS     : {result['peak_rss_mb']:.0f} MB")
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config, storage
+
+
+class IngestBatch:
+    """
+    受信したメッセージをまとめ、MinIOへの並列アップロードと
+    PostgreSQLへの一括INSERTを1回のフラッシュで行うバッファ。
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self._executor = executor
+        self._records: list[tuple[dict, bytes]] = []
+        self._last_delivery_tag: int | None = None
+        self.opened_at: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def last_delivery_tag(self) -> int | None:
+        return self._last_delivery_tag
+
+    def add(self, delivery_tag: int, metadata: dict | None = None, body: bytes | None = None):
+        """
+        メッセージをバッチに追加する。metadataがNoneの場合は保存対象がないメッセージとして
+        delivery_tagのみを記録し、バッチ全体のackに含める。
+        """
+        if self.opened_at is None:
+            self.opened_at = time.monotonic()
+        if metadata is not None:
+            self._records.append((metadata, body))
+        self._last_delivery_tag = delivery_tag
+
+    def flush(self) -> int | None:
+        """
+        バッチ内の全オブジェクトをアップロードし、メタデータを1トランザクションで書き込む。
+        コミットされなかったアップロード済みオブジェクトはコンパクターのGCが削除する。
+        両方のストアへの書き込みが成功した場合にのみ、ack対象の最後のdelivery_tagを返す。
+        失敗時は例外を送出する（呼び出し側でnackしてclearする）。
+        """
+        last_tag = self._last_delivery_tag
+        if self._records:
+            # 一部だけアップロードされて失敗した場合、再送時は別のobject_idになるため、
+            # アップロード前にGC待ちに登録しておき、メタデータのコミットと同時に解除する
+            with storage.get_db_connection() as db_conn:
+                storage.register_pending_objects(
+                    db_conn,
+                    [metadata["object_id"] for metadata, _ in self._records],
+                    config.COMPACTION_GC_DELAY_SEC,
+                )
+            futures = [
+                self._executor.submit(
+                    storage.upload_to_minio, metadata["object_id"], body, metadata["zstd_dict_id"]
+                )
+                for metadata, body in self._records
+            ]
+            for future in futures:
+                future.result()
+
+            # 失敗時はプールがロールバックしてから接続を返却する
+            with storage.get_db_connection() as db_conn:
+                storage.insert_raw_data_metadata_batch_to_db(
+                    db_conn, [metadata for metadata, _ in self._records]
+                )
+
+        self.clear()
+        return last_tag
+
+    def clear(self):
+        self._records = []
+        self._last_delivery_tag = None
+        self.opened_at = None
@@ -0,0 +1,144 @@
+from collections import deque
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+from . import config
+
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+# esp_micros は <u4 のため約71.6分で一周する
+ESP_MICROS_WRAP = 1 << 32
+# この範囲内の巻き戻りは順序入れ替わり・再送とみなし、wraparoundとは扱わない
+REORDER_TOLERANCE_US = 60_000_000
+
+
+def to_unix_us(dt: datetime) -> int:
+    return (dt - UNIX_EPOCH) // timedelta(microseconds=1)
+
+
+class DeviceClock:
+    """
+    1デバイス分のクロック同期モデル。
+
+    オフセット（サーバー時刻 - デバイス時刻）の観測値はネットワーク遅延の分だけ
+    常に真値より大きくなるため、直近 window パケットの最小値を真のオフセットの推定とする
+    （単調デックによるスライディング最小値で、更新は償却O(1)、メモリは window 件まで）。
+    水晶のドリフトは、ウィンドウが一巡するごとの最小値の傾きを指数平滑して推定する。
+    esp_micros の wraparound とデバイスの再起動は、前回パケットからのサーバー経過時間と
+    照合して区別する。
+    """
+
+    def __init__(self, window: int, drift_smoothing: float, reboot_tolerance_us: int):
+        self._window = window
+        self._drift_smoothing = drift_smoothing
+        self._reboot_tolerance_us = reboot_tolerance_us
+        self.reset()
+
+    def reset(self):
+        self._wrap_base = 0
+        self._last_raw: int | None = None
+        self._last_device_us = 0
+        self._last_server_us = 0
+        self._seq = 0
+        # (seq, device_us, offset_us) をオフセット昇順に保持する単調デック
+        self._min_window: deque[tuple[int, int, int]] = deque()
+        self._anchor: tuple[int, int] | None = None
+        self.drift = 0.0  # オフセットの変化率 (us/us)
+
+    def _unwrap(self, esp_micros: np.ndarray, server_us: int) -> tuple[np.ndarray, bool]:
+        """
+        wraparound補正済みのデバイス時刻[us]と、このパケットが最新のパケットより古いか（再送・
+        順序入れ替わり）を返す。古いパケットではモデルの状態を更新しない。
+        """
+        raw = esp_micros.astype(np.int64)
+        first_raw = int(raw[0])
+        stale = False
+        if self._last_raw is not None and first_raw < self._last_raw:
+            elapsed_us = server_us - self._last_server_us
+            if self._last_raw - first_raw <= REORDER_TOLERANCE_US:
+                stale = True
+            elif (
+                abs(
+                    self._wrap_base
+                    + ESP_MICROS_WRAP
+                    + first_raw
+                    - (self._last_device_us + elapsed_us)
+                )
+                <= self._reboot_tolerance_us
+            ):
+                self._wrap_base += ESP_MICROS_WRAP
+            elif first_raw <= server_us - (
+                self._last_device_us + self._estimate(self._last_device_us)
+            ):
+                # 再起動したデバイスのカウンタは、前回のパケットの最終サンプル
+                # （サーバー時刻の推定値）からの経過時間を超えない
+                self.reset()
+            else:
+                # それより長く動いているデバイスの古いパケット = 再送（requeueなど）
+                stale = True
+
+        # パケット内部での wraparound もベクトル演算で補正する
+        wraps = np.zeros(len(raw), dtype=np.int64)
+        np.cumsum(np.diff(raw) < -REORDER_TOLERANCE_US, out=wraps[1:])
+        device_us = self._wrap_base + raw + wraps * ESP_MICROS_WRAP
+        if not stale:
+            self._wrap_base += int(wraps[-1]) * ESP_MICROS_WRAP
+        return device_us, stale
+
+    def _estimate(self, device_us: int) -> float:
+        _, min_device_us, min_offset = self._min_window[0]
+        return min_offset + self.drift * (device_us - min_device_us)
+
+    def observe(
+        self, esp_micros: np.ndarray, server_received_time: datetime
+    ) -> tuple[datetime, np.ndarray]:
+        """
+        1パケット分の esp_micros を取り込み、推定を更新する。
+        (サーバー時刻系でのデバイス起動時刻, wraparound補正済みのデバイス時刻[us]) を返す。
+        最新のパケットより古いパケットは、推定を更新せずに現在のモデルで時刻を付ける。
+        """
+        server_us = to_unix_us(server_received_time)
+        device_us, stale = self._unwrap(esp_micros, server_us)
+        last_device_us = int(device_us[-1])
+        if stale:
+            offset = int(round(self._estimate(last_device_us)))
+            return UNIX_EPOCH + timedelta(microseconds=offset), device_us
+        observed = server_us - last_device_us
+
+        self._seq += 1
+        window = self._min_window
+        while window and window[-1][2] >= observed:
+            window.pop()
+        window.append((self._seq, last_device_us, observed))
+        while window[0][0] <= self._seq - self._window:
+            window.popleft()
+
+        _, min_device_us, min_offset = window[0]
+        if self._seq % self._window == 0:
+            if self._anchor is not None and min_device_us != self._anchor[0]:
+                slope = (min_offset - self._anchor[1]) / (min_device_us - self._anchor[0])
+                self.drift += self._drift_smoothing * (slope - self.drift)
+            self._anchor = (min_device_us, min_offset)
+
+        # 推定時刻が受信時刻を追い越さないようにする
+        offset = min(int(round(self._estimate(last_device_us))), observed)
+
+        self._last_raw = int(esp_micros[-1])
+        self._last_device_us = last_device_us
+        self._last_server_us = server_us
+        return UNIX_EPOCH + timedelta(microseconds=offset), device_us
+
+
+DEVICE_CLOCKS: dict[str, DeviceClock] = {}
+
+
+def get_device_clock(device_id: str) -> DeviceClock:
+    clock = DEVICE_CLOCKS.get(device_id)
+    if clock is None:
+        clock = DeviceClock(
+            window=config.CLOCK_SYNC_WINDOW,
+            drift_smoothing=config.CLOCK_DRIFT_SMOOTHING,
+            reboot_tolerance_us=int(config.CLOCK_REBOOT_TOLERANCE_SEC * 1_000_000),
+        )
+        DEVICE_CLOCKS[device_id] = clock
+    return clock
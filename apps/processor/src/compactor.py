@@ -0,0 +1,284 @@
+"""
+パケット単位の小さなオブジェクトを、ユーザー・デバイスごとの時間バケット
+（COMPACTION_BUCKET_SEC、既定10分）単位のチャンク化オブジェクトにまとめるバックグラウンドサービス。
+
+まとめたオブジェクトは neuro_common.chunk の列指向レイアウトで保存され、チャンク索引により
+読み手は必要な時間範囲だけを範囲GETで取得できる。メタデータの置き換え（行の追加、
+session_object_linksの付け替え、元の行の削除）は1トランザクションで行い、元のMinIOオブジェクトは
+COMPACTION_GC_DELAY_SEC 経過後に削除する。遅れて届いたパケットがある場合は、既存の
+チャンク化オブジェクトと合わせて作り直す。
+
+長時間の記録を概観表示できるよう、EEGのチャンネルごとのmin/max/mean要約
+（neuro_common.summary、COMPACTION_SUMMARY_LEVELS_SEC の各時間幅）も同じオブジェクトの
+セクションとして保存する。
+
+Usage (from apps/processor):
+    python -m src.compactor [--once]
+"""
+
+import argparse
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+from neuro_common import chunk, codec, db, log, metrics, object_store, packet, summary
+
+from . import config, storage
+
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+GC_BATCH_SIZE = 1000
+
+logger = log.get_logger("compactor")
+_DECOMPRESS = metrics.STAGE_SECONDS.labels("decompress")
+_ENCODE = metrics.STAGE_SECONDS.labels("chunk_encode")
+_SAMPLES = metrics.SAMPLES_TOTAL.labels("compaction")
+
+
+def to_us(t: datetime) -> int:
+    return (t - EPOCH) // timedelta(microseconds=1)
+
+
+def from_us(us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=us)
+
+
+def packet_times(start_us: np.ndarray, micros: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    パケットごとの先頭サンプル時刻 start_us[i] と esp_micros から各サンプルの時刻[µs]を求める
+    （サンプル offsets[i]:offsets[i + 1] がパケット i）。processorは先頭サンプルの時刻を
+    start_timeとして保存しているため、以降のサンプルはesp_microsの差分（wraparoundを考慮）から求める。
+    """
+    counts = np.diff(offsets)
+    micros = micros.astype(np.int64)
+    # サンプルのないパケットは除いて各パケットの先頭のesp_microsを求める
+    nonempty = counts > 0
+    first = np.repeat(micros[offsets[:-1][nonempty]], counts[nonempty])
+    return np.repeat(start_us, counts) + (micros - first) % (1 << 32)
+
+
+def decode_packet_object(data: bytes, start_time: datetime) -> tuple[np.ndarray, np.ndarray]:
+    """
+    パケットオブジェクトを (各サンプルの時刻[µs], レコード配列) に変換する
+    （レコードは解凍後のバッファ上のビュー）。
+    """
+    decoded = packet.decode(codec.decompress(data))
+    offsets = np.array([0, len(decoded)])
+    return packet_times(np.array([to_us(start_time)]), decoded.esp_micros, offsets), decoded.records
+
+
+def load_bucket(
+    objects: list[tuple], executor: ThreadPoolExecutor
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    バケット内の全オブジェクトを取得し、時刻順に並べた (時刻, 列ごとの配列) を返す。
+    パケットオブジェクトは解凍だけを並列に行い、まとめて1つの列配列にデコードする。
+    """
+    names = list(packet.RECORD_DTYPE.names)
+
+    def fetch(obj):
+        object_id, start_time = obj
+        data = storage.download_object(object_id)
+        if chunk.is_chunk_object(object_id):
+            _, columns = chunk.decode(data, names)
+            return columns.pop(chunk.TIME_COLUMN), columns
+        with _DECOMPRESS.time():
+            return to_us(start_time), codec.decompress(data)
+
+    parts, packet_starts, packet_bodies = [], [], []
+    for time_part, body in executor.map(fetch, objects):
+        if isinstance(body, dict):
+            parts.append((time_part, body))
+        else:
+            packet_starts.append(time_part)
+            packet_bodies.append(body)
+    if packet_bodies:
+        batch = packet.decode_batch(packet_bodies)
+        time_us = packet_times(
+            np.array(packet_starts, dtype=np.int64), batch["esp_micros"], batch.offsets
+        )
+        parts.append((time_us, batch.columns()))
+    time_us = np.concatenate([t for t, _ in parts])
+    # 遅れて届いたパケットが既存の区間の間に入る場合があるため、サンプル単位で安定ソートする
+    order = np.argsort(time_us, kind="stable")
+    columns = {name: np.concatenate([c[name] for _, c in parts])[order] for name in names}
+    return time_us[order], columns
+
+
+def build_summaries(time_us: np.ndarray, eeg: np.ndarray) -> dict[str, bytes]:
+    """時間幅ごとのEEG要約を、チャンク化オブジェクトのセクションとしてエンコードする。"""
+    return {
+        summary.section_name(level): summary.encode(
+            summary.summarize(time_us, eeg, level * 1_000_000), config.COMPACTION_ZSTD_LEVEL
+        )
+        for level in config.COMPACTION_SUMMARY_LEVELS_SEC
+    }
+
+
+def compact_bucket(
+    user_id: str, device_id: str | None, bucket_start: datetime, executor: ThreadPoolExecutor
+) -> int:
+    """1つのバケットをまとめ、置き換えた元オブジェクト数を返す（他のプロセスが先に置き換えた場合は0）。"""
+    bucket_end = bucket_start + timedelta(seconds=config.COMPACTION_BUCKET_SEC)
+    # ダウンロード・エンコードの間は接続をプールに返しておく
+    with storage.get_db_connection() as db_conn:
+        objects = storage.get_bucket_objects(db_conn, user_id, device_id, bucket_start, bucket_end)
+    if len(objects) < 2:
+        return 0
+
+    time_us, columns = load_bucket(objects, executor)
+    if len(time_us) == 0:
+        return 0
+    with _ENCODE.time():
+        payload = chunk.encode(
+            time_us,
+            columns,
+            {"user_id": user_id, "device_id": device_id, "source_objects": len(objects)},
+            config.COMPACTION_CHUNK_SAMPLES,
+            config.COMPACTION_ZSTD_LEVEL,
+            sections=build_summaries(time_us, columns["eeg"]),
+        )
+    start_time, end_time = from_us(int(time_us[0])), from_us(int(time_us[-1]))
+    device = (device_id or "unknown_device").replace(":", "")
+    object_id = (
+        f"eeg/{user_id}/{to_us(start_time) // 1000}-{to_us(end_time) // 1000}_{device}_"
+        f"{uuid.uuid4().hex[:8]}{chunk.OBJECT_SUFFIX}"
+    )
+
+    with storage.get_db_connection() as db_conn:
+        storage.register_pending_object(db_conn, object_id, config.COMPACTION_GC_DELAY_SEC)
+    storage.upload_to_minio(object_id, payload, content_type="application/octet-stream")
+    metadata = {
+        "object_id": object_id,
+        "user_id": user_id,
+        "device_id": device_id,
+        "start_time": start_time,
+        "end_time": end_time,
+        "data_type": "eeg",
+    }
+    old_ids = [obj[0] for obj in objects]
+    with storage.get_db_connection() as db_conn:
+        if not storage.replace_with_compacted_object(
+            db_conn, metadata, old_ids, config.COMPACTION_GC_DELAY_SEC
+        ):
+            # アップロードしたオブジェクトは未確定のままなのでGCが削除する
+            logger.info(
+                "bucket changed concurrently; skipped",
+                user_id=user_id,
+                device_id=device_id,
+                bucket_start=bucket_start.isoformat(),
+            )
+            return 0
+    _SAMPLES.inc(len(time_us))
+    logger.info(
+        "compacted bucket",
+        objects=len(old_ids),
+        samples=len(time_us),
+        bytes=len(payload),
+        object_id=object_id,
+    )
+    return len(old_ids)
+
+
+def collect_garbage() -> int:
+    """削除期限を過ぎた元オブジェクトをMinIOから削除し、削除した数を返す。"""
+    removed = 0
+    while True:
+        with storage.get_db_connection() as db_conn:
+            object_ids = storage.get_expired_garbage(db_conn, GC_BATCH_SIZE)
+        if not object_ids:
+            return removed
+        failed = set(storage.remove_objects(object_ids))
+        done = [object_id for object_id in object_ids if object_id not in failed]
+        if done:
+            with storage.get_db_connection() as db_conn:
+                storage.delete_garbage_records(db_conn, done)
+            removed += len(done)
+        if failed:
+            logger.error("failed to remove garbage objects; will retry", objects=len(failed))
+            return removed
+
+
+def run_pass(executor: ThreadPoolExecutor) -> tuple[int, int]:
+    """対象バケットを古い順にまとめ、(まとめたバケット数, 置き換えた元オブジェクト数) を返す。"""
+    with storage.get_db_connection() as db_conn:
+        buckets = storage.find_compaction_buckets(
+            db_conn,
+            config.COMPACTION_BUCKET_SEC,
+            config.COMPACTION_MIN_AGE_SEC,
+            config.COMPACTION_MAX_BUCKETS_PER_PASS,
+        )
+    num_buckets = num_objects = 0
+    for user_id, device_id, bucket_start in buckets:
+        try:
+            replaced = compact_bucket(user_id, device_id, bucket_start, executor)
+        except Exception as e:
+            logger.error(
+                "failed to compact bucket",
+                user_id=user_id,
+                device_id=device_id,
+                bucket_start=bucket_start.isoformat(),
+                error=str(e),
+            )
+            continue
+        if replaced:
+            num_buckets += 1
+            num_objects += replaced
+    return num_buckets, num_objects
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Compacts packet objects into chunked time-bucket objects."
+    )
+    ap.add_argument("--once", action="store_true", help="run a single pass and exit")
+    args = ap.parse_args()
+
+    print("🚀 Starting Compactor Service...")
+    log.configure(config.LOG_LEVEL, config.LOG_RATE_LIMIT_SEC)
+    storage.ensure_minio_bucket_exists()
+    codec.set_dictionary_loader(storage.download_dictionary)
+    storage.get_db_pool().wait()
+    if config.METRICS_PORT and not args.once:
+        metrics.register_collector(metrics.dict_collector("neuro_db_pool", db.metrics, "pool"))
+        metrics.register_collector(
+            metrics.dict_collector("neuro_minio_pool", object_store.metrics, "client")
+        )
+        metrics.start_http_server(config.METRICS_PORT, profiling=config.PROFILER_ENABLED)
+        print(f"📊 Serving metrics at http://0.0.0.0:{config.METRICS_PORT}/metrics.")
+    print(
+        f"✅ Compacting into {config.COMPACTION_BUCKET_SEC}s buckets older than "
+        f"{config.COMPACTION_MIN_AGE_SEC}s "
+        f"every {config.COMPACTION_INTERVAL_SEC}s."
+    )
+
+    executor = ThreadPoolExecutor(max_workers=config.COMPACTION_FETCH_WORKERS)
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                num_buckets, num_objects = run_pass(executor)
+                removed = collect_garbage()
+                if num_buckets or removed:
+                    logger.info(
+                        "compaction pass finished",
+                        buckets=num_buckets,
+                        objects=num_objects,
+                        removed=removed,
+                        seconds=round(time.monotonic() - started, 1),
+                    )
+            except Exception as e:
+                logger.error("compaction pass failed", error=str(e))
+            if args.once:
+                break
+            time.sleep(config.COMPACTION_INTERVAL_SEC)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait=True)
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
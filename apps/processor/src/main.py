@@ -1,72 +1,218 @@
-import pika
 import time
 import uuid
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+
+import pika
+from neuro_common import codec, db, log, metrics, object_store
+
 from . import config, parser, storage
+from .batch import IngestBatch
+
+logger = log.get_logger("processor")
+_QUEUE_LAG = metrics.QUEUE_LAG_SECONDS.labels("raw_data")
+_STORED = metrics.MESSAGES_TOTAL.labels("stored")
+_SKIPPED = metrics.MESSAGES_TOTAL.labels("skipped")
+_FAILED = metrics.MESSAGES_TOTAL.labels("failed")
+
+
+def observe_queue_lag(properties, server_received_time: datetime):
+    """collectorが付与した発行時刻（published_at_ms ヘッダー）から受信までの遅延を記録する。"""
+    published_at_ms = (properties.headers or {}).get("published_at_ms")
+    if published_at_ms is not None:
+        _QUEUE_LAG.observe(max(0.0, server_received_time.timestamp() - published_at_ms / 1000))
+
+
+def prepare_object(
+    body: bytes, user_id: str, server_received_time: datetime
+) -> tuple[dict, bytes] | None:
+    """
+    メッセージ本体をパースし、raw_data_objectsに保存するメタデータとMinIOに保存する本体を生成する。
+    保存すべきサンプルがない場合はNoneを返す。
+    """
+    raw_bytes = parser.decompress(body)
+    if raw_bytes is None:
+        return None
+    try:
+        # データをパースしてタイムスタンプとデバイスIDを抽出
+        device_id, _, timestamps = parser.parse_raw_data(raw_bytes, server_received_time)
+    except Exception as e:
+        logger.error("failed to parse raw data", user_id=user_id, error=str(e))
+        return None
+    if not timestamps:
+        return None
+
+    # 開始・終了時刻のみを取得し、サンプルごとのタイムスタンプは展開しない
+    start_time = timestamps.start
+    end_time = timestamps.end
+
+    # MinIOオブジェクトキーを生成
+    start_ms = int(start_time.timestamp() * 1000)
+    end_ms = int(end_time.timestamp() * 1000)
+    unique_id = uuid.uuid4().hex[:8]
+    object_id = f"eeg/{user_id}/{start_ms}-{end_ms}_{device_id.replace(':', '')}_{unique_id}.zst"
+
+    # 辞書が設定されている場合は、小さなパケットでも圧縮率が出るよう辞書付きで再圧縮する
+    if config.ZSTD_DICT_ID:
+        payload = codec.compress(raw_bytes, config.ZSTD_DICT_ID, config.ZSTD_LEVEL)
+    else:
+        payload = body
+
+    metadata = {
+        "object_id": object_id,
+        "user_id": user_id,
+        "device_id": device_id,
+        "start_time": start_time,
+        "end_time": end_time,
+        "data_type": "eeg",
+        "zstd_dict_id": config.ZSTD_DICT_ID,
+    }
+    return metadata, payload
+
 
 def main():
     print("🚀 Starting Processor Service...")
+    log.configure(config.LOG_LEVEL, config.LOG_RATE_LIMIT_SEC)
+    if config.METRICS_PORT:
+        metrics.register_collector(metrics.dict_collector("neuro_db_pool", db.metrics, "pool"))
+        metrics.register_collector(
+            metrics.dict_collector("neuro_minio_pool", object_store.metrics, "client")
+        )
+        metrics.start_http_server(config.METRICS_PORT, profiling=config.PROFILER_ENABLED)
+        print(f"📊 Serving metrics at http://0.0.0.0:{config.METRICS_PORT}/metrics.")
     storage.ensure_minio_bucket_exists()
-    db_conn = storage.get_db_connection()
-    print("✅ Connected to PostgreSQL.")
+    codec.set_dictionary_loader(storage.download_dictionary)
+    if config.ZSTD_DICT_ID:
+        codec.get_dictionary(config.ZSTD_DICT_ID)
+        print(f"✅ Loaded zstd dictionary {config.ZSTD_DICT_ID}.")
+    # 起動時に最小接続数が確立するまで待つ（以降の切断はプールが自動で張り直す）
+    storage.get_db_pool().wait()
+    print(
+        "✅ Connected to PostgreSQL (pool size "
+        f"{config.DB_POOL_MIN_SIZE}-{config.DB_POOL_MAX_SIZE})."
+    )
 
     connection = pika.BlockingConnection(pika.URLParameters(config.RABBITMQ_URL))
     channel = connection.channel()
 
     # Fanout Exchangeにバインドするための専用キューを作成
-    queue_result = channel.queue_declare(queue='', exclusive=True)
+    queue_result = channel.queue_declare(queue="", exclusive=True)
     queue_name = queue_result.method.queue
-    channel.queue_bind(exchange='raw_data_exchange', queue=queue_name)
-    channel.basic_qos(prefetch_count=1)
-    print(f"✅ Bound to 'raw_data_exchange', waiting for messages.")
+    channel.queue_bind(exchange="raw_data_exchange", queue=queue_name)
 
     def callback(ch, method, properties, body):
-        server_received_time = datetime.now(timezone.utc)
-        print(f"[{server_received_time.isoformat()}] Received message.")
+        server_received_time = datetime.now(UTC)
+        observe_queue_lag(properties, server_received_time)
         try:
             user_id = properties.headers.get("user_id", "unknown_user")
-            
-            # データをパースしてタイムスタンプとデバイスIDを抽出
-            device_id, _, timestamps = parser.decompress_and_parse(body, server_received_time)
-            if not timestamps:
+            prepared = prepare_object(body, user_id, server_received_time)
+            if prepared is None:
+                _SKIPPED.inc()
                 ch.basic_ack(delivery_tag=method.delivery_tag)
                 return
-
-            start_time = timestamps[0]
-            end_time = timestamps[-1]
-
-            # MinIOオブジェクトキーを生成
-            start_ms = int(start_time.timestamp() * 1000)
-            end_ms = int(end_time.timestamp() * 1000)
-            unique_id = uuid.uuid4().hex[:8]
-            object_id = f"eeg/{user_id}/{start_ms}-{end_ms}_{device_id.replace(':', '')}_{unique_id}.zst"
+            metadata, payload = prepared
 
             # MinIOに圧縮済みデータをアップロード
-            storage.upload_to_minio(object_id, body)
-            
+            storage.upload_to_minio(metadata["object_id"], payload, metadata["zstd_dict_id"])
+
             # PostgreSQLにメタデータを挿入
-            metadata = {
-                "object_id": object_id, "user_id": user_id, "device_id": device_id,
-                "start_time": start_time, "end_time": end_time, "data_type": "eeg",
-            }
-            storage.insert_raw_data_metadata_to_db(db_conn, metadata)
-            
+            with storage.get_db_connection() as db_conn:
+                storage.insert_raw_data_metadata_to_db(db_conn, metadata)
+
             ch.basic_ack(delivery_tag=method.delivery_tag)
-            print(f"  - Successfully processed message for device {device_id}.")
+            _STORED.inc()
+            logger.info(
+                "message stored", device_id=metadata["device_id"], object_id=metadata["object_id"]
+            )
         except Exception as e:
-            print(f"❌ An unexpected error occurred: {e}")
+            _FAILED.inc()
+            logger.error("unexpected error", error=str(e))
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
             time.sleep(5)
 
-    channel.basic_consume(queue=queue_name, on_message_callback=callback)
+    # --- Batch mode ---
+    executor = ThreadPoolExecutor(max_workers=config.UPLOAD_WORKERS)
+    batch = IngestBatch(executor)
+
+    def flush_batch():
+        if batch.last_delivery_tag is None:
+            return
+        num_records = len(batch)
+        try:
+            last_tag = batch.flush()
+            # 両方のストアへの書き込みが完了してからバッチ全体をまとめてack
+            channel.basic_ack(delivery_tag=last_tag, multiple=True)
+            _STORED.inc(num_records)
+            logger.info("flushed batch", objects=num_records)
+        except Exception as e:
+            _FAILED.inc(num_records)
+            logger.error("failed to flush batch", objects=num_records, error=str(e))
+            channel.basic_nack(delivery_tag=batch.last_delivery_tag, multiple=True, requeue=True)
+            batch.clear()
+            time.sleep(5)
+
+    def on_flush_timer():
+        if (
+            batch.opened_at is not None
+            and time.monotonic() - batch.opened_at >= config.BATCH_FLUSH_INTERVAL_SEC
+        ):
+            flush_batch()
+        connection.call_later(config.BATCH_FLUSH_INTERVAL_SEC / 2, on_flush_timer)
+
+    def batch_callback(ch, method, properties, body):
+        server_received_time = datetime.now(UTC)
+        observe_queue_lag(properties, server_received_time)
+        try:
+            user_id = properties.headers.get("user_id", "unknown_user")
+            prepared = prepare_object(body, user_id, server_received_time)
+        except Exception as e:
+            # 本体の処理で失敗したメッセージは再送しても同じ結果になるため、再キューせずに破棄する
+            # （requeueすると即座に再配信され続け、バッチの枠を塞ぐ）
+            _FAILED.inc()
+            logger.error("dropping message that failed to prepare", error=str(e))
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        if prepared is None:
+            _SKIPPED.inc()
+            batch.add(method.delivery_tag)
+        else:
+            batch.add(method.delivery_tag, *prepared)
+        if len(batch) >= config.BATCH_SIZE:
+            flush_batch()
+
+    def on_stats_timer():
+        # METRICS_PORTがなくても使用状況を追えるよう、/metricsと同じ値をログにも出す
+        logger.info("pool stats", db=db.metrics(), minio=object_store.metrics())
+        connection.call_later(config.POOL_STATS_INTERVAL_SEC, on_stats_timer)
+
+    if config.POOL_STATS_INTERVAL_SEC > 0:
+        connection.call_later(config.POOL_STATS_INTERVAL_SEC, on_stats_timer)
+
+    if config.INGEST_MODE == "batch":
+        # バッチが埋まる前にprefetchが尽きないよう、prefetchはバッチサイズ以上にする
+        channel.basic_qos(prefetch_count=max(config.PREFETCH_COUNT, config.BATCH_SIZE))
+        channel.basic_consume(queue=queue_name, on_message_callback=batch_callback)
+        connection.call_later(config.BATCH_FLUSH_INTERVAL_SEC / 2, on_flush_timer)
+        print(
+            f"✅ Bound to 'raw_data_exchange' in batch mode "
+            f"(batch_size={config.BATCH_SIZE}, flush_interval={config.BATCH_FLUSH_INTERVAL_SEC}s)."
+        )
+    else:
+        channel.basic_qos(prefetch_count=1)
+        channel.basic_consume(queue=queue_name, on_message_callback=callback)
+        print("✅ Bound to 'raw_data_exchange', waiting for messages.")
+
     try:
         channel.start_consuming()
     except KeyboardInterrupt:
         channel.stop_consuming()
+        flush_batch()
     finally:
+        executor.shutdown(wait=True)
         connection.close()
-        db_conn.close()
+        db.close_pools()
+
 
 if __name__ == "__main__":
     main()
-
@@ -1,58 +1,96 @@
-import struct
-from datetime import datetime, timedelta, timezone
+from datetime import UTC, datetime, timedelta
+
 import numpy as np
 import zstandard
+from neuro_common import codec, log, metrics, packet
+
+from .clock_sync import get_device_clock
+
+logger = log.get_logger("processor.parser")
+_DECOMPRESS = metrics.STAGE_SECONDS.labels("decompress")
+_PARSE = metrics.STAGE_SECONDS.labels("parse")
+_BYTES_IN = metrics.BYTES_TOTAL.labels("ingest")
+_SAMPLES = metrics.SAMPLES_TOTAL.labels("ingest")
+
+
+class SampleTimestamps:
+    """
+    パケット内の各サンプルのタイムスタンプを「基準時刻 + esp_microsのオフセット」で表す遅延ビュー。
+    開始・終了時刻は全サンプルを展開せずに取得でき、全サンプルが必要な場合は
+    to_datetime64() で1回のベクトル演算により datetime64[us] 配列を生成する。
+    """
+
+    __slots__ = ("base_time", "offsets_us")
+
+    def __init__(self, base_time: datetime, offsets_us: np.ndarray):
+        self.base_time = base_time
+        self.offsets_us = offsets_us
+
+    def __len__(self) -> int:
+        return len(self.offsets_us)
+
+    @property
+    def start(self) -> datetime:
+        return self.base_time + timedelta(microseconds=int(self.offsets_us[0]))
+
+    @property
+    def end(self) -> datetime:
+        return self.base_time + timedelta(microseconds=int(self.offsets_us[-1]))
+
+    def to_datetime64(self) -> np.ndarray:
+        """全サンプルのタイムスタンプを UTC の datetime64[us] 配列として返す。"""
+        base = np.datetime64(self.base_time.astimezone(UTC).replace(tzinfo=None), "us")
+        return base + self.offsets_us.astype("timedelta64[us]")
+
 
-# マイコン側の SensorData 構造体に対応
-ESP32_SENSOR_DATA_DTYPE = np.dtype(
-    [
-        ("eeg", "<u2", (8,)),
-        ("accel", "<f4", (3,)),
-        ("gyro", "<f4", (3,)),
-        ("trig", "u1"),
-        ("imp", "i1", (8,)),
-        ("esp_micros", "<u4"),
-    ]
-)
-ESP32_SENSOR_SIZE = ESP32_SENSOR_DATA_DTYPE.itemsize
-
-# マイコン側の PacketHeader 構造体に対応
-PACKET_HEADER_SIZE = 18
-
-DEVICE_BOOT_TIME_ESTIMATES: dict[str, datetime] = {}
-
-def parse_raw_data(raw_bytes: bytes, server_received_time: datetime) -> tuple[str, np.ndarray, list[datetime]]:
-    if len(raw_bytes) < PACKET_HEADER_SIZE:
-        return "unknown_device", np.array([]), []
-
-    header_bytes = raw_bytes[:PACKET_HEADER_SIZE]
-    device_id = header_bytes.split(b'\x00', 1)[0].decode('utf-8', 'ignore')
-
-    payload_bytes = raw_bytes[PACKET_HEADER_SIZE:]
-    num_samples = len(payload_bytes) // ESP32_SENSOR_SIZE
-    if num_samples == 0:
-        return device_id, np.array([]), []
-
-    structured_array = np.frombuffer(payload_bytes, dtype=ESP32_SENSOR_DATA_DTYPE, count=num_samples)
-    
-    esp_micros_arr = structured_array["esp_micros"]
-    latest_esp_micros = int(esp_micros_arr[-1])
-    esp_boot_time_server = server_received_time - timedelta(microseconds=latest_esp_micros)
-    
-    timestamps = [
-        esp_boot_time_server + timedelta(microseconds=int(us))
-        for us in esp_micros_arr.tolist()
-    ]
+def _empty_timestamps(server_received_time: datetime) -> SampleTimestamps:
+    return SampleTimestamps(server_received_time, np.empty(0, dtype=np.int64))
+
+
+def parse_raw_data(
+    raw_bytes: bytes, server_received_time: datetime
+) -> tuple[str, np.ndarray, SampleTimestamps]:
+    """
+    パケットをコピーせずにデコードする（レコード配列は raw_bytes 上のビュー）。
+    ヘッダーが不正な場合は packet.PacketError を送出する。
+    """
+    with _PARSE.time():
+        decoded = packet.decode(raw_bytes)
+        device_id = decoded.device_id
+        if len(decoded) == 0:
+            return device_id, np.array([]), _empty_timestamps(server_received_time)
+        structured_array = decoded.records
+
+        # デバイスごとのクロックモデルで起動時刻を推定し、ネットワーク遅延のジッタと
+        # esp_micros の wraparound を吸収する
+        clock = get_device_clock(device_id)
+        esp_boot_time_server, device_micros = clock.observe(
+            structured_array["esp_micros"], server_received_time
+        )
+    _SAMPLES.inc(len(decoded))
+
+    timestamps = SampleTimestamps(esp_boot_time_server, device_micros)
     return device_id, structured_array, timestamps
 
-def decompress_and_parse(compressed_body: bytes, server_received_time: datetime) -> tuple[str, np.ndarray, list[datetime]]:
+
+def decompress(compressed_body: bytes) -> bytes | None:
+    _BYTES_IN.inc(len(compressed_body))
     try:
-        raw_bytes = zstandard.ZstdDecompressor().decompress(compressed_body)
-        return parse_raw_data(raw_bytes, server_received_time)
+        with _DECOMPRESS.time():
+            return codec.decompress(compressed_body)
     except zstandard.ZstdError as e:
-        print(f"Error: Zstd decompression failed: {e}")
-        return "unknown_device", np.array([]), []
-    except Exception as e:
-        print(f"Error: Failed to parse raw data: {e}")
-        return "unknown_device", np.array([]), []
+        logger.error("zstd decompression failed", error=str(e))
+        return None
+
 
+def decompress_and_parse(
+    compressed_body: bytes, server_received_time: datetime
+) -> tuple[str, np.ndarray, SampleTimestamps]:
+    raw_bytes = decompress(compressed_body)
+    if raw_bytes is None:
+        return "unknown_device", np.array([]), _empty_timestamps(server_received_time)
+    try:
+        return parse_raw_data(raw_bytes, server_received_time)
+    except Exception as e:
+        logger.error("failed to parse raw data", error=str(e))
+        return "unknown_device", np.array([]), _empty_timestamps(server_received_time)
@@ -1,44 +1,299 @@
 import io
-import psycopg
-from minio import Minio
+
+from minio.deleteobjects import DeleteObject
+from neuro_common import chunk, db, metrics, object_store
+
 from . import config
 
-minio_client = Minio(
+# プロセス全体で共有するクライアント（HTTP接続はアップロードスレッド間で再利用される）
+minio_client = object_store.create_client(
     config.MINIO_ENDPOINT,
-    access_key=config.MINIO_ACCESS_KEY,
-    secret_key=config.MINIO_SECRET_KEY,
-    secure=config.MINIO_SECURE,
+    config.MINIO_ACCESS_KEY,
+    config.MINIO_SECRET_KEY,
+    config.MINIO_SECURE,
+    name="processor-minio",
+    max_connections=config.MINIO_MAX_CONNECTIONS,
 )
+db_pool = None
+
+_MINIO_UPLOAD = metrics.STAGE_SECONDS.labels("minio_upload")
+_MINIO_DOWNLOAD = metrics.STAGE_SECONDS.labels("minio_download")
+_DB_INSERT = metrics.STAGE_SECONDS.labels("db_insert")
+_DB_QUERY = metrics.STAGE_SECONDS.labels("db_query")
+_BYTES_UPLOADED = metrics.BYTES_TOTAL.labels("minio_upload")
+_BYTES_DOWNLOADED = metrics.BYTES_TOTAL.labels("minio_download")
+
 
 def ensure_minio_bucket_exists():
     if not minio_client.bucket_exists(config.MINIO_BUCKET_NAME):
         minio_client.make_bucket(config.MINIO_BUCKET_NAME)
         print(f"Bucket '{config.MINIO_BUCKET_NAME}' created.")
 
-def upload_to_minio(object_name: str, data: bytes) -> str:
-    result = minio_client.put_object(
+
+def upload_to_minio(
+    object_name: str, data: bytes, zstd_dict_id: int = 0, content_type: str = "application/zstd"
+) -> str:
+    with _MINIO_UPLOAD.time():
+        result = minio_client.put_object(
+            config.MINIO_BUCKET_NAME,
+            object_name,
+            io.BytesIO(data),
+            len(data),
+            content_type=content_type,  # 圧縮データを格納
+            # エクスポーター側で復号に使う辞書IDを記録（フレームヘッダーにも含まれる）
+            metadata={"zstd-dict-id": str(zstd_dict_id)},
+        )
+    _BYTES_UPLOADED.inc(len(data))
+    return result.etag
+
+
+def dictionary_object_name(dict_id: int) -> str:
+    return f"{config.ZSTD_DICT_PREFIX}{dict_id}.zdict"
+
+
+def download_dictionary(dict_id: int) -> bytes:
+    response = minio_client.get_object(config.MINIO_BUCKET_NAME, dictionary_object_name(dict_id))
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def upload_dictionary(dict_id: int, dict_bytes: bytes):
+    minio_client.put_object(
         config.MINIO_BUCKET_NAME,
-        object_name,
-        io.BytesIO(data),
-        len(data),
-        content_type="application/zstd", # 圧縮データを格納
+        dictionary_object_name(dict_id),
+        io.BytesIO(dict_bytes),
+        len(dict_bytes),
+        content_type="application/octet-stream",
     )
-    return result.etag
+
+
+def get_db_pool():
+    """初回呼び出し時にPostgreSQLのコネクションプールを作成する（辞書学習など、DBを使わないコマンドでは作らない）。"""
+    global db_pool
+    if db_pool is None:
+        db_pool = db.create_pool(
+            config.DATABASE_URL,
+            name="processor-db",
+            min_size=config.DB_POOL_MIN_SIZE,
+            max_size=config.DB_POOL_MAX_SIZE,
+        )
+    return db_pool
+
 
 def get_db_connection():
-    return psycopg.connect(config.DATABASE_URL)
+    """プールから接続を借りるコンテキストマネージャ。正常終了でコミット、例外時はロールバックして返却する。"""
+    return get_db_pool().connection()
+
 
 def insert_raw_data_metadata_to_db(db_conn, metadata: dict):
+    with _DB_INSERT.time():
+        with db_conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO raw_data_objects (
+                    object_id, user_id, device_id, start_time, end_time, data_type, created_at
+                ) VALUES (
+                    %(object_id)s, %(user_id)s, %(device_id)s,
+                    %(start_time)s, %(end_time)s, %(data_type)s, NOW()
+                )
+                """,
+                metadata,
+            )
+        db_conn.commit()
+
+
+def register_pending_objects(db_conn, object_ids: list[str], delete_after_sec: int):
+    """
+    これからアップロードするオブジェクトをGC待ちに登録する。メタデータの書き込みが
+    コミットされなかった場合（アップロードやCOPYの失敗、クラッシュ）はコンパクターのGCが削除する。
+    """
     with db_conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO compaction_garbage (object_id, compacted_into, delete_after)
+            SELECT unnest(%s::text[]), NULL, NOW() + make_interval(secs => %s)
+            ON CONFLICT (object_id) DO NOTHING
+            """,
+            (object_ids, delete_after_sec),
+        )
+    db_conn.commit()
+
+
+def insert_raw_data_metadata_batch_to_db(db_conn, metadata_list: list[dict]):
+    # 複数行を1回のCOPYで書き込み、GC待ちの登録の解除と合わせて1トランザクションでコミットする
+    with _DB_INSERT.time():
+        with db_conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM compaction_garbage WHERE object_id = ANY(%s)",
+                ([metadata["object_id"] for metadata in metadata_list],),
+            )
+            with cur.copy(
+                """
+                COPY raw_data_objects (
+                    object_id, user_id, device_id, start_time, end_time, data_type
+                ) FROM STDIN
+                """
+            ) as copy:
+                for metadata in metadata_list:
+                    copy.write_row(
+                        (
+                            metadata["object_id"],
+                            metadata["user_id"],
+                            metadata["device_id"],
+                            metadata["start_time"],
+                            metadata["end_time"],
+                            metadata["data_type"],
+                        )
+                    )
+        db_conn.commit()
+
+
+def download_object(object_name: str) -> bytes:
+    with _MINIO_DOWNLOAD.time():
+        response = minio_client.get_object(config.MINIO_BUCKET_NAME, object_name)
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+    _BYTES_DOWNLOADED.inc(len(data))
+    return data
+
+
+def remove_objects(object_names: list[str]) -> list[str]:
+    """まとめて削除し、削除できなかったオブジェクト名を返す（存在しないオブジェクトは削除済みとして扱われる）。"""
+    errors = minio_client.remove_objects(
+        config.MINIO_BUCKET_NAME, (DeleteObject(name) for name in object_names)
+    )
+    return [error.name for error in errors]
+
+
+# --- Compaction ---
+
+
+def find_compaction_buckets(db_conn, bucket_sec: int, min_age_sec: int, limit: int) -> list[tuple]:
+    """
+    未圧縮のオブジェクトを含み、2つ以上のオブジェクトがある
+    (user_id, device_id, バケット開始時刻) を古い順に返す。
+    """
+    with _DB_QUERY.time(), db_conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT user_id, device_id,
+                   to_timestamp(
+                       floor(extract(epoch FROM start_time) / %(bucket)s) * %(bucket)s
+                   ) AS bucket_start
+            FROM raw_data_objects
+            WHERE data_type = 'eeg' AND start_time < NOW() - make_interval(secs => %(min_age)s)
+            GROUP BY 1, 2, 3
+            HAVING count(*) > 1 AND bool_or(object_id NOT LIKE %(chunked)s)
+            ORDER BY bucket_start
+            LIMIT %(limit)s
+            """,
+            {
+                "bucket": bucket_sec,
+                "min_age": min_age_sec,
+                "chunked": f"%{chunk.OBJECT_SUFFIX}",
+                "limit": limit,
+            },
+        )
+        return cur.fetchall()
+
+
+def get_bucket_objects(db_conn, user_id: str, device_id: str | None, start, end) -> list[tuple]:
+    """バケット内のオブジェクトを (object_id, start_time) で開始時刻順に返す。"""
+    with _DB_QUERY.time(), db_conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT object_id, start_time FROM raw_data_objects
+            WHERE user_id = %s AND device_id IS NOT DISTINCT FROM %s AND data_type = 'eeg'
+              AND start_time >= %s AND start_time < %s
+            ORDER BY start_time
+            """,
+            (user_id, device_id, start, end),
+        )
+        return cur.fetchall()
+
+
+def register_pending_object(db_conn, object_id: str, delete_after_sec: int):
+    # アップロード後に置き換えが確定しなかった場合（クラッシュ・競合）はGCが削除する
+    with db_conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO compaction_garbage (object_id, compacted_into, delete_after)
+            VALUES (%s, NULL, NOW() + make_interval(secs => %s))
+            ON CONFLICT (object_id) DO NOTHING
+            """,
+            (object_id, delete_after_sec),
+        )
+
+
+def replace_with_compacted_object(
+    db_conn, metadata: dict, old_object_ids: list[str], gc_delay_sec: int
+) -> bool:
+    """
+    1トランザクションで、圧縮済みオブジェクトの行を追加し、元オブジェクトへの
+    session_object_linksを付け替え、元オブジェクトの行を削除してGC待ちに登録する。
+    元オブジェクトが既に置き換えられていた場合は何もせずFalseを返す。
+    """
+    new_id = metadata["object_id"]
+    with db_conn.cursor() as cur:
+        # 同時に実行された別のコンパクションやリンク作成と競合しないよう、元の行をロックする
+        cur.execute(
+            "SELECT object_id FROM raw_data_objects WHERE object_id = ANY(%s) FOR UPDATE",
+            (old_object_ids,),
+        )
+        if cur.rowcount != len(old_object_ids):
+            db_conn.rollback()
+            return False
         cur.execute(
             """
             INSERT INTO raw_data_objects (
                 object_id, user_id, device_id, start_time, end_time, data_type, created_at
             ) VALUES (
-                %(object_id)s, %(user_id)s, %(device_id)s, %(start_time)s, %(end_time)s, %(data_type)s, NOW()
+                %(object_id)s, %(user_id)s, %(device_id)s,
+                %(start_time)s, %(end_time)s, %(data_type)s, NOW()
             )
             """,
             metadata,
         )
+        cur.execute("DELETE FROM compaction_garbage WHERE object_id = %s", (new_id,))
+        cur.execute(
+            """
+            INSERT INTO session_object_links (session_id, object_id, start_time)
+            SELECT DISTINCT session_id, %s, %s FROM session_object_links WHERE object_id = ANY(%s)
+            ON CONFLICT (session_id, object_id) DO NOTHING
+            """,
+            (new_id, metadata["start_time"], old_object_ids),
+        )
+        cur.execute(
+            """
+            INSERT INTO compaction_garbage (object_id, compacted_into, delete_after)
+            SELECT unnest(%s::text[]), %s, NOW() + make_interval(secs => %s)
+            ON CONFLICT (object_id) DO NOTHING
+            """,
+            (old_object_ids, new_id, gc_delay_sec),
+        )
+        # session_object_linksの元の行はON DELETE CASCADEで削除される
+        cur.execute("DELETE FROM raw_data_objects WHERE object_id = ANY(%s)", (old_object_ids,))
     db_conn.commit()
+    return True
+
 
+def get_expired_garbage(db_conn, limit: int) -> list[str]:
+    with db_conn.cursor() as cur:
+        cur.execute(
+            "SELECT object_id FROM compaction_garbage WHERE delete_after <= NOW() ORDER BY "
+            "delete_after LIMIT %s",
+            (limit,),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def delete_garbage_records(db_conn, object_ids: list[str]):
+    with db_conn.cursor() as cur:
+        cur.execute("DELETE FROM compaction_garbage WHERE object_id = ANY(%s)", (object_ids,))
+    db_conn.commit()
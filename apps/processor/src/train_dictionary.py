@@ -0,0 +1,54 @@
+"""
+MinIOに保存済みのEEGパケットからzstd辞書を学習し、MinIOに保存する。
+
+    python -m src.train_dictionary --samples 5000 --dict-size 16384
+
+出力された辞書IDを ZSTD_DICT_ID に設定すると、以降のオブジェクトは辞書付きで保存される。
+"""
+
+import argparse
+
+from neuro_common import chunk, codec
+
+from . import config, storage
+
+
+def collect_samples(max_samples: int) -> list[bytes]:
+    samples = []
+    objects = storage.minio_client.list_objects(
+        config.MINIO_BUCKET_NAME, prefix="eeg/", recursive=True
+    )
+    for obj in objects:
+        # チャンク化済みオブジェクト（.nchk）はNCHKヘッダーで始まる列形式で、
+        # 辞書で圧縮するパケットとは中身が異なるため学習に使わない
+        if chunk.is_chunk_object(obj.object_name):
+            continue
+        response = storage.minio_client.get_object(config.MINIO_BUCKET_NAME, obj.object_name)
+        try:
+            samples.append(codec.decompress(response.read()))
+        finally:
+            response.close()
+            response.release_conn()
+        if len(samples) >= max_samples:
+            break
+    return samples
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Train a zstd dictionary for EEG packets.")
+    ap.add_argument("--samples", type=int, default=5000, help="number of packets to train on")
+    ap.add_argument("--dict-size", type=int, default=16 * 1024, help="dictionary size in bytes")
+    args = ap.parse_args()
+
+    codec.set_dictionary_loader(storage.download_dictionary)
+    samples = collect_samples(args.samples)
+    print(f"Collected {len(samples)} packets for training.")
+    dictionary = codec.train_dictionary(samples, args.dict_size)
+    dict_id = dictionary.dict_id()
+    storage.upload_dictionary(dict_id, dictionary.as_bytes())
+    print(f"✅ Stored dictionary {dict_id} as '{storage.dictionary_object_name(dict_id)}'.")
+    print(f"   Set ZSTD_DICT_ID={dict_id} to compress new objects with it.")
+
+
+if __name__ == "__main__":
+    main()
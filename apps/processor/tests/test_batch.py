@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import pytest
+
+from src import batch as batch_module
+from src.batch import IngestBatch
+
+
+class FakeStore:
+    """Records what IngestBatch.flush writes to MinIO and PostgreSQL."""
+
+    def __init__(self, monkeypatch, fail_upload: str | None = None, fail_insert: bool = False):
+        self.pending: set[str] = set()
+        self.uploaded: list[str] = []
+        self.rows: list[str] = []
+        self.fail_upload = fail_upload
+        self.fail_insert = fail_insert
+        storage = batch_module.storage
+        monkeypatch.setattr(storage, "get_db_connection", lambda: nullcontext(None))
+        monkeypatch.setattr(storage, "register_pending_objects", self.register_pending_objects)
+        monkeypatch.setattr(storage, "upload_to_minio", self.upload_to_minio)
+        monkeypatch.setattr(
+            storage, "insert_raw_data_metadata_batch_to_db", self.insert_metadata_batch
+        )
+
+    def register_pending_objects(self, db_conn, object_ids, delete_after_sec):
+        self.pending.update(object_ids)
+
+    def upload_to_minio(self, object_id, data, zstd_dict_id=0):
+        if object_id == self.fail_upload:
+            raise OSError("upload failed")
+        self.uploaded.append(object_id)
+
+    def insert_metadata_batch(self, db_conn, metadata_list):
+        if self.fail_insert:
+            raise RuntimeError("copy failed")
+        object_ids = [metadata["object_id"] for metadata in metadata_list]
+        self.pending.difference_update(object_ids)
+        self.rows.extend(object_ids)
+
+
+def make_batch(executor: ThreadPoolExecutor) -> IngestBatch:
+    batch = IngestBatch(executor)
+    for tag in range(1, 4):
+        batch.add(tag, {"object_id": f"eeg/u/{tag}.zst", "zstd_dict_id": 0}, b"body")
+    # A message with nothing to store is still acked with the batch
+    batch.add(4)
+    return batch
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+def test_flush_stores_every_object_and_returns_last_tag(monkeypatch, executor):
+    store = FakeStore(monkeypatch)
+    batch = make_batch(executor)
+    assert batch.flush() == 4
+    assert sorted(store.uploaded) == store.rows == ["eeg/u/1.zst", "eeg/u/2.zst", "eeg/u/3.zst"]
+    assert not store.pending
+    assert len(batch) == 0 and batch.last_delivery_tag is None
+
+
+@pytest.mark.parametrize("failure", [{"fail_upload": "eeg/u/2.zst"}, {"fail_insert": True}])
+def test_failed_flush_leaves_uploaded_objects_to_gc(monkeypatch, executor, failure):
+    store = FakeStore(monkeypatch, **failure)
+    batch = make_batch(executor)
+    with pytest.raises((OSError, RuntimeError)):
+        batch.flush()
+    assert not store.rows
+    # Objects that did reach MinIO are registered for garbage collection
+    assert store.uploaded and set(store.uploaded) <= store.pending
+    # The caller nacks up to the last delivery tag, then clears the batch
+    assert batch.last_delivery_tag == 4
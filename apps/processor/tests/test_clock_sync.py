@@ -0,0 +1,90 @@
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+from src.clock_sync import ESP_MICROS_WRAP, DeviceClock
+
+SAMPLES = 32
+PACKET_US = SAMPLES * 1_000_000 // 256
+BOOT = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+def make_clock() -> DeviceClock:
+    return DeviceClock(window=16, drift_smoothing=0.2, reboot_tolerance_us=30_000_000)
+
+
+def packet(first_us: int) -> np.ndarray:
+    """esp_micros of one packet whose first sample is first_us after boot."""
+    return ((first_us + np.arange(SAMPLES) * (PACKET_US // SAMPLES)) % ESP_MICROS_WRAP).astype(
+        np.uint32
+    )
+
+
+def received(first_us: int, delay_us: int = 20_000, boot: datetime = BOOT) -> datetime:
+    """Server time the packet arrives at, delay_us after its last sample."""
+    last_us = first_us + (SAMPLES - 1) * (PACKET_US // SAMPLES)
+    return boot + timedelta(microseconds=last_us + delay_us)
+
+
+def feed(clock: DeviceClock, start_us: int, count: int, boot: datetime = BOOT) -> datetime:
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        first_us = start_us + i * PACKET_US
+        estimate, _ = clock.observe(
+            packet(first_us), received(first_us, int(rng.integers(5_000, 50_000)), boot)
+        )
+    return estimate
+
+
+def assert_close(a: datetime, b: datetime, tolerance_ms: float = 50.0):
+    """The estimate is late by the smallest network delay seen (5-50 ms here)."""
+    assert abs((a - b).total_seconds()) * 1000 < tolerance_ms, (a, b)
+
+
+def test_steady_stream_estimates_boot_time():
+    clock = make_clock()
+    assert_close(feed(clock, 0, 200), BOOT)
+
+
+def test_redelivered_packets_do_not_reset_the_model():
+    clock = make_clock()
+    # 125 s of packets, so the oldest are well beyond the reorder tolerance
+    count = 1000
+    boot_estimate = feed(clock, 0, count)
+    state = (clock.drift, list(clock._min_window), clock._last_raw, clock._wrap_base)
+    now_first_us = count * PACKET_US
+    for old_first_us in (5 * PACKET_US, (count - 10) * PACKET_US):
+        # Redelivered (e.g. requeued) long after it was sent; a reset would put the boot at ~now
+        estimate, device_us = clock.observe(packet(old_first_us), received(now_first_us))
+        # Timestamped with the current model, extrapolated back with its drift estimate
+        assert_close(estimate, BOOT, 250.0)
+        assert device_us[0] == old_first_us
+    assert (clock.drift, list(clock._min_window), clock._last_raw, clock._wrap_base) == state
+    # The next fresh packet continues with the same model
+    estimate, device_us = clock.observe(packet(now_first_us), received(now_first_us))
+    assert_close(estimate, boot_estimate, 1.0)
+    assert device_us[0] == now_first_us
+
+
+def test_reboot_resets_the_model():
+    clock = make_clock()
+    feed(clock, 100_000_000, 200)
+    last_received = received(100_000_000 + 199 * PACKET_US)
+    # The device restarts 2 s later and sends from 1 s of uptime
+    new_boot = last_received + timedelta(seconds=1)
+    estimate, device_us = clock.observe(packet(1_000_000), received(1_000_000, boot=new_boot))
+    assert_close(estimate, new_boot)
+    assert device_us[0] == 1_000_000
+
+
+def test_wraparound_continues_device_time():
+    clock = make_clock()
+    start_us = ESP_MICROS_WRAP - 50 * PACKET_US
+    feed(clock, start_us, 40)
+    firsts = []
+    for i in range(40, 100):
+        first_us = start_us + i * PACKET_US
+        estimate, device_us = clock.observe(packet(first_us), received(first_us))
+        firsts.append(int(device_us[0]))
+    assert firsts == [start_us + i * PACKET_US for i in range(40, 100)]
+    assert_close(estimate, BOOT)
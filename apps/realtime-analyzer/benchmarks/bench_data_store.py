@@ -0,0 +1,114 @@
+"""
+Benchmark for UserDataStore with hundreds of concurrent users at 256 Hz.
+
+A consumer thread writes 32-sample packets for every user round-robin while an
+analysis thread keeps reading each user's latest window, as the service does.
+The previous deque-based store is included for comparison.
+
+Usage (from apps/realtime-analyzer):
+    python -m benchmarks.bench_data_store --users 300 --seconds 20
+"""
+
+import argparse
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from src import config
+from src.data_store import UserDataStore
+
+
+class DequeUserDataStore:
+    """The deque-per-user store with a single global lock used before RingBuffer."""
+
+    def __init__(self):
+        self._data_buffers = {}
+        self._lock = threading.Lock()
+
+    def add_samples(self, user_id, eeg_samples):
+        with self._lock:
+            if user_id not in self._data_buffers:
+                max_len = int(config.SAMPLE_RATE * config.BUFFER_MAX_SEC)
+                self._data_buffers[user_id] = deque(maxlen=max_len)
+            buffer = self._data_buffers[user_id]
+            for sample in eeg_samples:
+                buffer.append(sample)
+
+    def get_analysis_chunk(self, user_id):
+        with self._lock:
+            buffer = self._data_buffers[user_id]
+            required_samples = int(config.SAMPLE_RATE * config.ANALYSIS_WINDOW_SEC)
+            if len(buffer) < required_samples:
+                return None
+            return np.array(list(buffer)[-required_samples:])
+
+
+def run(store, users: list[str], seconds: int, packet: np.ndarray) -> dict:
+    packets_per_user = seconds * config.SAMPLE_RATE // len(packet)
+    # Pre-fill one analysis window so the reader does real work from the start
+    warmup = int(config.SAMPLE_RATE * config.ANALYSIS_WINDOW_SEC) // len(packet)
+    for _ in range(warmup):
+        for user_id in users:
+            store.add_samples(user_id, packet)
+
+    done = threading.Event()
+    read_latencies = []
+
+    def reader():
+        while not done.is_set():
+            for user_id in users:
+                start = time.perf_counter()
+                store.get_analysis_chunk(user_id)
+                read_latencies.append(time.perf_counter() - start)
+
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    start = time.perf_counter()
+    for _ in range(packets_per_user):
+        for user_id in users:
+            store.add_samples(user_id, packet)
+    ingest_seconds = time.perf_counter() - start
+    done.set()
+    reader_thread.join()
+
+    latencies = np.array(read_latencies) * 1e3
+    samples = packets_per_user * len(users) * len(packet)
+    return {
+        "ingest_samples_per_sec": samples / ingest_seconds,
+        "realtime_factor": seconds / ingest_seconds,
+        "reads": len(latencies),
+        "read_ms_mean": latencies.mean(),
+        "read_ms_p99": np.percentile(latencies, 99),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--users", type=int, default=300)
+    ap.add_argument("--seconds", type=int, default=20, help="seconds of signal to ingest per user")
+    ap.add_argument("--packet-samples", type=int, default=32)
+    ap.add_argument("--skip-legacy", action="store_true")
+    args = ap.parse_args()
+
+    users = [f"user_{i}" for i in range(args.users)]
+    rng = np.random.default_rng(0)
+    packet = rng.integers(
+        0, 4096, size=(args.packet_samples, config.NUM_EEG_CHANNELS), dtype=np.uint16
+    )
+
+    stores = [("ring", UserDataStore())]
+    if not args.skip_legacy:
+        stores.append(("deque", DequeUserDataStore()))
+    print(f"users={args.users} seconds={args.seconds} packet={args.packet_samples} samples")
+    for name, store in stores:
+        r = run(store, users, args.seconds, packet)
+        print(
+            f"  {name:>5}: {r['ingest_samples_per_sec']:12,.0f} samples/s "
+            f"({r['realtime_factor']:6.1f}x real time), {r['reads']} reads, "
+            f"read mean {r['read_ms_mean']:.3f} ms, p99 {r['read_ms_p99']:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark for the push (SSE) delivery of analysis results.
+
+Opens --subscribers streams spread over --users users on a ResultPublisher
+and stores --rounds numeric results for every user, --interval seconds
+apart, as the scheduler would. Reports the store-to-received latency, that
+every subscriber got every result exactly once, the server's memory per open
+stream, and that --slow subscribers which stop reading are disconnected
+without delaying the others. Loopback socket buffers take a few MB before a
+write blocks, so the disconnects need many rounds, e.g. --rounds 600
+--interval 0.02 (where fast subscribers also see results superseded).
+
+Usage (from apps/realtime-analyzer):
+    python -m benchmarks.bench_push --users 200 --subscribers 1000 --rounds 20
+"""
+
+import argparse
+import asyncio
+import socket
+import threading
+import time
+from datetime import UTC, datetime
+
+import numpy as np
+from neuro_common import loadgen
+from src import config, results
+from src.data_store import UserDataStore
+from src.push import STREAM_PATH, ResultPublisher
+
+
+def make_result(rng: np.random.Generator, round_no: int) -> dict:
+    freqs = np.linspace(0, 128, 129)
+    psd = rng.random((config.NUM_EEG_CHANNELS, len(freqs))) * 1e-11
+    coherence = rng.random((config.NUM_EEG_CHANNELS, config.NUM_EEG_CHANNELS))
+    timestamp = f"{datetime.now(UTC).isoformat()}#{round_no}"
+    return results.build_numeric_result(freqs, psd, coherence, timestamp)
+
+
+async def subscribe(
+    port: int, user_id: str, received: dict, ready: asyncio.Event, slow: bool = False
+):
+    """
+    Reads one stream, recording (event ID -> receive times) per subscriber; a
+    slow one never reads.
+    """
+    sock = socket.socket()
+    if slow:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    # A slow subscriber's reader stops taking data off the socket after a few KB
+    reader, writer = await asyncio.open_connection(sock=sock, limit=2048 if slow else 2**22)
+    path = STREAM_PATH.format(user_id=user_id)
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n".encode()
+    )
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+    ready.set()
+    if slow:
+        await asyncio.Event().wait()
+    events = received.setdefault(id(writer), {})
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        if line.startswith(b"id: "):
+            event_id = line[4:].strip().decode()
+            events.setdefault(event_id, []).append(time.perf_counter())
+
+
+async def run_clients(args, port: int, store: UserDataStore, publisher: ResultPublisher) -> dict:
+    received: dict[int, dict[str, list[float]]] = {}
+    users = [f"user{i}" for i in range(args.users)]
+    rss_before = loadgen.peak_rss_mb()
+    tasks = []
+    for n in range(args.subscribers):
+        ready = asyncio.Event()
+        tasks.append(asyncio.create_task(subscribe(port, users[n % len(users)], received, ready)))
+        await ready.wait()
+    for n in range(args.slow):
+        ready = asyncio.Event()
+        tasks.append(
+            asyncio.create_task(subscribe(port, users[n % len(users)], received, ready, slow=True))
+        )
+        await ready.wait()
+    rss_connected = loadgen.peak_rss_mb()
+
+    rng = np.random.default_rng(0)
+    published: dict[str, float] = {}
+    for round_no in range(args.rounds):
+        payloads = [(user_id, make_result(rng, round_no)) for user_id in users]
+        started = time.perf_counter()
+        for user_id, result in payloads:
+            published[results.result_etag(user_id, result, "event")] = time.perf_counter()
+            store.update_analysis_result(user_id, result)
+        store_seconds = time.perf_counter() - started
+        await asyncio.sleep(args.interval)
+    await asyncio.sleep(1.0)
+
+    latencies, duplicates, missing = [], 0, 0
+    for events in received.values():
+        missing += args.rounds - len(events)
+        for event_id, times in events.items():
+            duplicates += len(times) - 1
+            latencies.append(times[0] - published[event_id])
+    for task in tasks:
+        task.cancel()
+    return {
+        "latency": loadgen.latency_summary(latencies),
+        "duplicates": duplicates,
+        "missing": missing,
+        "store_ms_per_result": store_seconds / len(users) * 1000,
+        "rss_per_stream_kb": (rss_connected - rss_before) * 1024 / (args.subscribers + args.slow),
+        "metrics": publisher.get_metrics(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--subscribers", type=int, default=1000)
+    ap.add_argument("--slow", type=int, default=5, help="subscribers that never read")
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--interval", type=float, default=0.5, help="seconds between rounds of results")
+    ap.add_argument("--port", type=int, default=0, help="default: a free port")
+    args = ap.parse_args()
+    config.PUSH_WRITE_TIMEOUT_SEC = min(config.PUSH_WRITE_TIMEOUT_SEC, args.interval)
+
+    store = UserDataStore()
+    for n in range(args.users):
+        store.add_samples(f"user{n}", np.zeros((1, config.NUM_EEG_CHANNELS), dtype=np.uint16))
+    publisher = ResultPublisher(store)
+    port = args.port
+    if not port:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+    threading.Thread(target=publisher.serve, args=("127.0.0.1", port), daemon=True).start()
+    time.sleep(0.5)
+
+    r = asyncio.run(run_clients(args, port, store, publisher))
+    latency = r["latency"]
+    print(
+        f"users={args.users}, subscribers={args.subscribers} (+{args.slow} slow), "
+        f"rounds={args.rounds}"
+    )
+    print(
+        f"  store -> received: p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+        f"p99 {latency['p99_ms']:.1f} ms, max {latency['max_ms']:.1f} ms"
+    )
+    # Missing results were superseded by a newer one before their subscriber was written to
+    print(f"  exactly once     : {r['duplicates']} duplicates, {r['missing']} superseded")
+    print(f"  analyzer side    : {r['store_ms_per_result'] * 1000:.1f} µs per stored result")
+    print(f"  memory           : {r['rss_per_stream_kb']:.1f} KB per open stream")
+    print(f"  slow subscribers : {r['metrics']['push_slow_disconnected']} disconnected")
+
+
+if __name__ == "__main__":
+    main()
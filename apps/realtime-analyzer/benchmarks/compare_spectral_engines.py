@@ -0,0 +1,137 @@
+"""
+Compares the speed of the NumPy spectral engine with the MNE path, and of the
+incremental engine (SlidingSpectrum) with a from-scratch computation for
+longer windows. Timing covers the spectral computation only, not figure
+rendering. That the engines agree numerically is checked by
+tests/test_spectral.py against the analyzer's own code paths.
+
+Usage (from apps/realtime-analyzer):
+    python -m benchmarks.compare_spectral_engines --users 1 8 32 128 --windows 5 30 120
+"""
+
+import argparse
+import time
+
+import mne
+import numpy as np
+from mne_connectivity import spectral_connectivity_epochs
+from src import config, spectral
+
+mne.set_log_level("ERROR")
+
+EPOCH_SEC = 2.5
+
+
+def synthetic_windows(num_users: int, seed: int = 0) -> np.ndarray:
+    """(users, samples, channels) uint16 windows: shared 10 Hz alpha plus per-channel noise."""
+    rng = np.random.default_rng(seed)
+    num_samples = int(config.SAMPLE_RATE * config.ANALYSIS_WINDOW_SEC)
+    t = np.arange(num_samples) / config.SAMPLE_RATE
+    alpha = 150 * np.sin(2 * np.pi * 10 * t)[None, :, None]
+    noise = rng.normal(0, 80, (num_users, num_samples, config.NUM_EEG_CHANNELS))
+    return np.clip(2048 + alpha + noise, 0, 4095).astype(np.uint16)
+
+
+def mne_spectra(chunk_adc: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    info = mne.create_info(ch_names=config.CHANNEL_NAMES, sfreq=config.SAMPLE_RATE, ch_types="eeg")
+    info.set_montage("standard_1020", on_missing="warn")
+    raw = mne.io.RawArray(spectral.adc_to_volts(chunk_adc[None])[0], info, verbose=False)
+    psd = raw.compute_psd(fmin=1, fmax=40, n_fft=config.SAMPLE_RATE, verbose=False).get_data()
+    epochs = mne.make_fixed_length_epochs(raw, duration=EPOCH_SEC, preload=True, verbose=False)
+    con = spectral_connectivity_epochs(
+        epochs,
+        method="coh",
+        sfreq=config.SAMPLE_RATE,
+        fmin=8,
+        fmax=13,
+        faverage=True,
+        verbose=False,
+    )
+    coh = con.get_data(output="dense")[:, :, 0]
+    return psd, coh + coh.T + np.eye(len(coh))
+
+
+def numpy_spectra(data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(users, channels, samples) in volts -> stacked (psd, coherence)."""
+    _, psd = spectral.welch_psd(data, config.SAMPLE_RATE, config.SAMPLE_RATE, 1.0, 40.0)
+    coh = spectral.multitaper_coherence(
+        data, config.SAMPLE_RATE, int(EPOCH_SEC * config.SAMPLE_RATE), 8.0, 13.0
+    )
+    return psd, coh
+
+
+def time_incremental(window_sec: float, interval_sec: float, repeat: int) -> tuple[float, float]:
+    """
+    Per-user cost of one cycle: from-scratch over the window vs. updating with
+    interval_sec of new data.
+    """
+    sfreq = config.SAMPLE_RATE
+    rng = np.random.default_rng(3)
+    data = rng.normal(
+        0, 1e-5, (config.NUM_EEG_CHANNELS, int(sfreq * (window_sec + interval_sec * repeat * 5)))
+    )
+    window = int(sfreq * window_sec)
+    scratch_sec = best_of(lambda: numpy_spectra(data[None, :, :window]), repeat)
+
+    sliding = spectral.SlidingSpectrum(
+        sfreq, window, sfreq, (1.0, 40.0), int(EPOCH_SEC * sfreq), (8.0, 13.0)
+    )
+    sliding.update(0, data[:, :window])
+    step = int(sfreq * interval_sec)
+    timings = []
+    for i in range(repeat * 5):
+        start = time.perf_counter()
+        sliding.update(window + i * step, data[:, window + i * step : window + (i + 1) * step])
+        sliding.result()
+        timings.append(time.perf_counter() - start)
+    # Mean, not best: only some cycles complete a coherence epoch
+    return scratch_sec, sum(timings) / len(timings)
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--users", type=int, nargs="+", default=[1, 8, 32, 128])
+    ap.add_argument(
+        "--windows",
+        type=float,
+        nargs="+",
+        default=[5, 30, 120],
+        help="window lengths (s) for the incremental comparison",
+    )
+    ap.add_argument(
+        "--interval", type=float, default=1.0, help="new data per incremental cycle (s)"
+    )
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    for num_users in args.users:
+        chunks = synthetic_windows(num_users)
+        mne_sec = best_of(lambda chunks=chunks: [mne_spectra(c) for c in chunks], args.repeat)
+        numpy_sec = best_of(
+            lambda chunks=chunks: numpy_spectra(spectral.adc_to_volts(chunks)), args.repeat
+        )
+        print(
+            f"  users={num_users:4d} mne={mne_sec * 1e3 / num_users:8.2f} ms/user "
+            f"numpy={numpy_sec * 1e3 / num_users:7.3f} ms/user ({mne_sec / numpy_sec:6.1f}x)"
+        )
+
+    for window_sec in args.windows:
+        scratch_sec, incremental_sec = time_incremental(window_sec, args.interval, args.repeat)
+        print(
+            f"  window={window_sec:6.1f}s interval={args.interval}s "
+            f"from-scratch={scratch_sec * 1e3:7.3f} ms "
+            f"incremental={incremental_sec * 1e3:7.3f} ms ({scratch_sec / incremental_sec:6.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+End-to-end load test of the realtime analyzer: one synthetic device per user
+publishes through an in-process RabbitMQ stand-in (neuro_common.loadgen)
+into the service's own consumer, while an AnalysisScheduler analyzes the
+buffered users as in production. Two phases:
+
+  backlog  --backlog-sec (default: one analysis window) of every device's
+           packets published at once; the drain rate is the consumer's
+           maximum messages per second, and it fills every user's window
+  paced    real-time traffic from every device; latency is measured from
+           publish to ack (buffered). Once every user has been analyzed
+           (the worker processes are up), the scheduler's cycle lag and
+           completed analyses per user and interval are measured for
+           --seconds
+
+The engine and result format are those of the environment
+(ANALYSIS_ENGINE, RESULT_FORMAT). The last line of output is the results as
+JSON, for benchmarks/e2e.py in the repository root.
+
+Usage (from apps/realtime-analyzer):
+    python -m benchmarks.e2e_analyzer --devices 20 --seconds 15 --workers 2
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import pika
+from neuro_common import loadgen
+from src import config
+from src.consumer import start_consumer_thread
+from src.data_store import user_data_store
+from src.scheduler import AnalysisScheduler
+
+
+def streams(
+    devices: list[loadgen.SyntheticDevice], first: int, count: int
+) -> list[list[tuple[bytes, dict]]]:
+    return [
+        [(device.packet(i), {"user_id": f"user{n}"}) for i in range(first, first + count)]
+        for n, device in enumerate(devices)
+    ]
+
+
+def run(args) -> dict:
+    devices = loadgen.make_devices(args.devices, config.SAMPLE_RATE, args.samples_per_packet)
+    interval = devices[0].packet_interval
+    backlog_packets = max(1, round(args.backlog_sec / interval))
+    # Enough for the warm-up and the measurement; the publisher is stopped after the measurement
+    paced_packets = round((args.warmup + args.seconds) / interval)
+    backlog = [m for stream in streams(devices, 0, backlog_packets) for m in stream]
+    paced = streams(devices, backlog_packets, paced_packets)
+
+    broker = loadgen.LocalBroker()
+    pika.BlockingConnection = broker.connect
+    threading.Thread(target=start_consumer_thread, daemon=True).start()
+    broker.wait_bound()
+
+    started = time.perf_counter()
+    loadgen.publish_backlog(broker, backlog)
+    if not broker.wait_acked(len(backlog), args.timeout):
+        raise TimeoutError(f"backlog: {broker.acked} of {len(backlog)} messages acked")
+    drain_seconds = time.perf_counter() - started
+    broker.take_latencies()
+
+    scheduler = AnalysisScheduler(user_data_store, args.workers, args.interval)
+    threading.Thread(target=scheduler.run, daemon=True).start()
+    stop = threading.Event()
+    publisher = threading.Thread(target=loadgen.publish_paced, args=(broker, paced, interval, stop))
+    publisher.start()
+    # Warm-up: spawning the worker processes and the first round of analyses
+    deadline = time.monotonic() + args.warmup
+    while scheduler.get_metrics()["analysis_completed"] < args.devices:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"not every user was analyzed within {args.warmup}s")
+        time.sleep(0.1)
+    before = scheduler.get_metrics()
+    measured_from = time.monotonic()
+    max_lag = mean_lag = 0.0
+    while time.monotonic() - measured_from < args.seconds:
+        time.sleep(0.1)
+        m = scheduler.get_metrics()
+        max_lag = max(max_lag, m["last_cycle_max_lag_sec"])
+        mean_lag = max(mean_lag, m["last_cycle_mean_lag_sec"])
+    after = scheduler.get_metrics()
+    measured_intervals = (time.monotonic() - measured_from) / args.interval
+    stop.set()
+    publisher.join()
+    if not broker.wait_acked(broker.published, args.timeout):
+        raise TimeoutError(f"paced: {broker.acked} of {broker.published} messages acked")
+    latency = loadgen.latency_summary(broker.take_latencies())
+    broker.close()
+    scheduler.stop()
+
+    completed = after["analysis_completed"] - before["analysis_completed"]
+    return {
+        "engine": config.ANALYSIS_ENGINE,
+        "result_format": config.RESULT_FORMAT,
+        "messages_per_sec": len(backlog) / drain_seconds,
+        "offered_messages_per_sec": args.devices / interval,
+        "latency_p50_ms": latency["p50_ms"],
+        "latency_p95_ms": latency["p95_ms"],
+        "latency_p99_ms": latency["p99_ms"],
+        "latency_max_ms": latency["max_ms"],
+        "cycle_lag_max_sec": max_lag,
+        # The worst cycle's mean
+        "cycle_lag_mean_sec": mean_lag,
+        "analyses_per_user_interval": completed / (args.devices * measured_intervals),
+        "analysis_coalesced": after["analysis_coalesced"] - before["analysis_coalesced"],
+        "analysis_failed": after["analysis_failed"],
+        "peak_rss_mb": loadgen.peak_rss_mb(),
+        # The pool's workers, reaped by scheduler.stop()
+        "workers_peak_rss_mb": loadgen.peak_rss_mb(children=True),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--devices", type=int, default=20)
+    ap.add_argument(
+        "--seconds", type=float, default=15.0, help="measured length of the paced phase"
+    )
+    ap.add_argument(
+        "--warmup", type=float, default=60.0, help="longest wait for every user's first analysis"
+    )
+    ap.add_argument("--backlog-sec", type=float, default=config.ANALYSIS_WINDOW_SEC)
+    ap.add_argument("--samples-per-packet", type=int, default=32)
+    ap.add_argument("--workers", type=int, default=config.ANALYSIS_WORKERS)
+    ap.add_argument("--interval", type=float, default=config.ANALYSIS_INTERVAL_SEC)
+    ap.add_argument("--timeout", type=float, default=300.0)
+    args = ap.parse_args()
+    if args.seconds < 2 * args.interval:
+        ap.error("--seconds must cover at least two analysis intervals")
+
+    result = run(args)
+    print(
+        f"devices={args.devices} ({result['offered_messages_per_sec']:.0f} msg/s offered), "
+        f"engine={result['engine']}, workers={args.workers}, interval={args.interval}s"
+    )
+    print(f"  backlog drain: {result['messages_per_sec']:10.1f} msg/s")
+    print(
+        f"  paced latency: p50 {result['latency_p50_ms']:.2f} ms, p95 "
+        f"{result['latency_p95_ms']:.2f} ms, "
+        f"p99 {result['latency_p99_ms']:.2f} ms"
+    )
+    print(
+        f"  cycle lag    : max {result['cycle_lag_max_sec']:.2f} s, "
+        f"{result['analyses_per_user_interval']:.2f} analyses/user/interval, "
+        f"{result['analysis_coalesced']} coalesced"
+    )
+    print(
+        f"  peak RSS     : {result['peak_rss_mb']:.0f} MB (workers "
+        f"{result['workers_peak_rss_mb']:.0f} MB)"
+    )
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Load test for the analysis scheduler: how many users can one node sustain?
+
+For each user count, synthetic users stream 256 Hz samples into a
+UserDataStore while an AnalysisScheduler runs for a number of intervals.
+A load level is sustainable when every user is analyzed once per interval,
+nothing is coalesced, and the dispatch lag stays below one interval.
+
+Usage (from apps/realtime-analyzer):
+    python -m benchmarks.load_analysis --users 10 25 50 100 --workers 4 --intervals 4
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+from src import config
+from src.data_store import UserDataStore
+from src.scheduler import AnalysisScheduler
+
+
+def feed(store: UserDataStore, users: list[str], stop: threading.Event):
+    """Writes a 32-sample packet for every user each 125 ms, like 256 Hz devices."""
+    rng = np.random.default_rng(0)
+    packet_samples = config.SAMPLE_RATE // 8
+    while not stop.is_set():
+        for user_id in users:
+            store.add_samples(
+                user_id,
+                rng.integers(
+                    1900, 2200, (packet_samples, config.NUM_EEG_CHANNELS), dtype=np.uint16
+                ),
+            )
+        stop.wait(0.125)
+
+
+def run_level(num_users: int, workers: int, interval: float, intervals: int) -> dict:
+    store = UserDataStore()
+    users = [f"load_user_{i}" for i in range(num_users)]
+    window = int(config.SAMPLE_RATE * config.BUFFER_MAX_SEC)
+    rng = np.random.default_rng(1)
+    for user_id in users:
+        # Noise rather than a flat line, which has no defined coherence
+        store.add_samples(
+            user_id, rng.integers(1900, 2200, (window, config.NUM_EEG_CHANNELS), dtype=np.uint16)
+        )
+
+    stop = threading.Event()
+    feeder = threading.Thread(target=feed, args=(store, users, stop), daemon=True)
+    feeder.start()
+    scheduler = AnalysisScheduler(store, workers, interval)
+    runner = threading.Thread(target=scheduler.run, daemon=True)
+    runner.start()
+
+    # The first interval only warms up the worker processes
+    time.sleep(interval)
+    before = scheduler.get_metrics()
+    max_lag = 0.0
+    max_depth = 0
+    deadline = time.monotonic() + interval * intervals
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        m = scheduler.get_metrics()
+        max_lag = max(max_lag, m["last_cycle_max_lag_sec"])
+        max_depth = max(max_depth, m["queue_depth"])
+    after = scheduler.get_metrics()
+    stop.set()
+    scheduler.stop()
+
+    completed = after["analysis_completed"] - before["analysis_completed"]
+    coalesced = after["analysis_coalesced"] - before["analysis_coalesced"]
+    per_user_per_interval = completed / (num_users * intervals)
+    return {
+        "users": num_users,
+        "analyses_per_user_interval": per_user_per_interval,
+        "coalesced": coalesced,
+        "max_lag_sec": max_lag,
+        "max_queue_depth": max_depth,
+        "sustainable": coalesced == 0 and max_lag < interval and per_user_per_interval >= 0.9,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--users", type=int, nargs="+", default=[10, 25, 50, 100])
+    ap.add_argument("--workers", type=int, default=config.ANALYSIS_WORKERS)
+    ap.add_argument("--interval", type=float, default=config.ANALYSIS_INTERVAL_SEC)
+    ap.add_argument("--intervals", type=int, default=4, help="measured intervals per level")
+    args = ap.parse_args()
+
+    print(f"workers={args.workers} interval={args.interval}s")
+    sustained = 0
+    for num_users in args.users:
+        r = run_level(num_users, args.workers, args.interval, args.intervals)
+        print(
+            f"  users={r['users']:5d} analyses/user/interval={r['analyses_per_user_interval']:.2f} "
+            f"coalesced={r['coalesced']:4d} max_lag={r['max_lag_sec']:.2f}s "
+            f"max_queue={r['max_queue_depth']:3d} {'OK' if r['sustainable'] else 'OVERLOADED'}"
+        )
+        if r["sustainable"]:
+            sustained = num_users
+        else:
+            break
+    print(f"Sustained up to {sustained} users on this node.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,188 @@
 import base64
 import io
-import time
-import threading
-from datetime import datetime, timezone
+from datetime import UTC, datetime
+
 import matplotlib
-import numpy as np
 import mne
+import numpy as np
 from mne_connectivity import spectral_connectivity_epochs
-from .data_store import user_data_store
-from . import config
+from mne_connectivity.viz import plot_connectivity_circle
+from neuro_common import log, metrics
+
+from . import config, results, spectral
 
 # Set Matplotlib backend to Agg for non-GUI environments
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
-def fig_to_base64(fig) -> str:
-    """Converts a Matplotlib figure to a base64 encoded PNG string."""
+logger = log.get_logger("realtime-analyzer.analyzer")
+# Recorded in the analysis worker processes; multiprocess mode exports them from the API process
+_PSD = metrics.STAGE_SECONDS.labels("psd")
+_COHERENCE = metrics.STAGE_SECONDS.labels("coherence")
+_RENDER = metrics.STAGE_SECONDS.labels("render")
+
+
+def fig_to_png(fig) -> bytes:
+    """Renders a Matplotlib figure to PNG bytes and closes it."""
     buf = io.BytesIO()
     fig.savefig(buf, format="png", bbox_inches="tight", dpi=90)
-    plt.close(fig) # Prevent memory leaks
-    buf.seek(0)
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+    plt.close(fig)  # Prevent memory leaks
+    return buf.getvalue()
+
+
+def fig_to_base64(fig) -> str:
+    """Converts a Matplotlib figure to a base64 encoded PNG string."""
+    return base64.b64encode(fig_to_png(fig)).decode("utf-8")
+
 
 def perform_analysis(eeg_chunk_adc: np.ndarray) -> dict | None:
     """
     Performs PSD and coherence analysis on a chunk of EEG data.
     """
+    if config.ANALYSIS_ENGINE == "numpy":
+        return perform_batch_analysis([eeg_chunk_adc])[0]
+    return perform_mne_analysis(eeg_chunk_adc)
+
+
+def perform_batch_analysis(eeg_chunks_adc: list[np.ndarray]) -> list[dict | None]:
+    """
+    Analyzes several users' chunks at once. With the NumPy engine all windows
+    go through one stacked spectral computation; with MNE they run one by one.
+    """
+    if config.ANALYSIS_ENGINE != "numpy":
+        return [perform_mne_analysis(chunk) for chunk in eeg_chunks_adc]
+    try:
+        data_in_volts = spectral.adc_to_volts(np.stack(eeg_chunks_adc))
+        with _PSD.time():
+            freqs, psd = spectral.welch_psd(
+                data_in_volts, config.SAMPLE_RATE, config.SAMPLE_RATE, 1.0, 40.0
+            )
+        with _COHERENCE.time():
+            coherence = spectral.multitaper_coherence(
+                data_in_volts,
+                config.SAMPLE_RATE,
+                int(2.5 * config.SAMPLE_RATE),
+                *config.COHERENCE_BAND,
+            )
+    except Exception as e:
+        logger.error("error during spectral analysis", error=str(e))
+        return [None] * len(eeg_chunks_adc)
+    return build_results(freqs, psd, coherence)
+
+
+def new_sliding_spectrum() -> spectral.SlidingSpectrum:
+    """
+    Creates the per-user accumulator used by the incremental engine, with the
+    same parameters as the other engines.
+    """
+    return spectral.SlidingSpectrum(
+        config.SAMPLE_RATE,
+        int(config.SAMPLE_RATE * config.ANALYSIS_WINDOW_SEC),
+        n_fft=config.SAMPLE_RATE,
+        psd_band=(1.0, 40.0),
+        epoch_samples=int(2.5 * config.SAMPLE_RATE),
+        coh_band=config.COHERENCE_BAND,
+    )
+
+
+def build_results(freqs: np.ndarray, psd: np.ndarray, coherence: np.ndarray) -> list[dict | None]:
+    """
+    Turns stacked spectra (users, ...) from the NumPy engines into result
+    dicts: numeric arrays with RESULT_FORMAT="numeric", PNG images otherwise.
+    """
+    timestamp = datetime.now(UTC).isoformat()
+    if config.RESULT_FORMAT == "numeric":
+        return [
+            results.build_numeric_result(freqs, user_psd, user_coherence, timestamp)
+            for user_psd, user_coherence in zip(psd, coherence, strict=True)
+        ]
+    built = []
+    for user_psd, user_coherence in zip(psd, coherence, strict=True):
+        try:
+            with _RENDER.time():
+                built.append(
+                    {
+                        "psd_image": fig_to_base64(plot_psd(freqs, user_psd)),
+                        "coherence_image": fig_to_base64(plot_coherence(user_coherence)),
+                        "timestamp": timestamp,
+                    }
+                )
+        except Exception as e:
+            logger.error("error while rendering analysis", error=str(e))
+            built.append(None)
+    return built
+
+
+def plot_psd(freqs: np.ndarray, psd: np.ndarray):
+    """Plots per-channel PSD in dB (uV**2/Hz), like mne's Spectrum.plot."""
+    fig, ax = plt.subplots(figsize=(8, 4))
+    for channel_name, channel_psd in zip(config.CHANNEL_NAMES, psd, strict=True):
+        ax.plot(freqs, 10 * np.log10(channel_psd * 1e12), linewidth=1, label=channel_name)
+    ax.set_xlabel("Frequency (Hz)")
+    ax.set_ylabel("µV²/Hz (dB)")
+    ax.legend(loc="upper right", fontsize="small", ncol=2)
+    return fig
+
+
+def plot_coherence(coherence: np.ndarray):
+    """Plots alpha-band coherence on a connectivity circle (lower triangle, as MNE returns it)."""
+    fig, _ = plot_connectivity_circle(
+        np.tril(coherence, k=-1), config.CHANNEL_NAMES, show=False, vmin=0.2
+    )
+    return fig
+
+
+def perform_mne_analysis(eeg_chunk_adc: np.ndarray) -> dict | None:
+    """
+    Performs PSD and coherence analysis on a chunk of EEG data with MNE.
+    """
     try:
         # 1. Pre-process: Convert ADC values to Volts
         data_in_volts = (eeg_chunk_adc.T.astype(np.float64) - 2048.0) * (4.5 / 4096.0) * 1e-6
-        
-        info = mne.create_info(ch_names=config.CHANNEL_NAMES, sfreq=config.SAMPLE_RATE, ch_types="eeg")
+
+        info = mne.create_info(
+            ch_names=config.CHANNEL_NAMES, sfreq=config.SAMPLE_RATE, ch_types="eeg"
+        )
         info.set_montage("standard_1020", on_missing="warn")
         raw = mne.io.RawArray(data_in_volts, info, verbose=False)
 
-        # 2. Power Spectral Density (PSD) plot
-        fig_psd = raw.compute_psd(fmin=1.0, fmax=40.0, n_fft=config.SAMPLE_RATE, verbose=False).plot(show=False)
-        psd_b64 = fig_to_base64(fig_psd)
+        # 2. Power Spectral Density (PSD)
+        with _PSD.time():
+            spectrum = raw.compute_psd(fmin=1.0, fmax=40.0, n_fft=config.SAMPLE_RATE, verbose=False)
 
-        # 3. Coherence plot (alpha band)
-        epochs = mne.make_fixed_length_epochs(raw, duration=2.5, preload=True, verbose=False)
-        con = spectral_connectivity_epochs(
-            epochs, method="coh", sfreq=config.SAMPLE_RATE, fmin=8.0, fmax=13.0, faverage=True, verbose=False
-        )
-        fig_coh, _ = mne.viz.plot_connectivity_circle(
-            con.get_data(output="dense")[..., 0], config.CHANNEL_NAMES, show=False, vmin=0.2
-        )
-        coh_b64 = fig_to_base64(fig_coh)
+        # 3. Coherence (alpha band)
+        with _COHERENCE.time():
+            epochs = mne.make_fixed_length_epochs(raw, duration=2.5, preload=True, verbose=False)
+            fmin, fmax = config.COHERENCE_BAND
+            con = spectral_connectivity_epochs(
+                epochs,
+                method="coh",
+                sfreq=config.SAMPLE_RATE,
+                fmin=fmin,
+                fmax=fmax,
+                faverage=True,
+                verbose=False,
+            )
+
+        if config.RESULT_FORMAT == "numeric":
+            coherence = con.get_data(output="dense")[..., 0]
+            coherence = coherence + coherence.T + np.eye(len(coherence))
+            return results.build_numeric_result(
+                spectrum.freqs, spectrum.get_data(), coherence, datetime.now(UTC).isoformat()
+            )
+
+        with _RENDER.time():
+            psd_b64 = fig_to_base64(spectrum.plot(show=False))
+            fig_coh, _ = plot_connectivity_circle(
+                con.get_data(output="dense")[..., 0], config.CHANNEL_NAMES, show=False, vmin=0.2
+            )
+            coh_b64 = fig_to_base64(fig_coh)
 
         return {
             "psd_image": psd_b64,
             "coherence_image": coh_b64,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": datetime.now(UTC).isoformat(),
         }
     except Exception as e:
-        print(f"❌ Error during MNE analysis: {e}")
+        logger.error("error during MNE analysis", error=str(e))
         return None
-
-def analysis_worker_thread():
-    """
-    Background thread that periodically runs analysis for all active users.
-    """
-    print("🧠 Analysis worker thread started.")
-    while True:
-        time.sleep(config.ANALYSIS_INTERVAL_SEC)
-        
-        user_ids = user_data_store.get_all_user_ids()
-        if not user_ids:
-            continue
-            
-        print(f"Running analysis for {len(user_ids)} active users...")
-        for user_id in user_ids:
-            chunk = user_data_store.get_analysis_chunk(user_id)
-            if chunk is not None:
-                result = perform_analysis(chunk)
-                if result:
-                    user_data_store.update_analysis_result(user_id, result)
-                    print(f"  - ✅ Analysis updated for user: {user_id}")
\ No newline at end of file
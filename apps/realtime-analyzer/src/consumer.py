@@ -1,57 +1,92 @@
+import time
+
 import pika
-import zstandard
-import numpy as np
-from .data_store import user_data_store
+from neuro_common import codec, log, metrics, packet
+
 from . import config
+from .data_store import user_data_store
+from .sharding import ShardConsumer, ShardMap
+
+logger = log.get_logger("realtime-analyzer.consumer")
+_DECOMPRESS = metrics.STAGE_SECONDS.labels("decompress")
+_PARSE = metrics.STAGE_SECONDS.labels("parse")
+_QUEUE_LAG = metrics.QUEUE_LAG_SECONDS.labels("raw_data")
+_BYTES_IN = metrics.BYTES_TOTAL.labels("ingest")
+_SAMPLES = metrics.SAMPLES_TOTAL.labels("ingest")
+_BUFFERED = metrics.MESSAGES_TOTAL.labels("buffered")
+_DROPPED = metrics.MESSAGES_TOTAL.labels("dropped")
+_FAILED = metrics.MESSAGES_TOTAL.labels("failed")
+_NOT_OWNED = metrics.MESSAGES_TOTAL.labels("not_owned")
 
-# Sensor data format, matching the firmware and processor
-SENSOR_DATA_DTYPE = np.dtype([("eeg", "<u2", (config.NUM_EEG_CHANNELS,)), ("rest", "V45")])
-HEADER_SIZE = 18
 
-def start_consumer_thread():
+def start_consumer_thread(shard_map: ShardMap | None = None):
     """
     Connects to RabbitMQ and consumes messages, adding data to the UserDataStore.
+    With a shard_map, only the partitions this instance owns are consumed.
     """
     print("🐇 RabbitMQ consumer thread started.")
     connection = pika.BlockingConnection(pika.URLParameters(config.RABBITMQ_URL))
     channel = connection.channel()
 
     # Declare fanout exchange
-    channel.exchange_declare(exchange=config.RAW_DATA_EXCHANGE, exchange_type='fanout', durable=True)
-    
+    channel.exchange_declare(
+        exchange=config.RAW_DATA_EXCHANGE, exchange_type="fanout", durable=True
+    )
+
     # Create an exclusive, non-durable queue for this instance
-    result = channel.queue_declare(queue='', exclusive=True)
+    result = channel.queue_declare(queue="", exclusive=True)
     queue_name = result.method.queue
 
-    # Bind the queue to the exchange
-    channel.queue_bind(exchange=config.RAW_DATA_EXCHANGE, queue=queue_name)
+    if shard_map is None:
+        # Bind the queue to the exchange
+        channel.queue_bind(exchange=config.RAW_DATA_EXCHANGE, queue=queue_name)
+    else:
+        # Bound per owned partition once the other instances are known
+        ShardConsumer(connection, channel, queue_name, shard_map, user_data_store).start()
 
     def callback(ch, method, properties, body):
         try:
-            user_id = properties.headers.get("user_id")
+            headers = properties.headers or {}
+            # Set by the collector when it publishes the message
+            if "published_at_ms" in headers:
+                _QUEUE_LAG.observe(max(0.0, time.time() - headers["published_at_ms"] / 1000))
+            user_id = headers.get("user_id")
             if not user_id:
+                _DROPPED.inc()
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
+            if shard_map is not None and not shard_map.owns(user_id):
+                # Still queued from before a rebalance handed the user to another instance
+                _NOT_OWNED.inc()
                 ch.basic_ack(delivery_tag=method.delivery_tag)
                 return
 
-            dctx = zstandard.ZstdDecompressor()
-            decompressed_data = dctx.decompress(body)
-            
-            if len(decompressed_data) <= HEADER_SIZE:
+            _BYTES_IN.inc(len(body))
+            # Reuse this thread's decompression context instead of creating one per message
+            with _DECOMPRESS.time():
+                decompressed_data = codec.decompress(body)
+
+            try:
+                with _PARSE.time():
+                    decoded = packet.decode(decompressed_data)
+            except packet.PacketError as e:
+                _DROPPED.inc()
+                logger.warning("dropping malformed packet", user_id=user_id, error=str(e))
                 ch.basic_ack(delivery_tag=method.delivery_tag)
                 return
 
-            sensor_bytes = decompressed_data[HEADER_SIZE:]
-            num_samples = len(sensor_bytes) // SENSOR_DATA_DTYPE.itemsize
-            
-            if num_samples > 0:
-                structured_array = np.frombuffer(sensor_bytes, dtype=SENSOR_DATA_DTYPE, count=num_samples)
-                eeg_samples = structured_array["eeg"]
-                user_data_store.add_samples(user_id, eeg_samples)
-            
+            if len(decoded) > 0:
+                # A strided view of the EEG field in the decompressed buffer; the ring buffer
+                # copies it once
+                user_data_store.add_samples(user_id, decoded.eeg)
+                _SAMPLES.inc(len(decoded))
+
             ch.basic_ack(delivery_tag=method.delivery_tag)
+            _BUFFERED.inc()
         except Exception as e:
-            print(f"❌ Error in RabbitMQ callback: {e}")
+            _FAILED.inc()
+            logger.error("error in RabbitMQ callback", error=str(e))
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
     channel.basic_consume(queue=queue_name, on_message_callback=callback)
-    channel.start_consuming()
\ No newline at end of file
+    channel.start_consuming()
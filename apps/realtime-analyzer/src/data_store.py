@@ -1,57 +1,246 @@
 import threading
-from collections import deque
+import time
+from collections.abc import Callable
+
 import numpy as np
+
 from . import config
 
+
+class RingBuffer:
+    """
+    Fixed-capacity circular buffer of EEG samples for a single user.
+
+    Samples live in a preallocated (capacity, channels) uint16 array; writes are
+    vectorized slice assignments and at most two copies when they wrap around.
+    Each buffer has its own lock so one user's ingest never waits on another
+    user's read.
+    """
+
+    def __init__(self, capacity: int, num_channels: int):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, num_channels), dtype=np.uint16)
+        self.write_index = 0
+        self.size = 0
+        self.total_written = 0
+        self.analyzed_total = 0
+        self.last_write_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def write(self, samples: np.ndarray):
+        """Appends samples (n, channels), overwriting the oldest ones when full."""
+        num_new = len(samples)
+        if num_new == 0:
+            return
+        with self.lock:
+            self.total_written += num_new
+            self.last_write_time = time.monotonic()
+            if num_new >= self.capacity:
+                samples = samples[-self.capacity :]
+                num_new = self.capacity
+            end = self.write_index + num_new
+            if end <= self.capacity:
+                self.data[self.write_index : end] = samples
+            else:
+                first = self.capacity - self.write_index
+                self.data[self.write_index :] = samples[:first]
+                self.data[: num_new - first] = samples[first:]
+            self.write_index = end % self.capacity
+            self.size = min(self.size + num_new, self.capacity)
+
+    def has_unanalyzed_samples(self) -> bool:
+        return self.total_written != self.analyzed_total
+
+    def latest(self, num_samples: int, mark_analyzed: bool = False) -> np.ndarray | None:
+        """Returns a single copy of the most recent samples, oldest first."""
+        with self.lock:
+            if self.size < num_samples:
+                return None
+            if mark_analyzed:
+                self.analyzed_total = self.total_written
+            return self._copy_tail(num_samples)
+
+    def since(self, start_total: int) -> tuple[int, np.ndarray]:
+        """
+        Returns (absolute index of the first returned sample, samples written
+        since absolute index start_total). Samples already overwritten are
+        skipped, so the returned index is later than start_total after a gap.
+        """
+        with self.lock:
+            self.analyzed_total = self.total_written
+            first = max(start_total, self.total_written - self.size)
+            if first > self.total_written:
+                # The caller is ahead of this buffer, e.g. it was recreated after eviction
+                first = self.total_written - self.size
+            return first, self._copy_tail(self.total_written - first)
+
+    def _copy_tail(self, num_samples: int) -> np.ndarray:
+        """Copies the newest num_samples samples, oldest first. The caller must hold lock."""
+        start = (self.write_index - num_samples) % self.capacity
+        if start + num_samples <= self.capacity:
+            return self.data[start : start + num_samples].copy()
+        return np.concatenate((self.data[start:], self.data[: self.write_index]))
+
+
 class UserDataStore:
     """
     Manages in-memory data buffers and analysis results for all users
     in a thread-safe manner.
+
+    Users who stop sending samples are evicted after USER_IDLE_TTL_SEC, and the
+    total buffer memory is capped at MAX_BUFFER_MEMORY_MB by evicting the least
+    recently active users first.
     """
+
     def __init__(self):
-        self._data_buffers = {}
+        self._data_buffers: dict[str, RingBuffer] = {}
         self._latest_results = {}
-        self._lock = threading.Lock()
+        # Guards creation and eviction of buffers; sample I/O uses each buffer's own lock
+        self._buffers_lock = threading.Lock()
+        self._results_lock = threading.Lock()
+        self._result_listeners: list[Callable[[str, dict | None], None]] = []
+        self._counters = {
+            "evicted_idle_users": 0,
+            "evicted_memory_users": 0,
+            "evicted_moved_users": 0,
+            "analysis_skipped_stale": 0,
+        }
 
-    def _get_user_buffer(self, user_id: str) -> deque:
+    def _buffer_budget(self) -> int:
+        """Maximum number of user buffers that fit in MAX_BUFFER_MEMORY_MB."""
+        buffer_bytes = int(config.SAMPLE_RATE * config.BUFFER_MAX_SEC) * config.NUM_EEG_CHANNELS * 2
+        return max(1, int(config.MAX_BUFFER_MEMORY_MB * 1024 * 1024) // buffer_bytes)
+
+    def _remove_user(self, user_id: str):
+        """Drops a user's buffer and result. The caller must hold _buffers_lock."""
+        self._data_buffers.pop(user_id, None)
+        with self._results_lock:
+            self._latest_results.pop(user_id, None)
+        for listener in self._result_listeners:
+            listener(user_id, None)
+
+    def _get_user_buffer(self, user_id: str) -> RingBuffer:
         """Initializes a buffer for a user if it doesn't exist."""
-        if user_id not in self._data_buffers:
-            max_len = int(config.SAMPLE_RATE * config.BUFFER_MAX_SEC)
-            self._data_buffers[user_id] = deque(maxlen=max_len)
-        return self._data_buffers[user_id]
+        buffer = self._data_buffers.get(user_id)
+        if buffer is None:
+            with self._buffers_lock:
+                buffer = self._data_buffers.get(user_id)
+                if buffer is None:
+                    # Make room under the memory cap, least recently active users first
+                    overflow = len(self._data_buffers) + 1 - self._buffer_budget()
+                    if overflow > 0:
+                        by_activity = sorted(
+                            self._data_buffers.items(), key=lambda kv: kv[1].last_write_time
+                        )
+                        for stale_user_id, _ in by_activity[:overflow]:
+                            self._remove_user(stale_user_id)
+                        self._counters["evicted_memory_users"] += overflow
+                    capacity = int(config.SAMPLE_RATE * config.BUFFER_MAX_SEC)
+                    buffer = RingBuffer(capacity, config.NUM_EEG_CHANNELS)
+                    self._data_buffers[user_id] = buffer
+        return buffer
+
+    def evict_idle_users(self) -> int:
+        """Evicts users that have not sent samples for USER_IDLE_TTL_SEC."""
+        cutoff = time.monotonic() - config.USER_IDLE_TTL_SEC
+        with self._buffers_lock:
+            idle = [uid for uid, buf in self._data_buffers.items() if buf.last_write_time < cutoff]
+            for user_id in idle:
+                self._remove_user(user_id)
+            self._counters["evicted_idle_users"] += len(idle)
+        return len(idle)
+
+    def evict_users(self, keep: Callable[[str], bool]) -> int:
+        """Evicts users for whom keep(user_id) is false, e.g. users now owned by another shard."""
+        with self._buffers_lock:
+            moved = [uid for uid in self._data_buffers if not keep(uid)]
+            for user_id in moved:
+                self._remove_user(user_id)
+            self._counters["evicted_moved_users"] += len(moved)
+        return len(moved)
 
     def add_samples(self, user_id: str, eeg_samples: np.ndarray):
         """Adds new EEG samples to a user's buffer."""
-        with self._lock:
-            buffer = self._get_user_buffer(user_id)
-            for sample in eeg_samples:
-                buffer.append(sample)
+        self._get_user_buffer(user_id).write(eeg_samples)
 
     def get_analysis_chunk(self, user_id: str) -> np.ndarray | None:
         """Gets the most recent chunk of data for analysis."""
-        with self._lock:
-            buffer = self._get_user_buffer(user_id)
-            required_samples = int(config.SAMPLE_RATE * config.ANALYSIS_WINDOW_SEC)
-            if len(buffer) < required_samples:
-                return None
-            
-            # Return a copy of the most recent data
-            return np.array(list(buffer)[-required_samples:])
+        buffer = self._data_buffers.get(user_id)
+        if buffer is None:
+            return None
+        required_samples = int(config.SAMPLE_RATE * config.ANALYSIS_WINDOW_SEC)
+        return buffer.latest(required_samples)
+
+    def get_pending_analysis_chunk(self, user_id: str) -> np.ndarray | None:
+        """
+        Like get_analysis_chunk, but returns None when no samples have arrived
+        since the previous pending chunk was taken, so stale users are skipped.
+        """
+        buffer = self._data_buffers.get(user_id)
+        if buffer is None:
+            return None
+        if not buffer.has_unanalyzed_samples():
+            with self._buffers_lock:
+                self._counters["analysis_skipped_stale"] += 1
+            return None
+        required_samples = int(config.SAMPLE_RATE * config.ANALYSIS_WINDOW_SEC)
+        return buffer.latest(required_samples, mark_analyzed=True)
+
+    def get_samples_since(self, user_id: str, start_total: int) -> tuple[int, np.ndarray] | None:
+        """
+        Returns (absolute index, samples) written since absolute sample index
+        start_total for incremental analysis, or None when nothing new arrived.
+        """
+        buffer = self._data_buffers.get(user_id)
+        if buffer is None:
+            return None
+        if not buffer.has_unanalyzed_samples():
+            with self._buffers_lock:
+                self._counters["analysis_skipped_stale"] += 1
+            return None
+        return buffer.since(start_total)
+
+    def get_metrics(self) -> dict:
+        """Returns eviction/skip counters and current buffer usage."""
+        with self._buffers_lock:
+            metrics = dict(self._counters)
+            metrics["active_users"] = len(self._data_buffers)
+            metrics["buffer_bytes"] = sum(buf.nbytes for buf in self._data_buffers.values())
+        return metrics
 
     def get_all_user_ids(self) -> list[str]:
         """Returns a list of all user IDs currently in the store."""
-        with self._lock:
+        with self._buffers_lock:
             return list(self._data_buffers.keys())
 
+    def add_result_listener(self, listener: Callable[[str, dict | None], None]):
+        """
+        Calls listener(user_id, result) after each stored result and
+        listener(user_id, None) when a user is removed, in the calling thread.
+        Listeners must not block.
+        """
+        self._result_listeners.append(listener)
+
     def update_analysis_result(self, user_id: str, result: dict):
         """Stores the latest analysis result for a user."""
-        with self._lock:
-            self._latest_results[user_id] = result
+        with self._results_lock:
+            # An analysis that finishes after its user was evicted must not resurrect them
+            stored = user_id in self._data_buffers
+            if stored:
+                self._latest_results[user_id] = result
+        if stored:
+            for listener in self._result_listeners:
+                listener(user_id, result)
 
     def get_analysis_result(self, user_id: str) -> dict | None:
         """Retrieves the latest analysis result for a user."""
-        with self._lock:
+        with self._results_lock:
             return self._latest_results.get(user_id)
 
+
 # Create a global instance to be shared across the application
-user_data_store = UserDataStore()
\ No newline at end of file
+user_data_store = UserDataStore()
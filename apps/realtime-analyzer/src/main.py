@@ -1,40 +1,187 @@
 import threading
-from flask import Flask, jsonify
-from . import config
-from .data_store import user_data_store
-from .analyzer import analysis_worker_thread
+
+from flask import Flask, Response, jsonify, request
+from neuro_common import log, metrics, profiler
+
+from . import config, results, sharding
 from .consumer import start_consumer_thread
+from .data_store import user_data_store
+from .push import ResultPublisher
+from .results import encoded_results
+from .scheduler import AnalysisScheduler
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
+# Created at startup (not at import) so spawned analysis workers don't build their own pool
+analysis_scheduler: AnalysisScheduler | None = None
+# Set when ANALYZER_SHARDING is enabled
+shard_map: sharding.ShardMap | None = None
+result_publisher: ResultPublisher | None = None
+
 
 # --- API Endpoints ---
 @app.route("/api/v1/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "ok"})
 
+
+@app.route("/api/v1/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Returns buffer usage, eviction and skip counters, scheduler lag and queue
+    depth, push subscribers, and shard membership.
+    """
+    metrics = user_data_store.get_metrics()
+    if analysis_scheduler is not None:
+        metrics.update(analysis_scheduler.get_metrics())
+    if result_publisher is not None:
+        metrics.update(result_publisher.get_metrics())
+    if shard_map is not None:
+        metrics.update({f"shard_{key}": value for key, value in shard_map.get_metrics().items()})
+    return jsonify(metrics)
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Prometheus metrics: per-stage latency histograms (decompress, parse, psd,
+    coherence, render, ...) including those of the analysis workers, queue
+    and schedule lag, processed bytes and samples, and the counters above.
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/debug/profile", methods=["GET"])
+def profile():
+    """Samples this process's threads for ?seconds= (default 10) and returns collapsed stacks."""
+    if not config.PROFILER_ENABLED:
+        return jsonify({"error": "The profiler is disabled (PROFILER_ENABLED=false)."}), 404
+    try:
+        seconds = float(request.args.get("seconds", "10"))
+        interval = float(request.args.get("interval_ms", "5")) / 1000
+        return Response(profiler.profile(seconds, interval), mimetype="text/plain")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
+
+def _pending_response():
+    return jsonify(
+        {"status": "pending", "message": "Analysis results are not yet available. Please wait."}
+    ), 202
+
+
+def _cached_response(user_id: str, result: dict, representation: str, mimetype: str, encoder):
+    """Serves an encoded result with an ETag, answering 304 when the client already has it."""
+    etag = results.result_etag(user_id, result, representation.replace("/", "-"))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = encoded_results.get(user_id, result, representation, encoder)
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept")
+    return response
+
+
 @app.route("/api/v1/users/<user_id>/analysis", methods=["GET"])
 def get_analysis_results(user_id: str):
-    """Returns the latest analysis results for a specific user."""
+    """
+    Returns the latest analysis results for a specific user.
+
+    Numeric results are served as JSON, or as MessagePack (float32 arrays as
+    raw bytes) when requested with "Accept: application/msgpack". Responses
+    carry an ETag; an If-None-Match for the current result returns 304.
+    Clients that want every new result subscribe to the push stream on
+    PUSH_PORT instead (src/push.py). With sharding, requests for users of
+    another instance are served by it.
+    """
+    routed = sharding.route_to_owner(shard_map, user_id)
+    if routed is not None:
+        return routed
+    result = user_data_store.get_analysis_result(user_id)
+    if result is None:
+        return _pending_response()
+
+    mimetype = results.JSON_MIMETYPE
+    if results.is_numeric(result):
+        mimetype = request.accept_mimetypes.best_match(
+            results.available_mimetypes(), results.JSON_MIMETYPE
+        )
+    return _cached_response(
+        user_id, result, mimetype, mimetype, lambda: results.encode(result, mimetype)
+    )
+
+
+@app.route("/api/v1/users/<user_id>/analysis/<kind>.png", methods=["GET"])
+def get_analysis_image(user_id: str, kind: str):
+    """
+    Renders a PSD or coherence image from the latest numeric result on first
+    request and caches it.
+    """
+    if kind not in results.IMAGE_KINDS:
+        return jsonify(
+            {"error": f"Unknown image '{kind}'. Use one of {list(results.IMAGE_KINDS)}."}
+        ), 404
+    routed = sharding.route_to_owner(shard_map, user_id)
+    if routed is not None:
+        return routed
     result = user_data_store.get_analysis_result(user_id)
     if result is None:
-        return jsonify({
-            "status": "pending",
-            "message": "Analysis results are not yet available. Please wait."
-        }), 202
-    
-    return jsonify(result)
+        return _pending_response()
+    if not results.is_numeric(result):
+        return jsonify(
+            {"error": "Images are embedded in the analysis result when RESULT_FORMAT=image."}
+        ), 404
+    return _cached_response(
+        user_id, result, f"{kind}.png", "image/png", lambda: results.render_png(result, kind)
+    )
+
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    log.configure(config.LOG_LEVEL, config.LOG_RATE_LIMIT_SEC)
+    metrics.register_collector(
+        metrics.dict_collector("neuro_analyzer", user_data_store.get_metrics)
+    )
+
+    if config.ANALYZER_SHARDING:
+        shard_map = sharding.ShardMap(
+            config.SHARD_ID,
+            sharding.default_url(),
+            config.ANALYZER_PARTITIONS,
+            config.SHARD_MEMBER_TTL_SEC,
+        )
+        metrics.register_collector(
+            metrics.dict_collector("neuro_analyzer_shard", shard_map.get_metrics)
+        )
+
+    # Start the push (SSE) server on its own event loop thread
+    result_publisher = ResultPublisher(user_data_store, shard_map)
+    metrics.register_collector(
+        metrics.dict_collector("neuro_analyzer", result_publisher.get_metrics)
+    )
+    push_thread = threading.Thread(
+        target=result_publisher.serve, args=("0.0.0.0", config.PUSH_PORT), daemon=True
+    )
+    push_thread.start()
+
     # Start the RabbitMQ consumer in a background thread
-    consumer_thread = threading.Thread(target=start_consumer_thread, daemon=True)
+    consumer_thread = threading.Thread(target=start_consumer_thread, args=(shard_map,), daemon=True)
     consumer_thread.start()
-    
-    # Start the analysis worker in another background thread
-    analyzer_thread = threading.Thread(target=analysis_worker_thread, daemon=True)
+
+    # Start the analysis scheduler in another background thread
+    analysis_scheduler = AnalysisScheduler(
+        user_data_store, config.ANALYSIS_WORKERS, config.ANALYSIS_INTERVAL_SEC
+    )
+    metrics.register_collector(
+        metrics.dict_collector("neuro_analyzer", analysis_scheduler.get_metrics)
+    )
+    analyzer_thread = threading.Thread(target=analysis_scheduler.run, daemon=True)
     analyzer_thread.start()
-    
+
     # Start the Flask API server
     print(f"🚀 Realtime Analyzer service running at http://0.0.0.0:{config.PORT}")
-    app.run(host="0.0.0.0", port=config.PORT)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=config.PORT)
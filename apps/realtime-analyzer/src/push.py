@@ -0,0 +1,252 @@
+"""
+Push delivery of analysis results over Server-Sent Events.
+
+GET /api/v1/users/<user_id>/analysis/stream (on PUSH_PORT) keeps the
+connection open and sends each result as one "result" event (JSON) when
+UserDataStore.update_analysis_result stores it, instead of clients polling
+/analysis and getting the same result or a 202 back. The server is aiohttp
+on its own event loop thread, so an idle subscriber costs a coroutine and a
+socket rather than a thread.
+
+A result is encoded once for all of its user's subscribers, in the loop's
+executor, through the EncodedResultCache that the polling endpoint uses. The
+event ID is the result's ETag; a reconnecting client sends it back as
+Last-Event-ID and does not get the same result again.
+
+The analyzer only schedules a callback on the loop and never waits for a
+subscriber. Each subscriber holds at most one unsent result: a newer result
+replaces it (counted as superseded, the same as a poll would miss it), and a
+subscriber whose writes do not complete within PUSH_WRITE_TIMEOUT_SEC is
+disconnected.
+"""
+
+import asyncio
+from urllib.parse import urlsplit
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from neuro_common import log, metrics
+
+from . import config, results
+from .data_store import UserDataStore
+from .results import encoded_results
+from .sharding import FORWARDED_HEADER, ShardMap
+
+logger = log.get_logger("realtime-analyzer.push")
+_EVENTS = metrics.counter(
+    "neuro_analyzer_push_events_total",
+    "Results sent to subscribers, or superseded by a newer one before a slow subscriber took them",
+    ("outcome",),
+)
+_SENT = _EVENTS.labels("sent")
+_SUPERSEDED = _EVENTS.labels("superseded")
+_ENCODE = metrics.STAGE_SECONDS.labels("push_encode")
+
+STREAM_PATH = "/api/v1/users/{user_id}/analysis/stream"
+
+
+class _SlowSubscriber(Exception):
+    pass
+
+
+class _Subscriber:
+    """One open stream. Holds at most one unsent result, the newest."""
+
+    def __init__(self, last_event_id: str | None):
+        self.pending: dict | None = None
+        self.last_event_id = last_event_id
+        self.closed = False
+        self.wakeup = asyncio.Event()
+
+    def offer(self, result: dict):
+        if self.pending is not None and self.pending is not result:
+            _SUPERSEDED.inc()
+        self.pending = result
+        self.wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+
+def _encode(user_id: str, result: dict) -> bytes:
+    with _ENCODE.time():
+        return encoded_results.get(
+            user_id,
+            result,
+            results.JSON_MIMETYPE,
+            lambda: results.encode(result, results.JSON_MIMETYPE),
+        )
+
+
+class ResultPublisher:
+    """
+    Fans stored results out to the open streams. Subscribers and counters
+    are only touched on the event loop thread.
+    """
+
+    def __init__(self, store: UserDataStore, shard_map: ShardMap | None = None):
+        self._store = store
+        self._shard_map = shard_map
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._subscribers: dict[str, set[_Subscriber]] = {}
+        # Users with subscribers; read by the storing threads to skip everyone else without
+        # touching the loop
+        self._watched: set[str] = set()
+        # user_id -> (result timestamp, encoding future) shared by the user's subscribers
+        self._bodies: dict[str, tuple[str, asyncio.Future]] = {}
+        self._client: ClientSession | None = None
+        self._counters = {"push_subscribers": 0, "push_rejected": 0, "push_slow_disconnected": 0}
+        store.add_result_listener(self.publish)
+
+    def get_metrics(self) -> dict:
+        return dict(self._counters)
+
+    def publish(self, user_id: str, result: dict | None):
+        """Result listener of the store (None: the user was removed). Never blocks."""
+        if user_id in self._watched:
+            self._loop.call_soon_threadsafe(self._deliver, user_id, result)
+
+    def _deliver(self, user_id: str, result: dict | None):
+        for subscriber in self._subscribers.get(user_id, ()):
+            if result is None:
+                # Evicted or handed over to another shard; the client reconnects and waits for a
+                # new result
+                subscriber.close()
+            else:
+                subscriber.offer(result)
+
+    def _body(self, user_id: str, result: dict) -> asyncio.Future:
+        timestamp = result["timestamp"]
+        entry = self._bodies.get(user_id)
+        if entry is None or entry[0] != timestamp:
+            future = self._loop.run_in_executor(None, _encode, user_id, result)
+            entry = self._bodies[user_id] = (timestamp, future)
+        return entry[1]
+
+    def _subscribe(self, user_id: str, last_event_id: str | None) -> _Subscriber:
+        subscriber = _Subscriber(last_event_id)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        self._watched.add(user_id)
+        self._counters["push_subscribers"] += 1
+        return subscriber
+
+    def _unsubscribe(self, user_id: str, subscriber: _Subscriber):
+        subscribers = self._subscribers[user_id]
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[user_id]
+            self._watched.discard(user_id)
+            self._bodies.pop(user_id, None)
+        self._counters["push_subscribers"] -= 1
+
+    async def _write(self, response: web.StreamResponse, data: bytes):
+        try:
+            await asyncio.wait_for(response.write(data), config.PUSH_WRITE_TIMEOUT_SEC)
+        except TimeoutError:
+            raise _SlowSubscriber() from None
+
+    async def stream(self, request: web.Request) -> web.StreamResponse:
+        user_id = request.match_info["user_id"]
+        if self._shard_map is not None and FORWARDED_HEADER not in request.headers:
+            owner_id, url = self._shard_map.owner(user_id)
+            if owner_id != self._shard_map.shard_id:
+                return await self._proxy(request, owner_id, url)
+        if self._counters["push_subscribers"] >= config.PUSH_MAX_SUBSCRIBERS:
+            self._counters["push_rejected"] += 1
+            return web.json_response({"error": "Too many subscribers."}, status=503)
+
+        # Subscribe before reading the current result so one stored in between is not missed;
+        # should it also be delivered, the event ID check below sends it once
+        subscriber = self._subscribe(user_id, request.headers.get("Last-Event-ID"))
+        current = self._store.get_analysis_result(user_id)
+        if current is not None:
+            subscriber.offer(current)
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                # Tells nginx not to buffer the stream
+                "X-Accel-Buffering": "no",
+            }
+        )
+        try:
+            await response.prepare(request)
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), config.PUSH_KEEPALIVE_SEC)
+                except TimeoutError:
+                    await self._write(response, b": keepalive\n\n")
+                    continue
+                subscriber.wakeup.clear()
+                if subscriber.closed:
+                    break
+                result, subscriber.pending = subscriber.pending, None
+                event_id = results.result_etag(user_id, result, "event")
+                if event_id == subscriber.last_event_id:
+                    continue
+                # Shielded: other subscribers await the same encoding if this one disconnects
+                body = await asyncio.shield(self._body(user_id, result))
+                await self._write(
+                    response, b"id: %s\nevent: result\ndata: %s\n\n" % (event_id.encode(), body)
+                )
+                subscriber.last_event_id = event_id
+                _SENT.inc()
+        except _SlowSubscriber:
+            self._counters["push_slow_disconnected"] += 1
+            logger.warning("disconnecting slow subscriber", user_id=user_id)
+        except ConnectionResetError:
+            pass
+        finally:
+            self._unsubscribe(user_id, subscriber)
+        return response
+
+    async def _proxy(self, request: web.Request, owner_id: str, url: str) -> web.StreamResponse:
+        """
+        Relays the stream of the instance that owns the user; it ends when the owner
+        hands the user over.
+        """
+        if self._client is None:
+            timeout = ClientTimeout(
+                sock_connect=config.SHARD_PROXY_TIMEOUT_SEC, sock_read=2 * config.PUSH_KEEPALIVE_SEC
+            )
+            self._client = ClientSession(timeout=timeout)
+        owner = urlsplit(url)
+        target = f"{owner.scheme}://{owner.hostname}:{config.PUSH_PORT}{request.path_qs}"
+        headers = {FORWARDED_HEADER: self._shard_map.shard_id}
+        if "Last-Event-ID" in request.headers:
+            headers["Last-Event-ID"] = request.headers["Last-Event-ID"]
+        try:
+            upstream = await self._client.get(target, headers=headers)
+        except (TimeoutError, ClientError) as e:
+            logger.warning("shard unavailable", shard_id=owner_id, error=str(e))
+            return web.json_response(
+                {"error": "The analyzer instance for this user is unavailable."}, status=503
+            )
+        try:
+            response = web.StreamResponse(
+                status=upstream.status, headers={"X-Accel-Buffering": "no"}
+            )
+            for name in ("Content-Type", "Cache-Control"):
+                if name in upstream.headers:
+                    response.headers[name] = upstream.headers[name]
+            await response.prepare(request)
+            async for chunk in upstream.content.iter_any():
+                # A slow client slows the relay down, and the owner then disconnects it
+                await response.write(chunk)
+        except (TimeoutError, ClientError, ConnectionResetError):
+            pass
+        finally:
+            upstream.release()
+        return response
+
+    def serve(self, host: str, port: int):
+        """Runs the push server on a new event loop in the calling thread; does not return."""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get(STREAM_PATH, self.stream)
+        runner = web.AppRunner(app, handle_signals=False, access_log=None)
+        self._loop.run_until_complete(runner.setup())
+        self._loop.run_until_complete(web.TCPSite(runner, host, port).start())
+        print(f"📡 Result push (SSE) running at http://{host}:{port}{STREAM_PATH}")
+        self._loop.run_forever()
@@ -0,0 +1,142 @@
+"""
+Numeric analysis results and their wire encodings.
+
+With RESULT_FORMAT="numeric" the analyzer stores the spectra themselves
+(float32 arrays) instead of rendered PNGs. Each result is encoded at most
+once per representation (JSON, or MessagePack when the optional msgpack
+package is installed) and served with an ETag, so a poll that finds the same
+result again costs a 304 and no serialization. PNGs are rendered only when
+the image endpoint asks for them, and cached with the result.
+"""
+
+import hashlib
+import json
+import threading
+
+import numpy as np
+from neuro_common import metrics
+
+from . import config
+
+try:
+    import msgpack
+except ImportError:  # optional: poetry install --extras msgpack
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+IMAGE_KINDS = ("psd", "coherence")
+
+
+def available_mimetypes() -> list[str]:
+    return [JSON_MIMETYPE, MSGPACK_MIMETYPE] if msgpack is not None else [JSON_MIMETYPE]
+
+
+def build_numeric_result(
+    freqs: np.ndarray, psd: np.ndarray, coherence: np.ndarray, timestamp: str
+) -> dict:
+    """
+    freqs (n_freqs,), psd (channels, n_freqs) in V**2/Hz and coherence
+    (channels, channels) -> result dict of float32 arrays. PSD is stored in
+    uV**2/Hz, and band power (uV**2) is integrated over config.FREQ_BANDS.
+    """
+    psd_uv = psd * 1e12
+    df = freqs[1] - freqs[0] if len(freqs) > 1 else 1.0
+    band_power = {}
+    for band, (fmin, fmax) in config.FREQ_BANDS.items():
+        mask = (freqs >= fmin) & (freqs < fmax)
+        band_power[band] = (psd_uv[:, mask].sum(axis=-1) * df).astype(np.float32)
+    return {
+        "timestamp": timestamp,
+        "channels": list(config.CHANNEL_NAMES),
+        "freqs": freqs.astype(np.float32),
+        "psd": psd_uv.astype(np.float32),
+        "band_power": band_power,
+        "coherence_band": list(config.COHERENCE_BAND),
+        "coherence": coherence.astype(np.float32),
+    }
+
+
+def is_numeric(result: dict) -> bool:
+    return "psd" in result
+
+
+def _json_value(value):
+    if isinstance(value, np.ndarray):
+        if value.ndim == 0:
+            return float(f"{float(value):.5g}")
+        if value.ndim == 1:
+            # 5 significant digits is below float32 precision noise and keeps the payload short
+            return [float(f"{v:.5g}") for v in value.tolist()]
+        return [_json_value(row) for row in value]
+    if isinstance(value, dict):
+        return {k: _json_value(v) for k, v in value.items()}
+    return value
+
+
+def _msgpack_value(value):
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value, dtype="<f4")
+        return {"dtype": "<f4", "shape": list(array.shape), "data": array.tobytes()}
+    if isinstance(value, dict):
+        return {k: _msgpack_value(v) for k, v in value.items()}
+    return value
+
+
+def encode(result: dict, mimetype: str) -> bytes:
+    """Encodes a result. Image-mode results (plain JSON types) only support JSON."""
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(_msgpack_value(result), use_bin_type=True)
+    return json.dumps(_json_value(result), separators=(",", ":")).encode("utf-8")
+
+
+def result_etag(user_id: str, result: dict, representation: str) -> str:
+    digest = hashlib.blake2b(f"{user_id}:{result['timestamp']}".encode(), digest_size=8).hexdigest()
+    return f"{digest}-{representation}"
+
+
+def render_png(result: dict, kind: str) -> bytes:
+    # Imported here so the API process only loads Matplotlib once an image is requested
+    from .analyzer import fig_to_png, plot_coherence, plot_psd
+
+    with metrics.STAGE_SECONDS.labels("render").time():
+        if kind == "psd":
+            return fig_to_png(plot_psd(result["freqs"], result["psd"] * 1e-12))
+        return fig_to_png(plot_coherence(result["coherence"]))
+
+
+class EncodedResultCache:
+    """
+    Per-user cache of encoded bodies for the latest result, keyed by
+    representation ("application/json", "application/msgpack", "psd.png", ...).
+    Entries are dropped as soon as a newer result for the user is seen.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[str, dict[str, bytes]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, result: dict, representation: str, encoder) -> bytes:
+        timestamp = result["timestamp"]
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != timestamp:
+                entry = self._entries[user_id] = (timestamp, {})
+            body = entry[1].get(representation)
+        if body is None:
+            # Encode outside the lock; two racing requests just encode twice
+            body = encoder()
+            with self._lock:
+                current = self._entries.get(user_id)
+                if current is not None and current[0] == timestamp:
+                    current[1][representation] = body
+        return body
+
+    def discard_missing(self, user_ids: set[str]):
+        """Drops cache entries of users no longer in the store."""
+        with self._lock:
+            for user_id in self._entries.keys() - user_ids:
+                del self._entries[user_id]
+
+
+encoded_results = EncodedResultCache()
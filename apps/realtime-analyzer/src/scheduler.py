@@ -0,0 +1,210 @@
+import multiprocessing
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from neuro_common import log, metrics
+
+from . import config, spectral
+from .analyzer import build_results, new_sliding_spectrum, perform_analysis, perform_batch_analysis
+from .data_store import UserDataStore
+from .results import encoded_results
+
+logger = log.get_logger("realtime-analyzer.scheduler")
+_SCHEDULE_LAG = metrics.QUEUE_LAG_SECONDS.labels("analysis_schedule")
+_SLIDING_UPDATE = metrics.STAGE_SECONDS.labels("sliding_update")
+_SAMPLES = metrics.SAMPLES_TOTAL.labels("analysis")
+
+
+def _analyze_one(chunk: np.ndarray) -> list[dict | None]:
+    return [perform_analysis(chunk)]
+
+
+class AnalysisScheduler:
+    """
+    Spreads per-user analysis over a process pool.
+
+    MNE and Matplotlib hold the GIL for most of their work, so analyses run in
+    worker processes. Each user gets a stable phase within ANALYSIS_INTERVAL_SEC
+    (derived from a hash of the user ID) so work is staggered across the interval
+    instead of arriving in one burst. If a user's previous analysis is still
+    running when they come due again, the new run is coalesced into it.
+
+    With ANALYSIS_ENGINE="numpy", users that come due together are submitted
+    as one batch of up to ANALYSIS_BATCH_SIZE windows, which the engine
+    computes in a single stacked call.
+
+    With ANALYSIS_ENGINE="incremental", each user's SlidingSpectrum is updated
+    here with only the samples that arrived since the previous cycle (a few
+    small FFTs), and the pool only renders the resulting spectra. With
+    RESULT_FORMAT="numeric" there is nothing to render and the results are
+    stored directly. Accumulators are updated even while a user's render is
+    still in flight, so no samples are skipped when renders are coalesced.
+
+    Stage timings recorded in the workers reach this process's /metrics
+    through prometheus_client's multiprocess mode (see neuro_common.metrics).
+    """
+
+    def __init__(self, store: UserDataStore, max_workers: int, interval: float):
+        self._store = store
+        self._interval = interval
+        self._incremental = config.ANALYSIS_ENGINE == "incremental"
+        batched = config.ANALYSIS_ENGINE in ("numpy", "incremental")
+        self._batch_size = max(1, config.ANALYSIS_BATCH_SIZE) if batched else 1
+        self._spectra = {}
+        # "spawn" avoids forking a process that already runs the consumer and Flask threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._next_due: dict[str, float] = {}
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._cycle_lags: list[float] = []
+        self._metrics = {
+            "analysis_submitted": 0,
+            "analysis_completed": 0,
+            "analysis_failed": 0,
+            "analysis_coalesced": 0,
+            "last_cycle_max_lag_sec": 0.0,
+            "last_cycle_mean_lag_sec": 0.0,
+            "last_analysis_duration_sec": 0.0,
+        }
+
+    def _phase(self, user_id: str) -> float:
+        return (zlib.crc32(user_id.encode()) / 2**32) * self._interval
+
+    def _sync_users(self, now: float):
+        user_ids = set(self._store.get_all_user_ids())
+        for user_id in user_ids - self._next_due.keys():
+            cycle_start = now - (now % self._interval)
+            due = cycle_start + self._phase(user_id)
+            self._next_due[user_id] = due if due > now else due + self._interval
+        for user_id in self._next_due.keys() - user_ids:
+            del self._next_due[user_id]
+            self._spectra.pop(user_id, None)
+
+    def _on_done(self, user_ids: list[str], submitted_at: float, future: Future):
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.error("analysis failed", user_ids=user_ids, error=str(e))
+            results = [None] * len(user_ids)
+        with self._lock:
+            for user_id in user_ids:
+                self._in_flight.pop(user_id, None)
+            self._metrics["last_analysis_duration_sec"] = time.monotonic() - submitted_at
+            for result in results:
+                self._metrics[
+                    "analysis_completed" if result is not None else "analysis_failed"
+                ] += 1
+        for user_id, result in zip(user_ids, results, strict=True):
+            if result is not None:
+                self._store.update_analysis_result(user_id, result)
+
+    def _update_spectrum(self, user_id: str) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Feeds a user's new samples into their SlidingSpectrum and returns (psd,
+        coherence) once it is full.
+        """
+        sliding = self._spectra.get(user_id)
+        if sliding is None:
+            sliding = self._spectra[user_id] = new_sliding_spectrum()
+        new_samples = self._store.get_samples_since(user_id, sliding.end_index)
+        if new_samples is None:
+            return None
+        first_index, samples = new_samples
+        with _SLIDING_UPDATE.time():
+            sliding.update(first_index, spectral.adc_to_volts(samples[None])[0])
+            spectra = sliding.result()
+        _SAMPLES.inc(len(samples))
+        return spectra
+
+    def _dispatch(self, user_id: str, now: float):
+        """Advances the user's schedule and returns the work to submit for them, if any."""
+        due = self._next_due[user_id]
+        self._cycle_lags.append(now - due)
+        _SCHEDULE_LAG.observe(now - due)
+        # Skip whole intervals that were missed rather than replaying them
+        missed = int((now - due) // self._interval)
+        self._next_due[user_id] = due + (missed + 1) * self._interval
+
+        spectra = self._update_spectrum(user_id) if self._incremental else None
+        with self._lock:
+            if user_id in self._in_flight:
+                self._metrics["analysis_coalesced"] += 1
+                return None
+        if self._incremental:
+            return spectra
+        return self._store.get_pending_analysis_chunk(user_id)
+
+    def _submit(self, user_ids: list[str], chunks: list, now: float):
+        if self._incremental:
+            psd, coherence = (np.stack(x) for x in zip(*chunks, strict=True))
+            freqs = self._spectra[user_ids[0]].freqs
+            if config.RESULT_FORMAT == "numeric":
+                # Nothing left to render: store the numbers without a round trip through the pool
+                future = Future()
+                future.set_result(build_results(freqs, psd, coherence))
+            else:
+                future = self._pool.submit(build_results, freqs, psd, coherence)
+        elif self._batch_size == 1:
+            future = self._pool.submit(_analyze_one, chunks[0])
+        else:
+            future = self._pool.submit(perform_batch_analysis, chunks)
+        if not self._incremental:
+            # Whole windows; the incremental engine counts only the new samples it consumed
+            _SAMPLES.inc(sum(len(chunk) for chunk in chunks))
+        with self._lock:
+            for user_id in user_ids:
+                self._in_flight[user_id] = future
+            self._metrics["analysis_submitted"] += len(user_ids)
+        future.add_done_callback(lambda f, u=user_ids, t=now: self._on_done(u, t, f))
+
+    def run(self):
+        next_cycle = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= next_cycle:
+                next_cycle = now + self._interval
+                evicted = self._store.evict_idle_users()
+                if evicted:
+                    logger.info("evicted idle users", count=evicted)
+                    encoded_results.discard_missing(set(self._store.get_all_user_ids()))
+                self._sync_users(now)
+                with self._lock:
+                    if self._cycle_lags:
+                        self._metrics["last_cycle_max_lag_sec"] = max(self._cycle_lags)
+                        self._metrics["last_cycle_mean_lag_sec"] = sum(self._cycle_lags) / len(
+                            self._cycle_lags
+                        )
+                self._cycle_lags = []
+
+            batch_users, batch_chunks = [], []
+            for user_id in [u for u, due in self._next_due.items() if due <= now]:
+                chunk = self._dispatch(user_id, now)
+                if chunk is None:
+                    continue
+                batch_users.append(user_id)
+                batch_chunks.append(chunk)
+                if len(batch_users) == self._batch_size:
+                    self._submit(batch_users, batch_chunks, now)
+                    batch_users, batch_chunks = [], []
+            if batch_users:
+                self._submit(batch_users, batch_chunks, now)
+
+            wake_at = min([next_cycle, *self._next_due.values()])
+            self._stop.wait(max(0.0, min(wake_at - time.monotonic(), 0.5)))
+
+    def stop(self):
+        self._stop.set()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["queue_depth"] = len(self._in_flight)
+        metrics["scheduled_users"] = len(self._next_due)
+        return metrics
@@ -0,0 +1,308 @@
+"""
+User sharding across realtime-analyzer instances (ANALYZER_SHARDING=true).
+
+Users are split into ANALYZER_PARTITIONS partitions by an FNV-1a hash of the
+user ID. The collector publishes every packet with its user's partition as
+the routing key; raw_data_exchange stays a fanout (the processor ignores the
+key) and is bound to the direct SHARD_EXCHANGE, to which each instance binds
+its queue only for the partitions it owns. Packets of other users never
+reach an instance.
+
+Instances announce themselves with a heartbeat on the SHARD_MEMBERSHIP_EXCHANGE
+fanout every SHARD_HEARTBEAT_SEC and drop peers not heard from for
+SHARD_MEMBER_TTL_SEC. Partitions are assigned to the live instances by
+rendezvous (highest random weight) hashing: every instance derives the same
+assignment from the same membership, and an instance joining or leaving
+moves only the partitions it gains or loses. An instance keeps a partition
+it lost bound until the new owner announces that it has bound its own
+partitions, so packets are never routed to nobody during a handover (in the
+overlap the old owner drops them). Buffers of users that moved away are
+evicted; the new owner fills a window from the next packets.
+
+API requests for a user owned by another instance are proxied to it, or
+redirected with SHARD_API_ROUTING="redirect" (which needs SHARD_URL to be
+an address the clients can reach).
+"""
+
+import hashlib
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from flask import Response, jsonify, redirect, request
+from neuro_common import log, metrics
+
+from . import config
+from .data_store import UserDataStore
+from .results import encoded_results
+
+# Marks a request forwarded by another instance, which is always served locally so requests never
+# loop
+FORWARDED_HEADER = "X-Analyzer-Shard"
+_PROXIED_REQUEST_HEADERS = ("Accept", "If-None-Match")
+_PROXIED_RESPONSE_HEADERS = ("Content-Type", "ETag", "Cache-Control", "Vary")
+
+logger = log.get_logger("realtime-analyzer.sharding")
+_ROUTED = metrics.counter(
+    "neuro_analyzer_shard_routed_requests_total",
+    "API requests for users owned by another instance",
+    ("routing",),
+)
+
+
+def partition_of(user_id: str, partitions: int) -> int:
+    """FNV-1a (32 bit) of the UTF-8 user ID modulo partitions; the collector computes the same."""
+    h = 0x811C9DC5
+    for byte in user_id.encode():
+        h = ((h ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return h % partitions
+
+
+def _weight(shard_id: str, partition: int) -> int:
+    digest = hashlib.blake2b(f"{shard_id}/{partition}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def assign(shard_ids, partitions: int) -> list[str]:
+    """The owner of every partition: the instance with the highest weight for it."""
+    shard_ids = sorted(shard_ids)
+    return [max(shard_ids, key=lambda shard_id: _weight(shard_id, p)) for p in range(partitions)]
+
+
+def default_url() -> str:
+    """
+    SHARD_URL, or this container's address, which the other instances on the
+    network can reach.
+    """
+    if config.SHARD_URL:
+        return config.SHARD_URL.rstrip("/")
+    try:
+        host = socket.gethostbyname(socket.gethostname())
+    except OSError:
+        host = socket.gethostname()
+    return f"http://{host}:{config.PORT}"
+
+
+class ShardMap:
+    """
+    The live instances and the partition assignment derived from them.
+    Updated by the consumer thread and read by the API threads.
+    """
+
+    def __init__(self, shard_id: str, url: str, partitions: int, ttl: float):
+        self.shard_id = shard_id
+        self.url = url
+        self.partitions = partitions
+        self._ttl = ttl
+        # shard_id -> (url, time of the last heartbeat); this instance never expires
+        self._members: dict[str, tuple[str, float]] = {shard_id: (url, float("inf"))}
+        self._owners = assign(self._members, partitions)
+        self._lock = threading.Lock()
+        self._rebalances = 0
+
+    def _reassign(self):
+        """The caller must hold _lock."""
+        self._owners = assign(self._members, self.partitions)
+        self._rebalances += 1
+
+    def observe(self, shard_id: str, url: str, now: float) -> bool:
+        """Records a heartbeat; True when the instance is new and the assignment changed."""
+        with self._lock:
+            known = shard_id in self._members
+            self._members[shard_id] = (url, now)
+            if not known:
+                self._reassign()
+            return not known
+
+    def expire(self, now: float) -> list[str]:
+        """Drops instances without a heartbeat for the TTL and returns them."""
+        with self._lock:
+            expired = [s for s, (_, seen) in self._members.items() if now - seen > self._ttl]
+            for shard_id in expired:
+                del self._members[shard_id]
+            if expired:
+                self._reassign()
+            return expired
+
+    def owner(self, user_id: str) -> tuple[str, str]:
+        """(shard_id, url) of the instance owning the user."""
+        with self._lock:
+            shard_id = self._owners[partition_of(user_id, self.partitions)]
+            return shard_id, self._members[shard_id][0]
+
+    def partition_owner(self, partition: int) -> str:
+        return self._owners[partition]
+
+    def owns(self, user_id: str) -> bool:
+        return self._owners[partition_of(user_id, self.partitions)] == self.shard_id
+
+    def owned_partitions(self) -> set[int]:
+        with self._lock:
+            return {p for p, shard_id in enumerate(self._owners) if shard_id == self.shard_id}
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            return {
+                "members": len(self._members),
+                "owned_partitions": sum(
+                    1 for shard_id in self._owners if shard_id == self.shard_id
+                ),
+                "rebalances": self._rebalances,
+            }
+
+
+class ShardConsumer:
+    """
+    Keeps the consumer's queue bound to the partitions this instance owns and
+    exchanges heartbeats. Runs entirely in the consumer thread, which owns the
+    pika connection.
+    """
+
+    def __init__(self, connection, channel, queue: str, shard_map: ShardMap, store: UserDataStore):
+        self._connection = connection
+        self._channel = channel
+        self._queue = queue
+        self._map = shard_map
+        self._store = store
+        self._bound: set[int] = set()
+        # Lost partitions still bound until their new owner has bound them
+        self._releasing: set[int] = set()
+        # Instances that announced their partitions as bound
+        self._bound_members: set[str] = set()
+        self._started = False
+
+    def start(self):
+        channel = self._channel
+        channel.exchange_declare(
+            exchange=config.SHARD_EXCHANGE, exchange_type="direct", durable=True
+        )
+        channel.exchange_bind(destination=config.SHARD_EXCHANGE, source=config.RAW_DATA_EXCHANGE)
+        channel.exchange_declare(exchange=config.SHARD_MEMBERSHIP_EXCHANGE, exchange_type="fanout")
+        members_queue = channel.queue_declare(queue="", exclusive=True).method.queue
+        channel.queue_bind(exchange=config.SHARD_MEMBERSHIP_EXCHANGE, queue=members_queue)
+        channel.basic_consume(
+            queue=members_queue, on_message_callback=self._on_heartbeat, auto_ack=True
+        )
+        self._announce()
+        # Hear from the running instances before claiming partitions
+        self._connection.call_later(config.SHARD_HEARTBEAT_SEC, self._on_timer)
+        print(f"🧩 Joining analyzer shards as '{self._map.shard_id}' ({self._map.url}).")
+
+    def _announce(self):
+        body = json.dumps(
+            {"shard_id": self._map.shard_id, "url": self._map.url, "bound": self._started}
+        )
+        self._channel.basic_publish(
+            exchange=config.SHARD_MEMBERSHIP_EXCHANGE, routing_key="", body=body
+        )
+
+    def _on_heartbeat(self, ch, method, properties, body):
+        try:
+            message = json.loads(body)
+            shard_id, url = message["shard_id"], message["url"]
+            bound = bool(message.get("bound", True))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("malformed heartbeat", error=str(e))
+            return
+        if shard_id == self._map.shard_id:
+            return
+        if self._map.observe(shard_id, url, time.monotonic()):
+            # Answer right away so a joining instance learns every member within one round trip
+            self._announce()
+            if self._started:
+                self._rebind()
+        if not bound:
+            # Not bound yet, or restarted under the same ID before it expired
+            self._bound_members.discard(shard_id)
+        elif shard_id not in self._bound_members:
+            self._bound_members.add(shard_id)
+            self._release()
+
+    def _on_timer(self):
+        expired = self._map.expire(time.monotonic())
+        if expired:
+            logger.warning("shards expired", shard_ids=expired)
+            self._bound_members.difference_update(expired)
+        if not self._started or expired:
+            self._started = True
+            self._rebind()
+        self._announce()
+        self._connection.call_later(config.SHARD_HEARTBEAT_SEC, self._on_timer)
+
+    def _rebind(self):
+        owned = self._map.owned_partitions()
+        gained = owned - self._bound
+        for partition in sorted(gained):
+            self._channel.queue_bind(
+                exchange=config.SHARD_EXCHANGE, queue=self._queue, routing_key=str(partition)
+            )
+        self._bound |= owned
+        # Lost partitions stay bound until _release(); the consumer drops their packets meanwhile
+        self._releasing = self._bound - owned
+        evicted = self._store.evict_users(self._map.owns)
+        if evicted:
+            encoded_results.discard_missing(set(self._store.get_all_user_ids()))
+        logger.info(
+            "partitions rebalanced",
+            owned=len(owned),
+            partitions=self._map.partitions,
+            shards=self._map.get_metrics()["members"],
+            gained=len(gained),
+            releasing=len(self._releasing),
+            users_handed_over=evicted,
+        )
+        self._release()
+
+    def _release(self):
+        """Unbinds the lost partitions whose new owner has bound its partitions."""
+        released = {
+            p for p in self._releasing if self._map.partition_owner(p) in self._bound_members
+        }
+        for partition in sorted(released):
+            self._channel.queue_unbind(
+                exchange=config.SHARD_EXCHANGE, queue=self._queue, routing_key=str(partition)
+            )
+        self._bound -= released
+        self._releasing -= released
+
+
+def route_to_owner(shard_map: ShardMap | None, user_id: str):
+    """
+    None when this instance serves user_id itself. Otherwise the owning
+    instance's response to the current request, or a redirect to it.
+    """
+    if shard_map is None or FORWARDED_HEADER in request.headers:
+        return None
+    owner_id, url = shard_map.owner(user_id)
+    if owner_id == shard_map.shard_id:
+        return None
+    target = url + request.full_path.rstrip("?")
+    if config.SHARD_API_ROUTING == "redirect":
+        _ROUTED.labels("redirect").inc()
+        return redirect(target, code=307)
+
+    _ROUTED.labels("proxy").inc()
+    headers = {
+        name: request.headers[name] for name in _PROXIED_REQUEST_HEADERS if name in request.headers
+    }
+    headers[FORWARDED_HEADER] = shard_map.shard_id
+    try:
+        upstream_request = urllib.request.Request(target, headers=headers)
+        with urllib.request.urlopen(
+            upstream_request, timeout=config.SHARD_PROXY_TIMEOUT_SEC
+        ) as upstream:
+            status, upstream_headers, body = upstream.status, upstream.headers, upstream.read()
+    except urllib.error.HTTPError as e:
+        # 304 and error statuses are the owner's answer, passed on as they are
+        status, upstream_headers, body = e.code, e.headers, e.read()
+    except OSError as e:
+        logger.warning("shard unavailable", shard_id=owner_id, error=str(e))
+        return jsonify({"error": "The analyzer instance for this user is unavailable."}), 503
+    response = Response(body, status=status)
+    for name in _PROXIED_RESPONSE_HEADERS:
+        if name in upstream_headers:
+            response.headers[name] = upstream_headers[name]
+    return response
@@ -0,0 +1,260 @@
+"""
+Pure NumPy/SciPy spectral engine.
+
+Computes the same quantities as the MNE path in analyzer.perform_analysis
+(Welch PSD as in ``Raw.compute_psd`` and multitaper coherence as in
+``spectral_connectivity_epochs(method="coh")``) directly on stacked arrays of
+shape (users, channels, samples), so many users' windows are processed in one
+call. Window functions and frequency masks depend only on segment length and
+band, so they are computed once and cached. SlidingSpectrum keeps the same
+quantities up to date incrementally for one user's stream.
+"""
+
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import get_window
+from scipy.signal.windows import dpss
+
+# Conversion used throughout the platform: 12-bit ADC centred at 2048, 4.5 uV full scale
+ADC_OFFSET = 2048.0
+ADC_TO_VOLTS = (4.5 / 4096.0) * 1e-6
+
+
+def adc_to_volts(eeg_chunks_adc: np.ndarray) -> np.ndarray:
+    """(users, samples, channels) uint16 ADC values -> (users, channels, samples) volts."""
+    return (np.swapaxes(eeg_chunks_adc, -1, -2).astype(np.float64) - ADC_OFFSET) * ADC_TO_VOLTS
+
+
+@lru_cache(maxsize=8)
+def _welch_window(n_fft: int) -> tuple[np.ndarray, float]:
+    window = get_window("hamming", n_fft)
+    return window, float((window**2).sum())
+
+
+@lru_cache(maxsize=16)
+def _freq_slice(n_fft: int, sfreq: float, fmin: float, fmax: float) -> tuple[slice, np.ndarray]:
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / sfreq)
+    idx = np.flatnonzero((freqs >= fmin) & (freqs <= fmax))
+    if idx.size == 0:
+        raise ValueError(f"No frequencies found between fmin={fmin} and fmax={fmax}")
+    sl = slice(idx[0], idx[-1] + 1)
+    return sl, freqs[sl]
+
+
+@lru_cache(maxsize=8)
+def _multitaper_windows(n_times: int, half_nbw: float) -> tuple[np.ndarray, np.ndarray]:
+    """Low-bias DPSS tapers and their sqrt-eigenvalue weights, as MNE uses by default."""
+    tapers, ratios = dpss(n_times, half_nbw, int(2 * half_nbw), sym=False, return_ratios=True)
+    keep = ratios > 0.9
+    return tapers[keep], np.sqrt(ratios[keep])
+
+
+def _segment_power(
+    segments: np.ndarray, sfreq: float, fmin: float, fmax: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    One-sided Hamming-windowed power of each segment: (..., n_fft) -> (freqs,
+    (..., n_freqs)) in V**2/Hz.
+    """
+    n_fft = segments.shape[-1]
+    segments = segments - segments.mean(axis=-1, keepdims=True)
+    window, window_power = _welch_window(n_fft)
+    sl, freqs = _freq_slice(n_fft, float(sfreq), fmin, fmax)
+
+    spectrum = np.fft.rfft(segments * window, axis=-1)[..., sl]
+    power = (spectrum.real**2 + spectrum.imag**2) / (sfreq * window_power)
+    # One-sided spectrum: double everything except DC and Nyquist
+    scale = np.full(power.shape[-1], 2.0)
+    bins = np.arange(sl.start, sl.stop)
+    scale[(bins == 0) | ((n_fft % 2 == 0) & (bins == n_fft // 2))] = 1.0
+    return freqs, power * scale
+
+
+def _tapered_spectra(
+    epochs: np.ndarray, sfreq: float, fmin: float, fmax: float, half_nbw: float
+) -> np.ndarray:
+    """Eigenvalue-weighted DPSS spectra of each epoch: (..., n_times) -> (..., tapers, n_freqs)."""
+    n_times = epochs.shape[-1]
+    epochs = epochs - epochs.mean(axis=-1, keepdims=True)
+    tapers, weights = _multitaper_windows(n_times, half_nbw)
+    sl, _ = _freq_slice(n_times, float(sfreq), fmin, fmax)
+    spectra = np.fft.rfft(epochs[..., None, :] * tapers, axis=-1)[..., sl]
+    spectra *= weights[:, None]
+    return spectra
+
+
+def _coherence_from_csd(csd: np.ndarray) -> np.ndarray:
+    """
+    (..., ch, ch, freqs) cross-spectral density -> (..., ch, ch) magnitude
+    coherence averaged over frequency.
+    """
+    # Auto-spectra from the diagonal: (..., channels, freqs)
+    power = np.einsum("...ccf->...cf", csd).real
+    denom = np.sqrt(power[..., :, None, :] * power[..., None, :, :])
+    return (np.abs(csd) / denom).mean(axis=-1)
+
+
+def welch_psd(
+    data: np.ndarray, sfreq: float, n_fft: int, fmin: float, fmax: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Welch PSD with non-overlapping Hamming segments of n_fft samples.
+
+    data: (..., n_times) -> (freqs, psd of shape (..., n_freqs)) in V**2/Hz.
+    """
+    n_segments = data.shape[-1] // n_fft
+    segments = data[..., : n_segments * n_fft].reshape(*data.shape[:-1], n_segments, n_fft)
+    freqs, power = _segment_power(segments, sfreq, fmin, fmax)
+    return freqs, power.mean(axis=-2)
+
+
+def multitaper_coherence(
+    data: np.ndarray,
+    sfreq: float,
+    epoch_samples: int,
+    fmin: float,
+    fmax: float,
+    half_nbw: float = 4.0,
+) -> np.ndarray:
+    """
+    Magnitude coherence averaged over [fmin, fmax], from non-overlapping epochs.
+
+    data: (users, channels, n_times) -> (users, channels, channels), symmetric
+    with a unit diagonal.
+    """
+    n_users, n_channels, n_times = data.shape
+    n_epochs = n_times // epoch_samples
+    epochs = data[..., : n_epochs * epoch_samples].reshape(
+        n_users, n_channels, n_epochs, epoch_samples
+    )
+    # (users, channels, epochs, tapers, freqs) -> (users, channels, epochs * tapers, freqs)
+    spectra = _tapered_spectra(epochs, sfreq, fmin, fmax, half_nbw)
+    spectra = spectra.reshape(n_users, n_channels, -1, spectra.shape[-1])
+    # Cross-spectral density summed over epochs and tapers: (users, ch, ch, freqs)
+    csd = np.einsum("uckf,udkf->ucdf", spectra, spectra.conj())
+    return _coherence_from_csd(csd)
+
+
+class _RunningSum:
+    """
+    Sum over the last `maxlen` arrays pushed, updated by adding the newest and
+    subtracting the expired one.
+    """
+
+    # Re-sum from scratch this often so floating-point error from add/subtract does not accumulate
+    RESYNC_EVERY = 256
+
+    def __init__(self, maxlen: int):
+        self.items = deque(maxlen=maxlen)
+        self.total = None
+        self._updates = 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @property
+    def full(self) -> bool:
+        return len(self.items) == self.items.maxlen
+
+    def push(self, value: np.ndarray):
+        if self.full:
+            self.total -= self.items[0]
+        self.items.append(value)
+        self.total = value.copy() if self.total is None else self.total + value
+        self._updates += 1
+        if self._updates % self.RESYNC_EVERY == 0:
+            self.total = np.sum(self.items, axis=0)
+
+
+class SlidingSpectrum:
+    """
+    Running Welch PSD and multitaper coherence over the most recent window of
+    one user's signal.
+
+    Segments and epochs are aligned to absolute sample indices, so each sample
+    is transformed exactly once: update() only FFTs the segments completed by
+    the new samples and drops the ones that fell out of the window. The cost of
+    a cycle is proportional to the new data, not to the window length, and the
+    window can be longer than the raw sample buffer.
+    """
+
+    def __init__(
+        self,
+        sfreq: float,
+        window_samples: int,
+        n_fft: int,
+        psd_band: tuple[float, float],
+        epoch_samples: int,
+        coh_band: tuple[float, float],
+        half_nbw: float = 4.0,
+    ):
+        self.sfreq = float(sfreq)
+        self.n_fft = n_fft
+        self.epoch_samples = epoch_samples
+        self.psd_band = psd_band
+        self.coh_band = coh_band
+        self.half_nbw = half_nbw
+        self._psd = _RunningSum(max(1, window_samples // n_fft))
+        self._csd = _RunningSum(max(1, window_samples // epoch_samples))
+        self.freqs = np.asarray(_freq_slice(n_fft, self.sfreq, *psd_band)[1])
+        self._reset(0)
+
+    def _reset(self, first_index: int):
+        self._psd = _RunningSum(self._psd.items.maxlen)
+        self._csd = _RunningSum(self._csd.items.maxlen)
+        # Next segment/epoch boundaries at or after first_index
+        self._psd_next = -(-first_index // self.n_fft) * self.n_fft
+        self._coh_next = -(-first_index // self.epoch_samples) * self.epoch_samples
+        self._pending = None
+        self._pending_start = first_index
+        self.end_index = first_index
+
+    def update(self, first_index: int, samples: np.ndarray):
+        """
+        Adds samples (channels, n) in volts whose first sample has absolute
+        index first_index. A gap or rewind in the indices restarts the window.
+        """
+        if first_index != self.end_index:
+            self._reset(first_index)
+        self._pending = (
+            samples if self._pending is None else np.concatenate((self._pending, samples), axis=-1)
+        )
+        self.end_index = first_index + samples.shape[-1]
+
+        n_segments = (self.end_index - self._psd_next) // self.n_fft
+        if n_segments > 0:
+            offset = self._psd_next - self._pending_start
+            block = self._pending[:, offset : offset + n_segments * self.n_fft]
+            segments = block.reshape(block.shape[0], n_segments, self.n_fft).swapaxes(0, 1)
+            _, power = _segment_power(segments, self.sfreq, *self.psd_band)
+            for segment_power in power[-self._psd.items.maxlen :]:
+                self._psd.push(segment_power)
+            self._psd_next += n_segments * self.n_fft
+
+        n_epochs = (self.end_index - self._coh_next) // self.epoch_samples
+        if n_epochs > 0:
+            offset = self._coh_next - self._pending_start
+            block = self._pending[:, offset : offset + n_epochs * self.epoch_samples]
+            epochs = block.reshape(block.shape[0], n_epochs, self.epoch_samples).swapaxes(0, 1)
+            # (epochs, channels, tapers, freqs) -> per-epoch CSD summed over tapers
+            spectra = _tapered_spectra(epochs, self.sfreq, *self.coh_band, self.half_nbw)
+            for epoch_csd in np.einsum("eckf,edkf->ecdf", spectra, spectra.conj())[
+                -self._csd.items.maxlen :
+            ]:
+                self._csd.push(epoch_csd)
+            self._coh_next += n_epochs * self.epoch_samples
+
+        keep_from = min(self._psd_next, self._coh_next)
+        self._pending = self._pending[:, keep_from - self._pending_start :]
+        self._pending_start = keep_from
+
+    def result(self) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        (psd (channels, freqs), coherence (channels, channels)), or None until the
+        window is full.
+        """
+        if not (self._psd.full and self._csd.full):
+            return None
+        return self._psd.total / len(self._psd), _coherence_from_csd(self._csd.total)
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+from src import config
+from src.data_store import UserDataStore
+from src.sharding import ShardConsumer, ShardMap
+
+PARTITIONS = 16
+
+
+class Broker:
+    """The bindings of the shard exchange and the heartbeats in flight, delivered by pump()."""
+
+    def __init__(self):
+        self.bindings: set[tuple[str, int]] = set()
+        self.consumers: list[ShardConsumer] = []
+        self.in_flight: list[bytes] = []
+        self.timers: dict[ShardConsumer, object] = {}
+
+    def pump(self):
+        while self.in_flight:
+            body = self.in_flight.pop(0)
+            for consumer in self.consumers:
+                consumer._on_heartbeat(None, None, None, body)
+            self.assert_every_partition_bound()
+
+    def assert_every_partition_bound(self):
+        bound = {partition for _, partition in self.bindings}
+        if self.consumers and any(c._started for c in self.consumers):
+            assert bound == set(range(PARTITIONS))
+
+
+class Channel:
+    def __init__(self, broker: Broker, queue: str):
+        self.broker = broker
+        self.queue = queue
+
+    def exchange_declare(self, **kwargs):
+        pass
+
+    def exchange_bind(self, **kwargs):
+        pass
+
+    def queue_declare(self, **kwargs):
+        return SimpleNamespace(method=SimpleNamespace(queue=f"{self.queue}-members"))
+
+    def queue_bind(self, exchange, queue, routing_key=None):
+        if exchange == config.SHARD_EXCHANGE:
+            self.broker.bindings.add((queue, int(routing_key)))
+
+    def queue_unbind(self, exchange, queue, routing_key):
+        self.broker.bindings.discard((queue, int(routing_key)))
+
+    def basic_consume(self, **kwargs):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body):
+        self.broker.in_flight.append(body)
+
+
+def start(broker: Broker, shard_id: str) -> ShardConsumer:
+    shard_map = ShardMap(shard_id, f"http://{shard_id}", PARTITIONS, ttl=60)
+    connection = SimpleNamespace(
+        call_later=lambda delay, fn: broker.timers.__setitem__(consumer, fn)
+    )
+    consumer = ShardConsumer(
+        connection, Channel(broker, shard_id), shard_id, shard_map, UserDataStore()
+    )
+    broker.consumers.append(consumer)
+    consumer.start()
+    return consumer
+
+
+def tick(broker: Broker, consumer: ShardConsumer):
+    """One heartbeat of the consumer's timer."""
+    broker.timers[consumer]()
+    broker.pump()
+
+
+def test_joining_instance_takes_over_without_a_gap():
+    broker = Broker()
+    a = start(broker, "a")
+    broker.pump()
+    tick(broker, a)
+    assert {p for _, p in broker.bindings} == set(range(PARTITIONS))
+
+    b = start(broker, "b")
+    # a now assigns some partitions to b, which has not bound them yet
+    broker.pump()
+    moved = a._map.owned_partitions() ^ set(range(PARTITIONS))
+    assert moved
+    assert {("a", p) for p in moved} <= broker.bindings
+
+    # b binds on its first timer and announces it; only then does a unbind
+    tick(broker, b)
+    assert broker.bindings == {("a", p) for p in range(PARTITIONS) if p not in moved} | {
+        ("b", p) for p in moved
+    }
+    assert a._releasing == set()
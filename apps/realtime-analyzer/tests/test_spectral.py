@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from src import analyzer, config, spectral
+
+WINDOW = int(config.SAMPLE_RATE * config.ANALYSIS_WINDOW_SEC)
+
+
+def synthetic_adc(num_users: int, num_samples: int, seed: int) -> np.ndarray:
+    """(users, samples, channels) uint16 EEG: shared 10 Hz alpha plus per-channel noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_samples) / config.SAMPLE_RATE
+    alpha = 150 * np.sin(2 * np.pi * 10 * t)[None, :, None]
+    noise = rng.normal(0, 80, (num_users, num_samples, config.NUM_EEG_CHANNELS))
+    return np.clip(2048 + alpha + noise, 0, 4095).astype(np.uint16)
+
+
+@pytest.fixture
+def numeric_results(monkeypatch):
+    monkeypatch.setattr(config, "ANALYSIS_ENGINE", "numpy")
+    monkeypatch.setattr(config, "RESULT_FORMAT", "numeric")
+
+
+def assert_same_spectra(result: dict, reference: dict):
+    np.testing.assert_allclose(result["freqs"], reference["freqs"])
+    np.testing.assert_allclose(result["psd"], reference["psd"], rtol=1e-5)
+    np.testing.assert_allclose(result["coherence"], reference["coherence"], atol=1e-6)
+
+
+def test_numpy_engine_matches_mne(numeric_results):
+    chunks = list(synthetic_adc(4, WINDOW, seed=1))
+    results = analyzer.perform_batch_analysis(chunks)
+    for chunk, result in zip(chunks, results, strict=True):
+        assert_same_spectra(result, analyzer.perform_mne_analysis(chunk))
+
+
+def test_incremental_engine_matches_from_scratch(numeric_results):
+    rng = np.random.default_rng(2)
+    adc = synthetic_adc(1, 8 * WINDOW, seed=2)[0]
+    sliding = analyzer.new_sliding_spectrum()
+    index = 0
+    while index < len(adc):
+        # Uneven packet sizes, converted one by one as the scheduler does
+        n = int(rng.integers(1, 400))
+        sliding.update(index, spectral.adc_to_volts(adc[None, index : index + n])[0])
+        index += n
+    psd, coherence = sliding.result()
+    [result] = analyzer.build_results(sliding.freqs, psd[None], coherence[None])
+
+    # The accumulator covers the last whole FFT segments and coherence epochs
+    psd_end = len(adc) // sliding.n_fft * sliding.n_fft
+    coh_end = len(adc) // sliding.epoch_samples * sliding.epoch_samples
+    [psd_ref, coh_ref] = analyzer.perform_batch_analysis(
+        [adc[psd_end - WINDOW : psd_end], adc[coh_end - WINDOW : coh_end]]
+    )
+    np.testing.assert_allclose(result["psd"], psd_ref["psd"], rtol=1e-5)
+    np.testing.assert_allclose(result["coherence"], coh_ref["coherence"], atol=1e-6)
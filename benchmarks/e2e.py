@@ -0,0 +1,269 @@
+"""
+End-to-end benchmark of the Python pipeline with synthetic devices, compared
+against stored baselines so regressions show up between releases.
+
+Each service's load test runs in its own process from its app directory,
+on in-process stand-ins for RabbitMQ, MinIO and PostgreSQL
+(neuro_common.loadgen), and prints its results as JSON:
+
+  processor  apps/processor        benchmarks.e2e_processor
+             messages/s (backlog drain), publish-to-stored latency, peak RSS
+  analyzer   apps/realtime-analyzer benchmarks.e2e_analyzer
+             messages/s, publish-to-buffered latency, scheduler cycle lag,
+             analyses per user and interval, peak RSS of service and workers
+  exporter   apps/bids-exporter    benchmarks.e2e_exporter
+             export throughput in samples/s, peak RSS of service and workers
+
+Every scenario runs --repeat times and each metric keeps its best value,
+which filters out runs slowed down by something else on the machine.
+Results are compared with the baseline (benchmarks/baselines/e2e.json): a
+metric regresses when it is worse than the baseline by more than
+--tolerance and by more than its absolute slack, which keeps jitter in
+small numbers (a 0.2 ms latency, a 5 ms cycle lag) from failing the run.
+Baselines are only comparable for the same parameters and, in practice,
+the same machine; both are stored with them. --update-baseline replaces the
+stored results after an intended change.
+
+Usage (from the repository root):
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --scenarios processor --devices 50
+    python -m benchmarks.e2e --update-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "e2e.json")
+
+SCENARIOS = {
+    "processor": ("apps/processor", "benchmarks.e2e_processor"),
+    "analyzer": ("apps/realtime-analyzer", "benchmarks.e2e_analyzer"),
+    "exporter": ("apps/bids-exporter", "benchmarks.e2e_exporter"),
+}
+
+# Compared metrics: (higher is better, absolute slack)
+TRACKED = {
+    "processor.messages_per_sec": (True, 0.0),
+    "processor.latency_p50_ms": (False, 2.0),
+    "processor.latency_p95_ms": (False, 5.0),
+    "processor.latency_p99_ms": (False, 10.0),
+    "processor.peak_rss_mb": (False, 16.0),
+    "analyzer.messages_per_sec": (True, 0.0),
+    "analyzer.latency_p95_ms": (False, 1.0),
+    "analyzer.latency_p99_ms": (False, 2.0),
+    "analyzer.cycle_lag_max_sec": (False, 0.05),
+    "analyzer.analyses_per_user_interval": (True, 0.1),
+    "analyzer.peak_rss_mb": (False, 16.0),
+    "analyzer.workers_peak_rss_mb": (False, 16.0),
+    "exporter.samples_per_sec": (True, 0.0),
+    "exporter.peak_rss_mb": (False, 16.0),
+    "exporter.workers_peak_rss_mb": (False, 16.0),
+}
+
+
+def scenario_args(name: str, args) -> list[str]:
+    devices = [
+        "--devices",
+        str(args.devices),
+        "--samples-per-packet",
+        str(args.samples_per_packet),
+        "--backlog-sec",
+        str(args.backlog_sec),
+    ]
+    if name == "processor":
+        return [
+            *devices,
+            "--seconds",
+            str(args.seconds),
+            "--rtt-ms",
+            str(args.rtt_ms),
+            "--ingest-mode",
+            args.ingest_mode,
+        ]
+    if name == "analyzer":
+        return [
+            *devices,
+            "--seconds",
+            str(max(args.seconds, 3 * args.analysis_interval)),
+            "--workers",
+            str(args.analysis_workers),
+            "--interval",
+            str(args.analysis_interval),
+        ]
+    return [
+        "--sessions",
+        str(args.sessions),
+        "--minutes",
+        str(args.session_minutes),
+        "--workers",
+        str(args.export_workers),
+    ]
+
+
+def run_scenario(name: str, args) -> dict:
+    app_dir, module = SCENARIOS[name]
+    env = dict(os.environ, ANALYSIS_ENGINE=args.analysis_engine, RESULT_FORMAT=args.result_format)
+    cmd = [sys.executable, "-m", module, *scenario_args(name, args)]
+    r = subprocess.run(
+        cmd, cwd=os.path.join(ROOT, app_dir), env=env, capture_output=True, text=True
+    )
+    lines = r.stdout.strip().splitlines()
+    if r.returncode != 0 or not lines:
+        raise RuntimeError(f"{name} failed ({r.returncode}):\n{r.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def best_of(runs: list[dict]) -> dict:
+    """Each tracked metric's best value over the runs; other values are taken from the first run."""
+    best = dict(runs[0])
+    for metric, (higher_is_better, _) in TRACKED.items():
+        values = [run[metric] for run in runs if run.get(metric) is not None]
+        if values:
+            best[metric] = max(values) if higher_is_better else min(values)
+    return best
+
+
+def parameters(args) -> dict:
+    return {
+        "devices": args.devices,
+        "seconds": args.seconds,
+        "backlog_sec": args.backlog_sec,
+        "samples_per_packet": args.samples_per_packet,
+        "rtt_ms": args.rtt_ms,
+        "ingest_mode": args.ingest_mode,
+        "analysis_engine": args.analysis_engine,
+        "result_format": args.result_format,
+        "analysis_workers": args.analysis_workers,
+        "analysis_interval": args.analysis_interval,
+        "sessions": args.sessions,
+        "session_minutes": args.session_minutes,
+        "export_workers": args.export_workers,
+        "repeat": args.repeat,
+    }
+
+
+def machine() -> dict:
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def regressed(metric: str, value: float, baseline: float, tolerance: float) -> bool:
+    higher_is_better, slack = TRACKED[metric]
+    change = baseline - value if higher_is_better else value - baseline
+    return change > abs(baseline) * tolerance and change > slack
+
+
+def compare(results: dict, baseline: dict | None, tolerance: float) -> list[str]:
+    """Prints every tracked metric against the baseline and returns those that regressed."""
+    failures = []
+    print(f"\n{'metric':40s} {'value':>12s} {'baseline':>12s} {'change':>8s}")
+    for metric in TRACKED:
+        value = results.get(metric)
+        if value is None:
+            continue
+        base = (baseline or {}).get(metric)
+        if base is None:
+            print(f"{metric:40s} {value:12.2f} {'-':>12s}")
+            continue
+        change = f"{(value - base) / base * 100:+7.1f}%" if base else ""
+        flag = ""
+        if regressed(metric, value, base, tolerance):
+            failures.append(metric)
+            flag = "  REGRESSION"
+        print(f"{metric:40s} {value:12.2f} {base:12.2f} {change:>8s}{flag}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    ap.add_argument("--devices", type=int, default=20, help="synthetic devices (one user each)")
+    ap.add_argument("--seconds", type=float, default=10.0, help="length of the real-time phase")
+    ap.add_argument(
+        "--backlog-sec", type=float, default=30.0, help="recording time per device in the backlog"
+    )
+    ap.add_argument("--samples-per-packet", type=int, default=32)
+    ap.add_argument(
+        "--rtt-ms", type=float, default=1.0, help="simulated MinIO/PostgreSQL round trip"
+    )
+    ap.add_argument("--ingest-mode", choices=["single", "batch"], default="batch")
+    ap.add_argument("--analysis-engine", choices=["mne", "numpy", "incremental"], default="numpy")
+    ap.add_argument("--analysis-workers", type=int, default=2)
+    ap.add_argument("--result-format", choices=["image", "numeric"], default="numeric")
+    ap.add_argument("--analysis-interval", type=float, default=5.0)
+    ap.add_argument("--sessions", type=int, default=4, help="sessions of the exported experiment")
+    ap.add_argument("--session-minutes", type=float, default=10.0)
+    ap.add_argument("--export-workers", type=int, default=2)
+    ap.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per scenario; the best value of each metric counts",
+    )
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--output", help="also write the results as JSON to this file")
+    args = ap.parse_args()
+
+    results = {}
+    for name in args.scenarios:
+        started = time.perf_counter()
+        print(f"▶ {name} ...", flush=True)
+        runs = [
+            {f"{name}.{key}": value for key, value in run_scenario(name, args).items()}
+            for _ in range(args.repeat)
+        ]
+        results.update(best_of(runs))
+        print(f"  {args.repeat} runs in {time.perf_counter() - started:.0f} s")
+    report = {"parameters": parameters(args), "machine": machine(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    stored = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+    baseline = None
+    if stored is None:
+        print(f"No baseline at {args.baseline}.")
+    elif stored["parameters"] != report["parameters"]:
+        print("⚠️ The baseline was recorded with other parameters; not comparing.")
+    else:
+        baseline = stored["results"]
+        if stored["machine"] != report["machine"]:
+            print(
+                f"⚠️ The baseline was recorded on another machine ({stored['machine']}); expect "
+                "differences."
+            )
+    failures = compare(results, baseline, args.tolerance)
+
+    if args.update_baseline:
+        if stored is not None and stored["parameters"] == report["parameters"]:
+            # Keep the baselines of scenarios that were not run this time
+            report["results"] = {**stored["results"], **results}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\n✅ Baseline written to {args.baseline}.")
+    elif failures:
+        print(
+            f"\n❌ {len(failures)} metrics regressed by more than {args.tolerance:.0%}: "
+            f"{', '.join(failures)}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -45,8 +45,16 @@ CREATE TABLE IF NOT EXISTS raw_data_objects (
 CREATE TABLE IF NOT EXISTS session_object_links (
     session_id VARCHAR(255) NOT NULL REFERENCES sessions(session_id) ON DELETE CASCADE,
     object_id VARCHAR(512) NOT NULL REFERENCES raw_data_objects(object_id) ON DELETE CASCADE,
+    -- raw_data_objects.start_timeの複製（セッション内のオブジェクトを時刻順にインデックスだけで読むため）
+    start_time TIMESTAMPTZ NOT NULL,
     PRIMARY KEY (session_id, object_id)
 );
+-- start_time追加前に作られたテーブルには列を追加し、raw_data_objectsから埋める
+ALTER TABLE session_object_links ADD COLUMN IF NOT EXISTS start_time TIMESTAMPTZ;
+UPDATE session_object_links l SET start_time = o.start_time
+FROM raw_data_objects o
+WHERE l.object_id = o.object_id AND l.start_time IS NULL;
+ALTER TABLE session_object_links ALTER COLUMN start_time SET NOT NULL;
 
 -- MinIOに保存された画像のメタデータを管理
 CREATE TABLE IF NOT EXISTS images (
@@ -69,11 +77,43 @@ CREATE TABLE IF NOT EXISTS audio_clips (
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- BIDSエクスポートタスクの状態（サービス再起動後もタスクを再開できるよう永続化）
+CREATE TABLE IF NOT EXISTS export_tasks (
+    task_id UUID PRIMARY KEY,
+    experiment_id VARCHAR(255) NOT NULL,
+    status VARCHAR(50) NOT NULL DEFAULT 'pending', -- 'pending', 'running', 'completed', 'failed'
+    progress INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    result_file VARCHAR(512),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- エクスポートタスクに含まれるセッションと、完了したセッションの出力キャッシュキー
+CREATE TABLE IF NOT EXISTS export_task_sessions (
+    task_id UUID NOT NULL REFERENCES export_tasks(task_id) ON DELETE CASCADE,
+    session_id VARCHAR(255) NOT NULL,
+    session_index INTEGER NOT NULL,
+    cache_key VARCHAR(64), -- 未完了のセッションはNULL
+    finished_at TIMESTAMPTZ,
+    PRIMARY KEY (task_id, session_id)
+);
+
+-- コンパクションで置き換えられ、MinIOからの削除を待つオブジェクト
+-- （読み取り中のエクスポートのため、delete_afterを過ぎてから削除する）
+CREATE TABLE IF NOT EXISTS compaction_garbage (
+    object_id VARCHAR(512) PRIMARY KEY,
+    compacted_into VARCHAR(512), -- NULLは置き換えが確定していないアップロード済みの圧縮オブジェクト
+    delete_after TIMESTAMPTZ NOT NULL
+);
+
 -- インデックスを作成して検索パフォーマンスを向上
 CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id);
 CREATE INDEX IF NOT EXISTS idx_events_session ON events (session_id);
 CREATE INDEX IF NOT EXISTS idx_raw_data_user_time ON raw_data_objects (user_id, start_time DESC);
 CREATE INDEX IF NOT EXISTS idx_session_links_object ON session_object_links (object_id);
+CREATE INDEX IF NOT EXISTS idx_session_links_session_time ON session_object_links (session_id, start_time, object_id);
 CREATE INDEX IF NOT EXISTS idx_images_session ON images (session_id);
 CREATE INDEX IF NOT EXISTS idx_audio_clips_session ON audio_clips (session_id);
-
+CREATE INDEX IF NOT EXISTS idx_export_tasks_status ON export_tasks (status);
+CREATE INDEX IF NOT EXISTS idx_compaction_garbage_delete_after ON compaction_garbage (delete_after);
@@ -0,0 +1,90 @@
+"""
+Benchmark for the cost of instrumenting a hot path with neuro_common.metrics
+and neuro_common.log, per call:
+
+  print          what the processor did per message: one print() line
+                 (written to /dev/null here)
+  log/limited    the same event through a rate-limited StructuredLogger;
+                 after the first line every call is only counted
+  log/every      the logger with rate limiting off: one JSON line per call
+  counter        Counter.inc()
+  histogram      Histogram.observe()
+  timer          a `with child.time():` block around nothing
+
+and the size and render time of /metrics once --stages stages have data.
+
+Usage (from packages/py-common):
+    python -m benchmarks.bench_metrics --calls 200000
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import time
+
+from neuro_common import log, metrics
+
+
+def per_call(fn, calls: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--calls", type=int, default=200000)
+    ap.add_argument("--stages", type=int, default=20, help="labelled histogram children with data")
+    args = ap.parse_args()
+
+    devnull = open(os.devnull, "w")
+    # The loggers write to stdout through the "neuro" handler; point it at /dev/null too
+    for handler in logging.getLogger("neuro").handlers:
+        handler.setStream(devnull)
+    limited = log.get_logger("bench", interval=10.0)
+    every = log.get_logger("bench", interval=0.0)
+    counter = metrics.counter("bench_calls_total", "bench")
+    histogram = metrics.histogram("bench_seconds", "bench")
+
+    def timed():
+        with histogram.time():
+            pass
+
+    def printed():
+        with contextlib.redirect_stdout(devnull):
+            print("[2024-01-01T00:00:00+00:00] Received message.")
+            print("  - Successfully processed message for device AA:BB:CC:DD:EE:FF.")
+
+    cases = {
+        "print": printed,
+        "log/limited": lambda: limited.info(
+            "message stored", device_id="AA:BB:CC:DD:EE:FF", object_id="x"
+        ),
+        "log/every": lambda: every.info(
+            "message stored", device_id="AA:BB:CC:DD:EE:FF", object_id="x"
+        ),
+        "counter": lambda: counter.inc(),
+        "histogram": lambda: histogram.observe(0.003),
+        "timer": timed,
+    }
+    print(f"{args.calls} calls each")
+    for name, fn in cases.items():
+        calls = args.calls if name not in ("print", "log/every") else args.calls // 10
+        print(f"  {name:12s} {per_call(fn, calls) * 1e9:8.0f} ns/call")
+
+    for i in range(args.stages):
+        metrics.STAGE_SECONDS.labels(f"stage{i}").observe(0.001 * i)
+    started = time.perf_counter()
+    body = metrics.render()
+    elapsed = time.perf_counter() - started
+    print(
+        f"/metrics with {args.stages} stages: {len(body) / 1024:.1f} KiB rendered in "
+        f"{elapsed * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
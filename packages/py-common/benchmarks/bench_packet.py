@@ -0,0 +1,209 @@
+"""
+Benchmark for neuro_common.packet against the decoding each service did
+before, one scenario per call site:
+
+  ingest    processor: every message decoded whole (device ID, records,
+            esp_micros for the clock model); the payload was sliced off the
+            decompressed bytes (a copy) before np.frombuffer
+  eeg       realtime-analyzer: only the EEG of every message, appended to a
+            preallocated buffer; before, a payload slice and a "V45" padded dtype
+  stream    bids-exporter: one stored packet object decompressed in
+            --piece-size pieces; before, each piece was joined to the
+            previous remainder (a copy of the piece) and the EEG copied out
+  batch     processor compactor: --batch packets gathered into one column
+            per field; before, one frombuffer per packet, then a
+            concatenate per field
+
+Every scenario checks that both decoders return the same values. Reported:
+µs per packet and bytes allocated per packet (tracemalloc, separate run).
+
+Usage (from packages/py-common):
+    python -m benchmarks.bench_packet --samples 32 --packets 20000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from neuro_common import packet
+
+# The analyzer's former dtype: EEG, then the rest of the record as padding
+_EEG_ONLY_DTYPE = np.dtype(
+    [("eeg", "<u2", (packet.NUM_EEG_CHANNELS,)), ("rest", f"V{packet.RECORD_SIZE - 16}")]
+)
+
+
+def make_packets(count: int, samples: int) -> list[bytes]:
+    rng = np.random.default_rng(0)
+    header = b"AA:BB:CC:DD:EE:FF".ljust(packet.HEADER_SIZE, b"\x00")
+    packets = []
+    for i in range(count):
+        records = np.zeros(samples, dtype=packet.RECORD_DTYPE)
+        records["eeg"] = rng.integers(0, 4096, (samples, packet.NUM_EEG_CHANNELS))
+        records["accel"] = rng.normal(0, 1, (samples, 3))
+        records["esp_micros"] = (i * samples + np.arange(samples)) * 3906
+        packets.append(header + records.tobytes())
+    return packets
+
+
+# --- ingest (processor.parser.parse_raw_data) ---
+
+
+def ingest_before(raw: bytes):
+    device_id = raw[: packet.HEADER_SIZE].split(b"\x00", 1)[0].decode("utf-8", "ignore")
+    payload = raw[packet.HEADER_SIZE :]
+    records = np.frombuffer(
+        payload, dtype=packet.RECORD_DTYPE, count=len(payload) // packet.RECORD_SIZE
+    )
+    return device_id, records["esp_micros"]
+
+
+def ingest_after(raw: bytes):
+    decoded = packet.decode(raw)
+    return decoded.device_id, decoded.esp_micros
+
+
+# --- eeg (realtime-analyzer consumer) ---
+
+
+def eeg_before(raw: bytes, out: np.ndarray):
+    sensor_bytes = raw[packet.HEADER_SIZE :]
+    records = np.frombuffer(
+        sensor_bytes, dtype=_EEG_ONLY_DTYPE, count=len(sensor_bytes) // _EEG_ONLY_DTYPE.itemsize
+    )
+    out[: len(records)] = records["eeg"]
+
+
+def eeg_after(raw: bytes, out: np.ndarray):
+    eeg = packet.decode(raw).eeg
+    out[: len(eeg)] = eeg
+
+
+# --- stream (bids-exporter session_reader.decode_object_eeg) ---
+
+
+def stream_before(pieces: list[bytes]) -> np.ndarray:
+    parts, carry, header_skipped = [], b"", False
+    for piece in pieces:
+        buf = carry + piece if carry else piece
+        if not header_skipped:
+            if len(buf) < packet.HEADER_SIZE:
+                carry = buf
+                continue
+            buf = buf[packet.HEADER_SIZE :]
+            header_skipped = True
+        count = len(buf) // packet.RECORD_SIZE
+        if count:
+            parts.append(np.frombuffer(buf, dtype=packet.RECORD_DTYPE, count=count)["eeg"].copy())
+        carry = buf[count * packet.RECORD_SIZE :]
+    return np.concatenate(parts)
+
+
+def stream_after(pieces: list[bytes]) -> np.ndarray:
+    decoder = packet.StreamDecoder()
+    parts = [records["eeg"] for piece in pieces for records in decoder.feed(piece)]
+    decoder.close()
+    return np.concatenate(parts)
+
+
+# --- batch (processor compactor.load_bucket) ---
+
+
+def batch_before(raws: list[bytes]) -> dict[str, np.ndarray]:
+    parts = []
+    for raw in raws:
+        payload = raw[packet.HEADER_SIZE :]
+        parts.append(
+            np.frombuffer(
+                payload, dtype=packet.RECORD_DTYPE, count=len(payload) // packet.RECORD_SIZE
+            )
+        )
+    return {name: np.concatenate([p[name] for p in parts]) for name in packet.RECORD_DTYPE.names}
+
+
+def batch_after(raws: list[bytes]) -> dict[str, np.ndarray]:
+    return packet.decode_batch(raws).columns()
+
+
+def measure(run, repeat: int) -> tuple[float, float]:
+    """(seconds, bytes allocated) per call: timed untraced, then once more under tracemalloc."""
+    run()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    elapsed = (time.perf_counter() - started) / repeat
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument("--samples", type=int, default=32, help="samples per packet")
+    ap.add_argument("--packets", type=int, default=20000)
+    ap.add_argument("--batch", type=int, default=4800, help="packets per compaction bucket")
+    ap.add_argument(
+        "--object-samples", type=int, default=76800, help="samples in the streamed object"
+    )
+    ap.add_argument(
+        "--piece-size", type=int, default=128 * 1024, help="decompressed bytes per streamed piece"
+    )
+    args = ap.parse_args()
+
+    raws = make_packets(args.packets, args.samples)
+    print(f"{args.packets} packets of {args.samples} samples ({len(raws[0])} bytes)")
+
+    results = {}
+    assert all(np.array_equal(ingest_before(r)[1], ingest_after(r)[1]) for r in raws[:100]), (
+        "ingest: decoders differ"
+    )
+    results["ingest"] = (
+        measure(lambda: [ingest_before(r) for r in raws], 3),
+        measure(lambda: [ingest_after(r) for r in raws], 3),
+        len(raws),
+    )
+
+    out = np.empty((args.samples, packet.NUM_EEG_CHANNELS), dtype=np.uint16)
+    results["eeg"] = (
+        measure(lambda: [eeg_before(r, out) for r in raws], 3),
+        measure(lambda: [eeg_after(r, out) for r in raws], 3),
+        len(raws),
+    )
+
+    stream = make_packets(1, args.object_samples)[0]
+    pieces = [stream[i : i + args.piece_size] for i in range(0, len(stream), args.piece_size)]
+    assert np.array_equal(stream_before(pieces), stream_after(pieces)), "stream: decoders differ"
+    results["stream"] = (
+        measure(lambda: stream_before(pieces), 10),
+        measure(lambda: stream_after(pieces), 10),
+        args.object_samples / args.samples,
+    )
+
+    batch = raws[: args.batch]
+    expected, got = batch_before(batch), batch_after(batch)
+    assert all(np.array_equal(expected[n], got[n]) for n in packet.RECORD_DTYPE.names), (
+        "batch: decoders differ"
+    )
+    results["batch"] = (
+        measure(lambda: batch_before(batch), 5),
+        measure(lambda: batch_after(batch), 5),
+        len(batch),
+    )
+
+    print(
+        f"  {'':8s} {'before µs/pkt':>14s} {'after µs/pkt':>13s} {'before B/pkt':>13s} "
+        f"{'after B/pkt':>12s}"
+    )
+    for name, ((t0, m0), (t1, m1), per) in results.items():
+        print(
+            f"  {name:8s} {t0 / per * 1e6:14.2f} {t1 / per * 1e6:13.2f} {m0 / per:13.0f} "
+            f"{m1 / per:12.0f}"
+            f"   {t0 / t1:4.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared building blocks for the platform's Python services."""
@@ -0,0 +1,249 @@
+"""
+Chunked columnar layout for compacted sensor data.
+
+The processor stores one small object per device packet. The compactor merges
+a device's packets into one object per time bucket in this layout, which a
+reader can seek in without downloading the whole object:
+
+    preamble   MAGIC, format version, length of the header (12 bytes)
+    header     JSON: user/device, column names, dtypes and shapes, totals
+    index      one INDEX_DTYPE record per chunk: first sample, sample count,
+               first/last timestamp and the chunk's byte range in the data
+    data       the chunks back to back, each one zstd frame
+    sections   optional named blobs after the chunks (e.g. the summaries of
+               neuro_common.summary), with their byte ranges in the header
+
+A chunk holds chunk_samples consecutive samples stored column by column: the
+timestamps as microsecond deltas (the first relative to the chunk's start_us),
+then every data column, multi-channel columns channel by channel. Contiguous
+columns of slowly varying values compress far better than interleaved
+records, and a reader decodes only the columns it asks for.
+
+Timestamps are absolute microseconds since the Unix epoch (UTC), as estimated
+by the processor's clock sync when the packet arrived.
+"""
+
+import json
+import struct
+from collections.abc import Callable
+
+import numpy as np
+
+from . import codec
+
+MAGIC = b"NCHK"
+FORMAT_VERSION = 1
+# Object keys of compacted objects end with this, raw packet objects with ".zst"
+OBJECT_SUFFIX = ".nchk"
+_PREAMBLE = struct.Struct("<4sHxxI")
+INDEX_DTYPE = np.dtype(
+    [
+        ("first_sample", "<u8"),
+        ("num_samples", "<u4"),
+        ("start_us", "<i8"),
+        ("end_us", "<i8"),
+        ("offset", "<u8"),
+        ("length", "<u4"),
+    ]
+)
+# Enough for the header and index of a bucket of a few hours; longer ones take a second read
+HEADER_PROBE_SIZE = 64 * 1024
+TIME_COLUMN = "time_us"
+
+
+def is_chunk_object(object_id: str) -> bool:
+    return object_id.endswith(OBJECT_SUFFIX)
+
+
+class ChunkHeader:
+    """Parsed header and chunk index of a chunked object."""
+
+    def __init__(self, meta: dict, index: np.ndarray, data_offset: int):
+        self.meta = meta
+        self.index = index
+        self.data_offset = data_offset
+        self.columns = {
+            c["name"]: (np.dtype(c["dtype"]), tuple(c["shape"])) for c in meta["columns"]
+        }
+
+    @property
+    def num_samples(self) -> int:
+        return self.meta["num_samples"]
+
+    @property
+    def start_us(self) -> int:
+        return self.meta["start_us"]
+
+    @property
+    def end_us(self) -> int:
+        return self.meta["end_us"]
+
+    def chunk_range(
+        self, start_us: int | None = None, end_us: int | None = None
+    ) -> tuple[int, int]:
+        """
+        [first, last) chunk numbers whose samples overlap [start_us, end_us]; either
+        bound may be open.
+        """
+        index = self.index
+        first = (
+            0 if start_us is None else int(np.searchsorted(index["end_us"], start_us, side="left"))
+        )
+        last = (
+            len(index)
+            if end_us is None
+            else int(np.searchsorted(index["start_us"], end_us, side="right"))
+        )
+        return first, max(first, last)
+
+    def byte_range(self, first: int, last: int) -> tuple[int, int]:
+        """(offset, length) in the object of chunks [first, last), for a single range read."""
+        if first >= last:
+            return self.data_offset, 0
+        start = int(self.index["offset"][first])
+        end = int(self.index["offset"][last - 1]) + int(self.index["length"][last - 1])
+        return self.data_offset + start, end - start
+
+    def section_range(self, name: str) -> tuple[int, int] | None:
+        """(offset, length) in the object of a named section, or None if the object has none."""
+        section = self.meta.get("sections", {}).get(name)
+        if section is None:
+            return None
+        return self.data_offset + section[0], section[1]
+
+    def decode_chunks(
+        self, data: bytes, first: int, last: int, columns: list[str] | None = None
+    ) -> dict[str, np.ndarray]:
+        """
+        Decodes chunks [first, last) from ``data``, the bytes at byte_range(first, last).
+        Returns the requested columns (all by default) plus TIME_COLUMN.
+        """
+        names = list(self.columns) if columns is None else columns
+        parts: dict[str, list[np.ndarray]] = {name: [] for name in [TIME_COLUMN, *names]}
+        base = int(self.index["offset"][first]) if first < last else 0
+        dctx = codec.get_decompressor(codec.NO_DICTIONARY)
+        for entry in self.index[first:last]:
+            offset = int(entry["offset"]) - base
+            raw = dctx.decompress(data[offset : offset + int(entry["length"])])
+            for name, values in self._split(
+                raw, int(entry["num_samples"]), int(entry["start_us"]), names
+            ):
+                parts[name].append(values)
+        result = {}
+        for name, arrays in parts.items():
+            if arrays:
+                result[name] = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+            else:
+                dtype, shape = (np.dtype("<i8"), ()) if name == TIME_COLUMN else self.columns[name]
+                result[name] = np.empty((0, *shape), dtype=dtype)
+        return result
+
+    def _split(self, raw: bytes, n: int, start_us: int, names: list[str]):
+        times = np.frombuffer(raw, dtype="<i8", count=n)
+        yield TIME_COLUMN, np.cumsum(times) + start_us
+        offset = times.nbytes
+        wanted = set(names)
+        for name, (dtype, shape) in self.columns.items():
+            size = n * dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+            if name in wanted:
+                values = np.frombuffer(
+                    raw, dtype=dtype, count=size // dtype.itemsize, offset=offset
+                )
+                # Stored channel by channel; return one row per sample like the packet records
+                yield name, values.reshape(*shape, n).T if shape else values
+            offset += size
+
+
+def encode(
+    time_us: np.ndarray,
+    columns: dict[str, np.ndarray],
+    meta: dict,
+    chunk_samples: int,
+    level: int = codec.DEFAULT_LEVEL,
+    sections: dict[str, bytes] | None = None,
+) -> bytes:
+    """
+    Encodes samples sorted by time_us (int64 µs) into a chunked object.
+    ``columns`` maps names to arrays with one row per sample; ``meta`` (e.g.
+    user_id, device_id) is stored in the header as is, ``sections`` after
+    the chunks.
+    """
+    n = len(time_us)
+    time_us = np.asarray(time_us, dtype="<i8")
+    cctx = codec.get_compressor(codec.NO_DICTIONARY, level)
+    index = np.zeros((n + chunk_samples - 1) // chunk_samples, dtype=INDEX_DTYPE)
+    frames = []
+    offset = 0
+    for i, first in enumerate(range(0, n, chunk_samples)):
+        last = min(first + chunk_samples, n)
+        times = time_us[first:last]
+        deltas = np.diff(times, prepend=times[0])
+        body = [deltas.tobytes()]
+        for values in columns.values():
+            chunk = values[first:last]
+            # (n, channels) -> channels x n, so each channel is contiguous
+            body.append(np.ascontiguousarray(chunk.T if chunk.ndim > 1 else chunk).tobytes())
+        frame = cctx.compress(b"".join(body))
+        index[i] = (first, last - first, times[0], times[-1], offset, len(frame))
+        frames.append(frame)
+        offset += len(frame)
+    section_ranges = {}
+    for name, blob in (sections or {}).items():
+        section_ranges[name] = [offset, len(blob)]
+        frames.append(blob)
+        offset += len(blob)
+
+    header = dict(meta)
+    header.update(
+        {
+            "columns": [
+                {"name": name, "dtype": values.dtype.str, "shape": list(values.shape[1:])}
+                for name, values in columns.items()
+            ],
+            "num_samples": n,
+            "num_chunks": len(index),
+            "chunk_samples": chunk_samples,
+            "start_us": int(time_us[0]) if n else 0,
+            "end_us": int(time_us[-1]) if n else 0,
+        }
+    )
+    if section_ranges:
+        header["sections"] = section_ranges
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    preamble = _PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes))
+    return b"".join([preamble, header_bytes, index.tobytes(), *frames])
+
+
+def read_header(read_at: Callable[[int, int], bytes]) -> ChunkHeader:
+    """
+    Reads the header and chunk index through ``read_at(offset, length)``,
+    e.g. a ranged GET; usually a single call of HEADER_PROBE_SIZE bytes.
+    """
+    head = read_at(0, HEADER_PROBE_SIZE)
+    if len(head) < _PREAMBLE.size:
+        raise ValueError("not a chunked object: too short")
+    magic, version, header_len = _PREAMBLE.unpack_from(head)
+    if magic != MAGIC:
+        raise ValueError("not a chunked object: bad magic")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unsupported chunked object version {version}")
+    meta_end = _PREAMBLE.size + header_len
+    if len(head) < meta_end:
+        head += read_at(len(head), meta_end - len(head))
+    meta = json.loads(head[_PREAMBLE.size : meta_end])
+    data_offset = meta_end + meta["num_chunks"] * INDEX_DTYPE.itemsize
+    if len(head) < data_offset:
+        head += read_at(len(head), data_offset - len(head))
+    index = np.frombuffer(head, dtype=INDEX_DTYPE, count=meta["num_chunks"], offset=meta_end)
+    return ChunkHeader(meta, index, data_offset)
+
+
+def decode(
+    data: bytes, columns: list[str] | None = None
+) -> tuple[ChunkHeader, dict[str, np.ndarray]]:
+    """Decodes a whole chunked object held in memory."""
+    header = read_header(lambda offset, length: data[offset : offset + length])
+    offset, length = header.byte_range(0, len(header.index))
+    return header, header.decode_chunks(
+        data[offset : offset + length], 0, len(header.index), columns
+    )
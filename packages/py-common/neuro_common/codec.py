@@ -0,0 +1,172 @@
+"""
+Shared zstd codec for sensor packets.
+
+Compressor and decompressor contexts are expensive to create relative to a
+small packet, so they are kept per thread and per dictionary and reused for
+every message. Dictionaries are identified by their zstd dictionary ID, which
+zstd also writes into each frame header; a reader therefore never needs to be
+told which dictionary an object was compressed with.
+"""
+
+import threading
+from collections.abc import Callable, Iterator
+
+import zstandard
+
+# Objects stored without a dictionary report dictionary ID 0 in the frame header.
+NO_DICTIONARY = 0
+DEFAULT_LEVEL = 3
+
+_local = threading.local()
+_dictionaries: dict[int, zstandard.ZstdCompressionDict] = {}
+_dictionaries_lock = threading.Lock()
+_dictionary_loader: Callable[[int], bytes] | None = None
+
+
+def set_dictionary_loader(loader: Callable[[int], bytes] | None):
+    """Sets a callback that fetches raw dictionary bytes for an unknown dictionary ID."""
+    global _dictionary_loader
+    _dictionary_loader = loader
+
+
+def register_dictionary(dict_data: bytes | zstandard.ZstdCompressionDict) -> int:
+    """Registers a dictionary and returns its dictionary ID."""
+    if not isinstance(dict_data, zstandard.ZstdCompressionDict):
+        dict_data = zstandard.ZstdCompressionDict(dict_data)
+    dict_id = dict_data.dict_id()
+    with _dictionaries_lock:
+        _dictionaries[dict_id] = dict_data
+    return dict_id
+
+
+def get_dictionary(dict_id: int) -> zstandard.ZstdCompressionDict | None:
+    if dict_id == NO_DICTIONARY:
+        return None
+    dict_data = _dictionaries.get(dict_id)
+    if dict_data is None:
+        if _dictionary_loader is None:
+            raise KeyError(f"zstd dictionary {dict_id} is not registered")
+        loaded_id = register_dictionary(_dictionary_loader(dict_id))
+        if loaded_id != dict_id:
+            raise KeyError(f"zstd dictionary {dict_id} was loaded as dictionary {loaded_id}")
+        dict_data = _dictionaries[dict_id]
+    return dict_data
+
+
+def train_dictionary(
+    samples: list[bytes], dict_size: int = 16 * 1024
+) -> zstandard.ZstdCompressionDict:
+    """Trains a dictionary from decompressed sample packets."""
+    return zstandard.train_dictionary(dict_size, samples)
+
+
+def _contexts(kind: str) -> dict:
+    contexts = getattr(_local, kind, None)
+    if contexts is None:
+        contexts = {}
+        setattr(_local, kind, contexts)
+    return contexts
+
+
+def get_compressor(
+    dict_id: int = NO_DICTIONARY, level: int = DEFAULT_LEVEL
+) -> zstandard.ZstdCompressor:
+    """Returns this thread's compressor for the given dictionary and level."""
+    contexts = _contexts("compressors")
+    key = (dict_id, level)
+    cctx = contexts.get(key)
+    if cctx is None:
+        cctx = zstandard.ZstdCompressor(level=level, dict_data=get_dictionary(dict_id))
+        contexts[key] = cctx
+    return cctx
+
+
+def get_decompressor(dict_id: int = NO_DICTIONARY) -> zstandard.ZstdDecompressor:
+    """Returns this thread's decompressor for the given dictionary."""
+    contexts = _contexts("decompressors")
+    dctx = contexts.get(dict_id)
+    if dctx is None:
+        dctx = zstandard.ZstdDecompressor(dict_data=get_dictionary(dict_id))
+        contexts[dict_id] = dctx
+    return dctx
+
+
+def frame_dict_id(data: bytes) -> int:
+    """Returns the dictionary ID recorded in the header of the first zstd frame."""
+    return zstandard.get_frame_parameters(data).dict_id
+
+
+def compress(data: bytes, dict_id: int = NO_DICTIONARY, level: int = DEFAULT_LEVEL) -> bytes:
+    return get_compressor(dict_id, level).compress(data)
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    Decompresses every frame in ``data``. The dictionary is selected from the
+    first frame header; all frames in one object share a dictionary. Raises
+    ZstdError if the data is corrupt or its last frame is truncated.
+    """
+    params = zstandard.get_frame_parameters(data)
+    dctx = get_decompressor(params.dict_id)
+    if params.content_size != zstandard.CONTENTSIZE_UNKNOWN:
+        # Fast path: a single frame with a known size (one packet per object)
+        try:
+            return dctx.decompress(data, allow_extra_data=False)
+        except zstandard.ZstdError:
+            pass
+    # Frame by frame: a stream reader would return a truncated frame's output without an error
+    parts = []
+    while data:
+        dobj = dctx.decompressobj()
+        parts.append(dobj.decompress(data))
+        if not dobj.eof:
+            raise zstandard.ZstdError("truncated zstd frame")
+        data = dobj.unused_data
+    return b"".join(parts)
+
+
+# Largest possible zstd frame header; enough to read the dictionary ID
+_MAX_FRAME_HEADER_SIZE = 18
+STREAM_READ_SIZE = 128 * 1024
+
+
+class _PrefixedReader:
+    """File-like that replays bytes already read from ``source`` before reading on."""
+
+    def __init__(self, prefix: bytes, source):
+        self._prefix = prefix
+        self._source = source
+
+    def read(self, size: int = -1) -> bytes:
+        # Short reads are fine for zstd's stream_reader, so the prefix is returned on its own
+        if self._prefix:
+            if 0 <= size < len(self._prefix):
+                head, self._prefix = self._prefix[:size], self._prefix[size:]
+            else:
+                head, self._prefix = self._prefix, b""
+            return head
+        return self._source.read(size)
+
+
+def stream_decompress(source, read_size: int = STREAM_READ_SIZE) -> Iterator[bytes]:
+    """
+    Decompresses a stream of concatenated zstd frames from a file-like
+    ``source`` (e.g. a MinIO response), yielding decompressed chunks of at most
+    ``read_size`` bytes. Memory use is bounded by ``read_size`` and the zstd
+    window, not by the object size. As with decompress(), the dictionary is
+    selected from the first frame header.
+    """
+    head = b""
+    while len(head) < _MAX_FRAME_HEADER_SIZE:
+        more = source.read(_MAX_FRAME_HEADER_SIZE - len(head))
+        if not more:
+            break
+        head += more
+    if not head:
+        return
+    dctx = get_decompressor(frame_dict_id(head))
+    with dctx.stream_reader(
+        _PrefixedReader(head, source), read_size=read_size, read_across_frames=True, closefd=False
+    ) as reader:
+        while chunk := reader.read(read_size):
+            yield chunk
@@ -0,0 +1,84 @@
+"""
+Pooled PostgreSQL connections for the Python services.
+
+Each process creates its pool once and borrows a connection per unit of work
+with ``pool.connection()`` (committed on success, rolled back on error, then
+returned), instead of connecting per request or holding one connection for
+the life of the process. Every borrowed connection is checked first, so one
+broken by a database restart or a network drop is discarded and replaced
+transparently; the pool keeps reconnecting in the background meanwhile.
+
+Requires the ``db`` extra (psycopg, psycopg-pool).
+"""
+
+import threading
+
+from psycopg_pool import ConnectionPool
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def create_pool(
+    conninfo: str,
+    name: str,
+    min_size: int = 1,
+    max_size: int = 10,
+    timeout: float = 30.0,
+    row_factory=None,
+) -> ConnectionPool:
+    """
+    Opens a pool without waiting for its first connections, so a service
+    starts even while the database is still coming up. ``timeout`` bounds how
+    long a borrower waits for a free connection.
+    """
+    pool = ConnectionPool(
+        conninfo,
+        name=name,
+        min_size=min_size,
+        max_size=max_size,
+        kwargs={"row_factory": row_factory} if row_factory is not None else None,
+        check=ConnectionPool.check_connection,
+        timeout=timeout,
+        open=False,
+    )
+    pool.open(wait=False)
+    with _pools_lock:
+        _pools[name] = pool
+    return pool
+
+
+def pool_metrics(pool: ConnectionPool) -> dict:
+    """Current size and utilization of a pool, plus its counters since it was opened."""
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    in_use = size - stats.get("pool_available", 0)
+    return {
+        "min_size": pool.min_size,
+        "max_size": pool.max_size,
+        "size": size,
+        "in_use": in_use,
+        "waiting": stats.get("requests_waiting", 0),
+        "utilization": round(in_use / pool.max_size, 3),
+        "requests": stats.get("requests_num", 0),
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_wait_ms": stats.get("requests_wait_ms", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+        "connections_errors": stats.get("connections_errors", 0),
+    }
+
+
+def metrics() -> dict[str, dict]:
+    """pool_metrics() of every pool this process created, by pool name."""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool_metrics(pool) for name, pool in pools.items()}
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
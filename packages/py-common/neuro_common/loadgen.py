@@ -0,0 +1,552 @@
+"""
+Synthetic devices and in-process stand-ins for the servers around the
+services, so load tests can drive the services' real code paths without
+ESP32 hardware, RabbitMQ, MinIO or PostgreSQL:
+
+  SyntheticDevice     packets as the firmware sends them: a PacketHeader and
+                      RECORD_DTYPE records, zstd-compressed
+  LocalBroker         a fanout exchange behind pika's BlockingConnection
+                      interface; pass broker.connect where a service calls
+                      pika.BlockingConnection. Measures the time from
+                      publishing each message to its ack
+  MemoryObjectStore   the part of the minio client the services use, in memory
+  MemoryDbPool        a psycopg_pool stand-in whose statements are counted,
+                      not run
+
+The stores sleep for a simulated round trip per call, so a benchmark measures
+how many round trips a code path pays rather than the speed of a server.
+Nothing in the services imports this module.
+"""
+
+import heapq
+import io
+import itertools
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+
+from . import codec, packet
+
+# --- Devices ---
+
+
+def device_ids(count: int) -> list[str]:
+    """MAC-style IDs like the firmware's (17 characters and the NUL fill the header)."""
+    return [
+        f"02:00:00:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}" for i in range(count)
+    ]
+
+
+class SyntheticDevice:
+    """
+    A device streaming EEG at sample_rate in packets of samples_per_packet
+    samples. Packet i is generated from (seed, i) alone, so any packet can be
+    built on demand and in any order. The EEG is a 10 Hz alpha rhythm in
+    noise around the ADC midpoint, and esp_micros counts from start_micros
+    and wraps at 2**32 like the firmware's micros().
+    """
+
+    def __init__(
+        self,
+        device_id: str,
+        sample_rate: int = 256,
+        samples_per_packet: int = 32,
+        seed: int = 0,
+        start_micros: int = 0,
+    ):
+        self.device_id = device_id
+        self.sample_rate = sample_rate
+        self.samples_per_packet = samples_per_packet
+        self.seed = seed
+        self.start_micros = start_micros
+        self._header = device_id.encode("ascii").ljust(packet.HEADER_SIZE, b"\x00")[
+            : packet.HEADER_SIZE
+        ]
+        self._phases = np.random.default_rng(seed).uniform(0, 2 * np.pi, packet.NUM_EEG_CHANNELS)
+
+    @property
+    def packet_interval(self) -> float:
+        """Seconds between two packets."""
+        return self.samples_per_packet / self.sample_rate
+
+    def records(self, index: int) -> np.ndarray:
+        rng = np.random.default_rng((self.seed, index))
+        sample_index = index * self.samples_per_packet + np.arange(
+            self.samples_per_packet, dtype=np.int64
+        )
+        t = sample_index / self.sample_rate
+        records = np.zeros(self.samples_per_packet, dtype=packet.RECORD_DTYPE)
+        eeg = (
+            2048
+            + 120 * np.sin(2 * np.pi * 10 * t[:, None] + self._phases)
+            + rng.normal(0, 40, (len(t), 8))
+        )
+        records["eeg"] = np.clip(eeg, 0, 4095)
+        records["accel"] = rng.normal((0.0, 0.0, 1.0), 0.01, (len(t), 3))
+        records["gyro"] = rng.normal(0.0, 0.5, (len(t), 3))
+        records["imp"] = rng.integers(0, 100, (len(t), 8))
+        records["esp_micros"] = (
+            self.start_micros + sample_index * 1_000_000 // self.sample_rate
+        ) % (1 << 32)
+        return records
+
+    def packet(self, index: int) -> bytes:
+        """Packet index, compressed as the device sends it."""
+        return codec.compress(self._header + self.records(index).tobytes())
+
+
+def make_devices(
+    count: int, sample_rate: int = 256, samples_per_packet: int = 32
+) -> list[SyntheticDevice]:
+    """count devices with distinct IDs, signals and clocks."""
+    return [
+        SyntheticDevice(
+            device_id, sample_rate, samples_per_packet, seed=i, start_micros=i * 7_919_000
+        )
+        for i, device_id in enumerate(device_ids(count))
+    ]
+
+
+# --- RabbitMQ ---
+
+
+class _Connection:
+    """pika.BlockingConnection: timers from call_later run in the consuming thread, as with pika."""
+
+    def __init__(self, broker: "LocalBroker"):
+        self._broker = broker
+        self._timers: list[tuple[float, int, object]] = []
+        self._timer_ids = itertools.count()
+        self.is_open = True
+
+    def channel(self) -> "_Channel":
+        return _Channel(self._broker, self)
+
+    def call_later(self, delay: float, callback):
+        with self._broker._cond:
+            heapq.heappush(
+                self._timers, (time.monotonic() + delay, next(self._timer_ids), callback)
+            )
+            self._broker._cond.notify_all()
+
+    def _due_timers(self, now: float) -> list:
+        due = []
+        while self._timers and self._timers[0][0] <= now:
+            due.append(heapq.heappop(self._timers)[2])
+        return due
+
+    def _next_timer(self) -> float | None:
+        return self._timers[0][0] if self._timers else None
+
+    def process_data_events(self, time_limit: float = 0):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class _Channel:
+    def __init__(self, broker: "LocalBroker", connection: _Connection):
+        self._broker = broker
+        self._connection = connection
+        self._prefetch = 0
+        self._consumers: list[tuple[str, object]] = []
+        # Delivery tag -> (queue, perf_counter() at publish, body, headers)
+        self._unacked: dict[int, tuple] = {}
+        self._tags = itertools.count(1)
+        self._consuming = False
+
+    def basic_qos(self, prefetch_count: int = 0, **kwargs):
+        self._prefetch = prefetch_count
+
+    def exchange_declare(self, exchange: str, **kwargs):
+        pass
+
+    def queue_declare(self, queue: str = "", **kwargs):
+        return SimpleNamespace(method=SimpleNamespace(queue=self._broker._declare(queue)))
+
+    def queue_bind(self, queue: str, exchange: str, **kwargs):
+        self._broker._bind(queue)
+
+    def basic_consume(self, queue: str, on_message_callback, auto_ack: bool = False, **kwargs):
+        self._consumers.append((queue, on_message_callback))
+
+    def start_consuming(self):
+        """Delivers messages and runs timers until stop_consuming() or broker.close()."""
+        broker = self._broker
+        self._consuming = True
+        while self._consuming:
+            with broker._cond:
+                while True:
+                    if broker._closed or not self._consuming:
+                        return
+                    now = time.monotonic()
+                    timers = self._connection._due_timers(now)
+                    delivery = None if timers else self._next_delivery()
+                    if timers or delivery:
+                        break
+                    next_timer = self._connection._next_timer()
+                    broker._cond.wait(None if next_timer is None else next_timer - now)
+            for timer in timers:
+                timer()
+            if delivery:
+                callback, tag, body, headers = delivery
+                callback(
+                    self, SimpleNamespace(delivery_tag=tag), SimpleNamespace(headers=headers), body
+                )
+
+    def _next_delivery(self):
+        if self._prefetch and len(self._unacked) >= self._prefetch:
+            return None
+        for queue, callback in self._consumers:
+            messages = self._broker._queues[queue]
+            if messages:
+                published_at, body, headers = messages.popleft()
+                tag = next(self._tags)
+                self._unacked[tag] = (queue, published_at, body, headers)
+                return callback, tag, body, headers
+        return None
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def _settle(self, delivery_tag: int, multiple: bool) -> list[tuple]:
+        tags = [t for t in self._unacked if t <= delivery_tag] if multiple else [delivery_tag]
+        return [self._unacked.pop(t) for t in tags if t in self._unacked]
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        acked_at = time.perf_counter()
+        with self._broker._cond:
+            settled = self._settle(delivery_tag, multiple)
+            self._broker.latencies.extend(
+                acked_at - published_at for _, published_at, _, _ in settled
+            )
+            self._broker.acked += len(settled)
+            self._broker._cond.notify_all()
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        with self._broker._cond:
+            settled = self._settle(delivery_tag, multiple)
+            self._broker.nacked += len(settled)
+            if requeue:
+                for queue, published_at, body, headers in reversed(settled):
+                    self._broker._queues[queue].appendleft((published_at, body, headers))
+            self._broker._cond.notify_all()
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def basic_publish(
+        self, exchange: str, routing_key: str, body: bytes, properties=None, **kwargs
+    ):
+        self._broker.publish(body, getattr(properties, "headers", None))
+
+
+class LocalBroker:
+    """
+    One fanout exchange: every published message goes to every bound queue,
+    as with the collector's raw_data_exchange. latencies collects the
+    seconds from publish to ack of every acked message.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queues: dict[str, deque] = {}
+        self._bound: list[str] = []
+        self._names = itertools.count(1)
+        self._closed = False
+        self.published = 0
+        self.acked = 0
+        self.nacked = 0
+        self.latencies: list[float] = []
+
+    def connect(self, parameters=None) -> _Connection:
+        """Use in place of pika.BlockingConnection."""
+        return _Connection(self)
+
+    def _declare(self, name: str) -> str:
+        with self._cond:
+            name = name or f"amq.gen-{next(self._names)}"
+            self._queues.setdefault(name, deque())
+            return name
+
+    def _bind(self, name: str):
+        with self._cond:
+            if name not in self._bound:
+                self._bound.append(name)
+            self._cond.notify_all()
+
+    def wait_bound(self, count: int = 1, timeout: float = 30.0):
+        """
+        Waits until count queues are bound; messages published before that are lost,
+        as with a fanout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._bound) >= count, timeout):
+                raise TimeoutError(f"{len(self._bound)} of {count} queues bound after {timeout}s")
+
+    def publish(self, body: bytes, headers: dict | None = None):
+        """Publishes like the collector, which stamps published_at_ms."""
+        headers = {**(headers or {}), "published_at_ms": int(time.time() * 1000)}
+        published_at = time.perf_counter()
+        with self._cond:
+            for name in self._bound:
+                self._queues[name].append((published_at, body, headers))
+            self.published += 1
+            self._cond.notify_all()
+
+    def wait_acked(self, count: int, timeout: float) -> bool:
+        """Waits until count messages are acked in total; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.acked >= count, timeout)
+
+    def take_latencies(self) -> list[float]:
+        with self._cond:
+            latencies, self.latencies = self.latencies, []
+            return latencies
+
+    def close(self):
+        """Stops every start_consuming() loop."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def publish_backlog(broker: LocalBroker, bodies: list[tuple[bytes, dict]]):
+    """
+    Publishes prepared (body, headers) at once, like a queue that built up while
+    a consumer was down.
+    """
+    for body, headers in bodies:
+        broker.publish(body, headers)
+
+
+def publish_paced(
+    broker: LocalBroker,
+    streams: list[list[tuple[bytes, dict]]],
+    interval: float,
+    stop: threading.Event | None = None,
+) -> float:
+    """
+    Publishes stream i's packets every interval seconds, streams staggered
+    evenly within the interval like independently started devices, until
+    the streams or stop end it. Returns how far the last packet was published
+    behind its schedule, in seconds.
+    """
+    schedule = sorted(
+        (k * interval + i * interval / len(streams), i, k)
+        for i, stream in enumerate(streams)
+        for k in range(len(stream))
+    )
+    started = time.perf_counter()
+    behind = 0.0
+    for offset, i, k in schedule:
+        if stop is not None and stop.is_set():
+            break
+        delay = started + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            behind = -delay
+        broker.publish(*streams[i][k])
+    return behind
+
+
+# --- MinIO ---
+
+
+class _Response(io.BytesIO):
+    def stream(self, amt: int = 64 * 1024):
+        while chunk := self.read(amt):
+            yield chunk
+
+    def release_conn(self):
+        pass
+
+
+class MemoryObjectStore:
+    """The minio client calls the services make, on a dict, each sleeping rtt seconds."""
+
+    def __init__(self, rtt: float = 0.0):
+        self.rtt = rtt
+        self._objects: dict[tuple[str, str], tuple[bytes, dict]] = {}
+        self._buckets: set[str] = set()
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def _round_trip(self):
+        self.requests += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def bucket_exists(self, bucket: str) -> bool:
+        return bucket in self._buckets
+
+    def make_bucket(self, bucket: str):
+        self._buckets.add(bucket)
+
+    def put_object(
+        self, bucket: str, name: str, data, length: int, content_type=None, metadata=None, **kwargs
+    ):
+        self._round_trip()
+        with self._lock:
+            self._objects[(bucket, name)] = (data.read(length), dict(metadata or {}))
+        return SimpleNamespace(bucket_name=bucket, object_name=name, etag="local")
+
+    def get_object(
+        self, bucket: str, name: str, offset: int = 0, length: int = 0, **kwargs
+    ) -> _Response:
+        self._round_trip()
+        try:
+            data, _ = self._objects[(bucket, name)]
+        except KeyError:
+            raise KeyError(f"NoSuchKey: {bucket}/{name}") from None
+        return _Response(data[offset : offset + length] if length else data[offset:])
+
+    def stat_object(self, bucket: str, name: str, **kwargs):
+        self._round_trip()
+        data, metadata = self._objects[(bucket, name)]
+        return SimpleNamespace(
+            bucket_name=bucket, object_name=name, size=len(data), metadata=metadata
+        )
+
+    def remove_objects(self, bucket: str, delete_object_list, **kwargs):
+        self._round_trip()
+        with self._lock:
+            for obj in delete_object_list:
+                self._objects.pop((bucket, getattr(obj, "_name", obj)), None)
+        return iter(())
+
+    @property
+    def stored_bytes(self) -> int:
+        return sum(len(data) for data, _ in self._objects.values())
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+
+# --- PostgreSQL ---
+
+
+class _Copy:
+    def __init__(self, connection: "_DbConnection"):
+        self._connection = connection
+
+    def write_row(self, row):
+        self._connection.rows += 1
+
+
+class _Cursor:
+    def __init__(self, connection: "_DbConnection"):
+        self._connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self._connection._round_trip()
+        self._connection.rows += 1
+
+    def executemany(self, query, params_seq):
+        self._connection._round_trip()
+        self._connection.rows += len(params_seq)
+
+    @contextmanager
+    def copy(self, query):
+        yield _Copy(self._connection)
+        self._connection._round_trip()
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+
+class _DbConnection:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.rows = 0
+        self.round_trips = 0
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def cursor(self, *args, **kwargs) -> _Cursor:
+        return _Cursor(self)
+
+    def commit(self):
+        self._round_trip()
+
+    def rollback(self):
+        pass
+
+
+class MemoryDbPool:
+    """
+    Stands in for the psycopg_pool pool db.create_pool() returns. Every
+    statement and commit sleeps rtt seconds; rows written are only counted.
+    Queries return nothing.
+    """
+
+    def __init__(self, rtt: float = 0.0, size: int = 4):
+        self._idle = [_DbConnection(rtt) for _ in range(size)]
+        self._all = list(self._idle)
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def connection(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._idle)
+            conn = self._idle.pop()
+        try:
+            yield conn
+        finally:
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def wait(self, timeout: float = 30.0):
+        pass
+
+    def close(self):
+        pass
+
+    @property
+    def rows(self) -> int:
+        return sum(conn.rows for conn in self._all)
+
+
+# --- Reporting ---
+
+
+def latency_summary(seconds: list[float]) -> dict:
+    """p50/p95/p99/max of latencies in milliseconds (None without samples)."""
+    if not seconds:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 95, 99])
+    return {
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": max(seconds) * 1000,
+    }
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    """
+    Peak RSS of this process, or of its largest finished child process (e.g.
+    pool workers after shutdown).
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss / 1024
@@ -0,0 +1,99 @@
+"""
+Rate-limited structured logging for the services' hot paths.
+
+A logger writes one JSON object per line to stdout, for example
+
+    {"ts": "2024-01-01T00:00:00.000+00:00", "level": "warning", "logger": "processor",
+     "event": "malformed packet", "user_id": "u1", "error": "...", "suppressed": 41}
+
+Each event (level and event text) is written at most once per interval
+seconds; occurrences in between are only counted and reported with the
+next line as "suppressed". A message that arrives hundreds of times a
+second, or an error repeated for every message while a dependency is down,
+thus costs a dict lookup instead of a write to stdout. Keep the event text
+constant and put the details in fields.
+
+configure() sets the level and the interval for every logger of the
+process (services pass their LOG_LEVEL and LOG_RATE_LIMIT_SEC).
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+from datetime import UTC, datetime
+
+_root = logging.getLogger("neuro")
+_root.propagate = False
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _root.addHandler(_handler)
+_root.setLevel(logging.INFO)
+_interval = 10.0
+
+
+def configure(level: str | None = None, rate_limit_sec: float | None = None):
+    global _interval
+    if level is not None:
+        _root.setLevel(level.upper())
+    if rate_limit_sec is not None:
+        _interval = rate_limit_sec
+
+
+class StructuredLogger:
+    def __init__(self, name: str, interval: float | None = None):
+        self.name = name
+        self._logger = _root.getChild(name)
+        # None: the process-wide interval from configure()
+        self._interval = interval
+        # (level, event) -> [next time it may be written, occurrences suppressed since]
+        self._limits: dict[tuple[int, str], list] = {}
+        self._lock = threading.Lock()
+
+    def _log(self, level: int, event: str, fields: dict):
+        if not self._logger.isEnabledFor(level):
+            return
+        interval = _interval if self._interval is None else self._interval
+        suppressed = 0
+        if interval > 0:
+            now = time.monotonic()
+            key = (level, event)
+            with self._lock:
+                limit = self._limits.get(key)
+                if limit is not None and now < limit[0]:
+                    limit[1] += 1
+                    return
+                if limit is None:
+                    self._limits[key] = [now + interval, 0]
+                else:
+                    suppressed = limit[1]
+                    limit[0], limit[1] = now + interval, 0
+        record = {
+            "ts": datetime.now(UTC).isoformat(timespec="milliseconds"),
+            "level": logging.getLevelName(level).lower(),
+            "logger": self.name,
+            "event": event,
+            **fields,
+        }
+        if suppressed:
+            record["suppressed"] = suppressed
+        self._logger.log(level, json.dumps(record, default=str, ensure_ascii=False))
+
+    def debug(self, event: str, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields):
+        self._log(logging.ERROR, event, fields)
+
+
+def get_logger(name: str, interval: float | None = None) -> StructuredLogger:
+    """A logger for one module or service; interval overrides the process-wide rate limit for it."""
+    return StructuredLogger(name, interval)
@@ -0,0 +1,238 @@
+"""
+Prometheus metrics shared by the Python services, on top of prometheus_client.
+
+Metrics are declared once per module with counter(), gauge() or histogram()
+(declaring the same name again returns the existing metric) and updated
+from any thread. Bind labels once with labels() outside hot loops:
+
+    _UPLOAD = metrics.STAGE_SECONDS.labels("minio_upload")
+    with _UPLOAD.time():
+        ...
+
+render() returns every metric for a /metrics endpoint; services without an
+HTTP server call start_http_server() for one on a side port. Values that
+already live elsewhere (pool usage, scheduler counters) are exported by
+register_collector() callbacks evaluated at scrape time.
+
+prometheus_client runs in multiprocess mode, so what worker processes of a
+ProcessPoolExecutor record is exported by the parent without any plumbing.
+The first process to import this module creates a PROMETHEUS_MULTIPROC_DIR
+(removed at exit) that its workers inherit through the environment. If the
+variable is set beforehand, that directory is used and must be emptied
+before the service starts.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from collections.abc import Callable, Iterable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# prometheus_client picks multiprocess mode when it is imported
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="neuro-metrics-")
+    atexit.register(shutil.rmtree, os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+
+from . import log  # noqa: E402
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+# Seconds, from sub-millisecond decoding up to minute-long exports
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+logger = log.get_logger("metrics")
+
+_declared: dict[str, Counter | Gauge | Histogram] = {}
+_declared_lock = threading.Lock()
+_collectors: list[Callable[[], Iterable[tuple[str, dict, float]]]] = []
+
+
+def _declare(cls, name: str, help: str, labelnames: Iterable[str], **kwargs):
+    with _declared_lock:
+        metric = _declared.get(name)
+        if metric is None:
+            metric = _declared[name] = cls(name, help, tuple(labelnames), **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already declared as a {metric._type}")
+    return metric
+
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    return _declare(Counter, name, help, labelnames)
+
+
+def gauge(
+    name: str, help: str, labelnames: Iterable[str] = (), multiprocess_mode: str = "livesum"
+) -> Gauge:
+    """
+    multiprocess_mode says how the values of several processes combine (see
+    prometheus_client).
+    """
+    return _declare(Gauge, name, help, labelnames, multiprocess_mode=multiprocess_mode)
+
+
+def histogram(
+    name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return _declare(Histogram, name, help, labelnames, buckets=tuple(buckets))
+
+
+# --- Metrics shared by every service, so dashboards can compare them ---
+
+STAGE_SECONDS = histogram(
+    "neuro_stage_duration_seconds",
+    "Time spent per processing stage (decompress, parse, minio_upload, db_insert, psd, bids_write, "
+    "...)",
+    ("stage",),
+)
+BYTES_TOTAL = counter("neuro_bytes_processed_total", "Bytes handled per stage", ("stage",))
+SAMPLES_TOTAL = counter(
+    "neuro_samples_processed_total",
+    "EEG samples handled per stage; rate() gives samples per second",
+    ("stage",),
+)
+QUEUE_LAG_SECONDS = histogram(
+    "neuro_queue_lag_seconds", "Time from enqueueing a message or job to its processing", ("queue",)
+)
+MESSAGES_TOTAL = counter("neuro_messages_total", "Consumed messages by outcome", ("outcome",))
+
+# --- Collectors ---
+
+
+def register_collector(collect: Callable[[], Iterable[tuple[str, dict, float]]]):
+    """
+    collect() runs at every scrape and returns (name, labels, value) of gauges
+    computed on demand.
+    """
+    _collectors.append(collect)
+
+
+def dict_collector(prefix: str, fetch: Callable[[], dict], label: str | None = None) -> Callable:
+    """
+    A collector exporting the numbers of fetch() as prefix_<key> gauges. With
+    label, fetch() returns {label value: {key: number}}, as db.metrics() does.
+    """
+
+    def collect():
+        values = fetch()
+        groups = values.items() if label else [(None, values)]
+        for label_value, group in groups:
+            labels = {label: label_value} if label else {}
+            for key, value in group.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield f"{prefix}_{key}", labels, value
+
+    return collect
+
+
+class _CallbackCollector:
+    """Turns the registered callbacks into gauge families at scrape time."""
+
+    def collect(self):
+        families: dict[str, GaugeMetricFamily] = {}
+        for collect in list(_collectors):
+            try:
+                samples = list(collect())
+            except Exception as e:
+                logger.warning("metrics collector failed", error=str(e))
+                continue
+            for name, labels, value in samples:
+                family = families.get(name)
+                if family is None:
+                    family = families[name] = GaugeMetricFamily(name, "", labels=list(labels))
+                family.add_metric([str(v) for v in labels.values()], value)
+        return list(families.values())
+
+
+# Every process's files in PROMETHEUS_MULTIPROC_DIR, plus this process's callbacks
+_registry = CollectorRegistry()
+multiprocess.MultiProcessCollector(_registry)
+_registry.register(_CallbackCollector())
+
+
+def render() -> bytes:
+    """Every metric of this process and its worker processes in the Prometheus text format."""
+    return generate_latest(_registry)
+
+
+# --- Side-port HTTP server for services without one ---
+
+
+class _Handler(BaseHTTPRequestHandler):
+    profiling = False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            self._reply(200, CONTENT_TYPE, render())
+        elif url.path == "/debug/profile" and self.profiling:
+            from . import profiler
+
+            query = parse_qs(url.query)
+            try:
+                seconds = float(query.get("seconds", ["10"])[0])
+                interval = float(query.get("interval_ms", ["5"])[0]) / 1000
+                body = profiler.profile(seconds, interval)
+            except (ValueError, RuntimeError) as e:
+                self._reply(400, "text/plain; charset=utf-8", f"{e}\n".encode())
+                return
+            self._reply(200, "text/plain; charset=utf-8", body.encode())
+        else:
+            self._reply(404, "text/plain; charset=utf-8", b"not found\n")
+
+    def _reply(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the service's own output
+        pass
+
+
+def start_http_server(
+    port: int, host: str = "0.0.0.0", profiling: bool = False
+) -> ThreadingHTTPServer:
+    """
+    Serves /metrics (and /debug/profile when profiling is allowed) from a
+    daemon thread.
+    """
+    handler = type("Handler", (_Handler,), {"profiling": profiling})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
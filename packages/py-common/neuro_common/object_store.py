@@ -0,0 +1,87 @@
+"""
+Long-lived MinIO clients with tuned HTTP connection pools.
+
+The MinIO SDK's default urllib3 pool keeps at most 10 connections and waits up
+to five minutes to connect or read. A service that talks to MinIO from more
+threads than that opens and throws away a connection on every request beyond
+the tenth. Clients created here share one PoolManager per process, sized to
+the service's thread count, with short connect timeouts and retries with
+backoff; a connection dropped by a MinIO restart is retried on a fresh one.
+
+Requires the ``storage`` extra (minio).
+"""
+
+import os
+import threading
+
+import certifi
+import urllib3
+from minio import Minio
+
+_http_pools: dict[str, urllib3.PoolManager] = {}
+_http_pools_lock = threading.Lock()
+
+
+def create_client(
+    endpoint: str,
+    access_key: str,
+    secret_key: str,
+    secure: bool,
+    name: str,
+    max_connections: int = 10,
+    connect_timeout: float = 5.0,
+    read_timeout: float = 60.0,
+    retries: int = 5,
+    region: str | None = None,
+) -> Minio:
+    """Creates a client whose pool keeps up to max_connections connections alive per host."""
+    http_client = urllib3.PoolManager(
+        maxsize=max_connections,
+        timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(
+            total=retries, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]
+        ),
+    )
+    with _http_pools_lock:
+        _http_pools[name] = http_client
+    # With a region the client never has to look up a bucket's location first
+    return Minio(
+        endpoint,
+        access_key=access_key,
+        secret_key=secret_key,
+        secure=secure,
+        region=region,
+        http_client=http_client,
+    )
+
+
+def metrics() -> dict[str, dict]:
+    """
+    Connection pool usage of every client this process created, by name.
+    connections_opened growing much faster than requests / in_use means the
+    pool is too small for the number of threads using it.
+    """
+    with _http_pools_lock:
+        http_pools = dict(_http_pools)
+    result = {}
+    for name, http_client in http_pools.items():
+        maxsize = http_client.connection_pool_kw["maxsize"]
+        in_use = opened = requests = 0
+        for key in list(http_client.pools.keys()):
+            host_pool = http_client.pools.get(key)
+            if host_pool is None:
+                continue
+            # Free slots hold idle connections or placeholders; the rest are checked out
+            in_use += maxsize - host_pool.pool.qsize()
+            opened += host_pool.num_connections
+            requests += host_pool.num_requests
+        result[name] = {
+            "max_connections": maxsize,
+            "hosts": len(http_client.pools),
+            "in_use": in_use,
+            "connections_opened": opened,
+            "requests": requests,
+        }
+    return result
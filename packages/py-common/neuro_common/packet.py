@@ -0,0 +1,215 @@
+"""
+Sensor packets as sent by the device firmware, decoded without copies.
+
+A packet (after zstd decompression) is a PacketHeader followed by SensorData
+records:
+
+    header    HEADER_SIZE bytes: the device ID as a NUL-terminated string
+    records   RECORD_DTYPE records back to back; a partial record at the
+              end (a truncated packet) is ignored
+
+Every decoder takes any buffer (bytes, bytearray, memoryview) and views the
+records in place with numpy, at the header's offset, instead of slicing the
+payload off first: decode() returns a structured view, fields of which
+(e.g. packet.eeg) are strided views that never materialize the other fields.
+decode_batch() gathers many packets into one preallocated record array,
+copying each packet's records exactly once, and StreamDecoder decodes a
+packet that arrives in pieces (e.g. from codec.stream_decompress) without
+joining the pieces.
+"""
+
+from collections.abc import Iterable
+
+import numpy as np
+
+# The firmware's PacketHeader struct
+HEADER_SIZE = 18
+NUM_EEG_CHANNELS = 8
+# The firmware's SensorData struct
+RECORD_DTYPE = np.dtype(
+    [
+        ("eeg", "<u2", (NUM_EEG_CHANNELS,)),
+        ("accel", "<f4", (3,)),
+        ("gyro", "<f4", (3,)),
+        ("trig", "u1"),
+        ("imp", "i1", (8,)),
+        ("esp_micros", "<u4"),
+    ]
+)
+RECORD_SIZE = RECORD_DTYPE.itemsize
+
+
+class PacketError(ValueError):
+    """The buffer is not a sensor packet (e.g. its header is truncated or malformed)."""
+
+
+# Validated headers by their bytes; a service only ever sees a few devices
+_device_ids: dict[bytes, str] = {}
+_MAX_CACHED_DEVICE_IDS = 4096
+
+
+def _nbytes(buf) -> int:
+    return buf.nbytes if type(buf) is memoryview else len(buf)
+
+
+def _byte_view(buf) -> memoryview:
+    """buf as a flat view of its bytes, whatever its item size or shape."""
+    try:
+        return memoryview(buf).cast("B")
+    except TypeError as e:
+        raise PacketError(f"unsupported buffer: {e}") from None
+
+
+def parse_device_id(buf) -> str:
+    """Validates the header at the start of buf and returns the device ID."""
+    header = buf[:HEADER_SIZE]
+    if type(header) is not bytes:
+        header = bytes(header)
+    device_id = _device_ids.get(header)
+    if device_id is not None:
+        return device_id
+    if len(header) < HEADER_SIZE:
+        raise PacketError(f"truncated header: {len(header)} of {HEADER_SIZE} bytes")
+    end = header.find(b"\x00")
+    if end < 0:
+        raise PacketError("device ID is not NUL-terminated")
+    if end == 0:
+        raise PacketError("empty device ID")
+    try:
+        device_id = header[:end].decode("ascii")
+    except UnicodeDecodeError:
+        raise PacketError("device ID is not ASCII") from None
+    if not device_id.isprintable():
+        raise PacketError("device ID is not printable")
+    if len(_device_ids) >= _MAX_CACHED_DEVICE_IDS:
+        _device_ids.clear()
+    _device_ids[header] = device_id
+    return device_id
+
+
+class Packet:
+    """A decoded packet: device ID and its records, a view of the packet's buffer."""
+
+    __slots__ = ("device_id", "records", "trailing")
+
+    def __init__(self, device_id: str, records: np.ndarray, trailing: int):
+        self.device_id = device_id
+        self.records = records
+        # Bytes of a partial record after the last complete one
+        self.trailing = trailing
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def eeg(self) -> np.ndarray:
+        """(n, NUM_EEG_CHANNELS) uint16, strided over the records."""
+        return self.records["eeg"]
+
+    @property
+    def esp_micros(self) -> np.ndarray:
+        return self.records["esp_micros"]
+
+
+def decode(buf) -> Packet:
+    """Decodes a whole packet in place; raises PacketError if the header is invalid."""
+    device_id = parse_device_id(buf)
+    count, trailing = divmod(_nbytes(buf) - HEADER_SIZE, RECORD_SIZE)
+    return Packet(
+        device_id, np.frombuffer(buf, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE), trailing
+    )
+
+
+class PacketBatch:
+    """
+    Many packets decoded into one contiguous record array; fields (e.g.
+    batch["eeg"]) are views of it. Packet i's samples are records
+    offsets[i]:offsets[i + 1].
+    """
+
+    __slots__ = ("device_ids", "offsets", "records")
+
+    def __init__(self, device_ids: list[str], offsets: np.ndarray, records: np.ndarray):
+        self.device_ids = device_ids
+        self.offsets = offsets
+        self.records = records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.records[name]
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """Every field as a view, by name."""
+        return {name: self.records[name] for name in RECORD_DTYPE.names}
+
+
+def decode_batch(buffers: Iterable, out: np.ndarray | None = None) -> PacketBatch:
+    """
+    Decodes packets into one preallocated record array (out, if given and
+    large enough), copying each packet's complete records once. Raises
+    PacketError for the first packet with an invalid header or a buffer that
+    is not contiguous.
+    """
+    # Record counts and copies both come from the same byte view of each buffer
+    views = [_byte_view(buf) for buf in buffers]
+    device_ids = [parse_device_id(view) for view in views]
+    offsets = np.zeros(len(views) + 1, dtype=np.int64)
+    # parse_device_id() has checked that every view holds a whole header
+    np.cumsum([(view.nbytes - HEADER_SIZE) // RECORD_SIZE for view in views], out=offsets[1:])
+    total = int(offsets[-1])
+    if out is None or len(out) < total:
+        out = np.empty(total, dtype=RECORD_DTYPE)
+    records = out[:total]
+    dest = memoryview(records).cast("B")
+    starts = (offsets[:-1] * RECORD_SIZE).tolist()
+    ends = (offsets[1:] * RECORD_SIZE).tolist()
+    for view, start, end in zip(views, starts, ends, strict=True):
+        dest[start:end] = view[HEADER_SIZE : HEADER_SIZE + end - start]
+    return PacketBatch(device_ids, offsets, records)
+
+
+class StreamDecoder:
+    """
+    Decodes one packet that arrives as a sequence of buffers. feed() returns
+    views of the complete records in each piece; a record split between two
+    pieces is assembled from its two halves (the only bytes ever copied),
+    and a partial record left at the end is reported by close().
+    """
+
+    def __init__(self):
+        self.device_id: str | None = None
+        self._head = bytearray()
+        self._carry = bytearray()
+
+    def feed(self, piece) -> list[np.ndarray]:
+        """Record arrays (RECORD_DTYPE) completed by this piece, in order; usually one view."""
+        view = memoryview(piece).cast("B")
+        if self.device_id is None:
+            need = HEADER_SIZE - len(self._head)
+            self._head += view[:need]
+            view = view[need:]
+            if len(self._head) < HEADER_SIZE:
+                return []
+            self.device_id = parse_device_id(self._head)
+        out = []
+        if self._carry:
+            need = RECORD_SIZE - len(self._carry)
+            self._carry += view[:need]
+            view = view[need:]
+            if len(self._carry) < RECORD_SIZE:
+                return out
+            out.append(np.frombuffer(bytes(self._carry), dtype=RECORD_DTYPE))
+            self._carry.clear()
+        count = len(view) // RECORD_SIZE
+        if count:
+            out.append(np.frombuffer(view, dtype=RECORD_DTYPE, count=count))
+        self._carry += view[count * RECORD_SIZE :]
+        return out
+
+    def close(self) -> int:
+        """Ends the packet; returns the length of a trailing partial record (ignored)."""
+        if self.device_id is None:
+            parse_device_id(self._head)
+        return len(self._carry)
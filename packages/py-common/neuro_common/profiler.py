@@ -0,0 +1,94 @@
+"""
+A sampling profiler that can be switched on in a running service.
+
+While a profile is taken, a background thread snapshots the stack of every
+other thread of the process every interval seconds (sys._current_frames)
+and counts identical stacks. Nothing is hooked into the profiled code, so
+the overhead is one stack walk per thread per sample and nothing at all
+while no profile is running. The result is in the collapsed-stack format
+("thread;outer;...;inner count" per line) read by flamegraph.pl,
+speedscope and similar viewers.
+
+Only the calling process is sampled; worker processes of a process pool
+are not.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_SECONDS = 300.0
+MIN_INTERVAL = 0.001
+
+_running = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Start with start(), stop() returns the counted stacks."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = max(interval, MIN_INTERVAL)
+        self.samples = 0
+        self._stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self._stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        next_at = time.perf_counter()
+        while not self._stop.is_set():
+            self._sample()
+            next_at += self.interval
+            self._stop.wait(max(0.0, next_at - time.perf_counter()))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self._stacks
+
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile(seconds: float, interval: float = 0.005) -> str:
+    """
+    Profiles this process for seconds and returns collapsed stacks. One
+    profile runs at a time; a second request raises RuntimeError.
+    """
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"seconds must be in (0, {MAX_SECONDS:g}]")
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("a profile is already running")
+    try:
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+        time.sleep(seconds)
+        return collapsed(profiler.stop())
+    finally:
+        _running.release()
@@ -0,0 +1,172 @@
+"""
+Per-channel min/max/mean summaries over fixed time bins, for overview plots.
+
+A summary level divides time into bins of bin_us microseconds aligned to the
+Unix epoch, so bins computed from different objects line up and partial bins
+at object boundaries are merged with combine(). Only non-empty bins are kept,
+each with its sample count, so gaps in a recording stay visible and means
+can be merged exactly.
+
+The compactor stores one encoded summary per level (LEVELS_SEC) as a section
+of each chunked object; a reader fetches the one level it needs with a
+single ranged GET.
+"""
+
+import struct
+
+import numpy as np
+
+from . import codec
+
+# 1 s, 10 s and 1 min bins
+LEVELS_SEC = (1, 10, 60)
+_HEADER = struct.Struct("<qII4s")
+
+
+def section_name(level_sec: int) -> str:
+    return f"summary/{level_sec}s"
+
+
+class Summary:
+    """
+    Non-empty bins of bin_us: bin index (start_us = bin * bin_us), count and
+    per-channel min/max/mean.
+    """
+
+    __slots__ = ("bin_us", "bins", "count", "min", "max", "mean")
+
+    def __init__(
+        self,
+        bin_us: int,
+        bins: np.ndarray,
+        count: np.ndarray,
+        min_: np.ndarray,
+        max_: np.ndarray,
+        mean: np.ndarray,
+    ):
+        self.bin_us = bin_us
+        self.bins = bins
+        self.count = count
+        self.min = min_
+        self.max = max_
+        self.mean = mean
+
+    def __len__(self) -> int:
+        return len(self.bins)
+
+    @property
+    def start_us(self) -> np.ndarray:
+        return self.bins * self.bin_us
+
+    def cut(self, start_us: int, end_us: int) -> "Summary":
+        """Bins that overlap [start_us, end_us]."""
+        lo = int(np.searchsorted(self.bins, start_us // self.bin_us, side="left"))
+        hi = int(np.searchsorted(self.bins, end_us // self.bin_us, side="right"))
+        return self[lo:hi]
+
+    def __getitem__(self, key) -> "Summary":
+        return Summary(
+            self.bin_us,
+            self.bins[key],
+            self.count[key],
+            self.min[key],
+            self.max[key],
+            self.mean[key],
+        )
+
+
+def empty(bin_us: int, num_channels: int, dtype=np.uint16) -> Summary:
+    return Summary(
+        bin_us,
+        np.empty(0, dtype=np.int64),
+        np.empty(0, dtype=np.uint32),
+        np.empty((0, num_channels), dtype=dtype),
+        np.empty((0, num_channels), dtype=dtype),
+        np.empty((0, num_channels), dtype=np.float32),
+    )
+
+
+def summarize(time_us: np.ndarray, values: np.ndarray, bin_us: int) -> Summary:
+    """Summarizes (n, channels) values with time_us sorted ascending."""
+    if len(time_us) == 0:
+        return empty(bin_us, values.shape[1], values.dtype)
+    bins = time_us // bin_us
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bins)) + 1))
+    count = np.diff(np.append(starts, len(bins))).astype(np.uint32)
+    sums = np.add.reduceat(values, starts, axis=0, dtype=np.float64)
+    return Summary(
+        bin_us,
+        bins[starts].astype(np.int64),
+        count,
+        np.minimum.reduceat(values, starts, axis=0),
+        np.maximum.reduceat(values, starts, axis=0),
+        (sums / count[:, None]).astype(np.float32),
+    )
+
+
+def combine(parts: list[Summary]) -> Summary:
+    """Concatenates summaries of one level in time order, merging bins split across parts."""
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        raise ValueError("nothing to combine")
+    if len(parts) == 1:
+        return parts[0]
+    bin_us = parts[0].bin_us
+    bins = np.concatenate([p.bins for p in parts])
+    order = np.argsort(bins, kind="stable")
+    bins = bins[order]
+    count = np.concatenate([p.count for p in parts])[order]
+    min_ = np.concatenate([p.min for p in parts])[order]
+    max_ = np.concatenate([p.max for p in parts])[order]
+    sums = np.concatenate([p.mean for p in parts])[order].astype(np.float64) * count[:, None]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bins)) + 1))
+    total = np.add.reduceat(count, starts).astype(np.uint32)
+    return Summary(
+        bin_us,
+        bins[starts],
+        total,
+        np.minimum.reduceat(min_, starts, axis=0),
+        np.maximum.reduceat(max_, starts, axis=0),
+        (np.add.reduceat(sums, starts, axis=0) / total[:, None]).astype(np.float32),
+    )
+
+
+def encode(summary: Summary, level: int = codec.DEFAULT_LEVEL) -> bytes:
+    """
+    One zstd frame: a small header, then bins, counts, min, max and mean, each
+    channel contiguous.
+    """
+    n, num_channels = summary.min.shape
+    header = _HEADER.pack(summary.bin_us, n, num_channels, summary.min.dtype.str.encode("ascii"))
+    body = [
+        header,
+        np.diff(summary.bins, prepend=summary.bins[:1]).astype("<i8").tobytes(),
+        summary.bins[:1].astype("<i8").tobytes(),
+        summary.count.astype("<u4").tobytes(),
+        np.ascontiguousarray(summary.min.T).tobytes(),
+        np.ascontiguousarray(summary.max.T).tobytes(),
+        np.ascontiguousarray(summary.mean.T, dtype="<f4").tobytes(),
+    ]
+    return codec.compress(b"".join(body), level=level)
+
+
+def decode(data: bytes) -> Summary:
+    raw = codec.get_decompressor(codec.NO_DICTIONARY).decompress(data)
+    bin_us, n, num_channels, dtype_str = _HEADER.unpack_from(raw)
+    dtype = np.dtype(dtype_str.rstrip(b"\x00").decode("ascii"))
+    offset = _HEADER.size
+
+    def take(dt, count):
+        nonlocal offset
+        values = np.frombuffer(raw, dtype=dt, count=count, offset=offset)
+        offset += values.nbytes
+        return values
+
+    deltas = take("<i8", n)
+    first = take("<i8", 1 if n else 0)
+    bins = np.cumsum(deltas) + (first[0] if n else 0)
+    count = take("<u4", n)
+    min_ = take(dtype, n * num_channels).reshape(num_channels, n).T
+    max_ = take(dtype, n * num_channels).reshape(num_channels, n).T
+    mean = take("<f4", n * num_channels).reshape(num_channels, n).T
+    return Summary(bin_us, bins, count, min_, max_, mean)
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from neuro_common import chunk, packet
+
+
+def make_columns(num_samples: int) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    rng = np.random.default_rng(0)
+    # Irregular spacing, as from packets with network jitter
+    time_us = 1_700_000_000_000_000 + np.cumsum(rng.integers(3000, 5000, num_samples))
+    columns = {
+        "eeg": rng.integers(0, 4096, (num_samples, packet.NUM_EEG_CHANNELS)).astype("<u2"),
+        "accel": rng.normal(size=(num_samples, 3)).astype("<f4"),
+        "trig": rng.integers(0, 2, num_samples).astype("u1"),
+    }
+    return time_us, columns
+
+
+def ranged_reader(data: bytes, reads: list):
+    def read_at(offset, length):
+        reads.append((offset, length))
+        return data[offset : offset + length]
+
+    return read_at
+
+
+def test_round_trip():
+    time_us, columns = make_columns(1000)
+    data = chunk.encode(time_us, columns, {"user_id": "u1"}, chunk_samples=256)
+    header, decoded = chunk.decode(data)
+    assert header.meta["user_id"] == "u1"
+    assert header.num_samples == 1000 and len(header.index) == 4
+    assert (header.start_us, header.end_us) == (time_us[0], time_us[-1])
+    np.testing.assert_array_equal(decoded[chunk.TIME_COLUMN], time_us)
+    for name, values in columns.items():
+        np.testing.assert_array_equal(decoded[name], values)
+
+
+def test_decode_selected_columns():
+    time_us, columns = make_columns(300)
+    _, decoded = chunk.decode(chunk.encode(time_us, columns, {}, 100), ["eeg"])
+    assert set(decoded) == {chunk.TIME_COLUMN, "eeg"}
+    np.testing.assert_array_equal(decoded["eeg"], columns["eeg"])
+
+
+def test_ranged_read_of_some_chunks():
+    time_us, columns = make_columns(1000)
+    data = chunk.encode(time_us, columns, {}, 100)
+    reads = []
+    header = chunk.read_header(ranged_reader(data, reads))
+    assert len(reads) == 1
+    start_us, end_us = int(time_us[250]), int(time_us[420])
+    first, last = header.chunk_range(start_us, end_us)
+    assert (first, last) == (2, 5)
+    offset, length = header.byte_range(first, last)
+    decoded = header.decode_chunks(data[offset : offset + length], first, last)
+    np.testing.assert_array_equal(decoded[chunk.TIME_COLUMN], time_us[200:500])
+    np.testing.assert_array_equal(decoded["eeg"], columns["eeg"][200:500])
+
+
+def test_range_outside_the_object():
+    time_us, columns = make_columns(300)
+    header, _ = chunk.decode(chunk.encode(time_us, columns, {}, 100))
+    first, last = header.chunk_range(int(time_us[-1]) + 1, None)
+    assert header.byte_range(first, last)[1] == 0
+    decoded = header.decode_chunks(b"", first, last, ["eeg"])
+    assert decoded["eeg"].shape == (0, packet.NUM_EEG_CHANNELS)
+    assert decoded[chunk.TIME_COLUMN].dtype == np.int64
+
+
+def test_header_larger_than_the_probe_takes_more_reads():
+    time_us, columns = make_columns(5000)
+    data = chunk.encode(time_us, columns, {"note": "x" * chunk.HEADER_PROBE_SIZE}, 10)
+    reads = []
+    header = chunk.read_header(ranged_reader(data, reads))
+    assert len(reads) == 3
+    assert len(header.index) == 500
+
+
+def test_sections():
+    time_us, columns = make_columns(100)
+    data = chunk.encode(time_us, columns, {}, 50, sections={"a": b"first", "b": b"second"})
+    header, _ = chunk.decode(data)
+    offset, length = header.section_range("b")
+    assert data[offset : offset + length] == b"second"
+    assert header.section_range("missing") is None
+
+
+def test_empty_object():
+    time_us, columns = make_columns(0)
+    header, decoded = chunk.decode(chunk.encode(time_us, columns, {}, 100))
+    assert header.num_samples == 0 and len(header.index) == 0
+    assert len(decoded[chunk.TIME_COLUMN]) == 0
+
+
+@pytest.mark.parametrize(
+    "data, message",
+    [
+        (b"NCHK", "too short"),
+        (b"XXXX" + bytes(8), "bad magic"),
+        (chunk._PREAMBLE.pack(chunk.MAGIC, chunk.FORMAT_VERSION + 1, 0), "unsupported"),
+    ],
+)
+def test_read_header_rejects_other_data(data, message):
+    with pytest.raises(ValueError, match=message):
+        chunk.read_header(ranged_reader(data, []))
+
+
+def test_is_chunk_object():
+    assert chunk.is_chunk_object(f"eeg/u1/1-2_dev_ab{chunk.OBJECT_SUFFIX}")
+    assert not chunk.is_chunk_object("eeg/u1/1-2_dev_ab.zst")
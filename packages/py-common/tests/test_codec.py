@@ -0,0 +1,100 @@
+import io
+
+import numpy as np
+import pytest
+import zstandard
+from neuro_common import codec
+
+
+def sample_packets(seed: int, count: int = 300) -> list[bytes]:
+    rng = np.random.default_rng(seed)
+    return [
+        b"AA:BB:CC:DD:EE:FF\x00" + (2048 + rng.integers(-50, 50, (32, 24))).astype("<u2").tobytes()
+        for _ in range(count)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def fresh_codec(monkeypatch):
+    """Every test starts without registered dictionaries, loader or cached contexts."""
+    monkeypatch.setattr(codec, "_dictionaries", {})
+    monkeypatch.setattr(codec, "_dictionary_loader", None)
+    codec._local.__dict__.clear()
+    yield
+    codec._local.__dict__.clear()
+
+
+@pytest.fixture(scope="module")
+def dictionaries() -> tuple[zstandard.ZstdCompressionDict, zstandard.ZstdCompressionDict]:
+    first = codec.train_dictionary(sample_packets(1), 4096)
+    second = codec.train_dictionary(sample_packets(2), 4096)
+    assert first.dict_id() != second.dict_id()
+    return first, second
+
+
+def test_round_trip_without_dictionary():
+    data = sample_packets(3, 1)[0]
+    compressed = codec.compress(data)
+    assert codec.frame_dict_id(compressed) == codec.NO_DICTIONARY
+    assert codec.decompress(compressed) == data
+
+
+def test_decompress_concatenated_frames():
+    parts = sample_packets(3, 3)
+    # Frames written by a streaming compressor do not record their size
+    streamed = io.BytesIO()
+    with zstandard.ZstdCompressor().stream_writer(streamed, closefd=False) as writer:
+        writer.write(parts[2])
+    data = codec.compress(parts[0]) + codec.compress(parts[1]) + streamed.getvalue()
+    assert codec.decompress(data) == b"".join(parts)
+
+
+def test_stream_decompress_matches_decompress():
+    parts = sample_packets(3, 50)
+    data = b"".join(codec.compress(part) for part in parts)
+    pieces = list(codec.stream_decompress(io.BytesIO(data), read_size=1000))
+    assert max(len(piece) for piece in pieces) <= 1000
+    assert b"".join(pieces) == b"".join(parts)
+    assert list(codec.stream_decompress(io.BytesIO(b""))) == []
+
+
+def test_round_trip_with_dictionary(dictionaries):
+    dict_id = codec.register_dictionary(dictionaries[0].as_bytes())
+    data = sample_packets(3, 2)
+    compressed = codec.compress(data[0], dict_id) + codec.compress(data[1], dict_id)
+    assert codec.frame_dict_id(compressed) == dict_id
+    assert codec.decompress(compressed) == b"".join(data)
+    assert b"".join(codec.stream_decompress(io.BytesIO(compressed))) == b"".join(data)
+
+
+def test_unknown_dictionary_is_loaded_once(dictionaries):
+    dict_id = dictionaries[0].dict_id()
+    compressed = zstandard.ZstdCompressor(dict_data=dictionaries[0]).compress(b"x" * 100)
+    with pytest.raises(KeyError):
+        codec.decompress(compressed)
+    loaded = []
+    codec.set_dictionary_loader(lambda i: loaded.append(i) or dictionaries[0].as_bytes())
+    assert codec.decompress(compressed) == b"x" * 100
+    assert codec.decompress(compressed) == b"x" * 100
+    assert loaded == [dict_id]
+
+
+def test_loader_returning_another_dictionary(dictionaries):
+    compressed = zstandard.ZstdCompressor(dict_data=dictionaries[0]).compress(b"x" * 100)
+    codec.set_dictionary_loader(lambda i: dictionaries[1].as_bytes())
+    with pytest.raises(KeyError, match="was loaded as dictionary"):
+        codec.decompress(compressed)
+
+
+def test_frames_with_different_dictionaries(dictionaries):
+    first, second = (codec.register_dictionary(d) for d in dictionaries)
+    mixed = codec.compress(b"x" * 100, first) + codec.compress(b"y" * 100, second)
+    with pytest.raises(zstandard.ZstdError):
+        codec.decompress(mixed)
+
+
+def test_corrupt_input_raises_zstd_error():
+    with pytest.raises(zstandard.ZstdError):
+        codec.decompress(b"not zstd at all")
+    with pytest.raises(zstandard.ZstdError):
+        codec.decompress(codec.compress(b"x" * 1000)[:-4])
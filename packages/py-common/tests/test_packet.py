@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from neuro_common import packet
+
+DEVICE_ID = "AA:BB:CC:DD:EE:FF"
+
+
+def make_packet(num_samples: int, first_us: int = 0, device_id: str = DEVICE_ID) -> bytes:
+    header = device_id.encode("ascii").ljust(packet.HEADER_SIZE, b"\x00")
+    records = np.zeros(num_samples, dtype=packet.RECORD_DTYPE)
+    records["esp_micros"] = first_us + np.arange(num_samples) * 3906
+    records["eeg"] = np.arange(num_samples * packet.NUM_EEG_CHANNELS).reshape(
+        num_samples, packet.NUM_EEG_CHANNELS
+    )
+    return header + records.tobytes()
+
+
+def test_decode_round_trip():
+    decoded = packet.decode(make_packet(5, first_us=100))
+    assert decoded.device_id == DEVICE_ID
+    assert len(decoded) == 5 and decoded.trailing == 0
+    assert decoded.esp_micros.tolist() == [100 + i * 3906 for i in range(5)]
+    assert decoded.eeg.shape == (5, packet.NUM_EEG_CHANNELS)
+
+
+@pytest.mark.parametrize("buf_type", [bytes, bytearray, memoryview])
+def test_decode_accepts_any_buffer(buf_type):
+    assert len(packet.decode(buf_type(make_packet(3)))) == 3
+
+
+def test_decode_header_only():
+    decoded = packet.decode(make_packet(0))
+    assert len(decoded) == 0 and decoded.trailing == 0
+
+
+def test_decode_ignores_trailing_partial_record():
+    decoded = packet.decode(make_packet(4) + b"\x01" * 7)
+    assert len(decoded) == 4 and decoded.trailing == 7
+
+
+@pytest.mark.parametrize(
+    "buf",
+    [
+        b"",
+        b"AA:BB:CC",
+        b"A" * packet.HEADER_SIZE,
+        b"\x00" * packet.HEADER_SIZE,
+        "é".encode().ljust(packet.HEADER_SIZE, b"\x00"),
+    ],
+    ids=["empty", "truncated-header", "no-nul", "empty-device-id", "not-ascii"],
+)
+def test_decode_rejects_bad_header(buf):
+    with pytest.raises(packet.PacketError):
+        packet.decode(buf)
+
+
+def test_decode_batch_concatenates_packets():
+    buffers = [make_packet(3), make_packet(0), bytearray(make_packet(2, first_us=5) + b"\x00")]
+    batch = packet.decode_batch(buffers)
+    assert batch.device_ids == [DEVICE_ID] * 3
+    assert batch.offsets.tolist() == [0, 3, 3, 5]
+    assert batch["esp_micros"].tolist() == [0, 3906, 7812, 5, 3911]
+    for buf, start, end in zip(buffers, batch.offsets[:-1], batch.offsets[1:], strict=True):
+        np.testing.assert_array_equal(batch.records[start:end], packet.decode(buf).records)
+
+
+def test_decode_batch_reuses_out_when_large_enough():
+    out = np.empty(10, dtype=packet.RECORD_DTYPE)
+    batch = packet.decode_batch([make_packet(4)], out=out)
+    assert np.shares_memory(batch.records, out)
+    assert len(packet.decode_batch([make_packet(11)], out=out)) == 11
+
+
+def test_decode_batch_rejects_bad_and_unsupported_buffers():
+    with pytest.raises(packet.PacketError):
+        packet.decode_batch([make_packet(2), b"short"])
+    with pytest.raises(packet.PacketError):
+        packet.decode_batch([np.zeros((4, 4), dtype=np.uint16)[:, ::2]])
+
+
+@pytest.mark.parametrize("piece_size", [1, 5, packet.HEADER_SIZE, packet.RECORD_SIZE + 3, 4096])
+def test_stream_decoder_matches_decode(piece_size):
+    data = make_packet(9) + b"\x02" * 5
+    decoder = packet.StreamDecoder()
+    parts = []
+    for i in range(0, len(data), piece_size):
+        parts.extend(decoder.feed(data[i : i + piece_size]))
+    assert decoder.close() == 5
+    assert decoder.device_id == DEVICE_ID
+    np.testing.assert_array_equal(np.concatenate(parts), packet.decode(data).records)
+
+
+def test_stream_decoder_header_only():
+    decoder = packet.StreamDecoder()
+    assert decoder.feed(make_packet(0)) == []
+    assert decoder.close() == 0
+    assert decoder.device_id == DEVICE_ID
+
+
+def test_stream_decoder_truncated_header():
+    decoder = packet.StreamDecoder()
+    assert decoder.feed(make_packet(1)[:10]) == []
+    with pytest.raises(packet.PacketError):
+        decoder.close()
@@ -0,0 +1,68 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from neuro_common import db, object_store
+
+
+class FakePool:
+    min_size = 2
+    max_size = 8
+
+    def get_stats(self):
+        return {"pool_size": 4, "pool_available": 1, "requests_waiting": 3, "requests_num": 10}
+
+
+def test_pool_metrics():
+    m = db.pool_metrics(FakePool())
+    assert (m["size"], m["in_use"], m["waiting"], m["requests"]) == (4, 3, 3, 10)
+    assert m["utilization"] == 0.375
+    # Counters a fresh pool does not report yet
+    assert m["connections_lost"] == 0
+
+
+def test_pools_are_registered_until_closed():
+    # Nothing listens on port 1; the pool opens without waiting for a connection
+    pool = db.create_pool("host=127.0.0.1 port=1 dbname=test connect_timeout=1", name="test-db")
+    try:
+        assert db.metrics()["test-db"]["max_size"] == pool.max_size
+    finally:
+        db.close_pools()
+    assert db.metrics() == {}
+    assert pool.closed
+
+
+class _BucketHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def minio_endpoint():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _BucketHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_object_store_metrics_count_reused_connections(minio_endpoint):
+    client = object_store.create_client(
+        minio_endpoint, "key", "secret", False, name="test-minio", max_connections=3, region="x"
+    )
+    assert object_store.metrics()["test-minio"]["requests"] == 0
+    for _ in range(5):
+        assert client.bucket_exists("bucket")
+    m = object_store.metrics()["test-minio"]
+    assert m["max_connections"] == 3 and m["hosts"] == 1
+    assert m["requests"] == 5
+    # Sequential requests share one kept-alive connection, returned to the pool after each
+    assert m["connections_opened"] == 1
+    assert m["in_use"] == 0
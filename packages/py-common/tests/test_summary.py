@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from neuro_common import summary
+
+BIN_US = 1_000_000
+
+
+def make_samples(num_samples: int, start_us: int = 0, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    time_us = start_us + np.arange(num_samples) * 3906
+    values = rng.integers(0, 4096, (num_samples, 8)).astype(np.uint16)
+    return time_us, values
+
+
+def assert_same(a: summary.Summary, b: summary.Summary):
+    assert a.bin_us == b.bin_us
+    np.testing.assert_array_equal(a.bins, b.bins)
+    np.testing.assert_array_equal(a.count, b.count)
+    np.testing.assert_array_equal(a.min, b.min)
+    np.testing.assert_array_equal(a.max, b.max)
+    np.testing.assert_allclose(a.mean, b.mean, rtol=1e-6)
+
+
+def test_summarize_matches_per_bin_reduction():
+    time_us, values = make_samples(1000)
+    result = summary.summarize(time_us, values, BIN_US)
+    bins = time_us // BIN_US
+    assert result.bins.tolist() == sorted(set(bins.tolist()))
+    for i, b in enumerate(result.bins):
+        in_bin = values[bins == b]
+        assert result.count[i] == len(in_bin)
+        np.testing.assert_array_equal(result.min[i], in_bin.min(axis=0))
+        np.testing.assert_array_equal(result.max[i], in_bin.max(axis=0))
+        np.testing.assert_allclose(result.mean[i], in_bin.mean(axis=0), rtol=1e-6)
+
+
+def test_gaps_leave_no_bins():
+    first, first_values = make_samples(100)
+    second, second_values = make_samples(100, start_us=10 * BIN_US)
+    result = summary.summarize(
+        np.concatenate([first, second]), np.concatenate([first_values, second_values]), BIN_US
+    )
+    assert result.bins.tolist() == [0, 10]
+    assert result.start_us.tolist() == [0, 10 * BIN_US]
+
+
+def test_combine_merges_bins_split_across_parts():
+    time_us, values = make_samples(1000)
+    whole = summary.summarize(time_us, values, BIN_US)
+    # Split in the middle of a bin, as at an object boundary
+    parts = [
+        summary.summarize(time_us[:300], values[:300], BIN_US),
+        summary.summarize(time_us[300:301], values[300:301], BIN_US),
+        summary.summarize(time_us[301:], values[301:], BIN_US),
+    ]
+    assert_same(summary.combine(parts), whole)
+
+
+def test_combine_skips_empty_parts_and_rejects_nothing():
+    time_us, values = make_samples(100)
+    part = summary.summarize(time_us, values, BIN_US)
+    assert summary.combine([summary.empty(BIN_US, 8), part]) is part
+    with pytest.raises(ValueError):
+        summary.combine([summary.empty(BIN_US, 8)])
+
+
+def test_encode_round_trip():
+    time_us, values = make_samples(2000, start_us=1_700_000_000_000_000)
+    result = summary.summarize(time_us, values, BIN_US)
+    assert_same(summary.decode(summary.encode(result)), result)
+
+
+def test_encode_empty():
+    empty = summary.empty(BIN_US, 8)
+    decoded = summary.decode(summary.encode(empty))
+    assert len(decoded) == 0
+    assert decoded.min.shape == (0, 8) and decoded.min.dtype == np.uint16
+
+
+def test_cut():
+    time_us, values = make_samples(2000)
+    result = summary.summarize(time_us, values, BIN_US)
+    cut = result.cut(int(2.5 * BIN_US), 4 * BIN_US)
+    assert cut.bins.tolist() == [2, 3, 4]